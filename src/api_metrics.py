@@ -0,0 +1,134 @@
+import re
+import bisect
+from threading import Lock
+
+class ApiMetrics:
+    # Counts the requests made to each endpoint of the API (and for each playlist) with their errors,
+    # retries, response sizes and a histogram of their latencies, so that the API usage of each cycle
+    # of moderation can be summarised. Recording a request only updates a few counters, so metrics
+    # can always be kept. Reads which were shared with an identical read, answered from the cache
+    # or hedged are also counted (per endpoint)
+
+    latency_buckets = [ 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10 ] # upper bounds (in seconds) of the histogram's buckets
+    events = [ 'shared', 'cached', 'hedged' ]
+    top_playlists = 5 # number of playlists with the most requests which are included in a summary
+
+    def __init__(self, logger):
+        self.logger = logger.getChild('ApiMetrics')
+        self._lock = Lock()
+        self._endpoints = {}
+        self._playlists = {}
+
+
+    def record(self, endpoint, url, status, latency, size=0, retry=False):
+        # `status` is None if no response was received (e.g., the connection failed)
+        playlist_id = self.playlist_id(url)
+        bucket = bisect.bisect_left(self.latency_buckets, latency)
+        failed = status is None or status >= 400
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = self._new_endpoint_stats()
+            stats['requests'] += 1
+            stats['errors'] += 1 if failed else 0
+            stats['retries'] += 1 if retry else 0
+            stats['throttled'] += 1 if status == 429 else 0
+            stats['bytes'] += size
+            stats['latency'] += latency
+            stats['histogram'][bucket] += 1
+            if playlist_id is not None:
+                playlist_stats = self._playlists.get(playlist_id)
+                if playlist_stats is None:
+                    playlist_stats = self._playlists[playlist_id] = { 'requests': 0, 'errors': 0, 'bytes': 0, 'latency': 0.0 }
+                playlist_stats['requests'] += 1
+                playlist_stats['errors'] += 1 if failed else 0
+                playlist_stats['bytes'] += size
+                playlist_stats['latency'] += latency
+
+
+    def record_event(self, endpoint, event):
+        if event not in self.events:
+            raise ValueError('Unknown event \'%s\'' % event)
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = self._new_endpoint_stats()
+            stats[event] += 1
+
+
+    def take_summary(self):
+        # returns the metrics recorded since the last summary was taken (i.e., during the last cycle)
+        with self._lock:
+            (endpoints, playlists) = (self._endpoints, self._playlists)
+            (self._endpoints, self._playlists) = ({}, {})
+        return { 'endpoints': endpoints, 'playlists': playlists }
+
+
+    def log_summary(self):
+        summary = self.take_summary()
+        endpoints = summary['endpoints']
+        if len(endpoints) == 0:
+            self.logger.info('No API requests were made during this cycle')
+            return summary
+
+        total = lambda field: sum([ stats[field] for stats in endpoints.values() ])
+        self.logger.info('API requests during this cycle: %d (errors: %d, retries: %d, throttled: %d), '
+                         + '%.1f KB received, %.1f seconds waiting for responses',
+                         total('requests'), total('errors'), total('retries'), total('throttled'),
+                         total('bytes') / 1024, total('latency'))
+        for (endpoint, stats) in sorted(endpoints.items(), key=lambda entry: -entry[1]['requests']):
+            self.logger.info('  %s: %d requests (errors: %d, retries: %d, throttled: %d), %.1f KB, '
+                             + 'latency p50 %s, p95 %s, p99 %s (shared: %d, cached: %d, hedged: %d)',
+                             endpoint, stats['requests'], stats['errors'], stats['retries'], stats['throttled'],
+                             stats['bytes'] / 1024, self.format_bucket(self.percentile(stats['histogram'], 50)),
+                             self.format_bucket(self.percentile(stats['histogram'], 95)),
+                             self.format_bucket(self.percentile(stats['histogram'], 99)),
+                             stats['shared'], stats['cached'], stats['hedged'])
+
+        playlists = sorted(summary['playlists'].items(), key=lambda entry: -entry[1]['requests'])
+        for (playlist_id, stats) in playlists[:self.top_playlists]:
+            self.logger.info('  Playlist %s: %d requests (errors: %d), %.1f KB, %.1f seconds',
+                             playlist_id, stats['requests'], stats['errors'], stats['bytes'] / 1024, stats['latency'])
+        return summary
+
+
+    def _new_endpoint_stats(self):
+        stats = {
+            'requests': 0,
+            'errors': 0,
+            'retries': 0,
+            'throttled': 0,
+            'bytes': 0,
+            'latency': 0.0,
+            'histogram': [ 0 ] * (len(self.latency_buckets) + 1)
+        }
+        for event in self.events:
+            stats[event] = 0
+        return stats
+
+
+    @classmethod
+    def percentile(cls, histogram, percentile):
+        # returns the index of the bucket which contains the percentile of the recorded latencies
+        target = sum(histogram) * percentile / 100
+        count = 0
+        for (bucket, bucket_count) in enumerate(histogram):
+            count += bucket_count
+            if count >= target and count > 0:
+                return bucket
+        return None
+
+
+    @classmethod
+    def format_bucket(cls, bucket):
+        if bucket is None:
+            return 'n/a'
+        elif bucket >= len(cls.latency_buckets):
+            return '> %d ms' % (cls.latency_buckets[-1] * 1000)
+        return '<= %d ms' % (cls.latency_buckets[bucket] * 1000)
+
+
+    @staticmethod
+    def playlist_id(url):
+        match = re.search('/playlists/([A-Za-z0-9]{22})(?=/|\\?|$)', url)
+        return match.group(1) if match is not None else None
@@ -0,0 +1,377 @@
+import re
+import weakref
+from urllib.parse import urlencode
+from threading import Lock, local
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from time import monotonic, sleep
+import requests
+import urllib3
+from src.circuit_breaker import CircuitBreaker
+from src.retry_policy import RetryPolicy
+from src.request_scheduler import RequestScheduler
+from src.single_flight import SingleFlight
+
+class ApiSession(requests.Session):
+    # Session through which every request of the API client is made (spotipy sends all requests
+    # via its session), allowing request rates to be coordinated across all callers and allowing
+    # reads which failed due to transient errors to be retried.
+    # Requests are sent through a session owned by the calling thread (as requests' sessions are
+    # not thread-safe) but all of those sessions share one pool of kept-alive connections
+
+    def __init__(self, logger, rate_limiter=None, concurrency_controller=None, retry_policy=None,
+                 max_throttled_retries=3, circuit_failure_threshold=5, circuit_reset_timeout=30,
+                 pool_size=10, keep_alive=True, single_flight=True, hedger=None, response_cache=None,
+                 adapter=None, metrics=None, timeout=None, scheduler=None):
+        super().__init__()
+        self.logger = logger.getChild('ApiSession')
+        self.rate_limiter = rate_limiter
+        self.concurrency_controller = concurrency_controller
+        self.retry_policy = retry_policy
+        self.max_throttled_retries = max_throttled_retries
+        self.circuit_failure_threshold = circuit_failure_threshold
+        self.circuit_reset_timeout = circuit_reset_timeout
+        self._circuit_breakers = {}
+        self._circuit_breakers_lock = Lock()
+        # identical reads which are in flight at the same time share one request (and its response)
+        self.single_flight = SingleFlight() if single_flight else None
+        # reads which take unusually long may be hedged (i.e., a duplicate is sent and the first response is used)
+        self.hedger = hedger
+        self._hedge_executor = ThreadPoolExecutor(max_workers=2 * pool_size) if hedger is not None else None
+        # reads of data which has not changed since it was cached are served from the cache
+        self.response_cache = response_cache
+        # if given, the requests made to each endpoint (and their latencies, errors and retries) are counted
+        self.metrics = metrics
+        # if given, the (connect, read) timeouts in seconds of every request, replacing the API client's
+        self.timeout = timeout
+        # if given, requests wait for the rate limiter in order of their priority class (via the scheduler)
+        self.scheduler = scheduler
+        self._thread_local = local()
+        # the sessions of threads which have ended are dropped with their thread (e.g., when a pool of
+        # workers is shut down), so only the sessions of live threads are kept to be closed
+        self._thread_sessions = weakref.WeakSet()
+        self._thread_sessions_lock = Lock()
+        if not keep_alive:
+            self.headers['Connection'] = 'close'
+
+        # Failed connections are retried by the adapter (for all methods as nothing was sent)
+        # but failed responses are handled here, where only idempotent requests are retried and
+        # throttled requests wait for the rate limiter. The adapter would otherwise act on the
+        # Retry-After header of a 429 or 503 response itself (raising RetryError), so responses
+        # are always returned as they are
+        retry = urllib3.Retry(
+            total=3,
+            connect=3,
+            read=False,
+            status=0,
+            allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+            respect_retry_after_header=False,
+            raise_on_status=False,
+            backoff_factor=0.3)
+        # a different transport may be given (e.g., one which records or replays requests)
+        self._adapter = adapter if adapter is not None else requests.adapters.HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=retry)
+        self.mount('http://', self._adapter)
+        self.mount('https://', self._adapter)
+
+
+    def request(self, method, url, *args, **kwargs):
+        if method.upper() != 'GET':
+            return self._request(method, url, *args, **kwargs)
+        elif self.single_flight is None:
+            return self._read(method, url, *args, **kwargs)
+
+        sent = []
+        def send_read():
+            sent.append(True)
+            response = self._read(method, url, *args, **kwargs)
+            response.content # the body is read before the response is shared between callers
+            return response
+        response = self.single_flight.do(self.request_key(method, url, kwargs), send_read)
+        if len(sent) == 0 and self.metrics is not None:
+            self.metrics.record_event(self.endpoint_name(method, url), 'shared')
+        return response
+
+
+    def _read(self, method, url, *args, **kwargs):
+        if self.response_cache is None:
+            return self._request(method, url, *args, **kwargs)
+
+        cache_key = self.response_cache_key(url, kwargs)
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            headers = dict(kwargs['headers']) if 'headers' in kwargs.keys() and kwargs['headers'] else {}
+            headers['If-None-Match'] = cached['etag']
+            kwargs['headers'] = headers
+
+        response = self._request(method, url, *args, **kwargs)
+        if response.status_code == 304 and cached is not None:
+            self.response_cache.record_hit()
+            if self.metrics is not None:
+                self.metrics.record_event(self.endpoint_name(method, url), 'cached')
+            return self._build_cached_response(response, cached)
+        elif response.status_code == 200 and 'ETag' in response.headers:
+            self.response_cache.put(cache_key, response.headers['ETag'], response.content,
+                                    content_type=response.headers.get('Content-Type'))
+        return response
+
+
+    def _request(self, method, url, *args, **kwargs):
+        if self.timeout is not None:
+            kwargs['timeout'] = self.timeout
+        endpoint = self.endpoint_name(method, url)
+        circuit_breaker = self.get_circuit_breaker(endpoint)
+        retryable = method.upper() in [ 'GET', 'HEAD' ] and self.retry_policy is not None
+        attempt = 0
+        throttled_attempt = 0
+
+        trial = False # whether the request is the trial request of the endpoint's half-open circuit
+        try:
+            while True:
+                trial = circuit_breaker.check()
+                self._acquire(endpoint)
+
+                started = monotonic()
+                try:
+                    response = self._send(endpoint, method, url, *args, **kwargs)
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as err:
+                    self._record_metrics(endpoint, url, None, started, attempt + throttled_attempt > 0)
+                    circuit_breaker.record_failure()
+                    trial = False
+                    if not retryable or attempt >= self.retry_policy.max_retries:
+                        raise err
+                    self._wait_before_retry(endpoint, attempt, err)
+                    attempt += 1
+                    continue
+                self._record_metrics(endpoint, url, response, started, attempt + throttled_attempt > 0)
+
+                if response.status_code == 429:
+                    # throttling is not a failure of the endpoint, so a trial request neither opens
+                    # nor closes the circuit (and the next request may be the trial instead)
+                    if trial:
+                        circuit_breaker.release_trial()
+                        trial = False
+                    if self.rate_limiter is None or throttled_attempt >= self.max_throttled_retries:
+                        return response
+                    retry_after = self.get_retry_after(response)
+                    queue_depth = self.rate_limiter.queue_depth + (self.scheduler.queue_depth()
+                                                                   if self.scheduler is not None else 0)
+                    self.logger.warning('Request to \'%s\' was throttled - retrying in %.1f seconds (queued requests: %d)',
+                                        endpoint, retry_after, queue_depth)
+                    self.rate_limiter.pause(endpoint, retry_after)
+                    response.close()
+                    throttled_attempt += 1
+                    continue
+
+                if not RetryPolicy.is_retryable_status(response.status_code):
+                    circuit_breaker.record_success()
+                    trial = False
+                    return response
+
+                circuit_breaker.record_failure()
+                trial = False
+                if not retryable or attempt >= self.retry_policy.max_retries:
+                    return response
+                response.close()
+                self._wait_before_retry(endpoint, attempt, 'HTTP status %d' % response.status_code)
+                attempt += 1
+        finally:
+            # the trial is released if the request failed unexpectedly, so that another can be made
+            if trial:
+                circuit_breaker.release_trial()
+
+
+    def _acquire(self, endpoint):
+        if self.scheduler is not None:
+            self.scheduler.acquire(endpoint)
+        elif self.rate_limiter is not None:
+            self.rate_limiter.acquire(endpoint)
+
+
+    def get_circuit_breaker(self, endpoint):
+        with self._circuit_breakers_lock:
+            if endpoint not in self._circuit_breakers.keys():
+                self._circuit_breakers[endpoint] = CircuitBreaker(
+                    endpoint, self.circuit_failure_threshold, self.circuit_reset_timeout)
+            return self._circuit_breakers[endpoint]
+
+
+    def get_thread_session(self):
+        # returns the session of the calling thread, creating it on the thread's first request
+        session = getattr(self._thread_local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(self.headers)
+            session.mount('http://', self._adapter)
+            session.mount('https://', self._adapter)
+            self._thread_local.session = session
+            with self._thread_sessions_lock:
+                self._thread_sessions.add(session)
+        return session
+
+
+    def close(self):
+        with self._thread_sessions_lock:
+            thread_sessions = list(self._thread_sessions)
+            self._thread_sessions = weakref.WeakSet()
+        for session in thread_sessions:
+            session.close()
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+        super().close()
+
+
+    def _record_metrics(self, endpoint, url, response, started, retry):
+        if self.metrics is None:
+            return
+        size = 0
+        if response is not None:
+            # the size of a response is read from its header where possible so its body is not read early
+            size = (int(response.headers['Content-Length']) if 'Content-Length' in response.headers
+                    else len(response.content or b''))
+        self.metrics.record(endpoint, url, response.status_code if response is not None else None,
+                            monotonic() - started, size=size, retry=retry)
+
+
+    def _wait_before_retry(self, endpoint, attempt, reason):
+        delay = self.retry_policy.delay(attempt)
+        self.logger.warning('Request to \'%s\' failed (%s) - retrying in %.1f seconds (retry %d of %d)',
+                            endpoint, reason, delay, attempt + 1, self.retry_policy.max_retries)
+        sleep(delay)
+
+
+    def _send(self, endpoint, method, url, *args, **kwargs):
+        if self.hedger is None or method.upper() != 'GET':
+            return self._send_within_window(method, url, *args, **kwargs)
+
+        hedge_delay = self.hedger.hedge_delay(endpoint)
+        if hedge_delay is None:
+            # not enough latencies have been observed to know whether a request is slow
+            return self._send_and_record_latency(endpoint, self._send_within_window, method, url, *args, **kwargs)
+
+        # the priority class of the request is kept per thread, so it is passed on to the hedge threads
+        send = RequestScheduler.bind(self._send_and_record_latency)
+        primary = self._hedge_executor.submit(send, endpoint, self._send_within_window, method, url, *args, **kwargs)
+        (done, pending) = wait([ primary ], timeout=hedge_delay)
+        if len(done) > 0:
+            return primary.result()
+
+        if self.concurrency_controller is not None and not self.concurrency_controller.try_acquire():
+            # a hedge which has to wait for a slot (e.g., for the very request it backs up) is not sent
+            return primary.result()
+        send_hedge = self._send_in_slot if self.concurrency_controller is not None else self._send_within_window
+        try:
+            self._acquire(endpoint) # hedged requests count against the rate limit
+        except BaseException as err:
+            if self.concurrency_controller is not None:
+                self.concurrency_controller.release(0, failed=True)
+            raise err
+        if primary.done():
+            # the primary request was answered while the hedge waited for the rate limiter
+            if self.concurrency_controller is not None:
+                self.concurrency_controller.release(0, failed=True)
+            return primary.result()
+        if self.metrics is not None:
+            self.metrics.record_event(endpoint, 'hedged')
+        hedge = self._hedge_executor.submit(send, endpoint, send_hedge, method, url, *args, **kwargs)
+        (done, pending) = wait([ primary, hedge ], return_when=FIRST_COMPLETED)
+        (first, other) = (primary, hedge) if primary in done else (hedge, primary)
+        if first.exception() is not None:
+            # the slower request is used if the faster one failed
+            (first, other) = (other, first)
+        else:
+            other.add_done_callback(self._discard_response)
+
+        self.hedger.record_hedge(won=first is hedge)
+        self.logger.debug('Hedged request to \'%s\' after %.2f seconds (hedged: %d, hedge answered first: %d)',
+                          endpoint, hedge_delay, self.hedger.hedged_requests, self.hedger.hedge_wins)
+        return first.result()
+
+
+    def _send_and_record_latency(self, endpoint, send, method, url, *args, **kwargs):
+        # `send` sends the request (e.g., within the concurrency window)
+        started = monotonic()
+        response = send(method, url, *args, **kwargs)
+        if response.status_code < 400:
+            self.hedger.record_latency(endpoint, monotonic() - started)
+        return response
+
+
+    @staticmethod
+    def _discard_response(future):
+        if future.exception() is None:
+            future.result().close()
+
+
+    def _send_within_window(self, method, url, *args, **kwargs):
+        if self.concurrency_controller is None:
+            return self.get_thread_session().request(method, url, *args, **kwargs)
+
+        self.concurrency_controller.acquire(
+            priority=RequestScheduler.priority_classes.index(RequestScheduler.current_class()))
+        return self._send_in_slot(method, url, *args, **kwargs)
+
+
+    def _send_in_slot(self, method, url, *args, **kwargs):
+        # sends a request which already has a slot in the concurrency window, releasing the slot once answered
+        started = monotonic()
+        response = None
+        try:
+            response = self.get_thread_session().request(method, url, *args, **kwargs)
+            return response
+        finally:
+            self.concurrency_controller.release(
+                monotonic() - started,
+                throttled=response is not None and response.status_code == 429,
+                failed=response is None or response.status_code >= 500)
+
+
+    @staticmethod
+    def endpoint_name(method, url):
+        # e.g., 'GET https://api.spotify.com/v1/playlists/<playlist ID>/tracks?offset=100'
+        #       is named 'GET playlists/{id}/tracks'
+        path = re.sub('^https?://[^/]+(/v1)?/', '', url).split('?')[0]
+        path = re.sub('(^|/)[A-Za-z0-9]{22}(?=/|$)', '\\1{id}', path)
+        return '%s %s' % (method.upper(), path)
+
+
+    @staticmethod
+    def _build_cached_response(not_modified_response, cached):
+        # the response is given to the API client as if Spotify had sent the cached content again
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.url = not_modified_response.url
+        response.request = not_modified_response.request
+        response.headers = requests.structures.CaseInsensitiveDict(not_modified_response.headers)
+        response.headers['ETag'] = cached['etag']
+        if cached['content_type'] is not None:
+            response.headers['Content-Type'] = cached['content_type']
+        response.encoding = 'utf-8'
+        response._content = cached['content'].encode('utf-8')
+        not_modified_response.close()
+        return response
+
+
+    @staticmethod
+    def response_cache_key(url, kwargs):
+        params = kwargs['params'] if 'params' in kwargs.keys() and isinstance(kwargs['params'], dict) else {}
+        return '%s?%s' % (url, urlencode(sorted((str(key), str(val)) for key, val in params.items())))
+
+
+    @staticmethod
+    def request_key(method, url, kwargs):
+        # requests are identical if they are sent to the same URL with the same parameters and token
+        params = kwargs['params'] if 'params' in kwargs.keys() and isinstance(kwargs['params'], dict) else {}
+        headers = kwargs['headers'] if 'headers' in kwargs.keys() and isinstance(kwargs['headers'], dict) else {}
+        return (method.upper(), url, tuple(sorted((str(key), str(val)) for key, val in params.items())),
+                headers['Authorization'] if 'Authorization' in headers.keys() else None)
+
+
+    @staticmethod
+    def get_retry_after(response, default=1.0):
+        try:
+            return max(0.0, float(response.headers['Retry-After']))
+        except (KeyError, TypeError, ValueError):
+            return default
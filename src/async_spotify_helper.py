@@ -0,0 +1,56 @@
+import asyncio
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from src.spotify_helper import SpotifyHelper
+from src.request_scheduler import RequestScheduler
+from src.watchdog import Watchdog
+
+class AsyncSpotifyHelper:
+    # asyncio counterpart of SpotifyHelper which allows many playlists to be moderated at the same
+    # time from one event loop. Requests are still sent by the (shared) spotipy client, so each
+    # blocking call is made in a worker thread and remains subject to the client's rate limit,
+    # adaptive concurrency, retries and connection pool
+
+    def __init__(self, logger, api=None, max_workers=None):
+        self.logger = logger.getChild('AsyncSpotifyHelper')
+        self.spotify_helper = SpotifyHelper(logger, api=api)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+
+    @property
+    def api(self):
+        return self.spotify_helper.api
+
+
+    async def call(self, func, *args, **kwargs):
+        # runs a blocking function (e.g., a method of the API client) without blocking the event loop,
+        # with the priority class and cancellation event (see Watchdog) of the caller
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, Watchdog.bind(RequestScheduler.bind(partial(func, *args, **kwargs))))
+
+
+    async def get_all_collab_playlists(self, creator_id, api=None):
+        return await self.call(self.spotify_helper.get_all_collab_playlists, creator_id, api=api)
+
+
+    async def get_all_items_in_playlist(self, playlist_id, fields=None, api=None, total=None):
+        return await self.call(self.spotify_helper.get_all_items_in_playlist,
+                               playlist_id, fields=fields, api=api, total=total)
+
+
+    async def add_items_to_playlist(self, playlist_id, items, api=None, **kwargs):
+        return await self.call(self.spotify_helper.add_items_to_playlist, playlist_id, items, api=api, **kwargs)
+
+
+    async def remove_items_from_playlist(self, playlist_id, items, api=None, **kwargs):
+        # e.g., the snapshot ID of the playlist the positions of the items refer to
+        return await self.call(self.spotify_helper.remove_items_from_playlist, playlist_id, items, api=api, **kwargs)
+
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+    get_playlist_id = staticmethod(SpotifyHelper.get_playlist_id)
+    get_track_id = staticmethod(SpotifyHelper.get_track_id)
@@ -0,0 +1,232 @@
+from time import sleep
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from src.retry_policy import RetryPolicy
+from src.request_scheduler import RequestScheduler
+from src.watchdog import Watchdog
+
+class BulkWriteError(Exception):
+    # Raised when a bulk write stopped part of the way through. The write records which of its
+    # chunks were applied, so it can be resumed (with `resume`) from its first unapplied chunk
+
+    def __init__(self, write, cause):
+        super().__init__('%d of %d items were written to playlist before the write failed: %s (PID: %s)'
+                         % (len(write.applied_items), len(write.items), cause, write.playlist_id))
+        self.write = write
+        self.cause = cause
+
+
+    def resume(self):
+        return self.write.run()
+
+
+class BulkPlaylistWrite:
+    # Adds or removes any number of items to or from a playlist in chunks of at most 100 items (the
+    # most Spotify accepts per request), recording the progress of each chunk.
+    # The positions of items to remove refer to one snapshot of the playlist (whose ID is sent with
+    # every chunk), so chunks of removals can be applied in any order and sending a chunk again
+    # does not remove anything else: they are sent up to `max_parallel` at a time and a chunk
+    # which failed is sent again when the write is resumed (if the snapshot ID is unknown, chunks
+    # are sent one at a time, with positions moved up by the items removed by the chunks before them).
+    # Chunks of additions are sent one at a time, in order, at explicit positions (if a position
+    # is given), as each chunk's position depends on the chunks before it
+
+    max_items_per_chunk = 100
+
+    def __init__(self, spotify_helper, api, playlist_id, operation, items, snapshot_id=None, position=None,
+                 max_parallel=1):
+        # `operation` is 'add' (for items with a URI) or 'remove' (for items with a URI and position)
+        if operation not in [ 'add', 'remove' ]:
+            raise ValueError('Unknown playlist write operation \'%s\'' % operation)
+        self.spotify_helper = spotify_helper
+        self.logger = spotify_helper.logger.getChild('BulkPlaylistWrite')
+        self.api = api
+        self.playlist_id = playlist_id
+        self.operation = operation
+        self.items = list(items)
+        # additions: the playlist's snapshot ID after the last applied chunk (or before the first)
+        # removals: the snapshot ID the positions of the items refer to
+        self.snapshot_id = snapshot_id
+        self.position = position
+        self.max_parallel = max_parallel
+        self.chunks = self._split(self.items)
+        # the playlist's snapshot ID after the chunk which was applied last (if it is known)
+        self.last_snapshot_id = None
+        self._started = False
+        self._anchored = False
+
+
+    @property
+    def is_complete(self):
+        return all([ chunk['applied'] for chunk in self.chunks ])
+
+
+    @property
+    def applied_items(self):
+        return [ item for chunk in self.chunks if chunk['applied'] for item in chunk['items'] ]
+
+
+    @property
+    def unapplied_items(self):
+        return [ item for chunk in self.chunks if not chunk['applied'] for item in chunk['items'] ]
+
+
+    @property
+    def next_chunk(self):
+        # the index of the first unapplied chunk (or None if every chunk was applied)
+        return next((index for (index, chunk) in enumerate(self.chunks) if not chunk['applied']), None)
+
+
+    def run(self):
+        # applies every chunk which has not been applied yet (so also resumes a write which failed)
+        # and returns the playlist's snapshot ID after the last chunk was applied (if it is known)
+        if len(self.chunks) == 0:
+            return None
+        if not self._started:
+            self._started = True
+            # positions only need to be anchored to a snapshot if it is older than the playlist or
+            # the playlist changes (i.e., another chunk is applied) before they are applied
+            self._anchored = self.operation == 'remove' and (self.snapshot_id is not None or len(self.chunks) > 1)
+            if self.snapshot_id is None:
+                self.snapshot_id = self.spotify_helper._get_snapshot_id(self.playlist_id, self.api)
+            self._anchored = self._anchored and self.snapshot_id is not None
+        elif not self.is_complete:
+            self.logger.info('Resuming write to playlist from chunk %d of %d (PID: %s)',
+                             self.next_chunk + 1, len(self.chunks), self.playlist_id)
+            if self.operation == 'add':
+                self._check_failed_addition()
+
+        if self.operation == 'add':
+            self._add_chunks()
+        elif self._anchored and self.max_parallel > 1 and len(self.chunks) > 1:
+            self._remove_chunks_in_parallel()
+        else:
+            for chunk in self.chunks:
+                if not chunk['applied']:
+                    self._apply(chunk, self._remove_chunk)
+        return self.last_snapshot_id
+
+
+    def _split(self, items):
+        return [
+            {
+                'items': items[lbound:lbound + self.max_items_per_chunk],
+                'applied': False,
+                'snapshot_id': None # the playlist's snapshot ID after the chunk was applied (if known)
+            } for lbound in range(0, len(items), self.max_items_per_chunk)
+        ]
+
+
+    def _add_chunks(self):
+        for (index, chunk) in enumerate(self.chunks):
+            if chunk['applied']:
+                continue
+            uris = [ item['uri'] for item in chunk['items'] ]
+            position = self.position + index * self.max_items_per_chunk if self.position is not None else None
+            args = [ self.playlist_id, uris ] + ([ position ] if position is not None else [])
+            # a failed chunk is only sent again if the playlist's snapshot ID shows it was not applied
+            self._apply(chunk, lambda chunk: self.spotify_helper._write_to_playlist(
+                self.playlist_id, self.snapshot_id, self.api, self.api.playlist_add_items, *args,
+                is_applied=lambda playlist_uris: self._contains_addition(playlist_uris, uris, position)))
+            self.snapshot_id = chunk['snapshot_id']
+
+
+    def _remove_chunks_in_parallel(self):
+        # The last chunk is only sent once the others were applied, so that the snapshot ID it
+        # returns is the playlist's snapshot ID after the whole write
+        pending = [ chunk for chunk in self.chunks if not chunk['applied'] ]
+        errors = []
+        # the priority class of requests is kept per thread, so it is passed on to the workers
+        apply = Watchdog.bind(RequestScheduler.bind(lambda chunk: self._apply(chunk, self._remove_chunk)))
+
+        if len(pending) > 1:
+            with ThreadPoolExecutor(max_workers=min(self.max_parallel, len(pending) - 1)) as executor:
+                futures = [ executor.submit(apply, chunk) for chunk in pending[:-1] ]
+                # every chunk is sent (even if another failed) so that as much progress as possible is made
+                errors = [ future.exception() for future in futures if future.exception() is not None ]
+        try:
+            self._apply(pending[-1], self._remove_chunk)
+        except BulkWriteError as err:
+            errors.append(err)
+        if len(errors) > 0:
+            raise errors[0]
+
+
+    def _remove_chunk(self, chunk):
+        if not self._anchored:
+            # the positions refer to the playlist before the write, so they are re-anchored to the
+            # playlist after the chunks which were applied so far
+            applied = sorted([ item['position'] for item in self.applied_items ])
+            items_with_pos = [ { 'uri': item['uri'], 'positions': [ item['position'] - bisect_left(applied, item['position']) ] }
+                               for item in chunk['items'] ]
+            return self.spotify_helper._write_to_playlist(
+                self.playlist_id, self.snapshot_id, self.api,
+                self.api.playlist_remove_specific_occurrences_of_items, self.playlist_id, items_with_pos,
+                is_applied=lambda playlist_uris: self._contains_removal(
+                    playlist_uris, [ item['uri'] for item in chunk['items'] ]))
+
+        # removals anchored to a snapshot are idempotent, so they are simply retried
+        items_with_pos = [ { 'uri': item['uri'], 'positions': [ item['position'] ] } for item in chunk['items'] ]
+        attempt = 0
+        while True:
+            try:
+                response = self.api.playlist_remove_specific_occurrences_of_items(
+                    self.playlist_id, items_with_pos, snapshot_id=self.snapshot_id)
+                return response['snapshot_id'] if isinstance(response, dict) and 'snapshot_id' in response.keys() else None
+            except Exception as err:
+                retry_policy = self.spotify_helper.retry_policy
+                if not RetryPolicy.is_transient_error(err) or attempt >= retry_policy.max_retries:
+                    raise err
+                sleep(retry_policy.delay(attempt))
+                attempt += 1
+                self.logger.warning('Retrying failed removal from playlist (retry %d of %d). Error: \'%s\' (PID: %s)',
+                                    attempt, retry_policy.max_retries, err, self.playlist_id)
+
+
+    def _apply(self, chunk, write_func):
+        try:
+            # abandoned scans stop before their next write (see Watchdog)
+            Watchdog.check_cancelled()
+            chunk['snapshot_id'] = write_func(chunk)
+            self.last_snapshot_id = chunk['snapshot_id']
+        except Exception as err:
+            # a write of a single chunk was either applied or not, so there is no progress to keep
+            if len(self.chunks) == 1:
+                raise err
+            raise BulkWriteError(self, err) from err
+        chunk['applied'] = True
+
+
+    def _check_failed_addition(self):
+        # as when a failed write is retried, the failed chunk was only applied if the playlist changed
+        # and contains the chunk (otherwise it is sent again)
+        if self.snapshot_id is None:
+            return
+        current_snapshot_id = self.spotify_helper._get_snapshot_id(self.playlist_id, self.api)
+        if current_snapshot_id == self.snapshot_id:
+            return
+        index = self.next_chunk
+        chunk = self.chunks[index]
+        position = self.position + index * self.max_items_per_chunk if self.position is not None else None
+        self.snapshot_id = current_snapshot_id
+        if self._contains_addition(self.spotify_helper._get_track_uris(self.playlist_id, self.api),
+                                   [ item['uri'] for item in chunk['items'] ], position):
+            self.logger.warning('Playlist contains failed write - assuming write was applied (PID: %s)',
+                                self.playlist_id)
+            (chunk['applied'], chunk['snapshot_id']) = (True, current_snapshot_id)
+            self.last_snapshot_id = current_snapshot_id
+
+
+    @staticmethod
+    def _contains_addition(playlist_uris, added_uris, position=None):
+        # whether the added URIs are in the playlist in order (at the position they were added at, if given)
+        if position is not None:
+            return playlist_uris[position:position + len(added_uris)] == added_uris
+        return any([ playlist_uris[start:start + len(added_uris)] == added_uris
+                     for start in range(len(playlist_uris) - len(added_uris), -1, -1) ])
+
+
+    @staticmethod
+    def _contains_removal(playlist_uris, removed_uris):
+        # an occurrence of a track which is left in the playlist may or may not be the removed one
+        return len(set(removed_uris).intersection(playlist_uris)) == 0
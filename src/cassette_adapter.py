@@ -0,0 +1,122 @@
+import os
+import gzip
+import json
+import base64
+from collections import deque
+from datetime import timedelta
+from threading import Lock
+from time import monotonic, sleep
+import requests
+
+class CassetteMissError(requests.exceptions.RequestException):
+    pass
+
+
+class CassetteAdapter(requests.adapters.HTTPAdapter):
+    # Transport which records every request sent to Spotify (and its response) to a cassette file,
+    # or which replays the recorded responses without a network connection. Recorded requests are
+    # matched by method, URL and body, and identical requests are answered with their recorded
+    # responses in the order they were recorded so that replays are deterministic.
+    # Replayed responses are delayed by their recorded latency multiplied by `latency_scale`
+    # (i.e., 1 to replay recorded timings, 0 to replay without delays)
+
+    modes = [ 'record', 'replay' ]
+
+    def __init__(self, logger, path, mode='record', latency_scale=1.0, **kwargs):
+        super().__init__(**kwargs)
+        if mode not in self.modes:
+            raise ValueError('Unknown cassette mode \'%s\'' % mode)
+        self.logger = logger.getChild('CassetteAdapter')
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self._lock = Lock()
+        self._recordings = {}
+
+        if self.mode == 'record':
+            if os.path.dirname(self.path) != '':
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # each response is appended to the cassette as it is received (so nothing is lost if
+            # the application exits early), so a previous recording is replaced
+            if os.path.isfile(self.path):
+                os.remove(self.path)
+        else:
+            self._load()
+
+
+    def send(self, request, **kwargs):
+        if self.mode == 'replay':
+            return self._replay(request)
+
+        started = monotonic()
+        response = super().send(request, **kwargs)
+        latency = monotonic() - started
+        self._record(request, response, latency)
+        return response
+
+
+    def _record(self, request, response, latency):
+        recording = {
+            'method': request.method,
+            'url': request.url,
+            'body': self.encode_body(request.body),
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': dict(response.headers),
+            'content': base64.b64encode(response.content).decode('ascii'),
+            'latency': round(latency, 4)
+        }
+        # the body has already been decoded, so it must not be decoded again by the client
+        recording['headers'].pop('Content-Encoding', None)
+        with self._lock:
+            # gzip files can be appended to as a sequence of separately compressed members
+            with gzip.open(self.path, 'at', encoding='utf-8') as cassette:
+                cassette.write(json.dumps(recording) + '\n')
+
+
+    def _replay(self, request):
+        key = self.recording_key(request.method, request.url, self.encode_body(request.body))
+        with self._lock:
+            recordings = self._recordings.get(key)
+            if recordings is None or len(recordings) == 0:
+                raise CassetteMissError('No recorded response for \'%s %s\'' % (request.method, request.url),
+                                        request=request)
+            # the last recorded response is replayed again once all others have been replayed
+            recording = recordings.popleft() if len(recordings) > 1 else recordings[0]
+
+        if self.latency_scale > 0:
+            sleep(recording['latency'] * self.latency_scale)
+
+        response = requests.Response()
+        response.status_code = recording['status']
+        response.reason = recording['reason']
+        response.url = request.url
+        response.request = request
+        response.headers = requests.structures.CaseInsensitiveDict(recording['headers'])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response._content = base64.b64decode(recording['content'])
+        response.elapsed = timedelta(seconds=recording['latency'] * self.latency_scale)
+        return response
+
+
+    def _load(self):
+        num_recordings = 0
+        with gzip.open(self.path, 'rt', encoding='utf-8') as cassette:
+            for line in cassette:
+                recording = json.loads(line)
+                key = self.recording_key(recording['method'], recording['url'], recording['body'])
+                self._recordings.setdefault(key, deque()).append(recording)
+                num_recordings += 1
+        self.logger.debug('Loaded %d recorded responses from \'%s\'', num_recordings, self.path)
+
+
+    @staticmethod
+    def encode_body(body):
+        if body is None:
+            return None
+        return body.decode('utf-8') if isinstance(body, bytes) else str(body)
+
+
+    @staticmethod
+    def recording_key(method, url, body):
+        return (method.upper(), url, body)
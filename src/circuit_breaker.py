@@ -0,0 +1,73 @@
+from threading import Lock
+from time import monotonic
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    # Tracks consecutive failures of requests to one endpoint. Once `failure_threshold` requests
+    # have failed in a row the circuit opens, and requests are refused (without being sent) until
+    # `reset_timeout` seconds have passed. A single trial request is then allowed through: the
+    # circuit closes if it succeeds and opens again if it fails.
+
+    def __init__(self, endpoint, failure_threshold=5, reset_timeout=30):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._trial_in_progress = False
+        self._lock = Lock()
+
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self._opened_at is not None
+
+
+    def allow_request(self):
+        return self._try_request() is not None
+
+
+    def check(self):
+        # returns whether the request is the trial request of the half-open circuit
+        trial = self._try_request()
+        if trial is None:
+            raise CircuitOpenError('Requests to \'%s\' are suspended after %d consecutive failures'
+                                   % (self.endpoint, self.failure_threshold))
+        return trial
+
+
+    def release_trial(self):
+        # the trial request ended without showing whether the endpoint recovered (e.g., it was
+        # throttled or failed unexpectedly), so the circuit stays open and another trial is allowed
+        with self._lock:
+            self._trial_in_progress = False
+
+
+    def _try_request(self):
+        # returns None if the request is refused, or whether it is the trial request
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if monotonic() - self._opened_at < self.reset_timeout or self._trial_in_progress:
+                return None
+            self._trial_in_progress = True
+            return True
+
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+            self._opened_at = None
+            self._trial_in_progress = False
+
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._trial_in_progress or self._consecutive_failures >= self.failure_threshold:
+                self._opened_at = monotonic()
+            self._trial_in_progress = False
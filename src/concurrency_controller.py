@@ -0,0 +1,93 @@
+from itertools import count
+from threading import Condition
+from time import monotonic
+
+class ConcurrencyController:
+    # Limits the number of requests in flight to a window which is adjusted using AIMD (additive
+    # increase, multiplicative decrease): the window grows by roughly one request for each window
+    # of healthy responses, and is cut (e.g., halved) when a response is throttled or is much
+    # slower than usual. Throughput therefore tracks whatever share of the API quota is available.
+    # When the window is full, a free slot goes to the waiting request with the highest priority
+    # (the lowest number, e.g., the index of its class in RequestScheduler.priority_classes) and
+    # then to the one which has waited the longest.
+
+    def __init__(self, logger, max_window, min_window=1, initial_window=None, decrease_factor=0.5,
+                 latency_spike_ratio=3.0, latency_smoothing=0.2):
+        self.logger = logger.getChild('ConcurrencyController')
+        self.max_window = max_window
+        self.min_window = min_window
+        self.decrease_factor = decrease_factor
+        self.latency_spike_ratio = latency_spike_ratio
+        self.latency_smoothing = latency_smoothing
+        self._window = float(initial_window if initial_window is not None else min_window)
+        self._in_flight = 0
+        self._typical_latency = None
+        self._last_decrease = 0
+        self._waiting = []
+        self._tickets = count()
+        self._condition = Condition()
+
+
+    @property
+    def window(self):
+        # the number of requests currently allowed to be in flight at once
+        with self._condition:
+            return max(self.min_window, int(self._window))
+
+
+    @property
+    def in_flight(self):
+        with self._condition:
+            return self._in_flight
+
+
+    def acquire(self, priority=0):
+        entry = (priority, next(self._tickets))
+        with self._condition:
+            self._waiting.append(entry)
+            try:
+                while (self._in_flight >= max(self.min_window, int(self._window))
+                       or min(self._waiting) is not entry):
+                    self._condition.wait()
+            finally:
+                self._waiting.remove(entry)
+                # the next waiting request may be let through if the window is not yet full
+                self._condition.notify_all()
+            self._in_flight += 1
+
+
+    def try_acquire(self):
+        # takes a slot only if one is free and no other request is waiting for one (e.g., for a
+        # hedged request, which should not hold back the requests it competes with)
+        with self._condition:
+            if self._in_flight >= max(self.min_window, int(self._window)) or len(self._waiting) > 0:
+                return False
+            self._in_flight += 1
+            return True
+
+
+    def release(self, latency, throttled=False, failed=False):
+        with self._condition:
+            self._in_flight -= 1
+            previous_window = int(self._window)
+
+            latency_spiked = (self._typical_latency is not None
+                              and latency > self._typical_latency * self.latency_spike_ratio)
+            if throttled or latency_spiked:
+                # responses to requests sent before a decrease should not cause further decreases
+                if monotonic() - self._last_decrease > (self._typical_latency or 0):
+                    self._window = max(float(self.min_window), self._window * self.decrease_factor)
+                    self._last_decrease = monotonic()
+            elif not failed:
+                self._window = min(float(self.max_window), self._window + 1 / self._window)
+
+            if not throttled and not failed:
+                # spikes are included so that a lasting change in latency becomes the new norm
+                self._typical_latency = (latency if self._typical_latency is None
+                                         else (1 - self.latency_smoothing) * self._typical_latency
+                                              + self.latency_smoothing * latency)
+
+            if int(self._window) != previous_window:
+                self.logger.debug('Concurrency window changed from %d to %d (in flight: %d)',
+                                  previous_window, int(self._window), self._in_flight)
+            self._condition.notify_all()
@@ -5,10 +5,11 @@ from src.spotify_helper import SpotifyHelper
 
 class ConfigValidator:
 
-    def __init__(self, playlist={}, log={}, account={}):
+    def __init__(self, playlist={}, log={}, account={}, api={}):
         self.playlist = playlist
         self.log = log
         self.account = account
+        self.api = api
 
         self.logger = logging.getLogger('ConfigValidator')
         handler = logging.StreamHandler()
@@ -18,7 +19,8 @@ class ConfigValidator:
 
 
     def is_valid(self):
-        return self.validate_playlist_config() and self.validate_log_config() and self.validate_account_config()
+        return (self.validate_playlist_config() and self.validate_log_config()
+                and self.validate_account_config() and self.validate_api_config())
 
 
     def validate_account_config(self):
@@ -37,6 +39,81 @@ class ConfigValidator:
         return True
 
 
+    def validate_api_config(self):
+        # all API settings are optional
+        if not isinstance(self.api, dict):
+            self.logger.error('`API_CONFIG` is invalid - it must be a dictionary of API settings')
+            return False
+
+        for field in [ 'MAX_PARALLEL_REQUESTS', 'RATE_LIMIT_BURST', 'CONNECTION_POOL_SIZE', 'MAX_CONCURRENT_PLAYLISTS',
+                       'RESPONSE_CACHE_SIZE', 'TRACK_METADATA_CACHE_SIZE' ]:
+            if (field in self.api.keys()
+                and (not isinstance(self.api[field], int) or isinstance(self.api[field], bool)
+                     or self.api[field] < 1)):
+                self.logger.error('`API_CONFIG.%s` is invalid - it must be a positive integer', field)
+                self.logger.error('Please appropriately update this option in `data/config.yaml`')
+                return False
+
+        if ('MAX_RETRIES' in self.api.keys()
+            and (not isinstance(self.api['MAX_RETRIES'], int) or isinstance(self.api['MAX_RETRIES'], bool)
+                 or self.api['MAX_RETRIES'] < 0)):
+            self.logger.error('`API_CONFIG.MAX_RETRIES` is invalid - it must be a non-negative integer')
+            self.logger.error('Please appropriately update this option in `data/config.yaml`')
+            return False
+
+        for field in [ 'ADAPTIVE_CONCURRENCY', 'KEEP_ALIVE', 'HEDGE_READS', 'RESPONSE_CACHE', 'PLAYLIST_SNAPSHOTS',
+                       'TRACK_METADATA_CACHE', 'SKIP_UNCHANGED_PLAYLISTS', 'STATE_STORE',
+                       'PLAYLIST_REGISTRY', 'API_METRICS', 'PRIORITY_SCHEDULING' ]:
+            if field in self.api.keys() and not isinstance(self.api[field], bool):
+                self.logger.error('`API_CONFIG.%s` is invalid - it must be set to a Boolean value (either True or False)', field)
+                self.logger.error('Please appropriately update this option in `data/config.yaml`')
+                return False
+
+        for field in [ 'RATE_LIMIT', 'PLAYLIST_REGISTRY_TTL', 'CONNECT_TIMEOUT', 'READ_TIMEOUT' ]:
+            if (field in self.api.keys()
+                and (not isinstance(self.api[field], (int, float)) or isinstance(self.api[field], bool)
+                     or self.api[field] <= 0)):
+                self.logger.error('`API_CONFIG.%s` is invalid - it must be a positive number', field)
+                self.logger.error('Please appropriately update this option in `data/config.yaml`')
+                return False
+
+        for field in [ 'RESPONSE_CACHE_PATH', 'TRACK_METADATA_CACHE_PATH', 'STATE_STORE_PATH',
+                       'PLAYLIST_REGISTRY_PATH', 'CASSETTE_PATH' ]:
+            if (field in self.api.keys()
+                and (not isinstance(self.api[field], str) or self.api[field] == '')):
+                self.logger.error('`API_CONFIG.%s` is invalid - it must be set to a valid file system path', field)
+                self.logger.error('Please appropriately update this option in `data/config.yaml`')
+                return False
+
+        if ('HEDGE_PERCENTILE' in self.api.keys()
+            and (not isinstance(self.api['HEDGE_PERCENTILE'], (int, float)) or isinstance(self.api['HEDGE_PERCENTILE'], bool)
+                 or self.api['HEDGE_PERCENTILE'] <= 0 or self.api['HEDGE_PERCENTILE'] >= 100)):
+            self.logger.error('`API_CONFIG.HEDGE_PERCENTILE` is invalid - it must be a number between 0 and 100')
+            self.logger.error('Please appropriately update this option in `data/config.yaml`')
+            return False
+
+        if 'CASSETTE_MODE' in self.api.keys() and self.api['CASSETTE_MODE'] not in [ 'off', 'record', 'replay' ]:
+            self.logger.error('`API_CONFIG.CASSETTE_MODE` is invalid - it must be one of: off, record, replay')
+            self.logger.error('Please appropriately update this option in `data/config.yaml`')
+            return False
+
+        for field in [ 'PLAYLIST_TIME_BUDGET', 'ITERATION_TIME_BUDGET' ]:
+            if (field in self.api.keys()
+                and (not isinstance(self.api[field], (int, float)) or isinstance(self.api[field], bool)
+                     or self.api[field] < 0)):
+                self.logger.error('`API_CONFIG.%s` is invalid - it must be a non-negative number (0 for no limit)', field)
+                self.logger.error('Please appropriately update this option in `data/config.yaml`')
+                return False
+
+        if ('CASSETTE_LATENCY_SCALE' in self.api.keys()
+            and (not isinstance(self.api['CASSETTE_LATENCY_SCALE'], (int, float))
+                 or isinstance(self.api['CASSETTE_LATENCY_SCALE'], bool) or self.api['CASSETTE_LATENCY_SCALE'] < 0)):
+            self.logger.error('`API_CONFIG.CASSETTE_LATENCY_SCALE` is invalid - it must be a non-negative number')
+            self.logger.error('Please appropriately update this option in `data/config.yaml`')
+            return False
+        return True
+
+
     def validate_log_config(self):
         required = [
             'FILE',
@@ -159,14 +236,18 @@ class ConfigValidator:
         return True
 
 
-    def all_protected_playlists_exist(self, api_client):
+    def all_protected_playlists_exist(self, api_client, playlist_registry=None):
         if ('PROTECTED_PLAYLISTS' not in self.playlist.keys()
             or not isinstance(self.playlist['PROTECTED_PLAYLISTS'], list)):
             self.logger.error('`PLAYLIST_CONFIG.PROTECTED_PLAYLISTS is invalid - it must be a list`')
             return False
 
-        helper = SpotifyHelper(self.logger, api=api_client)
-        collab_playlists = helper.get_all_collab_playlists(self.account['USERNAME'])
+        if playlist_registry is not None:
+            # the listing is then reused by the first iteration of playlist moderation
+            collab_playlists = playlist_registry.get_collab_playlists(self.account['USERNAME'], api_client)
+        else:
+            helper = SpotifyHelper(self.logger, api=api_client)
+            collab_playlists = helper.get_all_collab_playlists(self.account['USERNAME'])
         collab_pl_uris = [ pl['uri'] for pl in collab_playlists ]
 
         for playlist in self.playlist['PROTECTED_PLAYLISTS']:
@@ -0,0 +1,29 @@
+import spotipy
+from src.fake_spotify_server import FakeSpotifyServer
+
+class FakeSpotify(spotipy.client.Spotify):
+    # In-process stand-in for the API client whose requests are answered directly by the in-memory
+    # model of the fake Spotify Web API (i.e., without sockets, latency or injected faults) so that
+    # the moderation logic can be benchmarked on synthetic workloads using only the CPU.
+    # Every request of spotipy's methods (e.g., `playlist_items`, `current_user_playlists` and
+    # `playlist_remove_specific_occurrences_of_items`) is made through `_internal_call`, so requests
+    # are built exactly as they are for Spotify
+
+    def __init__(self, logger, server=None, user_id='fakeuser', seed=None):
+        super().__init__(auth='fake-token', requests_session=False)
+        self.logger = logger.getChild('FakeSpotify')
+        # the model may be shared with a fake API which is served over HTTP
+        self.server = server if server is not None else FakeSpotifyServer(logger, user_id=user_id, seed=seed)
+
+
+    @property
+    def request_counts(self):
+        return self.server.request_counts
+
+
+    def _internal_call(self, method, url, payload, params):
+        (status, content) = self.server.call(method, url, params=params, payload=payload)
+        if status >= 400:
+            raise spotipy.exceptions.SpotifyException(
+                status, -1, '%s:\n %s' % (url, content['error']['message']), headers={})
+        return content
@@ -0,0 +1,608 @@
+import re
+import sys
+import json
+import base64
+import random
+import string
+import hashlib
+import logging
+import argparse
+from datetime import datetime, timezone, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock
+from time import sleep
+from urllib.parse import urlsplit, parse_qs, urlencode
+import spotipy
+from src.api_session import ApiSession
+
+class FakeSpotifyServer:
+    # Local stand-in for the subset of Spotify's Web API used by the moderator (the current user's
+    # playlists, playlists, playlist items and tracks) which is backed by an in-memory model so that
+    # the real client stack (i.e., spotipy, the API session and the Spotify helper) can be load
+    # tested without a network connection.
+    # Responses are delayed by latencies sampled from a configurable distribution (per endpoint if
+    # required), and throttling (429) and server errors (5xx) are injected at configurable rates.
+    # As on Spotify, every write gives a playlist a new snapshot ID, and positions of items to remove
+    # may refer to an earlier snapshot of the playlist (if the snapshot ID is given)
+
+    distributions = [ 'constant', 'uniform', 'triangular', 'gauss', 'lognormvariate', 'expovariate',
+                      'paretovariate', 'weibullvariate' ]
+    server_error_statuses = [ 500, 502, 503 ]
+    max_snapshots = 100 # number of earlier snapshots of each playlist which writes may refer to
+    max_playlists_per_page = 50
+    max_items_per_page = 100
+    max_tracks_per_request = 50
+    max_items_per_write = 100
+    added_at_start = datetime(2020, 1, 1, tzinfo=timezone.utc) # when the items of populated playlists were added
+
+    def __init__(self, logger, host='127.0.0.1', port=0, user_id='fakeuser', latency=None,
+                 throttle_rate=0.0, error_rate=0.0, retry_after=1, seed=None):
+        # `latency` is either one distribution or a dictionary of distributions per endpoint
+        # (e.g., 'GET playlists/{id}/tracks') which may include a 'default' distribution, where
+        # each distribution is a tuple of the name of a distribution and its parameters
+        # (e.g., ('uniform', 0.01, 0.05) or ('lognormvariate', -3.5, 0.5))
+        self.logger = logger.getChild('FakeSpotifyServer')
+        self.host = host
+        self.port = port
+        self.user_id = user_id
+        self.latency = latency if isinstance(latency, dict) or latency is None else { 'default': latency }
+        for distribution in (self.latency.values() if self.latency is not None else []):
+            if distribution[0] not in self.distributions:
+                raise ValueError('Unknown latency distribution \'%s\'' % distribution[0])
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._random_lock = Lock()
+        self._lock = Lock()
+        self._server = None
+        self._thread = None
+
+        self._tracks = {}
+        self._playlists = {}
+        self._listing = [] # IDs of the user's playlists (the most recently added first)
+        self._next_entry = 0
+        self.request_counts = {}
+
+
+    # ----- Server ----- #
+
+    @property
+    def url(self):
+        return 'http://%s:%d/v1/' % (self.host, self.port)
+
+
+    def start(self):
+        fake_spotify = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1' # connections are kept alive as they are by Spotify
+
+            def do_GET(self):
+                self.respond()
+
+            def do_POST(self):
+                self.respond()
+
+            def do_DELETE(self):
+                self.respond()
+
+            def respond(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length) if length > 0 else None
+                (status, headers, content) = fake_spotify.handle(self.command, self.path, self.headers, body)
+                self.send_response(status)
+                for (name, value) in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                if len(content) > 0:
+                    self.wfile.write(content)
+
+            def log_message(self, log_format, *args):
+                fake_spotify.logger.debug(log_format, *args)
+
+        self._server = ThreadingHTTPServer((self.host, self.port), RequestHandler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1] # a free port is chosen if the port is 0
+        self._thread = Thread(target=self._server.serve_forever, kwargs={ 'poll_interval': 0.05 }, daemon=True)
+        self._thread.start()
+        self.logger.info('Fake Spotify Web API is listening at %s', self.url)
+        return self
+
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+
+    def client(self, requests_session=None, requests_timeout=5):
+        # returns an API client which sends its requests to this server
+        api = spotipy.Spotify(auth='fake-token', requests_session=requests_session or True,
+                              requests_timeout=requests_timeout, retries=0)
+        api.prefix = self.url
+        return api
+
+
+    # ----- Model ----- #
+
+    def add_track(self, name=None, artists=None):
+        with self._lock:
+            track_id = self._generate_id()
+            self._tracks[track_id] = {
+                'id': track_id,
+                'uri': 'spotify:track:%s' % track_id,
+                'name': name if name is not None else 'Track %d' % (len(self._tracks) + 1),
+                'artists': [ { 'name': artist } for artist in (artists or [ 'Artist %d' % (len(self._tracks) % 100) ]) ]
+            }
+            return self._tracks[track_id]['uri']
+
+
+    def add_playlist(self, name=None, owner_id=None, collaborative=True, items=None):
+        # items are (track URI, ID of the user who added it, optional time it was added) tuples
+        with self._lock:
+            playlist_id = self._generate_id()
+            playlist = {
+                'id': playlist_id,
+                'name': name if name is not None else 'Playlist %d' % (len(self._playlists) + 1),
+                'owner_id': owner_id if owner_id is not None else self.user_id,
+                'collaborative': collaborative,
+                'version': 0,
+                'items': [],
+                'snapshots': {}
+            }
+            for (position, item) in enumerate(items or []):
+                added_at = item[2] if len(item) > 2 else self.added_at_start + timedelta(minutes=position)
+                playlist['items'].append(self._new_item(self._track_id(item[0]), item[1], added_at))
+            self._new_snapshot(playlist)
+            self._playlists[playlist_id] = playlist
+            self._listing.insert(0, playlist_id)
+            return 'spotify:playlist:%s' % playlist_id
+
+
+    def add_items(self, playlist_id, items, position=None):
+        # adds items (as in `add_playlist`) to a playlist as if they were added by other users,
+        # returning the new snapshot ID of the playlist
+        with self._lock:
+            playlist = self._playlists[self._playlist_id(playlist_id)]
+            position = len(playlist['items']) if position is None else position
+            added_at = datetime.now(timezone.utc)
+            playlist['items'][position:position] = [
+                self._new_item(self._track_id(item[0]), item[1], item[2] if len(item) > 2 else added_at)
+                for item in items ]
+            return self._new_snapshot(playlist)
+
+
+    def remove_items(self, playlist_id, positions):
+        # removes the items at the given positions of a playlist as if they were removed by other users,
+        # returning the new snapshot ID of the playlist
+        with self._lock:
+            playlist = self._playlists[self._playlist_id(playlist_id)]
+            positions = set(positions)
+            playlist['items'] = [ item for (position, item) in enumerate(playlist['items'])
+                                  if position not in positions ]
+            return self._new_snapshot(playlist)
+
+
+    def get_playlist_items(self, playlist_id):
+        # returns the (track URI, ID of the user who added it) of each item of a playlist
+        with self._lock:
+            playlist = self._playlists[self._playlist_id(playlist_id)]
+            return [ ('spotify:track:%s' % item['track_id'], item['added_by']) for item in playlist['items'] ]
+
+
+    def get_snapshot_id(self, playlist_id):
+        with self._lock:
+            return self._playlists[self._playlist_id(playlist_id)]['snapshot_id']
+
+
+    def populate(self, num_playlists=1000, num_tracks=10000, playlist_size=100, num_collaborators=3):
+        # adds playlists owned by the user whose items are random tracks added by the user or its collaborators
+        track_uris = [ self.add_track() for track_num in range(0, num_tracks) ]
+        collaborators = [ self.user_id ] + [ 'collaborator%d' % num for num in range(1, num_collaborators + 1) ]
+        with self._random_lock:
+            playlists = [
+                [ (self._random.choice(track_uris), self._random.choice(collaborators))
+                  for position in range(0, playlist_size) ]
+                for playlist_num in range(0, num_playlists)
+            ]
+        return [ self.add_playlist(items=items) for items in playlists ]
+
+
+    # ----- Requests ----- #
+
+    def handle(self, method, path, headers, body=None):
+        # returns the status, headers and content of the response to a request
+        url = urlsplit(path)
+        url_path = url.path.rstrip('/') # e.g., spotipy requests 'tracks/?ids=...'
+        params = dict([ (name, values[-1]) for (name, values) in parse_qs(url.query).items() ])
+        endpoint = ApiSession.endpoint_name(method, self.url + re.sub('^/(v1/)?', '', url_path))
+        with self._lock:
+            self.request_counts[endpoint] = self.request_counts.get(endpoint, 0) + 1
+        self._delay(endpoint)
+
+        fault = self._sample_fault()
+        if fault == 429:
+            return self._error(429, 'API rate limit exceeded', { 'Retry-After': str(self.retry_after) })
+        elif fault is not None and (method == 'GET' or self._sample() < 0.5):
+            return self._error(fault, 'Server error')
+        # a write may also fail after it was applied (so the client cannot know whether it was applied)
+
+        if not str(headers.get('Authorization', '')).startswith('Bearer '):
+            return self._error(401, 'No token provided')
+        try:
+            payload = json.loads(body) if body else {}
+        except ValueError as err:
+            return self._error(400, 'Invalid request: %s' % err)
+        (status, content) = self._answer(method, url_path, params, payload)
+        if fault is not None:
+            return self._error(fault, 'Server error')
+
+        content = json.dumps(content).encode('utf-8') if content is not None else b''
+        response_headers = { 'Content-Type': 'application/json; charset=utf-8' }
+        if method == 'GET' and status == 200:
+            response_headers['ETag'] = '"%s"' % hashlib.md5(content).hexdigest()
+            if headers.get('If-None-Match') == response_headers['ETag']:
+                return (304, { 'ETag': response_headers['ETag'] }, b'')
+        return (status, response_headers, content)
+
+
+    def call(self, method, path, params=None, payload=None):
+        # answers a request within the process (i.e., without latency or injected faults), returning
+        # the status and (decoded) content of the response, where the path may be relative to the API's URL
+        url = urlsplit(path)
+        path = '/v1/' + re.sub('^/?(v1/)?', '', url.path).rstrip('/')
+        # parameters may also be given in the URL (e.g., spotipy requests 'tracks/?ids=...')
+        query_params = dict([ (name, values[-1]) for (name, values) in parse_qs(url.query).items() ])
+        query_params.update(dict([ (name, value) for (name, value) in (params or {}).items() if value is not None ]))
+        params = query_params
+        endpoint = ApiSession.endpoint_name(method, self.url + path[len('/v1/'):])
+        with self._lock:
+            self.request_counts[endpoint] = self.request_counts.get(endpoint, 0) + 1
+        return self._answer(method.upper(), path, params, payload if payload is not None else {})
+
+
+    def _answer(self, method, path, params, payload):
+        try:
+            return self._route(method, path, params, payload)
+        except (ValueError, TypeError, AttributeError, KeyError) as err:
+            return (400, { 'error': { 'status': 400, 'message': 'Invalid request: %s' % err } })
+
+
+    def _route(self, method, path, params, payload):
+        routes = [
+            ('GET', '^/v1/me$', self._get_current_user),
+            ('GET', '^/v1/me/playlists$', self._get_current_user_playlists),
+            ('GET', '^/v1/tracks$', self._get_tracks),
+            ('GET', '^/v1/playlists/([^/]+)$', self._get_playlist),
+            ('GET', '^/v1/playlists/([^/]+)/tracks$', self._get_playlist_items),
+            ('POST', '^/v1/playlists/([^/]+)/tracks$', self._add_playlist_items),
+            ('DELETE', '^/v1/playlists/([^/]+)/tracks$', self._remove_playlist_items)
+        ]
+        for (route_method, route_path, route_handler) in routes:
+            match = re.search(route_path, path)
+            if match is not None and route_method == method:
+                with self._lock:
+                    return route_handler(params, payload, *match.groups())
+        return (404, { 'error': { 'status': 404, 'message': 'Service not found' } })
+
+
+    def _get_current_user(self, params, payload):
+        return (200, { 'id': self.user_id, 'display_name': self.user_id, 'type': 'user' })
+
+
+    def _get_current_user_playlists(self, params, payload):
+        (offset, limit) = self._page_bounds(params, 20, self.max_playlists_per_page)
+        playlists = [ self._simplified_playlist(self._playlists[playlist_id])
+                      for playlist_id in self._listing[offset : offset + limit] ]
+        return (200, self._page(self.url + 'me/playlists', playlists, offset, limit, len(self._listing), params))
+
+
+    def _get_tracks(self, params, payload):
+        track_ids = params['ids'].split(',')
+        if len(track_ids) > self.max_tracks_per_request:
+            raise ValueError('too many IDs requested')
+        return (200, { 'tracks': [ self._track(track_id) if track_id in self._tracks.keys() else None
+                                   for track_id in track_ids ] })
+
+
+    def _get_playlist(self, params, payload, playlist_id):
+        if playlist_id not in self._playlists.keys():
+            return self._not_found()
+        playlist = self._playlists[playlist_id]
+        full_playlist = self._simplified_playlist(playlist)
+        full_playlist['followers'] = { 'href': None, 'total': 0 }
+        full_playlist['tracks'] = self._items_page(playlist, 0, self.max_items_per_page, {})
+        return (200, self.select_fields(full_playlist, params['fields']) if 'fields' in params.keys() else full_playlist)
+
+
+    def _get_playlist_items(self, params, payload, playlist_id):
+        if playlist_id not in self._playlists.keys():
+            return self._not_found()
+        (offset, limit) = self._page_bounds(params, self.max_items_per_page, self.max_items_per_page)
+        page = self._items_page(self._playlists[playlist_id], offset, limit, params)
+        return (200, self.select_fields(page, params['fields']) if 'fields' in params.keys() else page)
+
+
+    def _add_playlist_items(self, params, payload, playlist_id):
+        if playlist_id not in self._playlists.keys():
+            return self._not_found()
+        playlist = self._playlists[playlist_id]
+        uris = payload['uris'] if isinstance(payload, dict) else payload
+        if len(uris) > self.max_items_per_write:
+            raise ValueError('too many items to add')
+        track_ids = [ self._track_id(uri) for uri in uris ]
+        if any([ track_id not in self._tracks.keys() for track_id in track_ids ]):
+            raise ValueError('unknown track')
+        position = int(params['position']) if 'position' in params.keys() else len(playlist['items'])
+        if position < 0 or position > len(playlist['items']):
+            raise ValueError('position out of range')
+
+        added_at = datetime.now(timezone.utc)
+        playlist['items'][position:position] = [
+            self._new_item(track_id, self.user_id, added_at) for track_id in track_ids ]
+        return (201, { 'snapshot_id': self._new_snapshot(playlist) })
+
+
+    def _remove_playlist_items(self, params, payload, playlist_id):
+        if playlist_id not in self._playlists.keys():
+            return self._not_found()
+        playlist = self._playlists[playlist_id]
+        if len(payload['tracks']) > self.max_items_per_write:
+            raise ValueError('too many items to remove')
+        # positions refer to the given snapshot of the playlist (or its current snapshot if none is given)
+        if 'snapshot_id' in payload.keys() and payload['snapshot_id'] not in playlist['snapshots'].keys():
+            raise ValueError('invalid snapshot ID')
+        base = (playlist['snapshots'][payload['snapshot_id']] if 'snapshot_id' in payload.keys()
+                else playlist['items'])
+
+        removed_entries = set()
+        for track in payload['tracks']:
+            track_id = self._track_id(track['uri'])
+            if 'positions' not in track.keys():
+                removed_entries.update([ item['entry'] for item in base if item['track_id'] == track_id ])
+                continue
+            for position in track['positions']:
+                if position < 0 or position >= len(base) or base[position]['track_id'] != track_id:
+                    raise ValueError('track %s is not at position %d' % (track['uri'], position))
+                removed_entries.add(base[position]['entry'])
+
+        playlist['items'] = [ item for item in playlist['items'] if item['entry'] not in removed_entries ]
+        return (200, { 'snapshot_id': self._new_snapshot(playlist) })
+
+
+    # ----- Responses ----- #
+
+    def _simplified_playlist(self, playlist):
+        return {
+            'id': playlist['id'],
+            'uri': 'spotify:playlist:%s' % playlist['id'],
+            'href': self.url + 'playlists/%s' % playlist['id'],
+            'name': playlist['name'],
+            'type': 'playlist',
+            'public': not playlist['collaborative'],
+            'collaborative': playlist['collaborative'],
+            'owner': { 'id': playlist['owner_id'], 'display_name': playlist['owner_id'], 'type': 'user' },
+            'snapshot_id': playlist['snapshot_id'],
+            'tracks': { 'href': self.url + 'playlists/%s/tracks' % playlist['id'], 'total': len(playlist['items']) }
+        }
+
+
+    def _items_page(self, playlist, offset, limit, params):
+        items = [
+            {
+                'added_at': item['added_at'],
+                'added_by': { 'id': item['added_by'], 'type': 'user', 'uri': 'spotify:user:%s' % item['added_by'] },
+                'is_local': False,
+                'track': self._track(item['track_id'])
+            } for item in playlist['items'][offset : offset + limit]
+        ]
+        return self._page(self.url + 'playlists/%s/tracks' % playlist['id'], items, offset, limit,
+                          len(playlist['items']), params)
+
+
+    def _track(self, track_id):
+        track = dict(self._tracks[track_id])
+        track['type'] = 'track'
+        track['is_local'] = False
+        return track
+
+
+    def _page(self, href, items, offset, limit, total, params):
+        def page_url(page_offset):
+            page_params = dict(params)
+            page_params.update({ 'offset': page_offset, 'limit': limit })
+            return '%s?%s' % (href, urlencode(page_params))
+
+        return {
+            'href': page_url(offset),
+            'items': items,
+            'limit': limit,
+            'offset': offset,
+            'total': total,
+            'next': page_url(offset + limit) if offset + limit < total else None,
+            'previous': page_url(max(0, offset - limit)) if offset > 0 else None
+        }
+
+
+    def _not_found(self):
+        return (404, { 'error': { 'status': 404, 'message': 'Not found.' } })
+
+
+    def _error(self, status, message, headers=None):
+        content = json.dumps({ 'error': { 'status': status, 'message': message } }).encode('utf-8')
+        response_headers = { 'Content-Type': 'application/json; charset=utf-8' }
+        response_headers.update(headers or {})
+        return (status, response_headers, content)
+
+
+    # ----- Helpers ----- #
+
+    def _new_item(self, track_id, added_by, added_at):
+        self._next_entry += 1
+        return {
+            'entry': self._next_entry, # identifies an item across snapshots of its playlist
+            'track_id': track_id,
+            'added_by': added_by,
+            'added_at': added_at.strftime('%Y-%m-%dT%H:%M:%SZ')
+        }
+
+
+    def _new_snapshot(self, playlist):
+        playlist['version'] += 1
+        digest = hashlib.sha1(('%s:%d' % (playlist['id'], playlist['version'])).encode('utf-8')).hexdigest()
+        snapshot_id = base64.b64encode(('%d,%s' % (playlist['version'], digest)).encode('utf-8')).decode('ascii')
+        playlist['snapshot_id'] = snapshot_id
+        playlist['snapshots'][snapshot_id] = list(playlist['items'])
+        while len(playlist['snapshots']) > self.max_snapshots:
+            del playlist['snapshots'][next(iter(playlist['snapshots']))]
+        return snapshot_id
+
+
+    def _generate_id(self):
+        with self._random_lock:
+            return ''.join([ self._random.choice(string.ascii_letters + string.digits) for i in range(0, 22) ])
+
+
+    def _sample(self):
+        with self._random_lock:
+            return self._random.random()
+
+
+    def _sample_fault(self):
+        sample = self._sample()
+        if sample < self.throttle_rate:
+            return 429
+        elif sample < self.throttle_rate + self.error_rate:
+            with self._random_lock:
+                return self._random.choice(self.server_error_statuses)
+        return None
+
+
+    def _delay(self, endpoint):
+        if self.latency is None:
+            return
+        distribution = self.latency.get(endpoint, self.latency.get('default'))
+        if distribution is None:
+            return
+        if distribution[0] == 'constant':
+            latency = distribution[1]
+        else:
+            with self._random_lock:
+                latency = getattr(self._random, distribution[0])(*distribution[1:])
+        if latency > 0:
+            sleep(latency)
+
+
+    @staticmethod
+    def _page_bounds(params, default_limit, max_limit):
+        offset = int(params['offset']) if 'offset' in params.keys() else 0
+        limit = int(params['limit']) if 'limit' in params.keys() else default_limit
+        if offset < 0 or limit < 1 or limit > max_limit:
+            raise ValueError('invalid offset or limit')
+        return (offset, limit)
+
+
+    @staticmethod
+    def _track_id(uri):
+        return uri.split(':')[-1]
+
+
+    @staticmethod
+    def _playlist_id(playlist):
+        return playlist.split(':')[-1]
+
+
+    @classmethod
+    def select_fields(cls, value, fields):
+        # applies Spotify's field selection (e.g., 'items(added_by.id,track(name,uri)),total') to a response
+        selection = {}
+        position = cls._parse_fields(fields, 0, selection)
+        if position != len(fields):
+            raise ValueError('invalid fields \'%s\'' % fields)
+        return cls._apply_selection(value, selection)
+
+
+    @classmethod
+    def _parse_fields(cls, fields, position, selection):
+        # parses a comma-separated list of fields, returning the position after the list
+        position = cls._parse_field(fields, position, selection)
+        while position < len(fields) and fields[position] == ',':
+            position = cls._parse_field(fields, position + 1, selection)
+        return position
+
+
+    @classmethod
+    def _parse_field(cls, fields, position, selection):
+        # a field is selected entirely (None) or only some of its subfields are selected
+        match = re.compile('[^,.()]+').match(fields, position)
+        if match is None:
+            raise ValueError('invalid fields \'%s\'' % fields)
+        (name, position) = (match.group(0).strip(), match.end())
+        subfields = selection[name] if isinstance(selection.get(name), dict) else {}
+        if position < len(fields) and fields[position] == '.':
+            position = cls._parse_field(fields, position + 1, subfields)
+        elif position < len(fields) and fields[position] == '(':
+            position = cls._parse_fields(fields, position + 1, subfields)
+            if position >= len(fields) or fields[position] != ')':
+                raise ValueError('invalid fields \'%s\'' % fields)
+            position += 1
+        else:
+            subfields = None
+        if name not in selection.keys() or selection[name] is not None:
+            selection[name] = subfields
+        return position
+
+
+    @classmethod
+    def _apply_selection(cls, value, selection):
+        if selection is None:
+            return value
+        elif isinstance(value, list):
+            return [ cls._apply_selection(element, selection) for element in value ]
+        elif isinstance(value, dict):
+            return dict([ (name, cls._apply_selection(value[name], subfields))
+                          for (name, subfields) in selection.items() if name in value.keys() ])
+        return value
+
+
+def parse_latency(latency):
+    # e.g., 'uniform,0.01,0.05' is parsed as ('uniform', 0.01, 0.05)
+    parts = latency.split(',')
+    return tuple([ parts[0] ] + [ float(param) for param in parts[1:] ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a fake Spotify Web API for load testing')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8888)
+    parser.add_argument('--playlists', type=int, default=1000, help='number of playlists to create')
+    parser.add_argument('--tracks', type=int, default=10000, help='number of distinct tracks to create')
+    parser.add_argument('--playlist-size', type=int, default=100, help='number of items in each playlist')
+    parser.add_argument('--collaborators', type=int, default=3, help='number of collaborators adding items')
+    parser.add_argument('--latency', type=parse_latency, default=None,
+                        help='latency distribution and its parameters (e.g., \'lognormvariate,-3.5,0.5\')')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fraction of requests answered with 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 5xx')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    server = FakeSpotifyServer(logging.getLogger('spautomod-fake'), host=args.host, port=args.port,
+                               latency=args.latency, throttle_rate=args.throttle_rate,
+                               error_rate=args.error_rate, seed=args.seed)
+    server.populate(num_playlists=args.playlists, num_tracks=args.tracks, playlist_size=args.playlist_size,
+                    num_collaborators=args.collaborators)
+    server.start()
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
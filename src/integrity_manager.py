@@ -1,52 +1,79 @@
 import re
 import os
 import json
+import asyncio
 from time import time, sleep
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
 from inputimeout import inputimeout, TimeoutOccurred
 from src.spotify_helper import SpotifyHelper
+from src.request_scheduler import RequestScheduler
 
 class IntegrityManager:
 
-    def __init__(self, logger, api, config):
+    def __init__(self, logger, api, config, track_resolver=None, state_store=None, change_tracker=None):
         self.logger = logger.getChild('IntegrityManager')
         self.api = api
         self.config = config
         self.spotify_helper = SpotifyHelper(self.logger, api=self.api)
+        self._approval_lock = Lock()
+        # approval requests of playlists moderated concurrently are made one at a time (see `get_unapproved_removals`)
+        self._approval_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='Approval')
+        # if given, the names and artists of backed up tracks are looked up (mostly from its cache)
+        # rather than fetched with every item of the playlist
+        self.track_resolver = track_resolver
+        # if given, the number of items of each backed up playlist is kept
+        self.state_store = state_store
+        # if given, the snapshot ID returned by each restoration is recorded so it is not seen as a change
+        self.change_tracker = change_tracker
 
         # to avoid uncertainty of whether a forward slash needs to be appended to the backup path
         while self.config['BACKUP_PATH'][-1] == '/':
             self.config['BACKUP_PATH'] = self.config['BACKUP_PATH'][:-1]
 
 
-    def run(self, playlist):
+    def run(self, playlist, snapshot=None):
+        # `snapshot` is the playlist as already fetched (and possibly cleaned) during this cycle
+        # returns whether the integrity of the playlist was verified (i.e., nothing was left until later)
         pl_id = self.spotify_helper.get_playlist_id(playlist)
         latest_backup = self.find_latest_backup(pl_id)
         if latest_backup is None:
-            self.logger.info('Playlist has no backup for comparison (PID: %s)', pl_id)
-            self.backup_playlist(pl_id)
-            return
+            return self._back_up_new_playlist(pl_id, snapshot)
 
         self.logger.info('Checking if any tracks were removed (PID: %s)', pl_id)
-        removals = self.get_removals(pl_id, latest_backup)
+        if snapshot is not None:
+            removals = self._find_removals(snapshot.items, latest_backup)
+        else:
+            removals = self.get_removals(pl_id, latest_backup)
         try:
             unapproved_removals = self.get_unapproved_removals(removals, latest_backup['name'])
         except TimeoutOccurred as err:
-            self.logger.warning('No response given for an approval request (PID: %s)', pl_id)
-            self.logger.warning('Skipping track restoration until next run (PID: %s)', pl_id)
-            return
+            return self._skip_restoration(pl_id)
+        return self._restore_and_back_up(pl_id, unapproved_removals, snapshot=snapshot)
 
-        if isinstance(unapproved_removals, list) and len(unapproved_removals) > 0:
-            try:
-                self._restore_removals(pl_id, unapproved_removals)
-            except Exception as err:
-                self.logger.error('Failed to restore unapproved removals (PID: %s). Error: \'%s\'', pl_id, err)
-                return
-            else:
-                self.logger.info('Successfully restored unapproved removals (PID: )', pl_id)
 
-        self.backup_playlist(pl_id)
-        self.manage_redundant_backups(pl_id)
-        self.logger.debug('Completed verification of playlist integrity (PID: %s)', pl_id)
+    async def run_async(self, playlist, async_helper, snapshot=None):
+        # same as `run` but allows other playlists to be moderated while waiting for Spotify (or the user)
+        pl_id = self.spotify_helper.get_playlist_id(playlist)
+        latest_backup = self.find_latest_backup(pl_id)
+        if latest_backup is None:
+            return await async_helper.call(self._back_up_new_playlist, pl_id, snapshot)
+
+        self.logger.info('Checking if any tracks were removed (PID: %s)', pl_id)
+        if snapshot is not None:
+            current_items = snapshot.items
+        else:
+            current_items = await async_helper.get_all_items_in_playlist(
+                pl_id, fields='items.track(uri),total', api=self.api)
+        removals = self._find_removals(current_items, latest_backup)
+        try:
+            # approval requests wait for the user, so they are made by a thread of their own rather
+            # than by one of the (limited number of) workers which moderate playlists
+            unapproved_removals = await asyncio.get_running_loop().run_in_executor(
+                self._approval_executor, self.get_unapproved_removals, removals, latest_backup['name'])
+        except TimeoutOccurred as err:
+            return self._skip_restoration(pl_id)
+        return await async_helper.call(self._restore_and_back_up, pl_id, unapproved_removals, snapshot=snapshot)
 
 
     def find_latest_backup(self, playlist_id):
@@ -69,50 +96,49 @@ class IntegrityManager:
 
 
     def get_removals(self, playlist_id, backup_info):
-        current_items = self.spotify_helper.get_all_items_in_playlist(
-            playlist_id, fields='items.track(uri)', api=self.api)
-        removals = []
-
-        for backup_item in backup_info['items']:
-            still_in_playlist = False
-
-            for current_item in current_items:
-                if backup_item['uri'] == current_item['track']['uri']:
-                    still_in_playlist = True
-                    break
-            if not still_in_playlist:
-                removals.append(backup_item)
-
-        return removals
+        current_items = self.spotify_helper.iter_playlist_items(
+            playlist_id, fields='items.track(uri),total', api=self.api)
+        return self._find_removals(current_items, backup_info)
 
 
     def get_unapproved_removals(self, removals, playlist_name):
         unapproved = []
-        for removal in removals:
-            try:
-                if not self._user_approves_removal(removal, playlist_name, 20):
-                    unapproved.append(removal)
-            except TimeoutOccurred as err:
-                raise err
+        # approval requests for playlists which are moderated concurrently must not be interleaved
+        with self._approval_lock:
+            for removal in removals:
+                try:
+                    if not self._user_approves_removal(removal, playlist_name, 20):
+                        unapproved.append(removal)
+                except TimeoutOccurred as err:
+                    raise err
         return unapproved
 
 
-    def backup_playlist(self, playlist_id):
-        playlist_info = self.api.playlist(playlist_id, fields='name')
-        playlist_items = self.spotify_helper.get_all_items_in_playlist(
-            playlist_id, fields='items(track(name,uri, artists.name)),total', api=self.api)
-        formatted_items = []
+    def backup_playlist(self, playlist_id, snapshot=None):
+        if snapshot is not None:
+            playlist_info = { 'name': snapshot.name }
+            playlist_items = snapshot.items
+        else:
+            with RequestScheduler.priority('background'):
+                playlist_info = self.api.playlist(playlist_id, fields='name')
+                playlist_items = self.spotify_helper.get_all_items_in_playlist(
+                    playlist_id, fields=('items(track(uri)),total' if self.track_resolver is not None
+                                         else 'items(track(name,uri, artists.name)),total'), api=self.api)
 
         self.logger.info('Backing up playlist contents (PID: %s)', playlist_id)
-        for item in playlist_items:
-            formatted_items.append({
-                'name': item['track']['name'],
-                'artists': self._get_artists_string([
-                    artist['name'] for artist in item['track']['artists']
-                ]),
-                'uri': item['track']['uri'],
-                'position': item['position']
-            })
+        if self.track_resolver is not None:
+            formatted_items = self._format_resolved_items(playlist_items)
+        else:
+            formatted_items = []
+            for item in playlist_items:
+                formatted_items.append({
+                    'name': item['track']['name'],
+                    'artists': self._get_artists_string([
+                        artist['name'] for artist in item['track']['artists']
+                    ]),
+                    'uri': item['track']['uri'],
+                    'position': item['position']
+                })
 
         backup = {
             'name': playlist_info['name'],
@@ -126,6 +152,8 @@ class IntegrityManager:
         backup_file.close()
         sleep(0.2) # for stability
         self.logger.debug('Playlist backup was saved successfully (PID: %s)', playlist_id)
+        if self.state_store is not None:
+            self.state_store.update(playlist_id, item_count=len(formatted_items))
 
 
     def manage_redundant_backups(self, playlist_id):
@@ -166,6 +194,67 @@ class IntegrityManager:
         return False
 
 
+    def _back_up_new_playlist(self, playlist_id, snapshot):
+        self.logger.info('Playlist has no backup for comparison (PID: %s)', playlist_id)
+        self._backup_playlist_from_snapshot(playlist_id, snapshot)
+        return True
+
+
+    def _skip_restoration(self, playlist_id):
+        self.logger.warning('No response given for an approval request (PID: %s)', playlist_id)
+        self.logger.warning('Skipping track restoration until next run (PID: %s)', playlist_id)
+        return False
+
+
+    def _restore_and_back_up(self, playlist_id, unapproved_removals, snapshot=None):
+        # the steps of `run` and `run_async` once the removals which were not approved are known
+        if isinstance(unapproved_removals, list) and len(unapproved_removals) > 0:
+            try:
+                self._restore_removals(playlist_id, unapproved_removals, snapshot=snapshot)
+            except Exception as err:
+                self.logger.error('Failed to restore unapproved removals (PID: %s). Error: \'%s\'', playlist_id, err)
+                return False
+            else:
+                self.logger.info('Successfully restored unapproved removals (PID: %s)', playlist_id)
+
+        self._backup_playlist_from_snapshot(playlist_id, snapshot)
+        self.manage_redundant_backups(playlist_id)
+        self.logger.debug('Completed verification of playlist integrity (PID: %s)', playlist_id)
+        return True
+
+
+    def _backup_playlist_from_snapshot(self, playlist_id, snapshot):
+        # the playlist is only fetched again if its snapshot is no longer current
+        if snapshot is not None and snapshot.is_current:
+            self.backup_playlist(playlist_id, snapshot=snapshot)
+        else:
+            self.backup_playlist(playlist_id)
+
+
+    def _find_removals(self, current_items, backup_info):
+        # backed up tracks are crossed off as the current items are received (page by page)
+        missing_uris = set([ backup_item['uri'] for backup_item in backup_info['items'] ])
+        for current_item in current_items:
+            missing_uris.discard(current_item['track']['uri'])
+
+        return [ backup_item for backup_item in backup_info['items'] if backup_item['uri'] in missing_uris ]
+
+
+    def _format_resolved_items(self, playlist_items):
+        metadata = self.track_resolver.resolve([ item['track']['uri'] for item in playlist_items ])
+        formatted_items = []
+        for item in playlist_items:
+            uri = item['track']['uri']
+            formatted_items.append({
+                # a track which cannot be looked up (e.g., a local file) is identified by its URI
+                'name': metadata[uri]['name'] if uri in metadata.keys() else uri,
+                'artists': metadata[uri]['artists'] if uri in metadata.keys() else '',
+                'uri': uri,
+                'position': item['position']
+            })
+        return formatted_items
+
+
     def _get_artists_string(self, artist_names):
         combined = ''
         for name in artist_names:
@@ -175,10 +264,20 @@ class IntegrityManager:
         return combined
 
 
-    def _restore_removals(self, playlist_id, removals):
+    def _restore_removals(self, playlist_id, removals, snapshot=None):
+        # the restored tracks are added to the snapshot (if given) with their backed up details
         for removal in removals:
             self.logger.info('Restoring track \'%s\' (PID: %s)', removal['name'], playlist_id)
-        self.spotify_helper.add_items_to_playlist(playlist_id, removals)
+        try:
+            snapshot_id = self.spotify_helper.add_items_to_playlist(playlist_id, removals)
+        except Exception as err:
+            if snapshot is not None:
+                snapshot.invalidate()
+            raise err
+        if snapshot is not None:
+            snapshot.add_items(removals, snapshot_id=snapshot_id)
+        if self.change_tracker is not None:
+            self.change_tracker.record_write(playlist_id)
 
 
     def _load_backup_from_file(self, filename):
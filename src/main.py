@@ -2,6 +2,11 @@ import os
 import sys
 import logging
 import yaml
+import json
+import hashlib
+import asyncio
+from threading import Event
+from time import time
 from importlib import import_module
 from inputimeout import inputimeout, TimeoutOccurred
 import spotipy
@@ -9,6 +14,15 @@ from src.config_validator import ConfigValidator
 from src.spotify_helper import SpotifyHelper
 from src.integrity_manager import IntegrityManager
 from src.playlist_cleaner import PlaylistCleaner
+from src.retry_policy import RetryPolicy
+from src.async_spotify_helper import AsyncSpotifyHelper
+from src.playlist_snapshot import PlaylistSnapshot
+from src.track_metadata_resolver import TrackMetadataResolver
+from src.playlist_change_tracker import PlaylistChangeTracker
+from src.state_store import StateStore
+from src.playlist_registry import PlaylistRegistry
+from src.watchdog import Watchdog, WatchdogTimeout
+from src.request_scheduler import RequestScheduler
 
 
 def main():
@@ -22,7 +36,8 @@ def main():
     try:
         logger = default_logger() # used for error logging before custom logger can be configured
         (playlist_config, log_config, account_config) = load_configurations(path=get_config_filepath())
-        config_validator = ConfigValidator(playlist_config, log_config, account_config)
+        api_config = load_api_configuration(path=get_config_filepath())
+        config_validator = ConfigValidator(playlist_config, log_config, account_config, api_config)
         if not config_validator.is_valid():
             raise Exception('Invalid configuration file - check \'data/config.yaml\'')
 
@@ -32,14 +47,35 @@ def main():
         api_client = SpotifyHelper(logger).configure_api(
             account_config['CLIENT_ID'],
             account_config['CLIENT_SECRET'],
-            account_config['REDIRECT_URI']
+            account_config['REDIRECT_URI'],
+            api_config=api_config
         )
+        playlist_registry = create_playlist_registry(logger, api_config)
         if not isinstance(api_client, spotipy.client.Spotify):
             raise Exception('Failed to authenticate with Spotify')
-        elif not config_validator.all_protected_playlists_exist(api_client):
+        elif not config_validator.all_protected_playlists_exist(api_client, playlist_registry=playlist_registry):
             raise Exception('Could not find all protected playlists in Spotify')
 
-        moderate_playlists(logger, api_client, account_config['USERNAME'], playlist_config)
+        track_resolver = create_track_resolver(logger, api_client, api_config)
+        state_store = create_state_store(logger, api_config)
+        watchdog = create_watchdog(logger, api_config)
+        moderate_playlists(logger, api_client, account_config['USERNAME'], playlist_config,
+                           max_concurrent_playlists=(api_config['MAX_CONCURRENT_PLAYLISTS']
+                                                     if 'MAX_CONCURRENT_PLAYLISTS' in api_config.keys() else 1),
+                           use_snapshots=(api_config['PLAYLIST_SNAPSHOTS']
+                                          if 'PLAYLIST_SNAPSHOTS' in api_config.keys() else False),
+                           track_resolver=track_resolver,
+                           skip_unchanged=(api_config['SKIP_UNCHANGED_PLAYLISTS']
+                                           if 'SKIP_UNCHANGED_PLAYLISTS' in api_config.keys() else False),
+                           state_store=state_store,
+                           playlist_registry=playlist_registry,
+                           api_metrics=SpotifyHelper.shared_metrics,
+                           request_scheduler=SpotifyHelper.shared_scheduler,
+                           watchdog=watchdog)
+        if state_store is not None:
+            state_store.close()
+        if watchdog is not None:
+            watchdog.close()
 
     except OSError as err:
         logger.error('Error: \'%s\'', err)
@@ -58,15 +94,55 @@ def main():
     exit_with_code(0)
 
 
-def moderate_playlists(logger, api_client, username, playlist_config):
-    playlist_cleaner = PlaylistCleaner(logger, api_client, username, playlist_config)
-    integrity_manager = IntegrityManager(logger, api_client, playlist_config)
+def moderate_playlists(logger, api_client, username, playlist_config, max_concurrent_playlists=1, use_snapshots=False,
+                       track_resolver=None, skip_unchanged=False, state_store=None, playlist_registry=None,
+                       api_metrics=None, watchdog=None, request_scheduler=None):
+    # playlists which have not changed since they were last moderated are skipped (in loop mode,
+    # or also between runs if their state is stored)
+    change_tracker = PlaylistChangeTracker(state_store=state_store) if skip_unchanged else None
+    playlist_cleaner = PlaylistCleaner(logger, api_client, username, playlist_config, track_resolver=track_resolver,
+                                       state_store=state_store, change_tracker=change_tracker)
+    integrity_manager = IntegrityManager(logger, api_client, playlist_config, track_resolver=track_resolver,
+                                         state_store=state_store, change_tracker=change_tracker)
     sp_helper = SpotifyHelper(logger)
+    # track names and artists are not fetched with the playlist if they can be looked up when needed
+    snapshot_fields = PlaylistSnapshot.item_id_fields if track_resolver is not None else None
+    if state_store is not None:
+        forget_snapshot_ids_if_config_changed(logger, state_store, username, playlist_config)
 
     def protect_playlists():
-        # runs one iteration of playlist moderation
-        if playlist_config['PROTECT_ALL']:
-            protected_playlists = sp_helper.get_all_collab_playlists(username, api=api_client)
+        # runs one iteration of playlist moderation, saves the state of the moderated playlists and
+        # summarises the requests made to Spotify during the iteration
+        if watchdog is not None:
+            watchdog.start_iteration()
+        if change_tracker is not None:
+            change_tracker.start_cycle()
+        try:
+            moderate_protected_playlists()
+        finally:
+            if state_store is not None:
+                state_store.commit()
+            if api_metrics is not None:
+                api_metrics.log_summary()
+            if request_scheduler is not None:
+                request_scheduler.log_summary()
+
+    def scan_playlist(playlist):
+        # returns whether the integrity of the playlist was verified
+        if use_snapshots:
+            # the playlist is fetched once and shared by the cleaner and the integrity manager
+            snapshot = fetch_playlist_snapshot(sp_helper, api_client, playlist, fields=snapshot_fields)
+            playlist_cleaner.run(playlist, snapshot=snapshot)
+            return integrity_manager.run(playlist, snapshot=snapshot)
+        playlist_cleaner.run(playlist)
+        return integrity_manager.run(playlist)
+
+    def moderate_protected_playlists():
+        if playlist_config['PROTECT_ALL'] and playlist_registry is not None:
+            protected_playlists = playlist_registry.get_collab_playlists(username, api_client)
+        elif playlist_config['PROTECT_ALL']:
+            # playlists are moderated as they are listed rather than after all have been listed
+            protected_playlists = sp_helper.iter_collab_playlists(username, api=api_client)
         else:
             protected_playlists = []
             for playlist in playlist_config['PROTECTED_PLAYLISTS']:
@@ -74,10 +150,35 @@ def moderate_playlists(logger, api_client, username, playlist_config):
                     for key, val in playlist.items():
                         protected_playlists.append(val)
 
+        if max_concurrent_playlists > 1:
+            asyncio.run(moderate_playlists_concurrently(
+                logger, api_client, playlist_cleaner, integrity_manager, protected_playlists,
+                max_concurrent_playlists, use_snapshots=use_snapshots, snapshot_fields=snapshot_fields,
+                change_tracker=change_tracker, state_store=state_store, watchdog=watchdog))
+            return
+
         for playlist in protected_playlists:
             print('') # newlines between playlists improves readibility of logs
-            playlist_cleaner.run(playlist)
-            integrity_manager.run(playlist)
+            if watchdog is not None and watchdog.iteration_expired():
+                logger.warning('Iteration ran past its time budget - the remaining playlists are skipped until the next iteration')
+                break
+            (pl_id, snapshot_id) = (None, None)
+            if change_tracker is not None or state_store is not None or watchdog is not None:
+                pl_id = sp_helper.get_playlist_id(playlist)
+            started = time()
+            try:
+                if change_tracker is not None:
+                    snapshot_id = get_playlist_snapshot_id(api_client, pl_id, playlist)
+                    if is_unchanged(logger, change_tracker, pl_id, snapshot_id):
+                        continue
+
+                if watchdog is not None:
+                    verified = watchdog.run('Scan of playlist (PID: %s)' % pl_id, scan_playlist, playlist)
+                else:
+                    verified = scan_playlist(playlist)
+                record_scan(change_tracker, state_store, pl_id, snapshot_id, verified, started)
+            except Exception as err:
+                skip_playlist_after_error(logger, state_store, pl_id, err)
 
     if '--loop' in sys.argv or '-l' in sys.argv:
         # For termination of loop mode, the idea is: delays between loop iterations are implemented
@@ -92,6 +193,159 @@ def moderate_playlists(logger, api_client, username, playlist_config):
         protect_playlists()
 
 
+async def moderate_playlists_concurrently(logger, api_client, playlist_cleaner, integrity_manager,
+                                          protected_playlists, max_concurrent_playlists, use_snapshots=False,
+                                          snapshot_fields=None, change_tracker=None, state_store=None,
+                                          watchdog=None):
+    # moderates up to `max_concurrent_playlists` playlists at a time from a single event loop
+    async_helper = AsyncSpotifyHelper(logger, api=api_client, max_workers=max_concurrent_playlists)
+    semaphore = asyncio.Semaphore(max_concurrent_playlists)
+
+    async def scan_playlist(playlist):
+        if use_snapshots:
+            snapshot = await async_helper.call(
+                fetch_playlist_snapshot, async_helper.spotify_helper, api_client, playlist,
+                fields=snapshot_fields)
+            await playlist_cleaner.run_async(playlist, async_helper, snapshot=snapshot)
+            return await integrity_manager.run_async(playlist, async_helper, snapshot=snapshot)
+        await playlist_cleaner.run_async(playlist, async_helper)
+        return await integrity_manager.run_async(playlist, async_helper)
+
+    async def moderate_playlist(playlist):
+        async with semaphore:
+            (pl_id, snapshot_id) = (None, None)
+            if change_tracker is not None or state_store is not None or watchdog is not None:
+                pl_id = async_helper.get_playlist_id(playlist)
+            if watchdog is not None and watchdog.iteration_expired():
+                logger.warning('Skipping playlist as the iteration ran past its time budget (PID: %s)', pl_id)
+                return
+            started = time()
+            try:
+                if change_tracker is not None:
+                    snapshot_id = await async_helper.call(get_playlist_snapshot_id, api_client, pl_id, playlist)
+                    if is_unchanged(logger, change_tracker, pl_id, snapshot_id):
+                        return
+
+                budget = watchdog.budget() if watchdog is not None else None
+                if budget is None:
+                    verified = await scan_playlist(playlist)
+                else:
+                    # the blocking calls of an abandoned scan are left to run, so they are cancelled
+                    # (and are waited for before the next iteration, when the async helper is closed)
+                    cancelled = Event()
+                    try:
+                        with Watchdog.cancellation(cancelled):
+                            verified = await asyncio.wait_for(scan_playlist(playlist), timeout=budget)
+                    except asyncio.TimeoutError:
+                        cancelled.set()
+                        # the threads of the scan (e.g., waiting for Spotify) are not known, so all stacks are logged
+                        raise watchdog.timed_out('Scan of playlist (PID: %s)' % pl_id, budget)
+                record_scan(change_tracker, state_store, pl_id, snapshot_id, verified, started)
+            except Exception as err:
+                skip_playlist_after_error(logger, state_store, pl_id, err)
+
+    try:
+        # the playlists may still need to be listed (if all collaborative playlists are protected)
+        playlists = await async_helper.call(list, protected_playlists)
+        await asyncio.gather(*[ moderate_playlist(playlist) for playlist in playlists ])
+    finally:
+        async_helper.close()
+
+
+def is_unchanged(logger, change_tracker, playlist_id, snapshot_id):
+    if change_tracker.has_changed(playlist_id, snapshot_id):
+        return False
+    logger.info('Skipping playlist as it has not changed since it was last moderated (PID: %s)', playlist_id)
+    return True
+
+
+def record_scan(change_tracker, state_store, playlist_id, snapshot_id, verified, started):
+    # a playlist whose restoration was left until later must be scanned again
+    if change_tracker is not None and verified:
+        change_tracker.record(playlist_id, snapshot_id)
+    if state_store is not None:
+        state_store.record_scan(playlist_id, time(), time() - started)
+
+
+def skip_playlist_after_error(logger, state_store, playlist_id, err):
+    # a playlist which cannot be moderated in time or due to a temporary API problem (which
+    # persisted despite retries) is skipped until the next iteration
+    if isinstance(err, WatchdogTimeout):
+        logger.warning('Skipping playlist until the next iteration: \'%s\'', err)
+    elif RetryPolicy.is_transient_error(err):
+        logger.warning('Skipping playlist until the next iteration due to an API error: \'%s\'', err)
+    else:
+        raise err
+    if state_store is not None:
+        state_store.record_error(playlist_id)
+
+
+def fetch_playlist_snapshot(sp_helper, api_client, playlist, fields=None):
+    # the track total of a listed playlist allows all of its pages to be requested at once
+    total = (playlist['tracks']['total']
+             if isinstance(playlist, dict) and 'tracks' in playlist.keys() else None)
+    return PlaylistSnapshot.fetch(sp_helper, api_client, sp_helper.get_playlist_id(playlist),
+                                  total=total, fields=fields)
+
+
+def get_playlist_snapshot_id(api_client, playlist_id, playlist):
+    # listed playlists already include their snapshot ID, whereas configured playlists need to be fetched
+    if isinstance(playlist, dict) and 'snapshot_id' in playlist.keys():
+        return playlist['snapshot_id']
+    with RequestScheduler.priority('probe'):
+        return api_client.playlist(playlist_id, fields='snapshot_id')['snapshot_id']
+
+
+def create_track_resolver(logger, api_client, api_config):
+    # track details are only looked up separately if enabled (and are then cached on disk if a path is given)
+    if 'TRACK_METADATA_CACHE' not in api_config.keys() or not api_config['TRACK_METADATA_CACHE']:
+        return None
+    return TrackMetadataResolver(
+        logger, api_client,
+        max_entries=(api_config['TRACK_METADATA_CACHE_SIZE']
+                     if 'TRACK_METADATA_CACHE_SIZE' in api_config.keys() else 10000),
+        path=(api_config['TRACK_METADATA_CACHE_PATH']
+              if 'TRACK_METADATA_CACHE_PATH' in api_config.keys() else None))
+
+
+def create_state_store(logger, api_config):
+    # the state of moderated playlists is only kept between runs if enabled
+    if 'STATE_STORE' not in api_config.keys() or not api_config['STATE_STORE']:
+        return None
+    return StateStore(logger, api_config['STATE_STORE_PATH']
+                      if 'STATE_STORE_PATH' in api_config.keys() else 'data/state/state.db')
+
+
+def create_playlist_registry(logger, api_config):
+    # the listing of the user's playlists is only reused if enabled
+    if 'PLAYLIST_REGISTRY' not in api_config.keys() or not api_config['PLAYLIST_REGISTRY']:
+        return None
+    return PlaylistRegistry(
+        logger,
+        ttl=api_config['PLAYLIST_REGISTRY_TTL'] if 'PLAYLIST_REGISTRY_TTL' in api_config.keys() else 300,
+        path=(api_config['PLAYLIST_REGISTRY_PATH']
+              if 'PLAYLIST_REGISTRY_PATH' in api_config.keys() else 'data/state/playlist_registry.json'))
+
+
+def create_watchdog(logger, api_config):
+    # the time taken by each playlist and each iteration is only bounded if a budget is set (0 means no limit)
+    budgets = [ (api_config[field] if field in api_config.keys() and api_config[field] > 0 else None)
+                for field in [ 'PLAYLIST_TIME_BUDGET', 'ITERATION_TIME_BUDGET' ] ]
+    if budgets == [ None, None ]:
+        return None
+    return Watchdog(logger, playlist_budget=budgets[0], iteration_budget=budgets[1])
+
+
+def forget_snapshot_ids_if_config_changed(logger, state_store, username, playlist_config):
+    # a playlist which has not changed may still need to be scanned if it is moderated differently
+    fingerprint = hashlib.sha256(json.dumps([ username, playlist_config ], sort_keys=True, default=str)
+                                 .encode('utf-8')).hexdigest()
+    if state_store.get_metadata('playlist_config') != fingerprint:
+        logger.debug('Playlist configuration has changed so all playlists will be scanned')
+        state_store.forget_snapshot_ids()
+        state_store.set_metadata('playlist_config', fingerprint)
+
+
 def default_logger():
     logger = logging.getLogger('spautomod-default')
     logger.setLevel('INFO')
@@ -167,6 +421,20 @@ def load_configurations(path='data/config.yaml'):
             config_file.close()
 
 
+def load_api_configuration(path='data/config.yaml'):
+    # API_CONFIG is optional (and so are all of its settings) - defaults are used for anything not set
+    config_file = None
+    try:
+        config_file = open(path, 'r')
+        config_data = yaml.load(config_file, Loader=yaml.FullLoader)
+        if isinstance(config_data, dict) and isinstance(config_data.get('API_CONFIG'), dict):
+            return config_data['API_CONFIG']
+        return {}
+    finally:
+        if config_file is not None:
+            config_file.close()
+
+
 def restore_default_config_file():
     config_path = get_config_filepath()
     default_config_path = 'data/.default_config.yaml'
@@ -0,0 +1,63 @@
+from threading import Lock
+
+class PlaylistChangeTracker:
+    # Remembers the snapshot ID each playlist had when it was last moderated. Spotify gives a
+    # playlist a new snapshot ID whenever it is changed, so a playlist with the same snapshot ID
+    # has not changed since it was moderated and does not need to be scanned again.
+    # Snapshot IDs are kept in the state store (if given) so that they are remembered between runs.
+    # The moderator's own writes also change snapshot IDs, but the snapshot ID a write returns may
+    # include changes made by someone else between the scan and the write (which were never
+    # scanned). So nothing is recorded for a playlist which was written to during its moderation,
+    # and it is scanned once more next time (when its snapshot ID is recorded if it needs no writes)
+
+    def __init__(self, state_store=None):
+        self.state_store = state_store
+        self._snapshot_ids = {}
+        self._written = set()
+        self._lock = Lock()
+
+
+    def has_changed(self, playlist_id, snapshot_id):
+        # a playlist whose snapshot ID is not known is assumed to have changed
+        if snapshot_id is None:
+            return True
+        if self.state_store is not None:
+            state = self.state_store.get(playlist_id)
+            return state is None or state['snapshot_id'] != snapshot_id
+        with self._lock:
+            return self._snapshot_ids.get(playlist_id) != snapshot_id
+
+
+    def start_cycle(self):
+        # writes which were not followed by a recorded scan (e.g., the scan failed) are discarded
+        with self._lock:
+            self._written = set()
+
+
+    def record_write(self, playlist_id):
+        # e.g., unauthorized additions were removed from the playlist during its moderation
+        with self._lock:
+            self._written.add(playlist_id)
+
+
+    def record(self, playlist_id, snapshot_id):
+        # `snapshot_id` is the one the playlist had when it was scanned
+        with self._lock:
+            if playlist_id in self._written:
+                self._written.discard(playlist_id)
+                return
+        if snapshot_id is None:
+            return
+        if self.state_store is not None:
+            self.state_store.update(playlist_id, snapshot_id=snapshot_id)
+            return
+        with self._lock:
+            self._snapshot_ids[playlist_id] = snapshot_id
+
+
+    def forget(self, playlist_id):
+        if self.state_store is not None:
+            self.state_store.update(playlist_id, snapshot_id=None)
+            return
+        with self._lock:
+            self._snapshot_ids.pop(playlist_id, None)
@@ -1,66 +1,83 @@
+from src.bulk_playlist_write import BulkWriteError
 from src.spotify_helper import SpotifyHelper
 
 class PlaylistCleaner:
 
-    def __init__(self, logger, api, playlist_creator_id, config):
+    def __init__(self, logger, api, playlist_creator_id, config, track_resolver=None, state_store=None,
+                 change_tracker=None):
         self.logger = logger.getChild('PlaylistCleaner')
         self.api = api
         self.playlist_creator_id = playlist_creator_id
         self.config = config
         self.spotify_helper = SpotifyHelper(self.logger)
-
-    def run(self, playlist):
+        # if given, track names are only looked up for the tracks which are removed
+        self.track_resolver = track_resolver
+        self.item_fields = ('items(added_at,added_by.id,track(uri)),total' if track_resolver is not None
+                            else 'items(added_at,added_by.id,track(name,uri)),total')
+        # if given, the number of items and the time of the newest addition of each scanned playlist are kept
+        self.state_store = state_store
+        # if given, the snapshot ID returned by each removal is recorded so it is not seen as a change
+        self.change_tracker = change_tracker
+
+    def run(self, playlist, snapshot=None):
         playlist_id = self.spotify_helper.get_playlist_id(playlist)
-        pl_details = self.api.playlist(playlist_id, fields='name')
-        self.logger.info('Scanning playlist \'%s\' for unauthorized additions (PID: %s)',
-                         pl_details['name'], playlist_id)
-        unauth_additions = self.find_unauthorized_additions(playlist_id)
-        if len(unauth_additions) > 0:
-            self.remove_playlist_items(playlist_id, unauth_additions)
-
-
-    def find_unauthorized_additions(self, playlist_id):
+        if snapshot is not None:
+            # the playlist has already been fetched for this cycle
+            self._log_playlist_scan(playlist_id, snapshot.name)
+            unauth_additions = self._get_unauthorized_additions(playlist_id, snapshot.items)
+        else:
+            pl_details = self.api.playlist(playlist_id, fields='name')
+            self._log_playlist_scan(playlist_id, pl_details['name'])
+            unauth_additions = self.find_unauthorized_additions(playlist_id, total=self._get_track_total(playlist))
+        self.remove_unauthorized_additions(playlist_id, unauth_additions, snapshot=snapshot)
+
+
+    async def run_async(self, playlist, async_helper, snapshot=None):
+        # same as `run` but allows other playlists to be moderated while waiting for Spotify
+        playlist_id = self.spotify_helper.get_playlist_id(playlist)
+        if snapshot is not None:
+            self._log_playlist_scan(playlist_id, snapshot.name)
+            all_items = snapshot.items
+        else:
+            pl_details = await async_helper.call(self.api.playlist, playlist_id, fields='name')
+            self._log_playlist_scan(playlist_id, pl_details['name'])
+            all_items = await async_helper.get_all_items_in_playlist(
+                playlist_id, fields=self.item_fields, api=self.api, total=self._get_track_total(playlist))
+        unauth_additions = await async_helper.call(self._get_unauthorized_additions, playlist_id, all_items)
+        await async_helper.call(self.remove_unauthorized_additions, playlist_id, unauth_additions, snapshot=snapshot)
+
+
+    def find_unauthorized_additions(self, playlist_id, total=None):
         pl_uri = 'spotify:playlist:' + playlist_id
-        all_items = self.spotify_helper.get_all_items_in_playlist(
-            playlist_id, fields='items(added_at,added_by.id,track(name,uri)),total', api=self.api)
-        unauth_additions = []
-
-        for item in all_items:
-            if not self.playlist_addition_is_authorized(item['added_by']['id'], playlist_id):
-                unauth_additions.append({
-                    'name': item['track']['name'],
-                    'uri': item['track']['uri'],
-                    'added_at': item['added_at'],
-                    'added_by': item['added_by']['id'],
-                    'position': item['position']
-                })
-
-        self.logger.debug('Identified %d unauthorized track additions (PID: %s)'
-                          % (len(unauth_additions), playlist_id))
-
-        return unauth_additions
-
-
-    def remove_playlist_items(self, playlist_id, items):
-        items_with_pos = [
-            {
-                'uri': item['uri'],
-                'positions': [ item['position'] ]
-            } for item in items
-        ]
-        item_limit = 100
-        lower_bound = 0
-        upper_bound = 100
-        more_to_process = True
-
+        # items are classified as they are received so the whole playlist is never held in memory
+        all_items = self.spotify_helper.iter_playlist_items(
+            playlist_id, fields=self.item_fields, api=self.api, total=total)
+        return self._get_unauthorized_additions(playlist_id, all_items)
+
+
+    def remove_unauthorized_additions(self, playlist_id, unauth_additions, snapshot=None):
+        # `snapshot` is the snapshot of the playlist the additions were found in (if any), which
+        # is updated to reflect the removals (also those applied before a removal failed)
+        if len(unauth_additions) == 0:
+            return
+        try:
+            snapshot_id = self.remove_playlist_items(
+                playlist_id, unauth_additions, snapshot_id=snapshot.snapshot_id if snapshot is not None else None)
+        except BulkWriteError as err:
+            if snapshot is not None:
+                snapshot.remove_items(err.write.applied_items)
+            raise err
+        if snapshot is not None:
+            snapshot.remove_items(unauth_additions, snapshot_id=snapshot_id)
+
+
+    def remove_playlist_items(self, playlist_id, items, snapshot_id=None):
+        # `snapshot_id` identifies the snapshot of the playlist the positions of the items refer to
         self._log_playlist_item_removal(playlist_id, items)
-        while more_to_process:
-            more_to_process = upper_bound < len(items_with_pos)
-            self.api.playlist_remove_specific_occurrences_of_items(playlist_id, items_with_pos[lower_bound:upper_bound])
-            lower_bound = upper_bound
-            upper_bound = (lower_bound + item_limit
-                        if lower_bound + item_limit < len(items_with_pos)
-                        else len(items_with_pos))
+        snapshot_id = self.spotify_helper.remove_items_from_playlist(playlist_id, items, api=self.api, snapshot_id=snapshot_id)
+        if self.change_tracker is not None:
+            self.change_tracker.record_write(playlist_id)
+        return snapshot_id
 
 
     def playlist_addition_is_authorized(self, adder_id, playlist_id):
@@ -103,6 +120,48 @@ class PlaylistCleaner:
         return 'neutral'
 
 
+    def _get_unauthorized_additions(self, playlist_id, all_items):
+        unauth_additions = []
+        (item_count, newest_added_at) = (0, None)
+        for item in all_items:
+            item_count += 1
+            if item['added_at'] is not None and (newest_added_at is None or item['added_at'] > newest_added_at):
+                newest_added_at = item['added_at'] # timestamps are in ISO 8601 format so compare as strings
+            if not self.playlist_addition_is_authorized(item['added_by']['id'], playlist_id):
+                unauth_additions.append({
+                    'name': item['track']['name'] if 'name' in item['track'].keys() else None,
+                    'uri': item['track']['uri'],
+                    'added_at': item['added_at'],
+                    'added_by': item['added_by']['id'],
+                    'position': item['position']
+                })
+
+        self.logger.debug('Identified %d unauthorized track additions (PID: %s)'
+                          % (len(unauth_additions), playlist_id))
+        if self.state_store is not None:
+            self.state_store.update(playlist_id, item_count=item_count - len(unauth_additions),
+                                    newest_added_at=newest_added_at)
+
+        if self.track_resolver is not None and len(unauth_additions) > 0:
+            metadata = self.track_resolver.resolve([ item['uri'] for item in unauth_additions ])
+            for item in unauth_additions:
+                # a track which cannot be looked up (e.g., a local file) is identified by its URI
+                item['name'] = metadata[item['uri']]['name'] if item['uri'] in metadata.keys() else item['uri']
+
+        return unauth_additions
+
+
+    def _log_playlist_scan(self, playlist_id, playlist_name):
+        self.logger.info('Scanning playlist \'%s\' for unauthorized additions (PID: %s)', playlist_name, playlist_id)
+
+
+    @staticmethod
+    def _get_track_total(playlist):
+        # the track total of a listed playlist allows all of its pages to be requested at once
+        return (playlist['tracks']['total']
+                if isinstance(playlist, dict) and 'tracks' in playlist.keys() else None)
+
+
     def _log_playlist_item_removal(self, playlist_id, items):
         for item in items:
             self.logger.info('Removing \'%s\' added by user \'%s\' at %s (Track URI: %s) (PID: %s)'
@@ -0,0 +1,138 @@
+import os
+import json
+from time import time
+from threading import Lock
+from src.request_scheduler import RequestScheduler
+
+class PlaylistRegistry:
+    # Remembers the listing of the user's playlists (including followed playlists) so that the
+    # collaborative playlists owned by the user can be found without listing every playlist again.
+    # The listing is reused for `ttl` seconds and is then refreshed incrementally: Spotify lists the
+    # most recently added playlists first, so listing stops at the first page of already known
+    # playlists if the rest of the known listing accounts for all of the user's playlists.
+    # The whole listing is still refreshed every `full_refresh_interval` seconds to notice changes to
+    # older playlists (e.g., a playlist which is no longer collaborative), so such a change may go
+    # unnoticed for up to `full_refresh_interval` seconds.
+    # A playlist's snapshot ID and number of tracks are included while the listing it was listed by
+    # is reused (so a change to a playlist may go unnoticed for up to `ttl` seconds); those of older
+    # playlists which were not listed again by an incremental refresh are left out
+
+    page_size = 50 # limit of Spotify's playlist listing endpoint
+    full_refresh_interval = 24 * 60 * 60 # seconds
+
+    def __init__(self, logger, ttl=300, path=None):
+        self.logger = logger.getChild('PlaylistRegistry')
+        self.ttl = ttl
+        self.path = path
+        self._lock = Lock()
+        self._listing = None
+        if self.path is not None:
+            if os.path.dirname(self.path) != '':
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._load()
+
+
+    def get_collab_playlists(self, creator_id, api):
+        with self._lock:
+            if self._is_fresh(creator_id):
+                self.logger.debug('Using the listing of playlists from %d seconds ago',
+                                  time() - self._listing['listed_at'])
+            else:
+                self._refresh(creator_id, api)
+            (playlists, listed_at) = (self._listing['playlists'], self._listing['listed_at'])
+
+        collab_playlists = []
+        for playlist in playlists:
+            if playlist['collaborative'] and playlist['owner_id'] == creator_id:
+                collab_playlist = { 'uri': playlist['uri'] }
+                # i.e., the playlist was listed by the latest listing (rather than being known from before)
+                if 'listed_at' in playlist.keys() and playlist['listed_at'] == listed_at:
+                    if playlist['snapshot_id'] is not None:
+                        collab_playlist['snapshot_id'] = playlist['snapshot_id']
+                    if playlist['total'] is not None:
+                        collab_playlist['tracks'] = { 'total': playlist['total'] }
+                collab_playlists.append(collab_playlist)
+        return collab_playlists
+
+
+    def _is_fresh(self, creator_id):
+        return (self._listing is not None and self._listing['creator_id'] == creator_id
+                and time() - self._listing['listed_at'] < self.ttl)
+
+
+    def _refresh(self, creator_id, api):
+        now = time()
+        known = (self._listing['playlists'] if self._listing is not None
+                 and self._listing['creator_id'] == creator_id
+                 and now - self._listing['fully_listed_at'] < self.full_refresh_interval else None)
+        known_positions = dict([ (playlist['uri'], position) for (position, playlist) in enumerate(known) ]
+                               if known is not None else [])
+
+        listed = []
+        offset = 0
+        while True:
+            # the listing includes the snapshot ID of each playlist, so it is used to detect changes
+            with RequestScheduler.priority('probe'):
+                response = api.current_user_playlists(limit=self.page_size, offset=offset)
+            page = [ self._summarise(playlist, now) for playlist in response['items'] ]
+            listed.extend(page)
+            offset += self.page_size
+            if len(response['items']) < self.page_size:
+                fully_listed_at = now
+                break
+
+            if len(page) > 0 and all([ playlist['uri'] in known_positions.keys() for playlist in page ]):
+                # the known playlists after this page are assumed to be unchanged
+                tail = known[known_positions[page[-1]['uri']] + 1:]
+                listed_uris = set([ playlist['uri'] for playlist in listed ])
+                if (len(listed) + len(tail) == response['total']
+                    and not any([ playlist['uri'] in listed_uris for playlist in tail ])):
+                    self.logger.debug('Listed %d of %d playlists (the rest are known)', len(listed), response['total'])
+                    fully_listed_at = self._listing['fully_listed_at']
+                    listed.extend(tail)
+                    break
+
+        self._listing = {
+            'creator_id': creator_id,
+            'listed_at': now,
+            'fully_listed_at': fully_listed_at,
+            'playlists': listed
+        }
+        if self.path is not None:
+            self._save()
+
+
+    def _summarise(self, playlist, listed_at):
+        return {
+            'uri': playlist['uri'],
+            'listed_at': listed_at,
+            'collaborative': playlist['collaborative'],
+            'owner_id': playlist['owner']['id'],
+            'snapshot_id': playlist['snapshot_id'] if 'snapshot_id' in playlist.keys() else None,
+            'total': (playlist['tracks']['total']
+                      if 'tracks' in playlist.keys() and isinstance(playlist['tracks'], dict) else None)
+        }
+
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, 'r') as registry_file:
+                listing = json.loads(registry_file.read())
+            for field in [ 'creator_id', 'listed_at', 'fully_listed_at', 'playlists' ]:
+                if field not in listing.keys():
+                    raise ValueError('\'%s\' is missing' % field)
+            self._listing = listing
+        except (OSError, ValueError, AttributeError) as err:
+            self.logger.warning('Ignoring unreadable playlist registry \'%s\'. Error: \'%s\'', self.path, err)
+
+
+    def _save(self):
+        try:
+            # the registry is written to a temporary file first so a saved registry is never partial
+            with open(self.path + '.tmp', 'w') as registry_file:
+                registry_file.write(json.dumps(self._listing))
+            os.replace(self.path + '.tmp', self.path)
+        except OSError as err:
+            self.logger.warning('Failed to save playlist registry \'%s\'. Error: \'%s\'', self.path, err)
@@ -0,0 +1,88 @@
+import sys
+
+class PlaylistSnapshot:
+    # The name and items of a playlist, fetched once per moderation cycle (with every field needed
+    # by both PlaylistCleaner and IntegrityManager) and updated locally as the playlist is changed
+
+    item_fields = 'items(added_at,added_by.id,track(name,uri,artists.name)),total'
+    # for when track names and artists are looked up separately (see TrackMetadataResolver)
+    item_id_fields = 'items(added_at,added_by.id,track(uri)),total'
+    # the number of items included with a playlist (the rest are fetched page by page)
+    first_page_size = 100
+    # how many more times the items are fetched if the playlist changes while they are fetched
+    max_refetches = 2
+
+    def __init__(self, playlist_id, name, items, snapshot_id=None):
+        self.playlist_id = playlist_id
+        self.name = name
+        self.items = items
+        self.snapshot_id = snapshot_id
+        # false once the playlist was changed in a way which cannot be reflected locally
+        self.is_current = True
+
+
+    @classmethod
+    def fetch(cls, spotify_helper, api, playlist_id, total=None, fields=None):
+        # The snapshot ID is read from the same response as the first page of items, since writes
+        # are anchored to it (i.e., the positions of the items must refer to it). If there are more
+        # pages, the snapshot ID is read again after the last page and the items are fetched again
+        # if the playlist changed in the meantime. If it keeps changing, the snapshot ID is left
+        # unknown so that no write is anchored to it
+        fields = fields if fields is not None else cls.item_fields
+        for attempt in range(0, cls.max_refetches + 1):
+            details = api.playlist(playlist_id, fields='name,snapshot_id,tracks(%s)' % fields)
+            snapshot_id = details['snapshot_id'] if 'snapshot_id' in details.keys() else None
+            first_page = details['tracks']
+            items = first_page['items']
+            for position in range(0, len(items)):
+                items[position]['position'] = position
+            # a total included in the response is preferred over a given total as it is up to date
+            total = first_page['total'] if 'total' in first_page.keys() else total
+            if len(items) < cls.first_page_size or (total is not None and len(items) >= total):
+                break
+            items += spotify_helper.get_all_items_in_playlist(
+                playlist_id, fields=fields, api=api, total=total, offset=len(items))
+            if snapshot_id is not None and cls._get_snapshot_id(api, playlist_id) == snapshot_id:
+                break
+        else:
+            snapshot_id = None
+
+        for item in items:
+            # the items are kept for the whole cycle, so each adder's ID is kept once rather than per item
+            if isinstance(item.get('added_by'), dict) and isinstance(item['added_by'].get('id'), str):
+                item['added_by']['id'] = sys.intern(item['added_by']['id'])
+        return cls(playlist_id, details['name'], items, snapshot_id=snapshot_id)
+
+
+    def remove_items(self, removed_items, snapshot_id=None):
+        # the remaining items move up to fill the positions of the removed items
+        removed_positions = set([ item['position'] for item in removed_items ])
+        self.items = [ item for item in self.items if item['position'] not in removed_positions ]
+        for position in range(0, len(self.items)):
+            self.items[position]['position'] = position
+        self.snapshot_id = snapshot_id
+
+
+    def add_items(self, added_items, snapshot_id=None):
+        # the items (e.g., restored tracks with their backed up details) are added to the end of the
+        # playlist; backed up artists are already joined into one string, so they are kept as one name
+        for item in added_items:
+            artists = [ { 'name': item['artists'] } ] if item.get('artists', '') != '' else []
+            self.items.append({
+                'added_at': None,
+                'added_by': { 'id': None },
+                'track': { 'name': item['name'], 'uri': item['uri'], 'artists': artists },
+                'position': len(self.items)
+            })
+        self.snapshot_id = snapshot_id
+
+
+    @staticmethod
+    def _get_snapshot_id(api, playlist_id):
+        details = api.playlist(playlist_id, fields='snapshot_id')
+        return details['snapshot_id'] if isinstance(details, dict) and 'snapshot_id' in details.keys() else None
+
+
+    def invalidate(self):
+        # e.g., after restoring tracks (as only their backed up details are known)
+        self.is_current = False
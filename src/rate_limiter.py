@@ -0,0 +1,63 @@
+from threading import Condition
+from time import monotonic
+
+class RateLimiter:
+    # A token bucket shared by every request made with an API client. Tokens are added at `rate`
+    # tokens per second up to a maximum of `burst` tokens, and each request consumes one token.
+    # Requests to an endpoint which has been throttled (e.g., via a Retry-After header) are held
+    # back until the endpoint's pause ends, without holding back requests to other endpoints.
+
+    def __init__(self, rate=None, burst=1):
+        self.rate = rate # a rate of None means requests are only limited by pauses
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last_refill = monotonic()
+        self._paused_until = {}
+        self._num_waiting = 0
+        self._condition = Condition()
+
+
+    @property
+    def queue_depth(self):
+        # the number of requests currently waiting for a token (or for a pause to end)
+        with self._condition:
+            return self._num_waiting
+
+
+    def acquire(self, endpoint=None):
+        with self._condition:
+            self._num_waiting += 1
+            try:
+                while True:
+                    now = monotonic()
+                    pause_remaining = self._paused_until.get(endpoint, 0) - now
+                    if pause_remaining > 0:
+                        self._condition.wait(pause_remaining)
+                        continue
+
+                    if self.rate is None:
+                        return
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    self._condition.wait((1 - self._tokens) / self.rate)
+            finally:
+                self._num_waiting -= 1
+
+
+    def pause(self, endpoint, seconds):
+        with self._condition:
+            resume_at = monotonic() + seconds
+            if resume_at > self._paused_until.get(endpoint, 0):
+                self._paused_until[endpoint] = resume_at
+
+
+    def pause_remaining(self, endpoint):
+        with self._condition:
+            return max(0, self._paused_until.get(endpoint, 0) - monotonic())
+
+
+    def _refill(self, now):
+        self._tokens = min(float(self.burst), self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
@@ -0,0 +1,53 @@
+import math
+from collections import deque
+from threading import Lock
+
+class RequestHedger:
+    # Decides when a duplicate (hedged) read should be sent for a slow request: once a request
+    # has taken longer than the `percentile` of the latencies recently observed for its endpoint.
+    # Also counts how often hedged requests are sent and how often they answer first.
+
+    def __init__(self, percentile=95, window=200, min_samples=20):
+        self.percentile = percentile
+        self.window = window
+        self.min_samples = min_samples
+        self._latencies = {}
+        self._lock = Lock()
+        self._hedged_requests = 0
+        self._hedge_wins = 0
+
+
+    @property
+    def hedged_requests(self):
+        with self._lock:
+            return self._hedged_requests
+
+
+    @property
+    def hedge_wins(self):
+        with self._lock:
+            return self._hedge_wins
+
+
+    def record_latency(self, endpoint, latency):
+        with self._lock:
+            if endpoint not in self._latencies.keys():
+                self._latencies[endpoint] = deque(maxlen=self.window)
+            self._latencies[endpoint].append(latency)
+
+
+    def hedge_delay(self, endpoint):
+        # returns None until enough latencies have been observed for the endpoint
+        with self._lock:
+            if endpoint not in self._latencies.keys() or len(self._latencies[endpoint]) < self.min_samples:
+                return None
+            latencies = sorted(self._latencies[endpoint])
+        index = min(len(latencies) - 1, max(0, math.ceil(len(latencies) * self.percentile / 100) - 1))
+        return latencies[index]
+
+
+    def record_hedge(self, won):
+        with self._lock:
+            self._hedged_requests += 1
+            if won:
+                self._hedge_wins += 1
@@ -0,0 +1,145 @@
+from itertools import count
+from contextlib import contextmanager
+from threading import Condition, Lock, local
+from time import monotonic
+
+class RequestScheduler:
+    # Orders the requests waiting for the rate limiter by priority class, so that when the request
+    # budget is tight, enforcement (removing unauthorized additions and restoring removals) is not
+    # held back by routine reads. Classes, from the highest priority:
+    #   'enforcement' - removals and restores
+    #   'probe'       - change detection (e.g., fetching a playlist's snapshot ID)
+    #   'scan'        - full scans of playlists (the class of requests which were not classified)
+    #   'background'  - backups and track metadata
+    # One waiting request at a time (the first of the highest class whose endpoint is not paused)
+    # is let through to wait for a token, so requests are only reordered and never sent more often.
+    # The class of a request is that of the code sending it (see `priority`), which is kept per
+    # thread and passed on to the workers the code hands requests to (see `bind`). The number of
+    # requests, time spent queued and queue depth are kept for each class
+
+    priority_classes = [ 'enforcement', 'probe', 'scan', 'background' ]
+    default_class = 'scan'
+    _context = local()
+
+    def __init__(self, logger, rate_limiter):
+        self.logger = logger.getChild('RequestScheduler')
+        self.rate_limiter = rate_limiter
+        self._condition = Condition()
+        self._waiting = []
+        self._tickets = count()
+        self._granted = False
+        self._stats_lock = Lock()
+        self._stats = {}
+
+
+    @classmethod
+    @contextmanager
+    def priority(cls, priority_class):
+        # every request sent by the calling thread within the context has the given class
+        if priority_class not in cls.priority_classes:
+            raise ValueError('Unknown priority class \'%s\'' % priority_class)
+        previous = getattr(cls._context, 'priority_class', None)
+        cls._context.priority_class = priority_class
+        try:
+            yield
+        finally:
+            cls._context.priority_class = previous
+
+
+    @classmethod
+    def current_class(cls):
+        priority_class = getattr(cls._context, 'priority_class', None)
+        return priority_class if priority_class is not None else cls.default_class
+
+
+    @classmethod
+    def bind(cls, func):
+        # returns a function which runs `func` with the calling thread's current class (e.g., in
+        # a worker thread), so the class is captured when work is submitted rather than when it runs
+        priority_class = cls.current_class()
+        def run_with_class(*args, **kwargs):
+            with cls.priority(priority_class):
+                return func(*args, **kwargs)
+        return run_with_class
+
+
+    def queue_depth(self, priority_class=None):
+        # the number of requests (of the given class, or of any class) waiting to be let through
+        with self._condition:
+            return len([ entry for entry in self._waiting
+                         if priority_class is None or self.priority_classes[entry[0]] == priority_class ])
+
+
+    def acquire(self, endpoint=None):
+        # waits until a request of the calling thread's class may be sent to the endpoint
+        priority_class = self.current_class()
+        entry = (self.priority_classes.index(priority_class), next(self._tickets), endpoint)
+        started = monotonic()
+        with self._condition:
+            self._waiting.append(entry)
+            try:
+                while True:
+                    (next_entry, pause_remaining) = self._next_entry()
+                    if not self._granted and next_entry is entry:
+                        self._granted = True
+                        break
+                    # paused endpoints may resume without anyone being notified
+                    self._condition.wait(pause_remaining)
+            finally:
+                self._waiting.remove(entry)
+
+        try:
+            self.rate_limiter.acquire(endpoint)
+        finally:
+            with self._condition:
+                self._granted = False
+                self._condition.notify_all()
+        self._record_wait(priority_class, monotonic() - started)
+
+
+    def take_summary(self):
+        # returns the queue metrics of each class since the last summary was taken
+        with self._stats_lock:
+            (stats, self._stats) = (self._stats, {})
+        return stats
+
+
+    def log_summary(self):
+        summary = self.take_summary()
+        if len(summary) > 0:
+            self.logger.info('Queued requests during this cycle by priority class:')
+        for priority_class in self.priority_classes:
+            if priority_class in summary.keys():
+                stats = summary[priority_class]
+                self.logger.info('  Priority \'%s\': %d requests (queued: %d), %.1f seconds queued '
+                                 + '(mean %.3f, max %.3f), %d waiting',
+                                 priority_class, stats['requests'], stats['queued'], stats['wait'],
+                                 stats['wait'] / stats['requests'], stats['max_wait'],
+                                 self.queue_depth(priority_class))
+        return summary
+
+
+    def _next_entry(self):
+        # returns the entry to let through next (if any) and how long until a paused endpoint
+        # of a waiting request resumes (or None if none is paused)
+        next_entry = None
+        pause_remaining = None
+        for entry in self._waiting:
+            remaining = self.rate_limiter.pause_remaining(entry[2])
+            if remaining > 0:
+                pause_remaining = remaining if pause_remaining is None else min(pause_remaining, remaining)
+            elif next_entry is None or entry < next_entry:
+                next_entry = entry
+        return (next_entry, pause_remaining)
+
+
+    def _record_wait(self, priority_class, wait):
+        # a request counts as queued if it waited for more than a millisecond
+        with self._stats_lock:
+            stats = self._stats.get(priority_class)
+            if stats is None:
+                stats = self._stats[priority_class] = { 'requests': 0, 'queued': 0, 'wait': 0.0, 'max_wait': 0.0 }
+            stats['requests'] += 1
+            stats['queued'] += 1 if wait > 0.001 else 0
+            stats['wait'] += wait
+            stats['max_wait'] = max(stats['max_wait'], wait)
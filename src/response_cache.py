@@ -0,0 +1,116 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+
+class ResponseCache:
+    # Persistent cache of responses which have ETags, allowing a read of unchanged data to be
+    # answered by Spotify with an empty '304 Not Modified' response and served from disk.
+    # Each response is stored in its own file (named by a hash of its key) and the least recently
+    # used responses are removed once more than `max_entries` responses are stored.
+
+    def __init__(self, logger, path, max_entries=1000):
+        self.logger = logger.getChild('ResponseCache')
+        self.path = path.rstrip('/')
+        self.max_entries = max_entries
+        self._lock = Lock()
+        self._hits = 0
+
+        os.makedirs(self.path, exist_ok=True)
+        # the order of use is preserved between runs by the modification times of the files
+        cache_files = [ filename for filename in os.listdir(self.path) if filename.endswith('.cache.json') ]
+        cache_files.sort(key=lambda filename: os.path.getmtime('%s/%s' % (self.path, filename)))
+        self._entries = OrderedDict([ (filename[:-len('.cache.json')], None) for filename in cache_files ])
+        self._evict()
+
+
+    @property
+    def hits(self):
+        # the number of reads which were served from the cache
+        with self._lock:
+            return self._hits
+
+
+    def get(self, key):
+        # returns the stored ETag and content of the response for the key (or None if there is none)
+        name = self.entry_name(key)
+        with self._lock:
+            if name not in self._entries.keys():
+                return None
+            self._entries.move_to_end(name)
+
+        filename = self._get_filename(name)
+        try:
+            with open(filename, 'r') as cache_file:
+                entry = json.loads(cache_file.read())
+            os.utime(filename)
+        except (OSError, ValueError) as err:
+            self.logger.warning('Ignoring unreadable cached response \'%s\'. Error: \'%s\'', filename, err)
+            self._remove(name)
+            return None
+
+        if entry['key'] != key: # i.e., a hash collision
+            return None
+        return entry
+
+
+    def put(self, key, etag, content, content_type=None):
+        name = self.entry_name(key)
+        filename = self._get_filename(name)
+        entry = {
+            'key': key,
+            'etag': etag,
+            'content': content.decode('utf-8'),
+            'content_type': content_type
+        }
+        try:
+            # the response is written to a temporary file first so a cached response is never partial
+            with open(filename + '.tmp', 'w') as cache_file:
+                cache_file.write(json.dumps(entry))
+            os.replace(filename + '.tmp', filename)
+        except (OSError, UnicodeDecodeError) as err:
+            self.logger.warning('Failed to cache response \'%s\'. Error: \'%s\'', filename, err)
+            return
+
+        with self._lock:
+            self._entries[name] = None
+            self._entries.move_to_end(name)
+        self._evict()
+
+
+    def record_hit(self):
+        with self._lock:
+            self._hits += 1
+
+
+    def _evict(self):
+        with self._lock:
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                (name, val) = self._entries.popitem(last=False)
+                evicted.append(name)
+        for name in evicted:
+            self._delete_file(name)
+
+
+    def _remove(self, name):
+        with self._lock:
+            self._entries.pop(name, None)
+        self._delete_file(name)
+
+
+    def _delete_file(self, name):
+        try:
+            os.remove(self._get_filename(name))
+        except OSError:
+            pass
+
+
+    def _get_filename(self, name):
+        return '%s/%s.cache.json' % (self.path, name)
+
+
+    @staticmethod
+    def entry_name(key):
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
@@ -0,0 +1,34 @@
+import random
+import requests
+from spotipy.exceptions import SpotifyException
+from src.circuit_breaker import CircuitOpenError
+
+class RetryPolicy:
+    # Exponential backoff with "full jitter": the delay before retry number n (starting at 0) is
+    # a random duration between 0 and min(max_delay, base_delay * 2^n) seconds, so that clients
+    # which failed at the same time do not retry at the same time
+
+    def __init__(self, max_retries=3, base_delay=0.5, max_delay=30):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+
+    def delay(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+    @staticmethod
+    def is_retryable_status(status_code):
+        return status_code >= 500
+
+
+    @staticmethod
+    def is_transient_error(err):
+        # errors which are likely to go away if the same request is made again later
+        if isinstance(getattr(err, 'cause', None), Exception):
+            # e.g., the error which stopped a bulk write part of the way through
+            return RetryPolicy.is_transient_error(err.cause)
+        if isinstance(err, (CircuitOpenError, requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+            return True
+        return isinstance(err, SpotifyException) and (err.http_status == 429 or err.http_status >= 500)
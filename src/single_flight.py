@@ -0,0 +1,50 @@
+from threading import Lock
+from concurrent.futures import Future
+
+class SingleFlight:
+    # Coalesces identical calls which are in flight at the same time: the first caller makes the
+    # call and every caller which arrives before it completes shares its result (or its error).
+    # Nothing is kept once the call completes, so later callers always make a new call.
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = Lock()
+        self._shared_calls = 0
+
+
+    @property
+    def shared_calls(self):
+        # the number of callers which shared the result of another caller's call
+        with self._lock:
+            return self._shared_calls
+
+
+    def do(self, key, func):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self._shared_calls += 1
+                leader = False
+            else:
+                future = Future()
+                self._calls[key] = future
+                leader = True
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = func()
+        except BaseException as err:
+            self._complete(key)
+            future.set_exception(err)
+            raise err
+        self._complete(key)
+        future.set_result(result)
+        return result
+
+
+    def _complete(self, key):
+        # callers arriving after this point make a new call
+        with self._lock:
+            del self._calls[key]
@@ -1,16 +1,60 @@
-import re
 import os
+from collections import deque
+from time import sleep
+from concurrent.futures import ThreadPoolExecutor
 import spotipy
-from spotipy.oauth2 import SpotifyOAuth
+from src.api_session import ApiSession
+from src.rate_limiter import RateLimiter
+from src.request_scheduler import RequestScheduler
+from src.concurrency_controller import ConcurrencyController
+from src.retry_policy import RetryPolicy
+from src.token_manager import TokenManager
+from src.request_hedger import RequestHedger
+from src.response_cache import ResponseCache
+from src.cassette_adapter import CassetteAdapter
+from src.api_metrics import ApiMetrics
+from src.spotify_id import SpotifyId
+from src.bulk_playlist_write import BulkPlaylistWrite, BulkWriteError
+from src.watchdog import Watchdog
 
 class SpotifyHelper:
 
+    # request settings are process-wide so that every helper (including those created by
+    # PlaylistCleaner, IntegrityManager and ConfigValidator) respects `API_CONFIG`
+    max_parallel_requests = 1
+    adaptive_concurrency = True
+    rate_limit = 10 # requests per second
+    rate_limit_burst = 20
+    retry_policy = RetryPolicy()
+    connection_pool_size = 10
+    keep_alive = True
+    hedge_reads = False
+    hedge_percentile = 95
+    response_cache = True
+    response_cache_path = 'data/cache'
+    response_cache_size = 1000 # responses
+    cassette_mode = 'off' # or 'record' or 'replay'
+    cassette_path = 'data/cassettes/spotify.jsonl.gz'
+    cassette_latency_scale = 1.0
+    api_metrics = True
+    connect_timeout = 5 # seconds
+    read_timeout = 5 # seconds
+    priority_scheduling = True
+
+    # the client created by `configure_api`, which is used by every helper not given its own client
+    shared_api = None
+    # the metrics of the requests made with the shared client (if they are kept)
+    shared_metrics = None
+    # the scheduler which orders the requests made with the shared client by priority (if enabled)
+    shared_scheduler = None
+
     def __init__(self, logger, api=None):
-        self.api = api
+        self.api = api if api is not None else SpotifyHelper.shared_api
         self.logger = logger.getChild('SpotifyHelper')
 
 
-    def configure_api(self, client_id, client_secret, redirect):
+    def configure_api(self, client_id, client_secret, redirect, api_config=None):
+        self.configure_requests(api_config)
         os.environ['SPOTIPY_CLIENT_ID'] = client_id
         os.environ['SPOTIPY_CLIENT_SECRET'] = client_secret
         os.environ['SPOTIPY_REDIRECT_URI'] = redirect
@@ -19,87 +63,308 @@ class SpotifyHelper:
         self.logger.debug('Attempting to authenticate with Spotify. Requested scope: \'%s\'', scope)
         api_client = None
         try:
-            api_client = spotipy.Spotify(auth_manager=SpotifyOAuth(scope=scope))
+            # all requests made with the client (via its session) share one rate limiter and, if
+            # enabled, one adaptive limit on the number of requests in flight, and failed reads
+            # are retried (failed writes are retried by this helper, where they can be verified)
+            controller = (ConcurrencyController(self.logger, self.max_parallel_requests)
+                          if self.adaptive_concurrency and self.max_parallel_requests > 1 else None)
+            pool_size = max(self.connection_pool_size, self.max_parallel_requests)
+            # requests may be recorded to (or replayed from) a cassette, in which case responses are not
+            # cached and reads are not hedged so that every recorded request is replayed the same way
+            cassette = (CassetteAdapter(self.logger, self.cassette_path, mode=self.cassette_mode,
+                                        latency_scale=self.cassette_latency_scale,
+                                        pool_connections=pool_size, pool_maxsize=pool_size)
+                        if self.cassette_mode != 'off' else None)
+            metrics = ApiMetrics(self.logger) if self.api_metrics else None
+            # while requests wait for the rate limiter, enforcement is let through before routine reads
+            rate_limiter = RateLimiter(self.rate_limit, self.rate_limit_burst)
+            scheduler = RequestScheduler(self.logger, rate_limiter) if self.priority_scheduling else None
+            session = ApiSession(self.logger, rate_limiter=rate_limiter, scheduler=scheduler,
+                                 concurrency_controller=controller, retry_policy=self.retry_policy,
+                                 pool_size=pool_size, keep_alive=self.keep_alive,
+                                 hedger=(RequestHedger(self.hedge_percentile)
+                                         if self.hedge_reads and cassette is None else None),
+                                 response_cache=(ResponseCache(self.logger, self.response_cache_path, self.response_cache_size)
+                                                 if self.response_cache and cassette is None else None),
+                                 adapter=cassette, metrics=metrics,
+                                 timeout=(self.connect_timeout, self.read_timeout))
+            if self.cassette_mode == 'replay':
+                # replayed requests do not need to be authorized
+                api_client = spotipy.Spotify(auth='replay', requests_session=session)
+            else:
+                # the access token is kept in memory and refreshed in the background before it expires
+                api_client = spotipy.Spotify(
+                    auth_manager=TokenManager(self.logger, scope=scope,
+                                              requests_timeout=(self.connect_timeout, self.read_timeout)),
+                    requests_session=session)
         except Exception as err:
             self.logger.error('Failed to authenticate with Spotify. Error: \'%s\'', err)
             return None
 
         if isinstance(api_client, spotipy.client.Spotify):
             self.api = api_client
+            SpotifyHelper.shared_api = api_client
+            SpotifyHelper.shared_metrics = metrics
+            SpotifyHelper.shared_scheduler = scheduler
             return self.api
 
         self.logger.error('Failed to authenticate with Spotify.')
         return None
 
 
+    @classmethod
+    def configure_requests(cls, api_config=None):
+        if not isinstance(api_config, dict):
+            api_config = {}
+        cls.max_parallel_requests = (api_config['MAX_PARALLEL_REQUESTS']
+                                     if 'MAX_PARALLEL_REQUESTS' in api_config.keys() else 1)
+        cls.adaptive_concurrency = (api_config['ADAPTIVE_CONCURRENCY']
+                                    if 'ADAPTIVE_CONCURRENCY' in api_config.keys() else True)
+        cls.rate_limit = api_config['RATE_LIMIT'] if 'RATE_LIMIT' in api_config.keys() else 10
+        cls.rate_limit_burst = (api_config['RATE_LIMIT_BURST']
+                                if 'RATE_LIMIT_BURST' in api_config.keys() else 20)
+        cls.retry_policy = RetryPolicy(
+            max_retries=api_config['MAX_RETRIES'] if 'MAX_RETRIES' in api_config.keys() else 3)
+        cls.connection_pool_size = (api_config['CONNECTION_POOL_SIZE']
+                                    if 'CONNECTION_POOL_SIZE' in api_config.keys() else 10)
+        cls.keep_alive = api_config['KEEP_ALIVE'] if 'KEEP_ALIVE' in api_config.keys() else True
+        cls.hedge_reads = api_config['HEDGE_READS'] if 'HEDGE_READS' in api_config.keys() else False
+        cls.hedge_percentile = (api_config['HEDGE_PERCENTILE']
+                                if 'HEDGE_PERCENTILE' in api_config.keys() else 95)
+        cls.response_cache = api_config['RESPONSE_CACHE'] if 'RESPONSE_CACHE' in api_config.keys() else True
+        cls.response_cache_path = (api_config['RESPONSE_CACHE_PATH']
+                                   if 'RESPONSE_CACHE_PATH' in api_config.keys() else 'data/cache')
+        cls.response_cache_size = (api_config['RESPONSE_CACHE_SIZE']
+                                   if 'RESPONSE_CACHE_SIZE' in api_config.keys() else 1000)
+        cls.cassette_mode = api_config['CASSETTE_MODE'] if 'CASSETTE_MODE' in api_config.keys() else 'off'
+        cls.cassette_path = (api_config['CASSETTE_PATH']
+                             if 'CASSETTE_PATH' in api_config.keys() else 'data/cassettes/spotify.jsonl.gz')
+        cls.cassette_latency_scale = (api_config['CASSETTE_LATENCY_SCALE']
+                                      if 'CASSETTE_LATENCY_SCALE' in api_config.keys() else 1.0)
+        cls.api_metrics = api_config['API_METRICS'] if 'API_METRICS' in api_config.keys() else True
+        cls.connect_timeout = api_config['CONNECT_TIMEOUT'] if 'CONNECT_TIMEOUT' in api_config.keys() else 5
+        cls.read_timeout = api_config['READ_TIMEOUT'] if 'READ_TIMEOUT' in api_config.keys() else 5
+        cls.priority_scheduling = (api_config['PRIORITY_SCHEDULING']
+                                   if 'PRIORITY_SCHEDULING' in api_config.keys() else True)
+
+
     def get_all_collab_playlists(self, creator_id, api=None):
         if not isinstance(api, spotipy.client.Spotify):
             api = self.api
         if not isinstance(api, spotipy.client.Spotify):
             self.logger.error('Cannot get all collaborative playlists: no API is available')
             return None
+        return list(self.iter_collab_playlists(creator_id, api=api))
+
+
+    def iter_collab_playlists(self, creator_id, api=None):
+        # yields the user's collaborative playlists as each page of (50) playlists is received
+        if not isinstance(api, spotipy.client.Spotify):
+            api = self.api
+        if not isinstance(api, spotipy.client.Spotify):
+            self.logger.error('Cannot get all collaborative playlists: no API is available')
+            return
 
         item_limit = 50
         last_checked = 0
         more_to_process = True
-        collaborative_playlists = []
 
         while more_to_process:
-            response = api.current_user_playlists(limit=item_limit, offset=last_checked)
+            # listing playlists is part of finding which playlists have changed
+            with RequestScheduler.priority('probe'):
+                response = api.current_user_playlists(limit=item_limit, offset=last_checked)
             for playlist in response['items']:
                 if playlist['collaborative'] and playlist['owner']['id'] == creator_id:
-                    collaborative_playlists.append({ 'uri': playlist['uri'] })
+                    collab_playlist = { 'uri': playlist['uri'] }
+                    if 'snapshot_id' in playlist.keys():
+                        # allows a playlist which has not changed since it was last moderated to be skipped
+                        collab_playlist['snapshot_id'] = playlist['snapshot_id']
+                    if 'tracks' in playlist.keys() and isinstance(playlist['tracks'], dict):
+                        # allows the items of the playlist to be fetched without first reading a page
+                        collab_playlist['tracks'] = { 'total': playlist['tracks']['total'] }
+                    yield collab_playlist
 
             more_to_process = len(response['items']) == item_limit
             last_checked += item_limit
-        return collaborative_playlists
 
 
-    def get_all_items_in_playlist(self, playlist_id, fields=None, api=None):
+    def get_all_items_in_playlist(self, playlist_id, fields=None, api=None, total=None, offset=0):
         if not isinstance(api, spotipy.client.Spotify):
             api = self.api
         if not isinstance(api, spotipy.client.Spotify):
             self.logger.error('Cannot get all items in a playlist: no API is available')
             return None
+        return list(self.iter_playlist_items(playlist_id, fields=fields, api=api, total=total, offset=offset))
+
+
+    def iter_playlist_items(self, playlist_id, fields=None, api=None, total=None, offset=0):
+        # Yields the items of a playlist (tagged with their positions) in order, as each page of
+        # (100) items is received, so that only a few pages need to be held in memory at a time.
+        # `total` is the number of items the playlist is expected to have (e.g., the track total of a
+        # playlist listed by get_all_collab_playlists). The fields must include `total` (if any fields
+        # are given) for the remaining pages to be fetched in parallel when no total is given.
+        # `offset` is the position of the first item to fetch (e.g., if the first page is known).
+        if not isinstance(api, spotipy.client.Spotify):
+            api = self.api
+        if not isinstance(api, spotipy.client.Spotify):
+            self.logger.error('Cannot get all items in a playlist: no API is available')
+            return
 
         item_limit = 100
-        offset = 0
-        more_to_process = True
-        items = []
 
-        while more_to_process:
-            response = api.playlist_items(playlist_id, limit=item_limit, offset=offset, fields=fields)
+        def fetch_page(page_offset):
+            # abandoned scans stop before their next page (see Watchdog)
+            Watchdog.check_cancelled()
+            return api.playlist_items(playlist_id, limit=item_limit, offset=page_offset, fields=fields)
+
+        def page_items(page_offset, response):
             for index in range(0, len(response['items'])):
                 item = response['items'][index]
-                item['position'] = offset + index
-                items.append(item)
-            more_to_process = len(response['items']) == item_limit
+                item['position'] = page_offset + index
+                yield item
+
+        def is_last_page(response, next_offset):
+            # a total included in the response is preferred over a given total as it is up to date
+            page_total = response['total'] if 'total' in response.keys() else None
+            return (len(response['items']) < item_limit
+                    or (page_total is not None and next_offset >= page_total))
+
+        if total is None or self.max_parallel_requests <= 1:
+            response = fetch_page(offset)
+            yield from page_items(offset, response)
             offset += item_limit
+            more_to_process = not is_last_page(response, offset)
+            total = response['total'] if 'total' in response.keys() else None
+        else:
+            more_to_process = True
+
+        if more_to_process and total is not None and self.max_parallel_requests > 1:
+            # The offsets of all remaining pages are known so they can be requested concurrently
+            # (at least one page is always requested in case the given total is out of date).
+            # No more than `max_parallel_requests` pages are requested ahead of the page being yielded.
+            offsets = list(range(offset, max(total, offset + 1), item_limit))
+            fetch_page_in_worker = Watchdog.bind(RequestScheduler.bind(fetch_page))
+            with ThreadPoolExecutor(max_workers=min(self.max_parallel_requests, len(offsets))) as executor:
+                pending = deque()
+                for page_offset in offsets:
+                    pending.append((page_offset, executor.submit(fetch_page_in_worker, page_offset)))
+                    if len(pending) >= self.max_parallel_requests:
+                        (ready_offset, future) = pending.popleft()
+                        response = future.result()
+                        yield from page_items(ready_offset, response)
+                while len(pending) > 0:
+                    (ready_offset, future) = pending.popleft()
+                    response = future.result()
+                    yield from page_items(ready_offset, response)
+            offset += item_limit * len(offsets)
 
-        return items
+            # the playlist may have grown since its total was read
+            more_to_process = not is_last_page(response, offset)
+
+        while more_to_process:
+            response = fetch_page(offset)
+            yield from page_items(offset, response)
+            offset += item_limit
+            more_to_process = not is_last_page(response, offset)
 
 
-    def add_items_to_playlist(self, playlist_id, items, api=None):
+    def add_items_to_playlist(self, playlist_id, items, api=None, position=None):
+        # returns the snapshot ID of the playlist after the items were added (if it is known); if
+        # only some of the items were added (despite resuming the write), a BulkWriteError is raised
         if not isinstance(api, spotipy.client.Spotify):
             api = self.api
         if not isinstance(api, spotipy.client.Spotify):
             self.logger.error('Cannot add items to playlist: no API is available')
             return
+        with RequestScheduler.priority('enforcement'):
+            return self._run_bulk_write(BulkPlaylistWrite(self, api, playlist_id, 'add', items, position=position))
+
+
+    def remove_items_from_playlist(self, playlist_id, items, api=None, snapshot_id=None):
+        # removes the occurrences of items at their particular positions (not all of their occurrences)
+        # and returns the snapshot ID of the playlist after the removal (if it is known). The positions
+        # refer to the given snapshot of the playlist (or its current snapshot if none is given)
+        if not isinstance(api, spotipy.client.Spotify):
+            api = self.api
+        if not isinstance(api, spotipy.client.Spotify):
+            self.logger.error('Cannot remove items from playlist: no API is available')
+            return
+        with RequestScheduler.priority('enforcement'):
+            write = BulkPlaylistWrite(self, api, playlist_id, 'remove', items, snapshot_id=snapshot_id,
+                                      max_parallel=self.max_parallel_requests)
+            return self._run_bulk_write(write)
+
+
+    def _run_bulk_write(self, write):
+        # A write which stopped part of the way through due to a temporary API problem is resumed
+        # from its first unapplied chunk (after the same delays as a failed request). It is only
+        # resumed if the playlist's snapshot ID is known, as that shows whether its failed chunk was applied
+        run = write.run
+        attempt = 0
+        while True:
+            try:
+                return run()
+            except BulkWriteError as err:
+                if (not RetryPolicy.is_transient_error(err)
+                    or write.snapshot_id is None
+                    or attempt >= self.retry_policy.max_retries):
+                    raise err
+                sleep(self.retry_policy.delay(attempt))
+                attempt += 1
+                self.logger.warning('Resuming failed write to playlist (retry %d of %d). Error: \'%s\' (PID: %s)',
+                                    attempt, self.retry_policy.max_retries, err.cause, write.playlist_id)
+                run = err.resume
+
+
+    def _write_to_playlist(self, playlist_id, snapshot_id, api, write_func, *args, is_applied=None):
+        # Writes are not idempotent, so a failed write is only retried if the playlist's snapshot ID
+        # shows that the write was not applied (a write changes the snapshot ID of the playlist).
+        # A changed snapshot ID may also be due to someone else's change, so the write is then only
+        # assumed to have been applied if `is_applied` (given the track URIs of the playlist) shows
+        # that it was, and otherwise its error is raised.
+        # Returns the playlist's snapshot ID after the write (or None if it is unknown).
+        attempt = 0
+        while True:
+            try:
+                response = write_func(*args)
+                return response['snapshot_id'] if isinstance(response, dict) and 'snapshot_id' in response.keys() else None
+            except Exception as err:
+                if (not RetryPolicy.is_transient_error(err)
+                    or snapshot_id is None
+                    or attempt >= self.retry_policy.max_retries):
+                    raise err
+
+                sleep(self.retry_policy.delay(attempt))
+                current_snapshot_id = self._get_snapshot_id(playlist_id, api)
+                if current_snapshot_id != snapshot_id:
+                    if is_applied is None or not is_applied(self._get_track_uris(playlist_id, api)):
+                        self.logger.warning('Playlist changed despite failed write, but does not contain the write '
+                                            + '- not retrying (PID: %s)', playlist_id)
+                        raise err
+                    self.logger.warning('Playlist contains failed write - assuming write was applied (PID: %s)',
+                                        playlist_id)
+                    return current_snapshot_id
+
+                attempt += 1
+                self.logger.warning('Retrying failed write to playlist (retry %d of %d). Error: \'%s\' (PID: %s)',
+                                    attempt, self.retry_policy.max_retries, err, playlist_id)
+
+
+    def _get_snapshot_id(self, playlist_id, api):
+        playlist = api.playlist(playlist_id, fields='snapshot_id')
+        return playlist['snapshot_id'] if isinstance(playlist, dict) and 'snapshot_id' in playlist.keys() else None
+
 
-        item_uris = [ item['uri'] for item in items ]
-        max_additions = 100
-        lbound = 0
-        while lbound < len(item_uris):
-            ubound = lbound + max_additions if lbound + max_additions <= len(item_uris) else len(item_uris)
-            api.playlist_add_items(playlist_id, item_uris[lbound:ubound])
-            lbound = ubound
+    def _get_track_uris(self, playlist_id, api):
+        # the URIs of the playlist's tracks in order (None for an item which is not a track)
+        return [ item['track']['uri'] if isinstance(item.get('track'), dict) else None
+                 for item in self.get_all_items_in_playlist(playlist_id, fields='items(track(uri)),total', api=api) ]
 
 
     @staticmethod
     def get_playlist_id(playlist):
-        if (isinstance(playlist, str)
-            and re.search('^spotify:playlist:[A-Za-z0-9]{22}$', playlist) is not None):
-            return playlist[17:]
+        if isinstance(playlist, str):
+            return SpotifyId.from_uri(playlist, 'playlist')
         elif isinstance(playlist, dict) and 'uri' in playlist.keys():
             return playlist['uri'][17:]
         return None
@@ -107,9 +372,8 @@ class SpotifyHelper:
 
     @staticmethod
     def get_track_id(track):
-        if (isinstance(track, str)
-            and re.search('^spotify:track:[A-Za-z0-9]{22}$', track) is not None):
-            return track[14:]
+        if isinstance(track, str):
+            return SpotifyId.from_uri(track, 'track')
         elif isinstance(track, dict) and 'uri' in track.keys():
             return track['uri'][14:]
         return None
@@ -0,0 +1,19 @@
+class SpotifyId:
+    # Parses the IDs (22 base62 characters) out of Spotify URIs by their prefix and length rather
+    # than with a regular expression.
+    # Tracks are diffed and cached by their URI strings rather than by a compact encoding of their
+    # IDs: hashing a string is much cheaper than encoding its ID in Python, and the items being
+    # compared keep their URIs anyway
+
+    id_length = 22
+
+    @classmethod
+    def from_uri(cls, uri, kind):
+        # returns the ID of a URI of the given kind (e.g., 'track'), or None if it is not such a URI
+        prefix_length = len(kind) + 9 # i.e., 'spotify:<kind>:'
+        if (isinstance(uri, str) and len(uri) == prefix_length + cls.id_length
+            and uri.startswith('spotify:') and uri[8:prefix_length - 1] == kind and uri[prefix_length - 1] == ':'):
+            spotify_id = uri[prefix_length:]
+            return spotify_id if spotify_id.isascii() and spotify_id.isalnum() else None
+        return None
+
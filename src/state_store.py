@@ -0,0 +1,120 @@
+import os
+import sqlite3
+from threading import Lock
+
+class StateStore:
+    # Keeps the state of each moderated playlist (e.g., its snapshot ID when it was last scanned and
+    # how many of its scans failed) in a local SQLite database so that it survives between runs.
+    # Updates are held in memory until `commit` is called (once per moderation cycle) so that each
+    # cycle is written in a single transaction
+
+    fields = [ 'snapshot_id', 'last_scanned', 'item_count', 'newest_added_at', 'last_duration',
+               'error_count', 'consecutive_errors' ]
+
+    def __init__(self, logger, path):
+        self.logger = logger.getChild('StateStore')
+        self.path = path
+        self._lock = Lock()
+        self._pending = {}
+
+        if os.path.dirname(self.path) != '':
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # playlists may be moderated from several threads but only one uses the connection at a time
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS playlist_state ('
+                + 'playlist_id TEXT PRIMARY KEY, snapshot_id TEXT, last_scanned REAL, item_count INTEGER, '
+                + 'newest_added_at TEXT, last_duration REAL, error_count INTEGER NOT NULL DEFAULT 0, '
+                + 'consecutive_errors INTEGER NOT NULL DEFAULT 0)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT)')
+
+
+    def get(self, playlist_id):
+        # returns the state of the playlist (including updates which have not been committed yet)
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT %s FROM playlist_state WHERE playlist_id = ?' % ', '.join(self.fields),
+                (playlist_id,)).fetchone()
+            state = dict(zip(self.fields, row)) if row is not None else None
+            if playlist_id in self._pending.keys():
+                state = dict(state if state is not None else self._empty_state(), **self._pending[playlist_id])
+        return state
+
+
+    def update(self, playlist_id, **state):
+        for field in state.keys():
+            if field not in self.fields:
+                raise ValueError('Unknown playlist state field \'%s\'' % field)
+        with self._lock:
+            self._pending.setdefault(playlist_id, {}).update(state)
+
+
+    def record_scan(self, playlist_id, scanned_at, duration):
+        # a successful scan ends a run of consecutive errors
+        self.update(playlist_id, last_scanned=scanned_at, last_duration=duration, consecutive_errors=0)
+
+
+    def record_error(self, playlist_id):
+        state = self.get(playlist_id)
+        if state is None:
+            state = self._empty_state()
+        self.update(playlist_id, error_count=state['error_count'] + 1,
+                    consecutive_errors=state['consecutive_errors'] + 1)
+
+
+    def forget_snapshot_ids(self):
+        # causes every playlist to be scanned again (e.g., after the playlist configuration changed)
+        with self._lock:
+            with self._connection:
+                self._connection.execute('UPDATE playlist_state SET snapshot_id = NULL')
+            for state in self._pending.values():
+                state.pop('snapshot_id', None)
+
+
+    def get_metadata(self, key):
+        with self._lock:
+            row = self._connection.execute('SELECT value FROM metadata WHERE key = ?', (key,)).fetchone()
+        return row[0] if row is not None else None
+
+
+    def set_metadata(self, key, value):
+        with self._lock:
+            with self._connection:
+                self._connection.execute('INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)', (key, value))
+
+
+    def commit(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            try:
+                with self._connection: # i.e., a single transaction
+                    for (playlist_id, state) in pending.items():
+                        if len(state) == 0:
+                            continue
+                        self._connection.execute(
+                            'INSERT OR IGNORE INTO playlist_state (playlist_id) VALUES (?)', (playlist_id,))
+                        self._connection.execute(
+                            'UPDATE playlist_state SET %s WHERE playlist_id = ?'
+                            % ', '.join([ '%s = ?' % field for field in state.keys() ]),
+                            list(state.values()) + [ playlist_id ])
+            except sqlite3.Error as err:
+                self.logger.error('Failed to save the state of moderated playlists. Error: \'%s\'', err)
+                self._pending = pending # to be saved with the next cycle instead
+                return False
+        self.logger.debug('Saved the state of %d playlists', len(pending))
+        return True
+
+
+    def close(self):
+        self.commit()
+        with self._lock:
+            self._connection.close()
+
+
+    def _empty_state(self):
+        state = dict([ (field, None) for field in self.fields ])
+        state['error_count'] = 0
+        state['consecutive_errors'] = 0
+        return state
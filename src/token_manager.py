@@ -0,0 +1,81 @@
+import warnings
+from threading import Lock, Timer
+from time import time
+from spotipy.oauth2 import SpotifyOAuth
+
+class TokenManager(SpotifyOAuth):
+    # Auth manager which keeps the access token in memory and refreshes it in the background
+    # (`refresh_margin` seconds before it expires) so that requests never wait for the token
+    # cache file to be read or for the token to be refreshed. The cache file is only read when
+    # a token is first needed and is only written after the token has been refreshed
+
+    def __init__(self, logger, scope=None, refresh_margin=300, retry_delay=30, **kwargs):
+        super().__init__(scope=scope, **kwargs)
+        self.logger = logger.getChild('TokenManager')
+        self.refresh_margin = refresh_margin
+        self.retry_delay = retry_delay
+        self._token_info = None
+        self._token_lock = Lock()
+        self._refresh_timer = None
+
+
+    def get_access_token(self, code=None, as_dict=True, check_cache=True):
+        token_info = self._token_info
+        if token_info is None or self.is_token_expired(token_info):
+            # only happens for the first request or if the token could not be refreshed in time
+            with self._token_lock:
+                if self._token_info is None or self.is_token_expired(self._token_info):
+                    with warnings.catch_warnings():
+                        warnings.simplefilter('ignore', DeprecationWarning) # for `as_dict`
+                        self._token_info = super().get_access_token(code=code, as_dict=True, check_cache=check_cache)
+                    self._schedule_refresh(self.seconds_until_refresh(self._token_info))
+                token_info = self._token_info
+        return token_info if as_dict else token_info['access_token']
+
+
+    def get_cached_token(self):
+        if self._token_info is not None:
+            return self._token_info
+        return super().get_cached_token()
+
+
+    def refresh_access_token(self, refresh_token):
+        # the refreshed token is written to the cache file by spotipy
+        token_info = super().refresh_access_token(refresh_token)
+        self._token_info = token_info
+        return token_info
+
+
+    def seconds_until_refresh(self, token_info):
+        return max(1, token_info['expires_at'] - self.refresh_margin - time())
+
+
+    def stop(self):
+        with self._token_lock:
+            if self._refresh_timer is not None:
+                self._refresh_timer.cancel()
+                self._refresh_timer = None
+
+
+    def _schedule_refresh(self, delay):
+        if self._refresh_timer is not None:
+            self._refresh_timer.cancel()
+        self._refresh_timer = Timer(delay, self._refresh_in_background)
+        self._refresh_timer.daemon = True # must not keep the program running
+        self._refresh_timer.start()
+
+
+    def _refresh_in_background(self):
+        with self._token_lock:
+            if self._token_info is None:
+                return
+            try:
+                token_info = self.refresh_access_token(self._token_info['refresh_token'])
+                self.logger.debug('Refreshed access token - next refresh in %d seconds',
+                                  self.seconds_until_refresh(token_info))
+                self._schedule_refresh(self.seconds_until_refresh(token_info))
+            except Exception as err:
+                # the token is refreshed on demand if it expires before a later attempt succeeds
+                self.logger.warning('Failed to refresh access token - retrying in %d seconds. Error: \'%s\'',
+                                    self.retry_delay, err)
+                self._schedule_refresh(self.retry_delay)
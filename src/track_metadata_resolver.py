@@ -0,0 +1,91 @@
+import os
+import json
+from collections import OrderedDict
+from threading import Lock
+from src.request_scheduler import RequestScheduler
+
+class TrackMetadataResolver:
+    # Looks up the names and artists of tracks only when they are needed (e.g., for a log line,
+    # an approval request or a backup) so that playlists can be scanned with only their track
+    # URIs and adders. Tracks are looked up in batches and their details are kept in a bounded
+    # least recently used cache which is optionally saved to disk between runs
+
+    max_tracks_per_request = 50 # limit of Spotify's tracks endpoint
+
+    def __init__(self, logger, api, max_entries=10000, path=None):
+        self.logger = logger.getChild('TrackMetadataResolver')
+        self.api = api
+        self.max_entries = max_entries
+        self.path = path
+        self._lock = Lock()
+        self._entries = OrderedDict()
+        if self.path is not None:
+            if os.path.dirname(self.path) != '':
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._load()
+
+
+    def resolve(self, uris):
+        # returns the name and artists (as a string) of each track which could be found, by URI
+        resolved = {}
+        missing_uris = []
+        with self._lock:
+            for uri in uris:
+                if uri in self._entries.keys():
+                    self._entries.move_to_end(uri)
+                    resolved[uri] = self._entries[uri]
+                elif uri.startswith('spotify:track:'): # e.g., local files cannot be looked up
+                    missing_uris.append(uri)
+        missing_uris = list(OrderedDict.fromkeys(missing_uris)) # without duplicates
+
+        if len(missing_uris) == 0:
+            return resolved
+
+        self.logger.debug('Looking up the details of %d tracks', len(missing_uris))
+        for start in range(0, len(missing_uris), self.max_tracks_per_request):
+            with RequestScheduler.priority('background'):
+                response = self.api.tracks(missing_uris[start : start + self.max_tracks_per_request])
+            for track in response['tracks']:
+                if track is None: # i.e., the track no longer exists
+                    continue
+                resolved[track['uri']] = {
+                    'name': track['name'],
+                    'artists': ', '.join([ artist['name'] for artist in track['artists'] ])
+                }
+
+        with self._lock:
+            for uri in missing_uris:
+                if uri in resolved.keys():
+                    self._entries[uri] = resolved[uri]
+                    self._entries.move_to_end(uri)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if self.path is not None:
+            self._save()
+        return resolved
+
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, 'r') as cache_file:
+                entries = json.loads(cache_file.read())
+            # entries are saved from least to most recently used
+            for (uri, metadata) in entries[-self.max_entries:]:
+                self._entries[uri] = { 'name': metadata['name'], 'artists': metadata['artists'] }
+        except (OSError, ValueError, TypeError, KeyError) as err:
+            self.logger.warning('Ignoring unreadable track metadata cache \'%s\'. Error: \'%s\'', self.path, err)
+            self._entries.clear()
+
+
+    def _save(self):
+        with self._lock:
+            entries = list(self._entries.items())
+        try:
+            # the cache is written to a temporary file first so a saved cache is never partial
+            with open(self.path + '.tmp', 'w') as cache_file:
+                cache_file.write(json.dumps(entries))
+            os.replace(self.path + '.tmp', self.path)
+        except OSError as err:
+            self.logger.warning('Failed to save track metadata cache \'%s\'. Error: \'%s\'', self.path, err)
@@ -0,0 +1,143 @@
+import sys
+import traceback
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import monotonic
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from src.request_scheduler import RequestScheduler
+
+class WatchdogTimeout(Exception):
+    pass
+
+
+class WorkCancelled(Exception):
+    # raised in abandoned work the next time it checks whether it was cancelled
+    pass
+
+
+class Watchdog:
+    # Bounds how long the scan of a playlist (`playlist_budget` seconds) and a whole iteration of
+    # moderation (`iteration_budget` seconds) may take. A scan is run in a worker thread which is
+    # watched by the calling thread: if the scan runs past its budget, the stack of the worker is
+    # logged, WatchdogTimeout is raised and the scan is abandoned. Python threads cannot be stopped,
+    # so an abandoned scan is cancelled instead: it stops (raising WorkCancelled) the next time it
+    # calls `check_cancelled` (e.g., before each page of items and each write) and a new worker is
+    # used for the next scan. Work with the same label (e.g., a scan of the same playlist) is not
+    # started again until the abandoned work has stopped. Once an iteration has run past its
+    # budget, no more playlists are scanned until the next iteration.
+    # The cancellation event of work is kept per thread (or asyncio task), so it is passed on to
+    # the workers the work hands blocking calls to (see `bind`)
+
+    _cancelled = ContextVar('cancelled', default=None)
+
+    def __init__(self, logger, playlist_budget=None, iteration_budget=None):
+        # a budget of None means there is no limit
+        self.logger = logger.getChild('Watchdog')
+        self.playlist_budget = playlist_budget
+        self.iteration_budget = iteration_budget
+        self._iteration_deadline = None
+        # scans are run in one worker (rather than a thread each) so that its API session is reused
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='Watchdog')
+        self._lock = threading.Lock()
+        # the futures of abandoned work which has not stopped yet, by label
+        self._abandoned = {}
+
+
+    @classmethod
+    @contextmanager
+    def cancellation(cls, cancelled):
+        # the work run within the context stops once the given event is set
+        token = cls._cancelled.set(cancelled)
+        try:
+            yield
+        finally:
+            cls._cancelled.reset(token)
+
+
+    @classmethod
+    def bind(cls, func):
+        # returns a function which runs `func` with the caller's cancellation event (e.g., in a worker thread)
+        cancelled = cls._cancelled.get()
+        if cancelled is None:
+            return func
+        def run_cancellable(*args, **kwargs):
+            with cls.cancellation(cancelled):
+                return func(*args, **kwargs)
+        return run_cancellable
+
+
+    @classmethod
+    def check_cancelled(cls):
+        cancelled = cls._cancelled.get()
+        if cancelled is not None and cancelled.is_set():
+            raise WorkCancelled('Abandoned work was cancelled')
+
+
+    def start_iteration(self):
+        self._iteration_deadline = (monotonic() + self.iteration_budget
+                                    if self.iteration_budget is not None else None)
+
+
+    def iteration_expired(self):
+        return self._iteration_deadline is not None and monotonic() >= self._iteration_deadline
+
+
+    def budget(self):
+        # the number of seconds the next scan may take (or None if there is no limit)
+        budgets = [ budget for budget in [
+            self.playlist_budget,
+            self._iteration_deadline - monotonic() if self._iteration_deadline is not None else None
+        ] if budget is not None ]
+        return max(0, min(budgets)) if len(budgets) > 0 else None
+
+
+    def run(self, label, func, *args, **kwargs):
+        # `label` describes the work in the logs (e.g., 'Scan of playlist (PID: ...)')
+        budget = self.budget()
+        if budget is None:
+            return func(*args, **kwargs)
+
+        worker = []
+        cancelled = threading.Event()
+        def work():
+            worker.append(threading.current_thread())
+            with self.cancellation(cancelled):
+                return func(*args, **kwargs)
+
+        with self._lock:
+            self._abandoned = { abandoned_label: abandoned for (abandoned_label, abandoned) in self._abandoned.items()
+                                if not abandoned.done() }
+            if label in self._abandoned.keys():
+                raise WatchdogTimeout('%s was not started as its abandoned previous run has not stopped yet' % label)
+            executor = self._executor
+            # e.g., the priority class of the requests of the work
+            future = executor.submit(RequestScheduler.bind(work))
+        try:
+            return future.result(timeout=budget)
+        except TimeoutError:
+            cancelled.set()
+            with self._lock:
+                self._abandoned[label] = future
+                if self._executor is executor:
+                    executor.shutdown(wait=False)
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='Watchdog')
+            raise self.timed_out(label, budget, threads=worker)
+
+
+    def timed_out(self, label, budget, threads=None):
+        # logs the stacks of the given threads (or of every other thread if they are not known)
+        # and returns the error with which the work is abandoned
+        self.logger.error('%s ran past its time budget of %.1f seconds and was abandoned', label, budget)
+        if threads is None:
+            threads = [ thread for thread in threading.enumerate() if thread is not threading.current_thread() ]
+        frames = sys._current_frames()
+        for thread in threads:
+            if thread.ident in frames.keys():
+                self.logger.error('Stack of thread \'%s\':\n%s', thread.name,
+                                  ''.join(traceback.format_stack(frames[thread.ident])).rstrip())
+        return WatchdogTimeout('%s ran past its time budget of %.1f seconds' % (label, budget))
+
+
+    def close(self):
+        self._executor.shutdown(wait=False)
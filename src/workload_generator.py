@@ -0,0 +1,117 @@
+import random
+
+class WorkloadGenerator:
+    # Generates reproducible synthetic accounts in the model of the fake Spotify Web API: collaborative
+    # playlists whose sizes and numbers of (authorized) collaborators are sampled from distributions,
+    # where some items are duplicates of tracks already in a playlist and some were added by users
+    # who are not authorized to contribute. Rounds of changes made by other users between cycles of
+    # moderation (i.e., churn) can then be applied at the given rates.
+    # A distribution is a tuple of the name of a method of Python's `random.Random` and its
+    # parameters (e.g., ('lognormvariate', 4.0, 1.0) or ('randint', 0, 5)) or ('constant', value).
+    # The same seed always generates the same workload
+
+    def __init__(self, seed=0, num_playlists=100, playlist_size=('lognormvariate', 4.0, 1.0),
+                 num_collaborators=('randint', 0, 5), num_tracks=10000, num_users=50,
+                 num_followed_playlists=0, duplicate_rate=0.02, unauthorized_rate=0.05,
+                 add_rate=0.05, remove_rate=0.02):
+        # rates are fractions of items: the items of a playlist which are duplicates or which were
+        # added by unauthorized users, and the items which are added or removed in each round of churn
+        self.seed = seed
+        self.num_playlists = num_playlists
+        self.playlist_size = playlist_size
+        self.num_collaborators = num_collaborators
+        self.num_tracks = num_tracks
+        self.num_users = num_users
+        self.num_followed_playlists = num_followed_playlists
+        self.duplicate_rate = duplicate_rate
+        self.unauthorized_rate = unauthorized_rate
+        self.add_rate = add_rate
+        self.remove_rate = remove_rate
+        self._random = random.Random(seed)
+        self.track_uris = []
+        self.playlists = [] # the URI and collaborators of each generated collaborative playlist
+
+
+    def generate(self, server):
+        # `server` is a FakeSpotifyServer (or the `server` of a FakeSpotify client)
+        self.track_uris = [ server.add_track() for track_num in range(0, self.num_tracks) ]
+        users = [ 'user%d' % num for num in range(1, self.num_users + 1) ]
+
+        for playlist_num in range(0, self.num_playlists):
+            num_collaborators = min(self._sample(self.num_collaborators), len(users))
+            collaborators = self._random.sample(users, num_collaborators)
+            items = []
+            for position in range(0, self._sample(self.playlist_size)):
+                if len(items) > 0 and self._random.random() < self.duplicate_rate:
+                    track_uri = self._random.choice(items)[0]
+                else:
+                    track_uri = self._random.choice(self.track_uris)
+                items.append((track_uri, self._choose_adder(server.user_id, collaborators)))
+            self.playlists.append({
+                'uri': server.add_playlist(name='Playlist %d' % (playlist_num + 1), items=items),
+                'collaborators': collaborators
+            })
+
+        for playlist_num in range(0, self.num_followed_playlists):
+            owner_id = self._random.choice(users)
+            items = [ (self._random.choice(self.track_uris), owner_id)
+                      for position in range(0, self._sample(self.playlist_size)) ]
+            server.add_playlist(owner_id=owner_id, collaborative=self._random.random() < 0.5, items=items)
+        return self.playlists
+
+
+    def churn(self, server):
+        # applies one round of additions and removals (at random positions) by other users to every
+        # generated playlist, returning the numbers of added and removed items
+        (num_added, num_removed) = (0, 0)
+        for playlist in self.playlists:
+            size = len(server.get_playlist_items(playlist['uri']))
+            additions = [ (self._random.choice(self.track_uris), self._choose_adder(None, playlist['collaborators']))
+                          for addition in range(0, self._round(size * self.add_rate)) ]
+            if len(additions) > 0:
+                server.add_items(playlist['uri'], additions)
+            size += len(additions)
+            positions = self._random.sample(range(0, size), min(size, self._round(size * self.remove_rate)))
+            if len(positions) > 0:
+                server.remove_items(playlist['uri'], positions)
+            num_added += len(additions)
+            num_removed += len(positions)
+        return (num_added, num_removed)
+
+
+    def playlist_config(self, backup_path='data/backups'):
+        # a configuration which protects every generated playlist, authorizing only its collaborators
+        return {
+            'DELAY_BETWEEN_SCANS': 1,
+            'PROTECT_ALL': False,
+            'GLOBAL_MODE': 'whitelist',
+            'GLOBAL_WHITELIST': [],
+            'GLOBAL_BLACKLIST': [],
+            'BACKUP_PATH': backup_path,
+            'MAX_BACKUPS_PER_PLAYLIST': 1,
+            'PROTECTED_PLAYLISTS': [
+                { 'Playlist%d' % (num + 1): { 'uri': playlist['uri'], 'whitelist': playlist['collaborators'] } }
+                for (num, playlist) in enumerate(self.playlists)
+            ]
+        }
+
+
+    def _choose_adder(self, owner_id, collaborators):
+        # unauthorized users are never collaborators of any generated playlist
+        if self._random.random() < self.unauthorized_rate:
+            return 'intruder%d' % self._random.randint(1, 10)
+        adders = collaborators + ([ owner_id ] if owner_id is not None else [])
+        return self._random.choice(adders) if len(adders) > 0 else 'intruder1'
+
+
+    def _sample(self, distribution):
+        if distribution[0] == 'constant':
+            value = distribution[1]
+        else:
+            value = getattr(self._random, distribution[0])(*distribution[1:])
+        return max(0, int(round(value)))
+
+
+    def _round(self, expected):
+        # rounds randomly so that the expected number of changes is kept for small playlists
+        return int(expected) + (1 if self._random.random() < expected - int(expected) else 0)
@@ -0,0 +1,93 @@
+import unittest
+import logging
+from unittest.mock import Mock
+from src.api_metrics import ApiMetrics
+
+class TestApiMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.test_logger = logging.getLogger('TestApiMetrics')
+        log_handler = logging.StreamHandler()
+        log_handler.setLevel('CRITICAL')
+        self.test_logger.addHandler(log_handler)
+        self.test_logger.propagate = False
+
+        self.playlist_id = 'x' * 22
+        self.items_url = 'https://api.spotify.com/v1/playlists/%s/tracks' % self.playlist_id
+
+
+    # ----- Tests for ApiMetrics.record ----- #
+
+    def test_record_counts_requests_errors_retries_and_sizes_per_endpoint_and_playlist(self):
+        metrics = ApiMetrics(self.test_logger)
+        metrics.record('GET playlists/{id}/tracks', self.items_url, 200, 0.08, size=1000)
+        metrics.record('GET playlists/{id}/tracks', self.items_url, 429, 0.01, size=50)
+        metrics.record('GET playlists/{id}/tracks', self.items_url, None, 3.0, retry=True)
+        metrics.record('GET me/playlists', 'https://api.spotify.com/v1/me/playlists', 200, 0.2, size=500)
+
+        summary = metrics.take_summary()
+        stats = summary['endpoints']['GET playlists/{id}/tracks']
+        self.assertEqual((stats['requests'], stats['errors'], stats['retries'], stats['throttled'], stats['bytes']),
+                         (3, 2, 1, 1, 1050))
+        self.assertAlmostEqual(stats['latency'], 3.09)
+        self.assertEqual(stats['histogram'], [ 1, 1, 0, 0, 0, 0, 1, 0, 0 ])
+        self.assertEqual(summary['endpoints']['GET me/playlists']['requests'], 1)
+        # requests which are not for a particular playlist are only counted per endpoint
+        self.assertEqual(list(summary['playlists'].keys()), [ self.playlist_id ])
+        self.assertEqual(summary['playlists'][self.playlist_id]['requests'], 3)
+        self.assertEqual(summary['playlists'][self.playlist_id]['bytes'], 1050)
+
+
+    # ----- Tests for ApiMetrics.record_event ----- #
+
+    def test_record_event_counts_shared_cached_and_hedged_reads(self):
+        metrics = ApiMetrics(self.test_logger)
+        metrics.record_event('GET me/playlists', 'cached')
+        metrics.record_event('GET me/playlists', 'cached')
+        metrics.record_event('GET me/playlists', 'shared')
+        stats = metrics.take_summary()['endpoints']['GET me/playlists']
+        self.assertEqual((stats['requests'], stats['cached'], stats['shared'], stats['hedged']), (0, 2, 1, 0))
+        with self.assertRaises(ValueError):
+            metrics.record_event('GET me/playlists', 'unknown')
+
+
+    # ----- Tests for ApiMetrics.take_summary ----- #
+
+    def test_take_summary_starts_counting_again_for_the_next_cycle(self):
+        metrics = ApiMetrics(self.test_logger)
+        metrics.record('GET me/playlists', 'https://api.spotify.com/v1/me/playlists', 200, 0.1)
+        self.assertEqual(len(metrics.take_summary()['endpoints']), 1)
+        self.assertEqual(metrics.take_summary(), { 'endpoints': {}, 'playlists': {} })
+
+
+    # ----- Tests for ApiMetrics.log_summary ----- #
+
+    def test_log_summary_logs_totals_and_each_endpoint_with_latency_percentiles(self):
+        metrics = ApiMetrics(self.test_logger)
+        for latency in [ 0.01 ] * 90 + [ 0.3 ] * 9 + [ 20 ]:
+            metrics.record('GET playlists/{id}/tracks', self.items_url, 200, latency, size=1024)
+        metrics.logger = Mock()
+        metrics.log_summary()
+
+        messages = [ call[0][0] % call[0][1:] for call in metrics.logger.info.call_args_list ]
+        self.assertEqual(len(messages), 3)
+        self.assertIn('API requests during this cycle: 100 (errors: 0, retries: 0, throttled: 0), 100.0 KB', messages[0])
+        self.assertIn('GET playlists/{id}/tracks: 100 requests', messages[1])
+        self.assertIn('latency p50 <= 50 ms, p95 <= 500 ms, p99 <= 500 ms', messages[1])
+        self.assertIn('Playlist %s: 100 requests' % self.playlist_id, messages[2])
+
+
+    def test_log_summary_logs_that_no_requests_were_made(self):
+        metrics = ApiMetrics(self.test_logger)
+        metrics.logger = Mock()
+        self.assertEqual(metrics.log_summary(), { 'endpoints': {}, 'playlists': {} })
+        metrics.logger.info.assert_called_once_with('No API requests were made during this cycle')
+
+
+    # ----- Tests for ApiMetrics.playlist_id ----- #
+
+    def test_playlist_id_returns_id_of_requested_playlist_if_any(self):
+        self.assertEqual(ApiMetrics.playlist_id(self.items_url), self.playlist_id)
+        self.assertEqual(ApiMetrics.playlist_id('https://api.spotify.com/v1/playlists/%s' % self.playlist_id),
+                         self.playlist_id)
+        self.assertIsNone(ApiMetrics.playlist_id('https://api.spotify.com/v1/me/playlists'))
@@ -0,0 +1,483 @@
+import unittest
+import gc
+import logging
+from time import monotonic, sleep
+from threading import Thread, Event
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, patch
+import requests
+from src.api_session import ApiSession
+from src.rate_limiter import RateLimiter
+from src.request_scheduler import RequestScheduler
+from src.retry_policy import RetryPolicy
+from src.circuit_breaker import CircuitOpenError
+from src.request_hedger import RequestHedger
+from src.concurrency_controller import ConcurrencyController
+from src.response_cache import ResponseCache
+
+class TestApiSession(unittest.TestCase):
+
+    def setUp(self):
+        self.test_logger = logging.getLogger('TestApiSession')
+        log_handler = logging.StreamHandler()
+        log_handler.setLevel('CRITICAL')
+        self.test_logger.addHandler(log_handler)
+        self.test_logger.propagate = False
+
+        self.make_response = lambda status, headers={}: Mock(status_code=status, headers=headers)
+
+
+    # ----- Tests for ApiSession.request ----- #
+
+    @patch('src.api_session.requests.Session.request')
+    def test_request_acquires_a_token_for_the_requested_endpoint_before_sending(self, send_mock):
+        send_mock.return_value = self.make_response(200)
+        limiter = Mock()
+        session = ApiSession(self.test_logger, rate_limiter=limiter)
+        response = session.request('GET', 'https://api.spotify.com/v1/me/playlists', params={ 'limit': 50 })
+
+        self.assertEqual(response, send_mock.return_value)
+        limiter.acquire.assert_called_once_with('GET me/playlists')
+        send_mock.assert_called_once_with('GET', 'https://api.spotify.com/v1/me/playlists', params={ 'limit': 50 })
+
+
+    @patch('src.api_session.requests.Session.request')
+    def test_request_waits_for_the_rate_limiter_via_the_scheduler_if_given(self, send_mock):
+        send_mock.return_value = self.make_response(200)
+        limiter = RateLimiter(rate=None)
+        scheduler = RequestScheduler(self.test_logger, limiter)
+        session = ApiSession(self.test_logger, rate_limiter=limiter, scheduler=scheduler)
+        with RequestScheduler.priority('enforcement'):
+            session.request('DELETE', 'https://api.spotify.com/v1/playlists/%s/tracks' % ('x' * 22))
+        session.request('GET', 'https://api.spotify.com/v1/me/playlists')
+
+        summary = scheduler.take_summary()
+        self.assertEqual((summary['enforcement']['requests'], summary['scan']['requests']), (1, 1))
+
+
+    @patch('src.api_session.requests.Session.request')
+    def test_request_sends_requests_with_the_configured_timeouts(self, send_mock):
+        send_mock.return_value = self.make_response(200)
+        session = ApiSession(self.test_logger, timeout=(2, 7))
+        session.request('GET', 'https://api.spotify.com/v1/me', timeout=5)
+        session.request('DELETE', 'https://api.spotify.com/v1/playlists/%s/tracks' % ('x' * 22))
+        self.assertEqual([ call[1]['timeout'] for call in send_mock.call_args_list ], [ (2, 7), (2, 7) ])
+
+
+    @patch('src.api_session.requests.Session.request')
+    def test_request_pauses_the_endpoint_for_the_retry_after_period_and_retries_if_throttled(self, send_mock):
+        send_mock.side_effect = [
+            self.make_response(429, { 'Retry-After': '0.2' }),
+            self.make_response(200)
+        ]
+        limiter = RateLimiter(rate=None)
+        session = ApiSession(self.test_logger, rate_limiter=limiter)
+
+        started = monotonic()
+        response = session.request('GET', 'https://api.spotify.com/v1/playlists/%s/tracks' % ('x' * 22))
+        self.assertGreaterEqual(monotonic() - started, 0.19)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(send_mock.call_count, 2)
+
+
+    @patch('src.api_session.requests.Session.request')
+    def test_request_returns_throttled_response_once_retries_are_exhausted(self, send_mock):
+        send_mock.return_value = self.make_response(429, { 'Retry-After': '0' })
+        session = ApiSession(self.test_logger, rate_limiter=RateLimiter(rate=None), max_throttled_retries=2)
+        response = session.request('GET', 'https://api.spotify.com/v1/me/playlists')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(send_mock.call_count, 3)
+
+
+    @patch('src.api_session.requests.Session.request')
+    def test_request_reports_latency_and_throttling_to_the_concurrency_controller(self, send_mock):
+        send_mock.side_effect = [
+            self.make_response(429, { 'Retry-After': '0' }),
+            self.make_response(200)
+        ]
+        controller = Mock()
+        session = ApiSession(self.test_logger, rate_limiter=RateLimiter(rate=None), concurrency_controller=controller)
+        session.request('GET', 'https://api.spotify.com/v1/me/playlists')
+
+        self.assertEqual(controller.acquire.call_count, 2)
+        self.assertEqual(controller.release.call_count, 2)
+        self.assertTrue(controller.release.call_args_list[0][1]['throttled'])
+        self.assertFalse(controller.release.call_args_list[1][1]['throttled'])
+        self.assertFalse(controller.release.call_args_list[1][1]['failed'])
+
+
+    @patch('src.api_session.requests.Session.request', side_effect=requests.exceptions.ConnectionError())
+    def test_request_releases_its_slot_in_the_concurrency_window_if_sending_fails(self, send_mock):
+        controller = Mock()
+        session = ApiSession(self.test_logger, concurrency_controller=controller)
+        self.assertRaises(requests.exceptions.ConnectionError, session.request,
+                          'GET', 'https://api.spotify.com/v1/me/playlists')
+        controller.release.assert_called_once()
+        self.assertTrue(controller.release.call_args[1]['failed'])
+
+
+    @patch('src.api_session.requests.Session.request')
+    def test_request_retries_reads_which_fail_with_server_errors(self, send_mock):
+        send_mock.side_effect = [
+            self.make_response(503),
+            self.make_response(500),
+            self.make_response(200)
+        ]
+        session = ApiSession(self.test_logger, retry_policy=RetryPolicy(max_retries=3, base_delay=0.01))
+        response = session.request('GET', 'https://api.spotify.com/v1/me/playlists')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(send_mock.call_count, 3)
+
+
+    @patch('src.api_session.requests.Session.request')
+    def test_request_retries_reads_which_fail_with_connection_errors(self, send_mock):
+        send_mock.side_effect = [ requests.exceptions.ConnectionError(), self.make_response(200) ]
+        session = ApiSession(self.test_logger, retry_policy=RetryPolicy(max_retries=3, base_delay=0.01))
+        self.assertEqual(session.request('GET', 'https://api.spotify.com/v1/me/playlists').status_code, 200)
+
+
+    @patch('src.api_session.requests.Session.request')
+    def test_request_does_not_retry_writes(self, send_mock):
+        send_mock.return_value = self.make_response(502)
+        session = ApiSession(self.test_logger, retry_policy=RetryPolicy(max_retries=3, base_delay=0.01))
+        response = session.request('POST', 'https://api.spotify.com/v1/playlists/%s/tracks' % ('x' * 22))
+        self.assertEqual(response.status_code, 502)
+        send_mock.assert_called_once()
+
+
+    @patch('src.api_session.requests.Session.request')
+    def test_request_returns_failed_response_once_retries_are_exhausted(self, send_mock):
+        send_mock.return_value = self.make_response(500)
+        session = ApiSession(self.test_logger, retry_policy=RetryPolicy(max_retries=2, base_delay=0.01))
+        self.assertEqual(session.request('GET', 'https://api.spotify.com/v1/me/playlists').status_code, 500)
+        self.assertEqual(send_mock.call_count, 3)
+
+
+    @patch('src.api_session.requests.Session.request')
+    def test_request_refuses_requests_to_an_endpoint_once_its_circuit_is_open(self, send_mock):
+        send_mock.return_value = self.make_response(500)
+        session = ApiSession(self.test_logger, retry_policy=RetryPolicy(max_retries=0),
+                             circuit_failure_threshold=2, circuit_reset_timeout=30)
+        session.request('GET', 'https://api.spotify.com/v1/me/playlists')
+        session.request('GET', 'https://api.spotify.com/v1/me/playlists')
+        self.assertRaises(CircuitOpenError, session.request, 'GET', 'https://api.spotify.com/v1/me/playlists')
+        self.assertEqual(send_mock.call_count, 2)
+
+        # other endpoints are not affected
+        send_mock.return_value = self.make_response(200)
+        self.assertEqual(session.request('GET', 'https://api.spotify.com/v1/playlists/%s' % ('x' * 22)).status_code, 200)
+
+
+    @patch('src.api_session.requests.Session.request')
+    def test_request_releases_trial_request_of_half_open_circuit_if_it_is_throttled(self, send_mock):
+        send_mock.side_effect = [ self.make_response(status) for status in [ 500, 429, 200, 200 ] ]
+        session = ApiSession(self.test_logger, circuit_failure_threshold=1, circuit_reset_timeout=0.1)
+        self.assertEqual(session.request('POST', 'https://api.spotify.com/v1/me/playlists').status_code, 500)
+        self.assertRaises(CircuitOpenError, session.request, 'POST', 'https://api.spotify.com/v1/me/playlists')
+        sleep(0.15)
+
+        # the throttled trial neither reopens nor closes the circuit, so the next request is the trial
+        self.assertEqual(session.request('POST', 'https://api.spotify.com/v1/me/playlists').status_code, 429)
+        self.assertTrue(session.get_circuit_breaker('POST me/playlists').is_open)
+        self.assertEqual(session.request('POST', 'https://api.spotify.com/v1/me/playlists').status_code, 200)
+        self.assertEqual(session.request('POST', 'https://api.spotify.com/v1/me/playlists').status_code, 200)
+
+
+    @patch('src.api_session.requests.Session.request')
+    def test_request_releases_trial_request_of_half_open_circuit_if_it_fails_unexpectedly(self, send_mock):
+        send_mock.side_effect = [ self.make_response(500), ValueError('unexpected'), self.make_response(200) ]
+        session = ApiSession(self.test_logger, circuit_failure_threshold=1, circuit_reset_timeout=0.1)
+        session.request('POST', 'https://api.spotify.com/v1/me/playlists')
+        sleep(0.15)
+        self.assertRaises(ValueError, session.request, 'POST', 'https://api.spotify.com/v1/me/playlists')
+        self.assertEqual(session.request('POST', 'https://api.spotify.com/v1/me/playlists').status_code, 200)
+
+
+    @patch('src.api_session.requests.Session.request')
+    def test_request_sends_one_request_for_identical_reads_which_are_in_flight_at_the_same_time(self, send_mock):
+        release = Event()
+        def send(*args, **kwargs):
+            release.wait()
+            return self.make_response(200)
+        send_mock.side_effect = send
+
+        session = ApiSession(self.test_logger)
+        url = 'https://api.spotify.com/v1/playlists/%s/tracks' % ('x' * 22)
+        responses = []
+        threads = [
+            Thread(target=lambda: responses.append(session.request('GET', url, params={ 'offset': 0, 'limit': 100 })))
+            for i in range(0, 3)
+        ]
+        for thread in threads:
+            thread.start()
+        sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        send_mock.assert_called_once()
+        self.assertEqual(len(responses), 3)
+        self.assertIs(responses[0], responses[1])
+        self.assertEqual(session.single_flight.shared_calls, 2)
+
+
+    @patch('src.api_session.requests.Session.request')
+    def test_request_does_not_coalesce_writes(self, send_mock):
+        send_mock.return_value = self.make_response(201)
+        session = ApiSession(self.test_logger)
+        session.single_flight.do = Mock()
+        session.request('POST', 'https://api.spotify.com/v1/playlists/%s/tracks' % ('x' * 22))
+        session.single_flight.do.assert_not_called()
+        send_mock.assert_called_once()
+
+
+    @patch('src.api_session.requests.Session.request')
+    def test_request_hedges_slow_reads_and_uses_the_first_response(self, send_mock):
+        slow_response = self.make_response(200)
+        fast_response = self.make_response(200)
+        send_mock.side_effect = lambda *args, **kwargs: (
+            sleep(0.5) or slow_response if send_mock.call_count == 1 else fast_response)
+
+        hedger = RequestHedger(percentile=50, min_samples=1)
+        hedger.record_latency('GET me/playlists', 0.05)
+        limiter = RateLimiter(rate=None)
+        limiter.acquire = Mock()
+        session = ApiSession(self.test_logger, rate_limiter=limiter, hedger=hedger, single_flight=False)
+
+        self.assertIs(session.request('GET', 'https://api.spotify.com/v1/me/playlists'), fast_response)
+        self.assertEqual(send_mock.call_count, 2)
+        self.assertEqual(limiter.acquire.call_count, 2) # the hedged request is rate limited
+        self.assertEqual(hedger.hedged_requests, 1)
+        self.assertEqual(hedger.hedge_wins, 1)
+        session.close()
+
+
+    @patch('src.api_session.requests.Session.request')
+    def test_request_does_not_hedge_reads_if_no_slot_of_the_concurrency_window_is_free(self, send_mock):
+        response = self.make_response(200)
+        send_mock.side_effect = lambda *args, **kwargs: sleep(0.3) or response
+        hedger = RequestHedger(percentile=50, min_samples=1)
+        hedger.record_latency('GET me/playlists', 0.05)
+        controller = ConcurrencyController(self.test_logger, max_window=1, initial_window=1)
+        session = ApiSession(self.test_logger, concurrency_controller=controller, hedger=hedger, single_flight=False)
+
+        started = monotonic()
+        self.assertIs(session.request('GET', 'https://api.spotify.com/v1/me/playlists'), response)
+        # the hedge would only have been sent once the request it backs up was answered
+        self.assertLess(monotonic() - started, 0.5)
+        send_mock.assert_called_once()
+        self.assertEqual(hedger.hedged_requests, 0)
+        self.assertEqual(controller.in_flight, 0)
+
+        # a hedge takes a free slot for as long as it is in flight
+        controller._window = 2.0
+        send_mock.side_effect = lambda *args, **kwargs: sleep(0.8 if send_mock.call_count == 2 else 0) or response
+        session.request('GET', 'https://api.spotify.com/v1/me/playlists')
+        self.assertEqual(hedger.hedged_requests, 1)
+        sleep(0.9)
+        self.assertEqual(controller.in_flight, 0)
+        session.close()
+
+
+    @patch('src.api_session.requests.Session.request')
+    def test_request_does_not_hedge_reads_answered_while_the_hedge_waited_for_the_rate_limiter(self, send_mock):
+        response = self.make_response(200)
+        send_mock.side_effect = lambda *args, **kwargs: sleep(0.2) or response
+        hedger = RequestHedger(percentile=50, min_samples=1)
+        hedger.record_latency('GET me/playlists', 0.05)
+        limiter = RateLimiter(rate=None)
+        limiter.acquire = Mock(side_effect=lambda endpoint: sleep(0.4) if limiter.acquire.call_count == 2 else None)
+        controller = ConcurrencyController(self.test_logger, max_window=2, initial_window=2)
+        session = ApiSession(self.test_logger, rate_limiter=limiter, concurrency_controller=controller, hedger=hedger,
+                             single_flight=False)
+
+        self.assertIs(session.request('GET', 'https://api.spotify.com/v1/me/playlists'), response)
+        send_mock.assert_called_once()
+        self.assertEqual(hedger.hedged_requests, 0)
+        self.assertEqual(controller.in_flight, 0) # the slot taken for the hedge was released
+        session.close()
+
+
+    @patch('src.api_session.requests.Session.request')
+    def test_request_sends_hedged_requests_with_the_priority_class_of_the_caller(self, send_mock):
+        classes = []
+        def send(*args, **kwargs):
+            classes.append(RequestScheduler.current_class())
+            if len(classes) == 1:
+                sleep(0.3)
+            return self.make_response(200)
+        send_mock.side_effect = send
+        hedger = RequestHedger(percentile=50, min_samples=1)
+        hedger.record_latency('GET me/playlists', 0.05)
+        session = ApiSession(self.test_logger, hedger=hedger, single_flight=False)
+
+        with RequestScheduler.priority('probe'):
+            session.request('GET', 'https://api.spotify.com/v1/me/playlists')
+        self.assertEqual(classes, [ 'probe', 'probe' ])
+        session.close()
+
+
+    @patch('src.api_session.requests.Session.request')
+    def test_request_does_not_hedge_reads_which_answer_within_the_hedge_delay(self, send_mock):
+        send_mock.return_value = self.make_response(200)
+        hedger = RequestHedger(percentile=50, min_samples=1)
+        hedger.record_latency('GET me/playlists', 1.0)
+        session = ApiSession(self.test_logger, hedger=hedger)
+
+        session.request('GET', 'https://api.spotify.com/v1/me/playlists')
+        send_mock.assert_called_once()
+        self.assertEqual(hedger.hedged_requests, 0)
+        session.close()
+
+
+    @patch('src.api_session.requests.Session.request')
+    def test_request_does_not_hedge_writes(self, send_mock):
+        send_mock.side_effect = lambda *args, **kwargs: sleep(0.1) or self.make_response(201)
+        hedger = RequestHedger(percentile=50, min_samples=1)
+        hedger.record_latency('POST playlists/{id}/tracks', 0.01)
+        session = ApiSession(self.test_logger, hedger=hedger)
+
+        session.request('POST', 'https://api.spotify.com/v1/playlists/%s/tracks' % ('x' * 22))
+        send_mock.assert_called_once()
+        session.close()
+
+
+    @patch('src.api_session.requests.Session.request')
+    def test_request_caches_reads_with_etags_and_serves_unchanged_data_from_the_cache(self, send_mock):
+        cache = ResponseCache(self.test_logger, 'data/test/cache')
+        cache.get = Mock(return_value=None)
+        cache.put = Mock()
+        first_response = self.make_response(200, { 'ETag': '"etag1"', 'Content-Type': 'application/json' })
+        first_response.content = b'{"items": []}'
+        send_mock.return_value = first_response
+
+        session = ApiSession(self.test_logger, response_cache=cache)
+        url = 'https://api.spotify.com/v1/playlists/%s/tracks' % ('x' * 22)
+        self.assertIs(session.request('GET', url, params={ 'offset': 0 }), first_response)
+        cache.put.assert_called_once_with(url + '?offset=0', '"etag1"', b'{"items": []}',
+                                          content_type='application/json')
+
+        cache.get = Mock(return_value={ 'etag': '"etag1"', 'content': '{"items": []}', 'content_type': 'application/json' })
+        send_mock.return_value = self.make_response(304, {})
+        response = session.request('GET', url, params={ 'offset': 0 }, headers={ 'Authorization': 'Bearer a' })
+        self.assertEqual(send_mock.call_args[1]['headers'], { 'Authorization': 'Bearer a', 'If-None-Match': '"etag1"' })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), { 'items': [] })
+        self.assertEqual(cache.hits, 1)
+
+
+    @patch('src.api_session.requests.Session.request')
+    def test_request_does_not_use_the_cache_for_writes(self, send_mock):
+        send_mock.return_value = self.make_response(201, { 'ETag': '"etag1"' })
+        cache = Mock()
+        session = ApiSession(self.test_logger, response_cache=cache)
+        session.request('POST', 'https://api.spotify.com/v1/playlists/%s/tracks' % ('x' * 22))
+        cache.get.assert_not_called()
+        cache.put.assert_not_called()
+
+
+    @patch('src.api_session.requests.Session.request')
+    def test_request_records_every_attempt_with_its_status_size_and_retry_in_metrics(self, send_mock):
+        send_mock.side_effect = [
+            self.make_response(503, { 'Content-Length': '10' }),
+            self.make_response(200, { 'Content-Length': '2048' })
+        ]
+        metrics = Mock()
+        session = ApiSession(self.test_logger, retry_policy=RetryPolicy(max_retries=1, base_delay=0), metrics=metrics)
+        url = 'https://api.spotify.com/v1/playlists/%s/tracks' % ('x' * 22)
+        session.request('GET', url)
+
+        self.assertEqual(metrics.record.call_count, 2)
+        self.assertEqual(metrics.record.call_args_list[0][0][0:3], ('GET playlists/{id}/tracks', url, 503))
+        self.assertEqual(metrics.record.call_args_list[0][1], { 'size': 10, 'retry': False })
+        self.assertEqual(metrics.record.call_args_list[1][0][2], 200)
+        self.assertEqual(metrics.record.call_args_list[1][1], { 'size': 2048, 'retry': True })
+
+
+    @patch('src.api_session.requests.Session.request')
+    def test_request_records_failed_connections_and_reads_served_from_the_cache_in_metrics(self, send_mock):
+        cache = Mock()
+        cache.get.return_value = { 'etag': '"etag1"', 'content': '{}', 'content_type': None }
+        send_mock.side_effect = [ requests.exceptions.ConnectionError('failed'),
+                                 self.make_response(304, { 'Content-Length': '0' }) ]
+        metrics = Mock()
+        session = ApiSession(self.test_logger, retry_policy=RetryPolicy(max_retries=1, base_delay=0),
+                             response_cache=cache, metrics=metrics)
+        session.request('GET', 'https://api.spotify.com/v1/me/playlists')
+
+        self.assertIsNone(metrics.record.call_args_list[0][0][2])
+        self.assertEqual(metrics.record.call_args_list[1][0][2], 304)
+        metrics.record_event.assert_called_once_with('GET me/playlists', 'cached')
+
+
+    # ----- Tests for ApiSession.request_key ----- #
+
+    def test_request_key_distinguishes_reads_by_url_parameters_and_token(self):
+        url = 'https://api.spotify.com/v1/playlists/%s/tracks' % ('x' * 22)
+        key = ApiSession.request_key('GET', url, { 'params': { 'offset': 0, 'limit': 100 },
+                                                   'headers': { 'Authorization': 'Bearer a' } })
+        self.assertEqual(key, ApiSession.request_key('get', url, { 'params': { 'limit': 100, 'offset': 0 },
+                                                                   'headers': { 'Authorization': 'Bearer a' } }))
+        self.assertNotEqual(key, ApiSession.request_key('GET', url, { 'params': { 'offset': 100, 'limit': 100 },
+                                                                      'headers': { 'Authorization': 'Bearer a' } }))
+        self.assertNotEqual(key, ApiSession.request_key('GET', url, { 'params': { 'offset': 0, 'limit': 100 },
+                                                                      'headers': { 'Authorization': 'Bearer b' } }))
+
+
+    # ----- Tests for ApiSession.get_thread_session ----- #
+
+    def test_get_thread_session_returns_one_session_per_thread_which_share_one_connection_pool(self):
+        session = ApiSession(self.test_logger, pool_size=4)
+        thread_sessions = []
+        threads = [ Thread(target=lambda: thread_sessions.append(session.get_thread_session())) for i in range(0, 3) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertIs(session.get_thread_session(), session.get_thread_session())
+        self.assertEqual(len(set([ id(thread_session) for thread_session in thread_sessions ])), 3)
+        for thread_session in thread_sessions:
+            self.assertIsNot(thread_session, session.get_thread_session())
+            self.assertIs(thread_session.get_adapter('https://api.spotify.com'),
+                          session.get_adapter('https://api.spotify.com'))
+        self.assertEqual(session.get_adapter('https://api.spotify.com')._pool_maxsize, 4)
+
+
+    def test_get_thread_session_does_not_keep_sessions_of_threads_which_have_ended(self):
+        session = ApiSession(self.test_logger)
+        for round in range(0, 50):
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                for future in [ executor.submit(lambda: session.get_thread_session() and None) for i in range(0, 4) ]:
+                    future.result()
+        gc.collect()
+        self.assertEqual(len(session._thread_sessions), 0)
+
+
+    def test_get_thread_session_asks_for_connections_to_be_closed_if_keep_alive_is_disabled(self):
+        self.assertEqual(ApiSession(self.test_logger, keep_alive=False).get_thread_session().headers['Connection'], 'close')
+        self.assertNotEqual(ApiSession(self.test_logger).get_thread_session().headers['Connection'], 'close')
+
+
+    # ----- Tests for ApiSession.endpoint_name ----- #
+
+    def test_endpoint_name_replaces_spotify_ids_and_removes_query_parameters(self):
+        pl_id = 'abcdefghijklmnopqrstuv'
+        self.assertEqual(ApiSession.endpoint_name('get', 'https://api.spotify.com/v1/playlists/%s/tracks?offset=100' % pl_id),
+                         'GET playlists/{id}/tracks')
+        self.assertEqual(ApiSession.endpoint_name('GET', 'https://api.spotify.com/v1/playlists/%s' % pl_id),
+                         'GET playlists/{id}')
+        self.assertEqual(ApiSession.endpoint_name('DELETE', 'https://api.spotify.com/v1/playlists/%s/tracks' % pl_id),
+                         'DELETE playlists/{id}/tracks')
+
+
+    # ----- Tests for ApiSession.get_retry_after ----- #
+
+    def test_get_retry_after_returns_default_if_header_is_missing_or_invalid(self):
+        self.assertEqual(ApiSession.get_retry_after(self.make_response(429, {}), default=2.0), 2.0)
+        self.assertEqual(ApiSession.get_retry_after(self.make_response(429, { 'Retry-After': 'soon' })), 1.0)
+        self.assertEqual(ApiSession.get_retry_after(self.make_response(429, { 'Retry-After': '7' })), 7.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
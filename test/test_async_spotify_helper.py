@@ -0,0 +1,143 @@
+import unittest
+import asyncio
+import logging
+import random
+import string
+import tempfile
+from threading import current_thread, main_thread
+from unittest.mock import Mock
+import spotipy
+import src.main as main
+from src.async_spotify_helper import AsyncSpotifyHelper
+from src.spotify_helper import SpotifyHelper
+from src.request_scheduler import RequestScheduler
+from src.fake_spotify_server import FakeSpotifyServer
+from src.workload_generator import WorkloadGenerator
+from src.api_session import ApiSession
+from src.retry_policy import RetryPolicy
+from src.playlist_cleaner import PlaylistCleaner
+from src.integrity_manager import IntegrityManager
+
+class TestAsyncSpotifyHelper(unittest.TestCase):
+
+    def setUp(self):
+        self.test_logger = logging.getLogger('TestAsyncSpotifyHelper')
+        log_handler = logging.StreamHandler()
+        log_handler.setLevel('CRITICAL')
+        self.test_logger.addHandler(log_handler)
+
+        self.test_api = spotipy.client.Spotify()
+        self.helper = AsyncSpotifyHelper(self.test_logger, api=self.test_api, max_workers=4)
+
+        self.generate_spotify_id = (
+            lambda: ''.join(random.choice(string.ascii_letters + string.digits) for i in range(0, 22)))
+        self.generate_track_uri = (
+            lambda gen_id=self.generate_spotify_id: 'spotify:track:' + gen_id())
+
+
+    def tearDown(self):
+        self.helper.close()
+
+
+    # ----- Tests for AsyncSpotifyHelper.call ----- #
+
+    def test_call_runs_blocking_function_in_a_worker_thread(self):
+        threads = []
+        def blocking_func(value, multiplier=1):
+            threads.append(current_thread())
+            return value * multiplier
+
+        self.assertEqual(asyncio.run(self.helper.call(blocking_func, 3, multiplier=2)), 6)
+        self.assertIsNot(threads[0], main_thread())
+
+
+    def test_call_runs_blocking_function_with_the_priority_class_of_the_caller(self):
+        async def get_class():
+            with RequestScheduler.priority('enforcement'):
+                return await self.helper.call(RequestScheduler.current_class)
+        self.assertEqual(asyncio.run(get_class()), 'enforcement')
+        self.assertEqual(asyncio.run(self.helper.call(RequestScheduler.current_class)), 'scan')
+
+
+    def test_call_allows_many_blocking_calls_to_be_in_flight_at_once(self):
+        in_flight = []
+        max_in_flight = []
+        def blocking_func():
+            in_flight.append(1)
+            max_in_flight.append(len(in_flight))
+            asyncio.run(asyncio.sleep(0.05)) # i.e., waiting for a response
+            in_flight.pop()
+
+        async def make_calls():
+            await asyncio.gather(*[ self.helper.call(blocking_func) for i in range(0, 4) ])
+
+        asyncio.run(make_calls())
+        self.assertGreater(max(max_in_flight), 1)
+
+
+    # ----- Tests for AsyncSpotifyHelper methods ----- #
+
+    def test_get_all_items_in_playlist_returns_items_received_by_spotify_helper(self):
+        pl_id = self.generate_spotify_id()
+        items = [ { 'track': { 'uri': self.generate_track_uri() }, 'position': 0 } ]
+        self.helper.spotify_helper.get_all_items_in_playlist = Mock(return_value=items)
+        self.assertEqual(asyncio.run(self.helper.get_all_items_in_playlist(pl_id, fields='items', total=1)), items)
+        self.helper.spotify_helper.get_all_items_in_playlist.assert_called_once_with(
+            pl_id, fields='items', api=None, total=1)
+
+
+    def test_get_all_collab_playlists_returns_playlists_received_by_spotify_helper(self):
+        playlists = [ { 'uri': 'spotify:playlist:' + self.generate_spotify_id() } ]
+        self.helper.spotify_helper.get_all_collab_playlists = Mock(return_value=playlists)
+        self.assertEqual(asyncio.run(self.helper.get_all_collab_playlists('creator')), playlists)
+        self.helper.spotify_helper.get_all_collab_playlists.assert_called_once_with('creator', api=None)
+
+
+    def test_add_and_remove_items_are_passed_to_spotify_helper(self):
+        pl_id = self.generate_spotify_id()
+        items = [ { 'uri': self.generate_track_uri(), 'position': 3 } ]
+        self.helper.spotify_helper.add_items_to_playlist = Mock()
+        self.helper.spotify_helper.remove_items_from_playlist = Mock()
+        asyncio.run(self.helper.add_items_to_playlist(pl_id, items, api=self.test_api))
+        asyncio.run(self.helper.remove_items_from_playlist(pl_id, items, api=self.test_api))
+        self.helper.spotify_helper.add_items_to_playlist.assert_called_once_with(pl_id, items, api=self.test_api)
+        self.helper.spotify_helper.remove_items_from_playlist.assert_called_once_with(pl_id, items, api=self.test_api)
+
+
+    def test_async_spotify_helper_uses_the_given_api_client(self):
+        self.assertIs(self.helper.api, self.test_api)
+        self.assertEqual(self.helper.get_playlist_id('spotify:playlist:' + 'a' * 22),
+                         SpotifyHelper.get_playlist_id('spotify:playlist:' + 'a' * 22))
+
+
+
+    # ----- Tests for moderating playlists concurrently against a fake Spotify server ----- #
+
+    def test_playlists_moderated_concurrently_over_http_lose_only_their_unauthorized_items(self):
+        server = FakeSpotifyServer(self.test_logger, seed=0).start()
+        self.addCleanup(server.stop)
+        generator = WorkloadGenerator(seed=0, num_playlists=6, playlist_size=('randint', 50, 250), unauthorized_rate=0.1)
+        playlists = generator.generate(server)
+        authorized_items = [
+            [ item for item in server.get_playlist_items(playlist['uri']) if not item[1].startswith('intruder') ]
+            for playlist in playlists
+        ]
+        session = ApiSession(self.test_logger, retry_policy=RetryPolicy(max_retries=3, base_delay=0, max_delay=0))
+        api = server.client(requests_session=session)
+        backup_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(backup_dir.cleanup)
+        config = generator.playlist_config(backup_path=backup_dir.name)
+        cleaner = PlaylistCleaner(self.test_logger, api, server.user_id, config)
+        integrity_manager = IntegrityManager(self.test_logger, api, config)
+
+        for use_snapshots in [ False, True ]:
+            asyncio.run(main.moderate_playlists_concurrently(self.test_logger, api, cleaner, integrity_manager,
+                                                             playlists, 3, use_snapshots=use_snapshots))
+            self.assertEqual([ server.get_playlist_items(playlist['uri']) for playlist in playlists ],
+                             authorized_items)
+        # every playlist had unauthorized items, which were removed in the first run only
+        self.assertEqual(server.request_counts['DELETE playlists/{id}/tracks'], len(playlists))
+
+
+if __name__ == '__main__':
+    unittest.main()
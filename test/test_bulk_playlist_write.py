@@ -0,0 +1,232 @@
+import unittest
+import logging
+from threading import Event
+import requests
+import spotipy
+from src.bulk_playlist_write import BulkPlaylistWrite, BulkWriteError
+from src.fake_spotify import FakeSpotify
+from src.spotify_helper import SpotifyHelper
+from src.retry_policy import RetryPolicy
+from src.request_scheduler import RequestScheduler
+from src.watchdog import Watchdog
+
+class TestBulkPlaylistWrite(unittest.TestCase):
+
+    def setUp(self):
+        self.test_logger = logging.getLogger('TestBulkPlaylistWrite')
+        log_handler = logging.StreamHandler()
+        log_handler.setLevel('CRITICAL')
+        self.test_logger.addHandler(log_handler)
+        self.test_logger.propagate = False
+        self.api = FakeSpotify(self.test_logger, seed=0)
+        self.helper = SpotifyHelper(self.test_logger, api=self.api)
+        self.helper.retry_policy = RetryPolicy(max_retries=0, base_delay=0, max_delay=0)
+        self.track_uris = [ self.api.server.add_track() for num in range(0, 1000) ]
+
+
+    def fail_once(self, func, failing_call, status=503):
+        # the write function fails (with a transient error by default) the `failing_call`th time it is called
+        calls = []
+        def write(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == failing_call:
+                raise spotipy.exceptions.SpotifyException(status, -1, 'error', headers={})
+            return func(*args, **kwargs)
+        return write
+
+
+    # ----- Tests for removals ----- #
+
+    def test_run_removes_chunks_in_parallel_at_positions_of_one_snapshot(self):
+        playlist_uri = self.api.server.add_playlist(items=[ (uri, 'user1') for uri in self.track_uris ])
+        removed = [ { 'uri': self.track_uris[position], 'position': position } for position in range(0, 1000, 2) ]
+
+        write = BulkPlaylistWrite(self.helper, self.api, playlist_uri, 'remove', removed, max_parallel=4)
+        self.assertEqual(write.run(), self.api.server.get_snapshot_id(playlist_uri))
+        self.assertTrue(write.is_complete)
+        self.assertEqual(len(write.chunks), 5)
+        self.assertEqual([ uri for (uri, adder) in self.api.server.get_playlist_items(playlist_uri) ],
+                         self.track_uris[1:1000:2])
+        self.assertEqual(self.api.request_counts['DELETE playlists/{id}/tracks'], 5)
+
+
+    def test_run_sends_chunks_removed_in_parallel_with_the_priority_class_of_the_write(self):
+        playlist_uri = self.api.server.add_playlist(items=[ (uri, 'user1') for uri in self.track_uris ])
+        removed = [ { 'uri': self.track_uris[position], 'position': position } for position in range(0, 500) ]
+        classes = []
+        remove = self.api.playlist_remove_specific_occurrences_of_items
+        def remove_and_record_class(*args, **kwargs):
+            classes.append(RequestScheduler.current_class())
+            return remove(*args, **kwargs)
+        self.api.playlist_remove_specific_occurrences_of_items = remove_and_record_class
+
+        with RequestScheduler.priority('enforcement'):
+            BulkPlaylistWrite(self.helper, self.api, playlist_uri, 'remove', removed, max_parallel=4).run()
+        self.assertEqual(classes, [ 'enforcement' ] * 5)
+
+
+    def test_run_removes_items_at_positions_of_given_snapshot_after_playlist_changed(self):
+        playlist_uri = self.api.server.add_playlist(items=[ (uri, 'user1') for uri in self.track_uris[0:300] ])
+        snapshot_id = self.api.server.get_snapshot_id(playlist_uri)
+        self.api.server.add_items(playlist_uri, [ (self.track_uris[999], 'user2') ], position=0)
+        removed = [ { 'uri': self.track_uris[position], 'position': position } for position in range(100, 300) ]
+
+        snapshot_id = BulkPlaylistWrite(self.helper, self.api, playlist_uri, 'remove', removed,
+                                        snapshot_id=snapshot_id).run()
+        self.assertEqual(snapshot_id, self.api.server.get_snapshot_id(playlist_uri))
+        self.assertEqual([ uri for (uri, adder) in self.api.server.get_playlist_items(playlist_uri) ],
+                         [ self.track_uris[999] ] + self.track_uris[0:100])
+
+
+    def test_run_resumes_removals_from_chunks_which_were_not_applied(self):
+        playlist_uri = self.api.server.add_playlist(items=[ (uri, 'user1') for uri in self.track_uris ])
+        removed = [ { 'uri': self.track_uris[position], 'position': position } for position in range(0, 500) ]
+        self.api.playlist_remove_specific_occurrences_of_items = self.fail_once(
+            self.api.playlist_remove_specific_occurrences_of_items, 3)
+
+        write = BulkPlaylistWrite(self.helper, self.api, playlist_uri, 'remove', removed)
+        with self.assertRaises(BulkWriteError) as context:
+            write.run()
+        self.assertTrue(RetryPolicy.is_transient_error(context.exception))
+        self.assertEqual(write.next_chunk, 2)
+        self.assertEqual(write.applied_items, removed[0:200])
+        self.assertEqual(write.unapplied_items, removed[200:500])
+        self.assertEqual(len(self.api.server.get_playlist_items(playlist_uri)), 800)
+
+        context.exception.resume()
+        self.assertTrue(write.is_complete)
+        self.assertEqual([ uri for (uri, adder) in self.api.server.get_playlist_items(playlist_uri) ],
+                         self.track_uris[500:1000])
+
+
+    def test_run_moves_positions_up_by_chunks_removed_before_them_if_snapshot_id_is_unknown(self):
+        playlist_uri = self.api.server.add_playlist(items=[ (uri, 'user1') for uri in self.track_uris ])
+        removed = [ { 'uri': self.track_uris[position], 'position': position } for position in range(0, 1000, 2) ]
+        self.helper._get_snapshot_id = lambda playlist_id, api: None
+
+        write = BulkPlaylistWrite(self.helper, self.api, playlist_uri, 'remove', removed, max_parallel=4)
+        write.run()
+        self.assertTrue(write.is_complete)
+        self.assertEqual([ uri for (uri, adder) in self.api.server.get_playlist_items(playlist_uri) ],
+                         self.track_uris[1:1000:2])
+
+
+    def test_remove_items_from_playlist_resumes_write_which_stopped_due_to_a_transient_error(self):
+        self.helper.retry_policy = RetryPolicy(max_retries=1, base_delay=0, max_delay=0)
+        playlist_uri = self.api.server.add_playlist(items=[ (uri, 'user1') for uri in self.track_uris ])
+        removed = [ { 'uri': self.track_uris[position], 'position': position } for position in range(0, 500) ]
+        # the third chunk fails even when it is retried, which stops the write
+        self.api.playlist_remove_specific_occurrences_of_items = self.fail_once(
+            self.fail_once(self.api.playlist_remove_specific_occurrences_of_items, 3), 3)
+
+        snapshot_id = self.helper.remove_items_from_playlist(playlist_uri, removed, api=self.api)
+        self.assertEqual(snapshot_id, self.api.server.get_snapshot_id(playlist_uri))
+        self.assertEqual([ uri for (uri, adder) in self.api.server.get_playlist_items(playlist_uri) ],
+                         self.track_uris[500:1000])
+        self.assertEqual(self.api.request_counts['DELETE playlists/{id}/tracks'], 5)
+
+
+    def test_add_items_to_playlist_does_not_resume_write_which_stopped_due_to_a_client_error(self):
+        self.helper.retry_policy = RetryPolicy(max_retries=3, base_delay=0, max_delay=0)
+        playlist_uri = self.api.server.add_playlist()
+        added = [ { 'uri': uri } for uri in self.track_uris[0:300] ]
+        self.api.playlist_add_items = self.fail_once(self.api.playlist_add_items, 2, status=403)
+
+        with self.assertRaises(BulkWriteError) as context:
+            self.helper.add_items_to_playlist(playlist_uri, added, api=self.api)
+        self.assertEqual(context.exception.write.next_chunk, 1)
+        self.assertEqual(len(self.api.server.get_playlist_items(playlist_uri)), 100)
+
+
+    def test_run_raises_error_of_write_of_a_single_chunk(self):
+        playlist_uri = self.api.server.add_playlist(items=[ (self.track_uris[0], 'user1') ])
+        with self.assertRaises(spotipy.exceptions.SpotifyException) as context:
+            BulkPlaylistWrite(self.helper, self.api, playlist_uri, 'remove', [
+                { 'uri': self.track_uris[1], 'position': 0 }
+            ]).run()
+        self.assertEqual(context.exception.http_status, 400)
+
+
+    # ----- Tests for additions ----- #
+
+    def test_run_adds_chunks_in_order_at_explicit_positions(self):
+        playlist_uri = self.api.server.add_playlist(items=[ (self.track_uris[0], 'user1'), (self.track_uris[1], 'user1') ])
+        added = [ { 'uri': uri } for uri in self.track_uris[2:252] ]
+
+        snapshot_id = BulkPlaylistWrite(self.helper, self.api, playlist_uri, 'add', added, position=1).run()
+        self.assertEqual(snapshot_id, self.api.server.get_snapshot_id(playlist_uri))
+        self.assertEqual([ uri for (uri, adder) in self.api.server.get_playlist_items(playlist_uri) ],
+                         [ self.track_uris[0] ] + self.track_uris[2:252] + [ self.track_uris[1] ])
+
+
+    def test_run_resumes_additions_from_first_chunk_which_was_not_applied(self):
+        playlist_uri = self.api.server.add_playlist()
+        added = [ { 'uri': uri } for uri in self.track_uris[0:350] ]
+        self.api.playlist_add_items = self.fail_once(self.api.playlist_add_items, 2)
+
+        write = BulkPlaylistWrite(self.helper, self.api, playlist_uri, 'add', added)
+        with self.assertRaises(BulkWriteError):
+            write.run()
+        self.assertEqual(write.next_chunk, 1)
+        self.assertEqual(write.snapshot_id, self.api.server.get_snapshot_id(playlist_uri))
+
+        write.run()
+        self.assertEqual([ uri for (uri, adder) in self.api.server.get_playlist_items(playlist_uri) ],
+                         self.track_uris[0:350])
+        self.assertEqual(self.api.request_counts['POST playlists/{id}/tracks'], 4)
+
+
+    def test_run_assumes_failed_addition_was_applied_if_playlist_changed_before_resuming(self):
+        playlist_uri = self.api.server.add_playlist()
+        added = [ { 'uri': uri } for uri in self.track_uris[0:200] ]
+        add_items = self.api.playlist_add_items
+        def add_items_and_lose_response(*args, **kwargs):
+            add_items(*args, **kwargs)
+            raise requests.exceptions.ConnectionError('connection reset')
+        calls = [ add_items, add_items_and_lose_response, add_items ]
+        self.api.playlist_add_items = lambda *args, **kwargs: calls.pop(0)(*args, **kwargs)
+
+        write = BulkPlaylistWrite(self.helper, self.api, playlist_uri, 'add', added)
+        with self.assertRaises(BulkWriteError):
+            write.run()
+        write.run()
+        self.assertTrue(write.is_complete)
+        self.assertEqual([ uri for (uri, adder) in self.api.server.get_playlist_items(playlist_uri) ],
+                         self.track_uris[0:200])
+        self.assertEqual(len(calls), 1)
+
+
+    def test_run_sends_failed_addition_again_if_playlist_changed_without_containing_it(self):
+        playlist_uri = self.api.server.add_playlist()
+        added = [ { 'uri': uri } for uri in self.track_uris[0:200] ]
+        self.api.playlist_add_items = self.fail_once(self.api.playlist_add_items, 2)
+
+        write = BulkPlaylistWrite(self.helper, self.api, playlist_uri, 'add', added)
+        with self.assertRaises(BulkWriteError):
+            write.run()
+        # someone else changes the playlist before the write is resumed
+        self.api.server.add_items(playlist_uri, [ (self.track_uris[500], 'user1') ])
+        write.run()
+        self.assertTrue(write.is_complete)
+        self.assertEqual([ uri for (uri, adder) in self.api.server.get_playlist_items(playlist_uri) ],
+                         self.track_uris[0:100] + [ self.track_uris[500] ] + self.track_uris[100:200])
+
+
+    def test_run_stops_before_the_next_chunk_once_cancelled(self):
+        playlist_uri = self.api.server.add_playlist()
+        added = [ { 'uri': uri } for uri in self.track_uris[0:300] ]
+        cancelled = Event()
+        add_items = self.api.playlist_add_items
+        self.api.playlist_add_items = lambda *args, **kwargs: cancelled.set() or add_items(*args, **kwargs)
+
+        write = BulkPlaylistWrite(self.helper, self.api, playlist_uri, 'add', added)
+        with Watchdog.cancellation(cancelled):
+            with self.assertRaises(BulkWriteError):
+                write.run()
+        self.assertEqual(write.next_chunk, 1)
+        self.assertEqual(len(self.api.server.get_playlist_items(playlist_uri)), 100)
+
+
+    def test_bulk_playlist_write_raises_error_for_unknown_operation(self):
+        with self.assertRaises(ValueError):
+            BulkPlaylistWrite(self.helper, self.api, 'a' * 22, 'replace', [])
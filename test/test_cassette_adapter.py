@@ -0,0 +1,131 @@
+import unittest
+import logging
+import os
+import re
+from unittest.mock import Mock, patch
+import requests
+from src.cassette_adapter import CassetteAdapter, CassetteMissError
+
+class TestCassetteAdapter(unittest.TestCase):
+
+    def setUp(self):
+        self.test_logger = logging.getLogger('TestCassetteAdapter')
+        log_handler = logging.StreamHandler()
+        log_handler.setLevel('CRITICAL')
+        self.test_logger.addHandler(log_handler)
+        self.test_logger.propagate = False
+
+        self.test_cassette_dir = 'data/test/cassettes'
+        self.test_cassette_path = '%s/test.jsonl.gz' % self.test_cassette_dir
+        self.clear_cassette_files()
+
+
+    def tearDown(self):
+        self.clear_cassette_files()
+
+
+    def clear_cassette_files(self):
+        for filename in os.listdir(self.test_cassette_dir):
+            if re.search('^\\.gitignore$', filename) is None:
+                os.remove('%s/%s' % (self.test_cassette_dir, filename))
+
+
+    def build_response(self, request, status, content):
+        response = requests.Response()
+        response.status_code = status
+        response.reason = 'OK' if status == 200 else 'Error'
+        response.url = request.url
+        response.request = request
+        response.headers = requests.structures.CaseInsensitiveDict({ 'Content-Type': 'application/json' })
+        response._content = content
+        return response
+
+
+    def session_with(self, adapter):
+        session = requests.Session()
+        session.mount('https://', adapter)
+        return session
+
+
+    def record(self, responses):
+        # each request is answered (by the network) with the next of the given (status, content) pairs
+        answers = iter(responses)
+        def send(adapter, request, **kwargs):
+            (status, content) = next(answers)
+            return self.build_response(request, status, content)
+        adapter = CassetteAdapter(self.test_logger, self.test_cassette_path, mode='record')
+        return (adapter, patch('requests.adapters.HTTPAdapter.send', autospec=True, side_effect=send))
+
+
+    # ----- Tests for CassetteAdapter.send ----- #
+
+    def test_send_replays_recorded_responses_to_matching_requests(self):
+        (adapter, send_patch) = self.record([ (200, b'{"name": "playlist"}'), (201, b'{"snapshot_id": "s"}') ])
+        with send_patch:
+            session = self.session_with(adapter)
+            session.get('https://api.spotify.com/v1/playlists/id', params={ 'fields': 'name' })
+            session.post('https://api.spotify.com/v1/playlists/id/tracks', json={ 'uris': [ 'uri' ] })
+
+        session = self.session_with(CassetteAdapter(self.test_logger, self.test_cassette_path, mode='replay',
+                                                    latency_scale=0))
+        response = session.post('https://api.spotify.com/v1/playlists/id/tracks', json={ 'uris': [ 'uri' ] })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), { 'snapshot_id': 's' })
+        response = session.get('https://api.spotify.com/v1/playlists/id', params={ 'fields': 'name' })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), { 'name': 'playlist' })
+        self.assertEqual(response.headers['Content-Type'], 'application/json')
+
+
+    def test_send_replays_identical_requests_in_the_order_they_were_recorded(self):
+        (adapter, send_patch) = self.record([ (200, b'1'), (200, b'2') ])
+        with send_patch:
+            session = self.session_with(adapter)
+            for i in range(0, 2):
+                session.get('https://api.spotify.com/v1/me/playlists')
+
+        session = self.session_with(CassetteAdapter(self.test_logger, self.test_cassette_path, mode='replay',
+                                                    latency_scale=0))
+        # the last recorded response is repeated once all have been replayed
+        self.assertEqual([ session.get('https://api.spotify.com/v1/me/playlists').content for i in range(0, 3) ],
+                         [ b'1', b'2', b'2' ])
+
+
+    def test_send_raises_error_for_requests_which_were_not_recorded(self):
+        (adapter, send_patch) = self.record([ (200, b'{}') ])
+        with send_patch:
+            self.session_with(adapter).get('https://api.spotify.com/v1/me/playlists')
+
+        session = self.session_with(CassetteAdapter(self.test_logger, self.test_cassette_path, mode='replay',
+                                                    latency_scale=0))
+        with self.assertRaises(CassetteMissError):
+            session.get('https://api.spotify.com/v1/me/playlists', params={ 'offset': 50 })
+
+
+    def test_send_delays_replayed_responses_by_scaled_recorded_latency(self):
+        (adapter, send_patch) = self.record([ (200, b'{}') ])
+        with send_patch, patch('src.cassette_adapter.monotonic', side_effect=[ 10.0, 10.5 ]):
+            self.session_with(adapter).get('https://api.spotify.com/v1/me/playlists')
+
+        session = self.session_with(CassetteAdapter(self.test_logger, self.test_cassette_path, mode='replay',
+                                                    latency_scale=2))
+        with patch('src.cassette_adapter.sleep') as sleep_mock:
+            session.get('https://api.spotify.com/v1/me/playlists')
+        sleep_mock.assert_called_once_with(1.0)
+
+
+    def test_init_replaces_previous_recording_when_recording(self):
+        (adapter, send_patch) = self.record([ (200, b'old') ])
+        with send_patch:
+            self.session_with(adapter).get('https://api.spotify.com/v1/me/playlists')
+        (adapter, send_patch) = self.record([ (200, b'new') ])
+        with send_patch:
+            self.session_with(adapter).get('https://api.spotify.com/v1/me')
+
+        adapter = CassetteAdapter(self.test_logger, self.test_cassette_path, mode='replay', latency_scale=0)
+        self.assertEqual(len(adapter._recordings), 1)
+
+
+    def test_init_raises_error_for_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            CassetteAdapter(self.test_logger, self.test_cassette_path, mode='rewind')
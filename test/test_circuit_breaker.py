@@ -0,0 +1,79 @@
+import unittest
+from time import sleep
+from src.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    # ----- Tests for CircuitBreaker.allow_request ----- #
+
+    def test_allow_request_returns_true_until_failure_threshold_is_reached(self):
+        breaker = CircuitBreaker('GET me/playlists', failure_threshold=3, reset_timeout=30)
+        for i in range(0, 2):
+            breaker.record_failure()
+            self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow_request())
+        self.assertTrue(breaker.is_open)
+
+
+    def test_allow_request_counts_only_consecutive_failures(self):
+        breaker = CircuitBreaker('GET me/playlists', failure_threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertTrue(breaker.allow_request())
+
+
+    def test_allow_request_allows_one_trial_request_after_reset_timeout(self):
+        breaker = CircuitBreaker('GET me/playlists', failure_threshold=1, reset_timeout=0.1)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow_request())
+        sleep(0.15)
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request()) # the trial request is still in progress
+
+
+    def test_allow_request_closes_circuit_if_trial_request_succeeds(self):
+        breaker = CircuitBreaker('GET me/playlists', failure_threshold=1, reset_timeout=0.1)
+        breaker.record_failure()
+        sleep(0.15)
+        breaker.allow_request()
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+        self.assertTrue(breaker.allow_request())
+
+
+    def test_allow_request_reopens_circuit_if_trial_request_fails(self):
+        breaker = CircuitBreaker('GET me/playlists', failure_threshold=5, reset_timeout=0.1)
+        for i in range(0, 5):
+            breaker.record_failure()
+        sleep(0.15)
+        breaker.allow_request()
+        breaker.record_failure()
+        self.assertFalse(breaker.allow_request())
+
+
+    # ----- Tests for CircuitBreaker.release_trial ----- #
+
+    def test_release_trial_allows_another_trial_request_without_closing_circuit(self):
+        breaker = CircuitBreaker('GET me/playlists', failure_threshold=1, reset_timeout=0.1)
+        breaker.record_failure()
+        sleep(0.15)
+        self.assertTrue(breaker.check())
+        breaker.release_trial()
+        self.assertTrue(breaker.is_open)
+        self.assertTrue(breaker.check())
+        self.assertRaises(CircuitOpenError, breaker.check)
+
+
+    # ----- Tests for CircuitBreaker.check ----- #
+
+    def test_check_raises_circuit_open_error_if_circuit_is_open(self):
+        breaker = CircuitBreaker('GET me/playlists', failure_threshold=1, reset_timeout=30)
+        breaker.check()
+        breaker.record_failure()
+        self.assertRaises(CircuitOpenError, breaker.check)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import unittest
+import logging
+from threading import Thread, Lock
+from time import sleep
+from src.concurrency_controller import ConcurrencyController
+
+class TestConcurrencyController(unittest.TestCase):
+
+    def setUp(self):
+        self.test_logger = logging.getLogger('TestConcurrencyController')
+        log_handler = logging.StreamHandler()
+        log_handler.setLevel('CRITICAL')
+        self.test_logger.addHandler(log_handler)
+        self.test_logger.propagate = False
+
+        def complete_requests(controller, num_requests, latency, throttled=False, failed=False):
+            for i in range(0, num_requests):
+                controller.acquire()
+                controller.release(latency, throttled=throttled, failed=failed)
+        self.complete_requests = complete_requests
+
+
+    # ----- Tests for ConcurrencyController.release ----- #
+
+    def test_release_grows_window_additively_while_responses_are_healthy(self):
+        controller = ConcurrencyController(self.test_logger, max_window=10)
+        self.assertEqual(controller.window, 1)
+        self.complete_requests(controller, 1, 0.1)
+        self.assertEqual(controller.window, 2)
+
+        # the window grows by roughly one for each window's worth of healthy responses
+        self.complete_requests(controller, 2, 0.1)
+        self.assertEqual(controller.window, 2)
+        self.complete_requests(controller, 1, 0.1)
+        self.assertEqual(controller.window, 3)
+
+
+    def test_release_does_not_grow_window_beyond_max_window(self):
+        controller = ConcurrencyController(self.test_logger, max_window=4)
+        self.complete_requests(controller, 100, 0.1)
+        self.assertEqual(controller.window, 4)
+
+
+    def test_release_cuts_window_multiplicatively_if_a_response_is_throttled(self):
+        controller = ConcurrencyController(self.test_logger, max_window=16, initial_window=16)
+        self.complete_requests(controller, 1, 0.1, throttled=True)
+        self.assertEqual(controller.window, 8)
+
+
+    def test_release_cuts_window_multiplicatively_if_latency_spikes(self):
+        controller = ConcurrencyController(self.test_logger, max_window=16, initial_window=12)
+        controller.acquire()
+        controller.release(0.1)
+        window_before_spike = controller.window
+        controller.acquire()
+        controller.release(1.0)
+        self.assertEqual(controller.window, window_before_spike // 2)
+
+
+    def test_release_does_not_grow_window_if_a_request_failed(self):
+        controller = ConcurrencyController(self.test_logger, max_window=16, initial_window=4)
+        self.complete_requests(controller, 10, 0.1, failed=True)
+        self.assertEqual(controller.window, 4)
+
+
+    def test_release_does_not_cut_window_below_min_window(self):
+        controller = ConcurrencyController(self.test_logger, max_window=16, min_window=2, initial_window=2)
+        self.complete_requests(controller, 1, 0.1, throttled=True)
+        self.assertEqual(controller.window, 2)
+
+
+    # ----- Tests for ConcurrencyController.acquire ----- #
+
+    def test_acquire_blocks_while_window_is_full(self):
+        controller = ConcurrencyController(self.test_logger, max_window=2, initial_window=2)
+        controller.acquire()
+        controller.acquire()
+        self.assertEqual(controller.in_flight, 2)
+
+        blocked = Thread(target=controller.acquire)
+        blocked.start()
+        sleep(0.1)
+        self.assertTrue(blocked.is_alive())
+
+        controller.release(0.1)
+        blocked.join(1)
+        self.assertFalse(blocked.is_alive())
+        self.assertEqual(controller.in_flight, 2)
+
+
+    def test_try_acquire_takes_a_slot_only_if_one_is_free_and_no_request_is_waiting(self):
+        controller = ConcurrencyController(self.test_logger, max_window=2, initial_window=2)
+        self.assertTrue(controller.try_acquire())
+        self.assertTrue(controller.try_acquire())
+        self.assertFalse(controller.try_acquire())
+        self.assertEqual(controller.in_flight, 2)
+
+        blocked = Thread(target=controller.acquire)
+        blocked.start()
+        sleep(0.05)
+        controller.release(0.1)
+        self.assertFalse(controller.try_acquire())
+        blocked.join(1)
+        self.assertEqual(controller.in_flight, 2)
+
+
+    def test_acquire_lets_waiting_requests_through_in_order_of_priority(self):
+        controller = ConcurrencyController(self.test_logger, max_window=1, initial_window=1)
+        controller.acquire()
+        (acquired, acquired_lock) = ([], Lock())
+        def acquire(priority):
+            controller.acquire(priority=priority)
+            with acquired_lock:
+                acquired.append(priority)
+        threads = []
+        for priority in [ 3, 2, 3, 0 ]:
+            threads.append(Thread(target=acquire, args=[ priority ]))
+            threads[-1].start()
+            sleep(0.02)
+
+        for i in range(0, 4):
+            controller.release(0.01)
+            sleep(0.02)
+        for thread in threads:
+            thread.join(1)
+        self.assertEqual(acquired, [ 0, 2, 3, 3 ])
+
+
+if __name__ == '__main__':
+    unittest.main()
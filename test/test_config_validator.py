@@ -50,6 +50,164 @@ class TestConfigValidator(unittest.TestCase):
         self.assertFalse(validator.is_valid())
 
 
+    def test_is_valid_returns_false_if_api_config_is_invalid(self):
+        validator = ConfigValidator(playlist={}, log={}, account={}, api={})
+        validator.validate_playlist_config = Mock(return_value=True)
+        validator.validate_log_config = Mock(return_value=True)
+        validator.validate_account_config = Mock(return_value=True)
+        validator.validate_api_config = Mock(return_value=False)
+        self.assertFalse(validator.is_valid())
+
+
+    # ----- Tests for ConfigValidator.validate_api_config ----- #
+
+    def test_validate_api_config_returns_true_if_no_api_settings_are_given(self):
+        self.assertTrue(ConfigValidator(api={}).validate_api_config())
+
+
+    def test_validate_api_config_returns_false_if_api_config_is_not_a_dict(self):
+        self.assertFalse(ConfigValidator(api=[ 'MAX_PARALLEL_REQUESTS' ]).validate_api_config())
+
+
+    def test_validate_api_config_returns_false_if_max_parallel_requests_is_not_a_positive_integer(self):
+        for value in [ 0, -2, 1.5, 'four', True ]:
+            self.assertFalse(ConfigValidator(api={ 'MAX_PARALLEL_REQUESTS': value }).validate_api_config())
+        self.assertTrue(ConfigValidator(api={ 'MAX_PARALLEL_REQUESTS': 4 }).validate_api_config())
+
+
+    def test_validate_api_config_returns_false_if_max_retries_is_not_a_non_negative_integer(self):
+        for value in [ -1, 1.5, 'three', True ]:
+            self.assertFalse(ConfigValidator(api={ 'MAX_RETRIES': value }).validate_api_config())
+        self.assertTrue(ConfigValidator(api={ 'MAX_RETRIES': 0 }).validate_api_config())
+
+
+    def test_validate_api_config_returns_false_if_adaptive_concurrency_is_not_a_boolean(self):
+        self.assertFalse(ConfigValidator(api={ 'ADAPTIVE_CONCURRENCY': 'yes' }).validate_api_config())
+        self.assertTrue(ConfigValidator(api={ 'ADAPTIVE_CONCURRENCY': False }).validate_api_config())
+
+
+    def test_validate_api_config_returns_false_if_connection_pool_settings_are_invalid(self):
+        for value in [ 0, -2, 2.5, 'ten', True ]:
+            self.assertFalse(ConfigValidator(api={ 'CONNECTION_POOL_SIZE': value }).validate_api_config())
+        self.assertFalse(ConfigValidator(api={ 'KEEP_ALIVE': 'yes' }).validate_api_config())
+        self.assertTrue(ConfigValidator(api={ 'CONNECTION_POOL_SIZE': 4, 'KEEP_ALIVE': False }).validate_api_config())
+
+
+    def test_validate_api_config_returns_false_if_max_concurrent_playlists_is_not_a_positive_integer(self):
+        for value in [ 0, 1.5, 'four', True ]:
+            self.assertFalse(ConfigValidator(api={ 'MAX_CONCURRENT_PLAYLISTS': value }).validate_api_config())
+        self.assertTrue(ConfigValidator(api={ 'MAX_CONCURRENT_PLAYLISTS': 8 }).validate_api_config())
+
+
+    def test_validate_api_config_returns_false_if_hedging_settings_are_invalid(self):
+        self.assertFalse(ConfigValidator(api={ 'HEDGE_READS': 'no' }).validate_api_config())
+        for value in [ 0, 100, -5, 'p95', True ]:
+            self.assertFalse(ConfigValidator(api={ 'HEDGE_PERCENTILE': value }).validate_api_config())
+        self.assertTrue(ConfigValidator(api={ 'HEDGE_READS': True, 'HEDGE_PERCENTILE': 99.5 }).validate_api_config())
+
+
+    def test_validate_api_config_returns_false_if_response_cache_settings_are_invalid(self):
+        self.assertFalse(ConfigValidator(api={ 'RESPONSE_CACHE': 'on' }).validate_api_config())
+        self.assertFalse(ConfigValidator(api={ 'RESPONSE_CACHE_PATH': '' }).validate_api_config())
+        self.assertFalse(ConfigValidator(api={ 'RESPONSE_CACHE_PATH': 5 }).validate_api_config())
+        self.assertFalse(ConfigValidator(api={ 'RESPONSE_CACHE_SIZE': 0 }).validate_api_config())
+        self.assertTrue(ConfigValidator(api={
+            'RESPONSE_CACHE': False,
+            'RESPONSE_CACHE_PATH': 'data/cache',
+            'RESPONSE_CACHE_SIZE': 50
+        }).validate_api_config())
+
+
+    def test_validate_api_config_returns_false_if_playlist_snapshots_is_not_a_boolean(self):
+        self.assertFalse(ConfigValidator(api={ 'PLAYLIST_SNAPSHOTS': 'true' }).validate_api_config())
+        self.assertTrue(ConfigValidator(api={ 'PLAYLIST_SNAPSHOTS': True }).validate_api_config())
+
+
+    def test_validate_api_config_returns_false_if_track_metadata_cache_settings_are_invalid(self):
+        self.assertFalse(ConfigValidator(api={ 'TRACK_METADATA_CACHE': 1 }).validate_api_config())
+        self.assertFalse(ConfigValidator(api={ 'TRACK_METADATA_CACHE_PATH': '' }).validate_api_config())
+        self.assertFalse(ConfigValidator(api={ 'TRACK_METADATA_CACHE_SIZE': 0 }).validate_api_config())
+        self.assertTrue(ConfigValidator(api={
+            'TRACK_METADATA_CACHE': True,
+            'TRACK_METADATA_CACHE_PATH': 'data/cache/track_metadata.json',
+            'TRACK_METADATA_CACHE_SIZE': 10000
+        }).validate_api_config())
+
+
+    def test_validate_api_config_returns_false_if_skip_unchanged_playlists_is_not_a_boolean(self):
+        self.assertFalse(ConfigValidator(api={ 'SKIP_UNCHANGED_PLAYLISTS': 'no' }).validate_api_config())
+        self.assertTrue(ConfigValidator(api={ 'SKIP_UNCHANGED_PLAYLISTS': False }).validate_api_config())
+
+
+    def test_validate_api_config_returns_false_if_state_store_settings_are_invalid(self):
+        self.assertFalse(ConfigValidator(api={ 'STATE_STORE': 'yes' }).validate_api_config())
+        self.assertFalse(ConfigValidator(api={ 'STATE_STORE_PATH': '' }).validate_api_config())
+        self.assertTrue(ConfigValidator(api={
+            'STATE_STORE': True,
+            'STATE_STORE_PATH': 'data/state/state.db'
+        }).validate_api_config())
+
+
+    def test_validate_api_config_returns_false_if_playlist_registry_settings_are_invalid(self):
+        self.assertFalse(ConfigValidator(api={ 'PLAYLIST_REGISTRY': 'true' }).validate_api_config())
+        self.assertFalse(ConfigValidator(api={ 'PLAYLIST_REGISTRY_TTL': 0 }).validate_api_config())
+        self.assertFalse(ConfigValidator(api={ 'PLAYLIST_REGISTRY_PATH': None }).validate_api_config())
+        self.assertTrue(ConfigValidator(api={
+            'PLAYLIST_REGISTRY': True,
+            'PLAYLIST_REGISTRY_TTL': 90.5,
+            'PLAYLIST_REGISTRY_PATH': 'data/state/playlist_registry.json'
+        }).validate_api_config())
+
+
+    def test_validate_api_config_returns_false_if_cassette_settings_are_invalid(self):
+        self.assertFalse(ConfigValidator(api={ 'CASSETTE_MODE': False }).validate_api_config())
+        self.assertFalse(ConfigValidator(api={ 'CASSETTE_MODE': 'rewind' }).validate_api_config())
+        self.assertFalse(ConfigValidator(api={ 'CASSETTE_PATH': '' }).validate_api_config())
+        self.assertFalse(ConfigValidator(api={ 'CASSETTE_LATENCY_SCALE': -1 }).validate_api_config())
+        self.assertTrue(ConfigValidator(api={
+            'CASSETTE_MODE': 'replay',
+            'CASSETTE_PATH': 'data/cassettes/spotify.jsonl.gz',
+            'CASSETTE_LATENCY_SCALE': 0
+        }).validate_api_config())
+
+
+    def test_validate_api_config_returns_false_if_api_metrics_is_not_a_boolean(self):
+        self.assertFalse(ConfigValidator(api={ 'API_METRICS': 'on' }).validate_api_config())
+        self.assertTrue(ConfigValidator(api={ 'API_METRICS': False }).validate_api_config())
+
+
+    def test_validate_api_config_returns_false_if_priority_scheduling_is_not_a_boolean(self):
+        self.assertFalse(ConfigValidator(api={ 'PRIORITY_SCHEDULING': 1 }).validate_api_config())
+        self.assertTrue(ConfigValidator(api={ 'PRIORITY_SCHEDULING': False }).validate_api_config())
+
+
+    def test_validate_api_config_returns_false_if_timeouts_or_time_budgets_are_invalid(self):
+        for field in [ 'CONNECT_TIMEOUT', 'READ_TIMEOUT' ]:
+            for value in [ 0, -1, 'ten', True ]:
+                self.assertFalse(ConfigValidator(api={ field: value }).validate_api_config())
+        for field in [ 'PLAYLIST_TIME_BUDGET', 'ITERATION_TIME_BUDGET' ]:
+            for value in [ -1, 'ten', False ]:
+                self.assertFalse(ConfigValidator(api={ field: value }).validate_api_config())
+        self.assertTrue(ConfigValidator(api={
+            'CONNECT_TIMEOUT': 3,
+            'READ_TIMEOUT': 12.5,
+            'PLAYLIST_TIME_BUDGET': 0,
+            'ITERATION_TIME_BUDGET': 1800
+        }).validate_api_config())
+
+
+    def test_validate_api_config_returns_false_if_rate_limit_is_not_a_positive_number(self):
+        for value in [ 0, -1.5, 'ten', False ]:
+            self.assertFalse(ConfigValidator(api={ 'RATE_LIMIT': value }).validate_api_config())
+        self.assertTrue(ConfigValidator(api={ 'RATE_LIMIT': 2.5 }).validate_api_config())
+
+
+    def test_validate_api_config_returns_false_if_rate_limit_burst_is_not_a_positive_integer(self):
+        for value in [ 0, 2.5, 'twenty' ]:
+            self.assertFalse(ConfigValidator(api={ 'RATE_LIMIT_BURST': value }).validate_api_config())
+        self.assertTrue(ConfigValidator(api={ 'RATE_LIMIT_BURST': 20 }).validate_api_config())
+
+
     # ----- Tests for ConfigValidator.validate_account_config ----- #
 
     def test_validate_account_config_returns_true_if_all_account_info_is_set(self):
@@ -514,6 +672,19 @@ class TestConfigValidator(unittest.TestCase):
         self.assertTrue(validator.all_protected_playlists_exist(spotipy.client.Spotify()))
 
 
+    @patch('src.config_validator.SpotifyHelper')
+    def test_all_protected_playlists_exist_lists_collab_playlists_through_the_playlist_registry_if_given(self, helper_stub):
+        playlist_uri = self.generate_playlist_uri()
+        playlist_registry = Mock()
+        playlist_registry.get_collab_playlists = Mock(return_value=[ { 'uri': playlist_uri } ])
+        api = spotipy.client.Spotify()
+        validator = ConfigValidator({ 'PROTECTED_PLAYLISTS': [ { 'pllabel': { 'uri': playlist_uri } } ] }, {},
+                                    { 'USERNAME': 'creator_id' })
+        self.assertTrue(validator.all_protected_playlists_exist(api, playlist_registry=playlist_registry))
+        playlist_registry.get_collab_playlists.assert_called_once_with('creator_id', api)
+        helper_stub.return_value.get_all_collab_playlists.assert_not_called()
+
+
     @patch('src.config_validator.SpotifyHelper')
     def test_all_protected_playlists_exist_returns_false_if_l_any_protected_playlist_uri_is_not_matched_in_the_users_collab_playlists(self, helper_stub):
         protected_playlists = [
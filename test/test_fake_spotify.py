@@ -0,0 +1,124 @@
+import unittest
+import logging
+import spotipy
+from src.fake_spotify import FakeSpotify
+from src.fake_spotify_server import FakeSpotifyServer
+from src.spotify_helper import SpotifyHelper
+from src.playlist_cleaner import PlaylistCleaner
+from src.workload_generator import WorkloadGenerator
+from src.playlist_snapshot import PlaylistSnapshot
+from src.playlist_change_tracker import PlaylistChangeTracker
+
+class TestFakeSpotify(unittest.TestCase):
+
+    def setUp(self):
+        self.test_logger = logging.getLogger('TestFakeSpotify')
+        log_handler = logging.StreamHandler()
+        log_handler.setLevel('CRITICAL')
+        self.test_logger.addHandler(log_handler)
+        self.test_logger.propagate = False
+
+
+    # ----- Tests for FakeSpotify requests ----- #
+
+    def test_fake_spotify_is_an_api_client_answering_from_the_model(self):
+        api = FakeSpotify(self.test_logger, seed=0)
+        self.assertIsInstance(api, spotipy.client.Spotify)
+        track_uris = [ api.server.add_track() for num in range(0, 3) ]
+        playlist_uri = api.server.add_playlist(name='Mix', items=[ (uri, 'user1') for uri in track_uris ])
+
+        self.assertEqual(api.current_user()['id'], 'fakeuser')
+        self.assertEqual(api.playlist(playlist_uri, fields='name,snapshot_id'), {
+            'name': 'Mix',
+            'snapshot_id': api.server.get_snapshot_id(playlist_uri)
+        })
+        self.assertEqual([ item['track']['uri'] for item in api.playlist_items(playlist_uri, limit=2, offset=1)['items'] ],
+                         track_uris[1:3])
+        self.assertEqual(api.tracks(track_uris[0:1])['tracks'][0]['uri'], track_uris[0])
+        self.assertEqual(api.request_counts, {
+            'GET me': 1,
+            'GET playlists/{id}': 1,
+            'GET playlists/{id}/tracks': 1,
+            'GET tracks': 1
+        })
+
+
+    def test_fake_spotify_writes_through_spotify_helper(self):
+        api = FakeSpotify(self.test_logger, seed=0)
+        track_uris = [ api.server.add_track() for num in range(0, 3) ]
+        playlist_uri = api.server.add_playlist(items=[ (track_uris[0], 'user1') ])
+        helper = SpotifyHelper(self.test_logger, api=api)
+
+        snapshot_id = helper.add_items_to_playlist(playlist_uri, [ { 'uri': uri } for uri in track_uris[1:3] ])
+        self.assertEqual(snapshot_id, api.server.get_snapshot_id(playlist_uri))
+        helper.remove_items_from_playlist(playlist_uri, [ { 'uri': track_uris[0], 'position': 0 } ])
+        self.assertEqual(api.server.get_playlist_items(playlist_uri), [ (uri, 'fakeuser') for uri in track_uris[1:3] ])
+
+
+    def test_fake_spotify_raises_spotify_exception_for_failed_requests(self):
+        api = FakeSpotify(self.test_logger, seed=0)
+        with self.assertRaises(spotipy.exceptions.SpotifyException) as context:
+            api.playlist_items('a' * 22)
+        self.assertEqual(context.exception.http_status, 404)
+        with self.assertRaises(spotipy.exceptions.SpotifyException) as context:
+            api.current_user_playlists(limit=51)
+        self.assertEqual(context.exception.http_status, 400)
+
+
+    def test_fake_spotify_shares_model_with_a_server(self):
+        server = FakeSpotifyServer(self.test_logger, seed=0)
+        playlist_uri = server.add_playlist()
+        api = FakeSpotify(self.test_logger, server=server)
+        self.assertEqual(api.current_user_playlists()['items'][0]['uri'], playlist_uri)
+
+
+    # ----- Tests for moderating a synthetic workload ----- #
+
+    def test_playlist_cleaner_removes_every_unauthorized_item_of_a_generated_workload(self):
+        api = FakeSpotify(self.test_logger, seed=0)
+        generator = WorkloadGenerator(seed=0, num_playlists=20, playlist_size=('randint', 0, 250),
+                                      unauthorized_rate=0.1, duplicate_rate=0.1)
+        playlists = generator.generate(api.server)
+        generator.churn(api.server)
+        authorized_items = [
+            [ item for item in api.server.get_playlist_items(playlist['uri']) if not item[1].startswith('intruder') ]
+            for playlist in playlists
+        ]
+
+        cleaner = PlaylistCleaner(self.test_logger, api, 'fakeuser', generator.playlist_config())
+        for playlist in playlists:
+            cleaner.run(playlist)
+        self.assertEqual([ api.server.get_playlist_items(playlist['uri']) for playlist in playlists ],
+                         authorized_items)
+
+
+    def test_playlists_written_to_are_scanned_once_more_before_they_are_skipped(self):
+        api = FakeSpotify(self.test_logger, seed=0)
+        generator = WorkloadGenerator(seed=0, num_playlists=5, playlist_size=('constant', 150), unauthorized_rate=0.2)
+        playlists = generator.generate(api.server)
+        tracker = PlaylistChangeTracker()
+        cleaner = PlaylistCleaner(self.test_logger, api, 'fakeuser', generator.playlist_config(), change_tracker=tracker)
+        helper = SpotifyHelper(self.test_logger, api=api)
+        late_addition = (api.server.add_track(), 'intruder1')
+
+        for cycle in range(0, 3):
+            tracker.start_cycle()
+            for playlist in playlists:
+                playlist_id = helper.get_playlist_id(playlist['uri'])
+                snapshot_id = api.server.get_snapshot_id(playlist['uri'])
+                if not tracker.has_changed(playlist_id, snapshot_id):
+                    continue
+                snapshot = PlaylistSnapshot.fetch(helper, api, playlist_id)
+                if cycle == 0 and playlist is playlists[0]:
+                    # an item added by someone else after the scan is not removed by this cycle's write
+                    api.server.add_items(playlist['uri'], [ late_addition ])
+                cleaner.run(playlist, snapshot=snapshot)
+                tracker.record(playlist_id, snapshot_id)
+        self.assertEqual([ item for item in api.server.get_playlist_items(playlists[0]['uri'])
+                           if item[1].startswith('intruder') ], [])
+        # the first page of items comes with each playlist, whose snapshot ID is checked after the second page;
+        # every playlist is written to in the first cycle, so each is scanned again in the second cycle,
+        # and the playlist whose late addition is removed in the second cycle is scanned in the third as well
+        self.assertEqual(api.request_counts['GET playlists/{id}'], 22)
+        self.assertEqual(api.request_counts['GET playlists/{id}/tracks'], 11)
+        self.assertEqual(api.request_counts['DELETE playlists/{id}/tracks'], 6)
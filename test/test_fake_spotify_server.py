@@ -0,0 +1,219 @@
+import unittest
+import logging
+from time import monotonic
+import requests
+import spotipy
+from src.fake_spotify_server import FakeSpotifyServer
+from src.api_session import ApiSession
+from src.spotify_helper import SpotifyHelper
+from src.retry_policy import RetryPolicy
+from src.rate_limiter import RateLimiter
+
+class TestFakeSpotifyServer(unittest.TestCase):
+
+    def setUp(self):
+        self.test_logger = logging.getLogger('TestFakeSpotifyServer')
+        log_handler = logging.StreamHandler()
+        log_handler.setLevel('CRITICAL')
+        self.test_logger.addHandler(log_handler)
+        self.test_logger.propagate = False
+        self.servers = []
+
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+
+
+    def start_server(self, **kwargs):
+        server = FakeSpotifyServer(self.test_logger, seed=0, **kwargs).start()
+        self.servers.append(server)
+        return server
+
+
+    def client_of(self, server):
+        # the API client sends its requests through the application's API session
+        session = ApiSession(self.test_logger, retry_policy=RetryPolicy(max_retries=3, base_delay=0, max_delay=0))
+        return server.client(requests_session=session)
+
+
+    def get(self, server, path, headers=None):
+        request_headers = { 'Authorization': 'Bearer fake-token' }
+        request_headers.update(headers or {})
+        return requests.get(server.url + path, headers=request_headers)
+
+
+    # ----- Tests for reading playlists ----- #
+
+    def test_server_lists_collaborative_playlists_across_pages(self):
+        server = self.start_server()
+        own_playlists = server.populate(num_playlists=120, num_tracks=50, playlist_size=2)
+        server.add_playlist(owner_id='someotheruser')
+        server.add_playlist(collaborative=False)
+        helper = SpotifyHelper(self.test_logger, api=self.client_of(server))
+
+        collab_playlists = helper.get_all_collab_playlists('fakeuser')
+        self.assertEqual([ playlist['uri'] for playlist in collab_playlists ], list(reversed(own_playlists)))
+        self.assertEqual(collab_playlists[0]['tracks'], { 'total': 2 })
+        self.assertEqual(collab_playlists[0]['snapshot_id'], server.get_snapshot_id(own_playlists[-1]))
+        self.assertEqual(server.request_counts, { 'GET me/playlists': 3 })
+
+
+    def test_server_returns_selected_fields_of_every_item_in_a_playlist(self):
+        server = self.start_server()
+        playlist_uri = server.populate(num_playlists=1, num_tracks=300, playlist_size=250)[0]
+        helper = SpotifyHelper(self.test_logger, api=self.client_of(server))
+
+        items = helper.get_all_items_in_playlist(playlist_uri, fields='items(added_by.id,track(uri)),total')
+        self.assertEqual([ (item['track']['uri'], item['added_by']['id']) for item in items ],
+                         server.get_playlist_items(playlist_uri))
+        self.assertEqual(items[249], {
+            'added_by': { 'id': server.get_playlist_items(playlist_uri)[249][1] },
+            'track': { 'uri': server.get_playlist_items(playlist_uri)[249][0] },
+            'position': 249
+        })
+
+
+    def test_server_returns_tracks_and_none_for_unknown_tracks(self):
+        server = self.start_server()
+        track_uri = server.add_track(name='Song', artists=[ 'Band' ])
+        tracks = self.client_of(server).tracks([ track_uri, 'spotify:track:' + 'a' * 22 ])['tracks']
+        self.assertEqual((tracks[0]['uri'], tracks[0]['name'], tracks[0]['artists']),
+                         (track_uri, 'Song', [ { 'name': 'Band' } ]))
+        self.assertIsNone(tracks[1])
+
+
+    def test_server_answers_unchanged_reads_with_not_modified(self):
+        server = self.start_server()
+        playlist_uri = server.add_playlist()
+        response = self.get(server, 'playlists/%s?fields=snapshot_id' % playlist_uri.split(':')[-1])
+        self.assertEqual(response.json(), { 'snapshot_id': server.get_snapshot_id(playlist_uri) })
+        response = self.get(server, 'playlists/%s?fields=snapshot_id' % playlist_uri.split(':')[-1],
+                            headers={ 'If-None-Match': response.headers['ETag'] })
+        self.assertEqual(response.status_code, 304)
+
+
+    def test_server_answers_requests_for_unknown_playlists_with_not_found(self):
+        server = self.start_server()
+        with self.assertRaises(spotipy.exceptions.SpotifyException) as context:
+            self.client_of(server).playlist('a' * 22)
+        self.assertEqual(context.exception.http_status, 404)
+
+
+    # ----- Tests for writing to playlists ----- #
+
+    def test_server_adds_and_removes_items_and_changes_snapshot_id(self):
+        server = self.start_server()
+        track_uris = [ server.add_track() for num in range(0, 150) ]
+        playlist_uri = server.add_playlist(items=[ (track_uris[0], 'someotheruser') ])
+        snapshot_id = server.get_snapshot_id(playlist_uri)
+        helper = SpotifyHelper(self.test_logger, api=self.client_of(server))
+
+        added_snapshot_id = helper.add_items_to_playlist(playlist_uri, [ { 'uri': uri } for uri in track_uris ])
+        self.assertNotEqual(added_snapshot_id, snapshot_id)
+        self.assertEqual(len(server.get_playlist_items(playlist_uri)), 151)
+
+        removed_snapshot_id = helper.remove_items_from_playlist(playlist_uri, [
+            { 'uri': track_uris[0], 'position': 0 },
+            { 'uri': track_uris[149], 'position': 150 }
+        ])
+        self.assertNotEqual(removed_snapshot_id, added_snapshot_id)
+        self.assertEqual(server.get_snapshot_id(playlist_uri), removed_snapshot_id)
+        self.assertEqual(server.get_playlist_items(playlist_uri),
+                         [ (uri, 'fakeuser') for uri in track_uris[0:149] ])
+
+
+    def test_server_removes_items_at_positions_of_an_earlier_snapshot(self):
+        server = self.start_server()
+        track_uris = [ server.add_track() for num in range(0, 3) ]
+        playlist_uri = server.add_playlist(items=[ (track_uris[0], 'fakeuser'), (track_uris[1], 'fakeuser') ])
+        snapshot_id = server.get_snapshot_id(playlist_uri)
+        api = self.client_of(server)
+        api.playlist_add_items(playlist_uri, [ track_uris[2] ], position=0)
+
+        api.playlist_remove_specific_occurrences_of_items(
+            playlist_uri, [ { 'uri': track_uris[1], 'positions': [ 1 ] } ], snapshot_id=snapshot_id)
+        self.assertEqual(server.get_playlist_items(playlist_uri),
+                         [ (track_uris[2], 'fakeuser'), (track_uris[0], 'fakeuser') ])
+
+
+    def test_server_rejects_removal_of_item_which_is_not_at_given_position(self):
+        server = self.start_server()
+        track_uris = [ server.add_track() for num in range(0, 2) ]
+        playlist_uri = server.add_playlist(items=[ (track_uris[0], 'fakeuser') ])
+        with self.assertRaises(spotipy.exceptions.SpotifyException) as context:
+            self.client_of(server).playlist_remove_specific_occurrences_of_items(
+                playlist_uri, [ { 'uri': track_uris[1], 'positions': [ 0 ] } ])
+        self.assertEqual(context.exception.http_status, 400)
+        self.assertEqual(len(server.get_playlist_items(playlist_uri)), 1)
+
+
+    # ----- Tests for injected latency and faults ----- #
+
+    def test_server_delays_responses_by_sampled_latency(self):
+        server = self.start_server(latency={ 'GET me/playlists': ('constant', 0.2), 'default': ('uniform', 0, 0.01) })
+        started = monotonic()
+        self.get(server, 'me')
+        self.assertLess(monotonic() - started, 0.2)
+        started = monotonic()
+        self.get(server, 'me/playlists')
+        self.assertGreaterEqual(monotonic() - started, 0.2)
+
+
+    def test_server_raises_error_for_unknown_latency_distribution(self):
+        with self.assertRaises(ValueError):
+            FakeSpotifyServer(self.test_logger, latency=('unknown', 1))
+
+
+    def test_server_injects_throttling_with_retry_after(self):
+        server = self.start_server(throttle_rate=1.0, retry_after=3)
+        response = self.get(server, 'me/playlists')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '3')
+
+
+    def test_throttled_responses_are_returned_by_the_adapter_to_the_session(self):
+        # i.e., the adapter does not act on their Retry-After header itself
+        server = self.start_server(throttle_rate=1.0, retry_after=0)
+        limiter = RateLimiter(rate=None)
+        session = ApiSession(self.test_logger, rate_limiter=limiter, max_throttled_retries=2)
+        api = server.client(requests_session=session)
+        response = session.request('GET', api.prefix + 'me/playlists', headers={ 'Authorization': 'Bearer fake-token' })
+        self.assertEqual(response.status_code, 429)
+        # the session retried the throttled request itself
+        self.assertEqual(server.request_counts['GET me/playlists'], 3)
+
+
+    def test_throttled_requests_are_retried_by_the_session_until_they_succeed(self):
+        server = self.start_server(throttle_rate=0.5, retry_after=0)
+        server.populate(num_playlists=20, num_tracks=10, playlist_size=1)
+        session = ApiSession(self.test_logger, rate_limiter=RateLimiter(rate=None), max_throttled_retries=10)
+        helper = SpotifyHelper(self.test_logger, api=server.client(requests_session=session))
+        for attempt in range(0, 5):
+            self.assertEqual(len(helper.get_all_collab_playlists('fakeuser')), 20)
+        self.assertGreater(server.request_counts['GET me/playlists'], 5)
+
+
+    def test_server_injects_server_errors_which_are_retried_by_the_session(self):
+        server = self.start_server(error_rate=0.5)
+        server.populate(num_playlists=20, num_tracks=10, playlist_size=1)
+        helper = SpotifyHelper(self.test_logger, api=self.client_of(server))
+        for attempt in range(0, 5):
+            self.assertEqual(len(helper.get_all_collab_playlists('fakeuser')), 20)
+        self.assertGreater(server.request_counts['GET me/playlists'], 5)
+
+
+    # ----- Tests for FakeSpotifyServer.select_fields ----- #
+
+    def test_select_fields_selects_nested_fields(self):
+        value = {
+            'items': [ { 'added_by': { 'id': 'user1', 'type': 'user' }, 'track': { 'name': 'a', 'uri': 'b', 'id': 'c' } } ],
+            'total': 1,
+            'limit': 100
+        }
+        self.assertEqual(FakeSpotifyServer.select_fields(value, 'items(added_by.id,track(name,uri)),total'), {
+            'items': [ { 'added_by': { 'id': 'user1' }, 'track': { 'name': 'a', 'uri': 'b' } } ],
+            'total': 1
+        })
+        with self.assertRaises(ValueError):
+            FakeSpotifyServer.select_fields(value, 'items(total')
@@ -1853,7 +1853,7 @@ LOG_CONFIG:
             self.assertEqual(api_mock.return_value.playlist_remove_specific_occurrences_of_items.call_args_list[call][0][1], [
                 {
                     'uri': pl_item_uris[0][i],
-                    'positions': [ i ]
+                    'positions': [ i - call * 100 ] # after the items removed by the calls before
                 } for i in range(call * 100, (call + 1) * 100)
             ])
 
@@ -1,4 +1,6 @@
 import unittest
+import threading
+import asyncio
 import logging
 import random
 import string
@@ -10,6 +12,8 @@ from unittest.mock import Mock, patch
 import spotipy
 import inputimeout
 from src.integrity_manager import IntegrityManager
+from src.playlist_snapshot import PlaylistSnapshot
+from src.playlist_change_tracker import PlaylistChangeTracker
 
 class TestIntegrityManager(unittest.TestCase):
 
@@ -74,7 +78,7 @@ class TestIntegrityManager(unittest.TestCase):
         self.manager.find_latest_backup = Mock(return_value=None)
         self.manager.backup_playlist = Mock()
         self.manager.get_removals = Mock()
-        self.manager.run({ 'uri': 'spotify:playlist:' + pl_id })
+        self.assertTrue(self.manager.run({ 'uri': 'spotify:playlist:' + pl_id }))
         self.assertEqual(len(self.manager.backup_playlist.call_args[0]), 1)
         self.manager.backup_playlist.assert_called_once_with(pl_id)
         self.manager.get_removals.assert_not_called
@@ -132,7 +136,7 @@ class TestIntegrityManager(unittest.TestCase):
         self.manager.get_unapproved_removals = Mock(return_value=unapproved)
         self.manager.spotify_helper.add_items_to_playlist = Mock()
 
-        self.manager.run({ 'uri': 'spotify:playlist:' + pl_id })
+        self.assertTrue(self.manager.run({ 'uri': 'spotify:playlist:' + pl_id }))
         self.assertEqual(len(self.manager.backup_playlist.call_args[0]), 1)
         self.manager.backup_playlist.assert_called_once_with(pl_id)
         self.manager.manage_redundant_backups.assert_called_once_with(pl_id)
@@ -158,7 +162,7 @@ class TestIntegrityManager(unittest.TestCase):
         self.manager.get_unapproved_removals = Mock(return_value=unapproved)
         self.manager._restore_removals = Mock(side_effect=Exception('unexpected error'))
 
-        self.manager.run({ 'uri': 'spotify:playlist:' + pl_id })
+        self.assertFalse(self.manager.run({ 'uri': 'spotify:playlist:' + pl_id }))
         self.manager.backup_playlist.assert_not_called()
         self.manager.manage_redundant_backups.assert_not_called()
 
@@ -182,11 +186,118 @@ class TestIntegrityManager(unittest.TestCase):
         self.manager.get_unapproved_removals = Mock(side_effect=inputimeout.TimeoutOccurred())
         self.manager._restore_removals = Mock()
 
-        self.manager.run({ 'uri': 'spotify:playlist:' + pl_id })
+        self.assertFalse(self.manager.run({ 'uri': 'spotify:playlist:' + pl_id }))
         self.manager.backup_playlist.assert_not_called()
         self.manager.manage_redundant_backups.assert_not_called()
 
 
+    def test_run_finds_removals_and_backs_up_playlist_using_the_given_snapshot(self):
+        pl_id = self.generate_spotify_id()
+        backup_items = [ { 'name': 'track %d' % num, 'uri': self.generate_track_uri() } for num in range(0, 2) ]
+        self.manager.find_latest_backup = Mock(return_value={ 'name': 'playlistname', 'items': backup_items })
+        self.manager.get_removals = Mock()
+        self.manager.get_unapproved_removals = Mock(return_value=[])
+        self.manager.backup_playlist = Mock()
+        self.manager.manage_redundant_backups = Mock()
+        snapshot = PlaylistSnapshot(pl_id, 'playlistname', [ { 'track': { 'uri': backup_items[0]['uri'] }, 'position': 0 } ])
+
+        self.manager.run({ 'uri': 'spotify:playlist:' + pl_id }, snapshot=snapshot)
+        self.manager.get_removals.assert_not_called()
+        self.manager.get_unapproved_removals.assert_called_once_with([ backup_items[1] ], 'playlistname')
+        self.manager.backup_playlist.assert_called_once_with(pl_id, snapshot=snapshot)
+
+
+    def test_run_adds_restored_removals_to_the_snapshot_and_backs_up_the_snapshot(self):
+        pl_id = self.generate_spotify_id()
+        backup_items = [ { 'name': 'track %d' % num, 'uri': self.generate_track_uri() } for num in range(0, 2) ]
+        self.manager.find_latest_backup = Mock(return_value={ 'name': 'playlistname', 'items': backup_items })
+        self.manager.get_unapproved_removals = Mock(return_value=backup_items)
+        self.manager.spotify_helper.add_items_to_playlist = Mock(return_value='snapshot2')
+        self.manager.backup_playlist = Mock()
+        self.manager.manage_redundant_backups = Mock()
+        self.manager.change_tracker = PlaylistChangeTracker()
+        snapshot = PlaylistSnapshot(pl_id, 'playlistname', [], snapshot_id='snapshot1')
+
+        self.manager.run({ 'uri': 'spotify:playlist:' + pl_id }, snapshot=snapshot)
+        self.manager.spotify_helper.add_items_to_playlist.assert_called_once_with(pl_id, backup_items)
+        self.assertTrue(snapshot.is_current)
+        self.assertEqual([ item['track']['uri'] for item in snapshot.items ], [ item['uri'] for item in backup_items ])
+        self.assertEqual(snapshot.snapshot_id, 'snapshot2')
+        self.manager.backup_playlist.assert_called_once_with(pl_id, snapshot=snapshot)
+        # the snapshot ID returned by a write may include changes nobody scanned, so the playlist is scanned again
+        self.manager.change_tracker.record(pl_id, 'snapshot1')
+        self.assertTrue(self.manager.change_tracker.has_changed(pl_id, 'snapshot2'))
+
+
+    def test_run_fetches_playlist_again_for_backup_if_restoring_removals_to_the_snapshot_playlist_failed(self):
+        pl_id = self.generate_spotify_id()
+        backup_items = [ { 'name': 'track %d' % num, 'uri': self.generate_track_uri() } for num in range(0, 2) ]
+        self.manager.find_latest_backup = Mock(return_value={ 'name': 'playlistname', 'items': backup_items })
+        self.manager.get_unapproved_removals = Mock(return_value=backup_items)
+        self.manager.spotify_helper.add_items_to_playlist = Mock(side_effect=Exception('failed'))
+        self.manager.backup_playlist = Mock()
+        snapshot = PlaylistSnapshot(pl_id, 'playlistname', [])
+
+        self.assertFalse(self.manager.run({ 'uri': 'spotify:playlist:' + pl_id }, snapshot=snapshot))
+        self.assertFalse(snapshot.is_current)
+        self.manager.backup_playlist.assert_not_called()
+
+
+    # ----- Tests for IntegrityManager.run_async ----- #
+
+    def make_async_helper(self, items):
+        async_helper = Mock()
+        async def call(func, *args, **kwargs):
+            return func(*args, **kwargs)
+        async_helper.call = call
+        async_helper.get_all_items_in_playlist = Mock(side_effect=lambda *args, **kwargs: asyncio.sleep(0, items))
+        return async_helper
+
+
+    def test_run_async_takes_a_backup_of_a_playlist_with_no_existing_backup(self):
+        pl_id = self.generate_spotify_id()
+        self.manager.find_latest_backup = Mock(return_value=None)
+        self.manager.backup_playlist = Mock()
+        async_helper = self.make_async_helper([])
+        asyncio.run(self.manager.run_async({ 'uri': 'spotify:playlist:' + pl_id }, async_helper))
+        self.manager.backup_playlist.assert_called_once_with(pl_id)
+        async_helper.get_all_items_in_playlist.assert_not_called()
+
+
+    def test_run_async_restores_only_unapproved_removals_and_backs_up_playlist(self):
+        pl_id = self.generate_spotify_id()
+        backup_items = [ { 'name': 'track %d' % num, 'uri': self.generate_track_uri() } for num in range(0, 3) ]
+        self.manager.find_latest_backup = Mock(return_value={ 'name': 'playlistname', 'items': backup_items })
+        self.manager.backup_playlist = Mock()
+        self.manager.manage_redundant_backups = Mock()
+        self.manager.get_unapproved_removals = Mock(side_effect=lambda removals, name: removals[0:1])
+        self.manager.spotify_helper.add_items_to_playlist = Mock()
+
+        async_helper = self.make_async_helper([ { 'track': { 'uri': backup_items[1]['uri'] }, 'position': 0 } ])
+        asyncio.run(self.manager.run_async({ 'uri': 'spotify:playlist:' + pl_id }, async_helper))
+
+        self.manager.get_unapproved_removals.assert_called_once_with(
+            [ backup_items[0], backup_items[2] ], 'playlistname')
+        self.manager.spotify_helper.add_items_to_playlist.assert_called_once_with(pl_id, [ backup_items[0] ])
+        self.manager.backup_playlist.assert_called_once_with(pl_id)
+        self.manager.manage_redundant_backups.assert_called_once_with(pl_id)
+
+
+    def test_run_async_asks_for_approval_of_removals_outside_of_the_workers_which_moderate_playlists(self):
+        pl_id = self.generate_spotify_id()
+        backup_items = [ { 'name': 'track', 'uri': self.generate_track_uri() } ]
+        self.manager.find_latest_backup = Mock(return_value={ 'name': 'playlistname', 'items': backup_items })
+        self.manager.backup_playlist = Mock()
+        self.manager.manage_redundant_backups = Mock()
+        threads = []
+        self.manager.get_unapproved_removals = Mock(
+            side_effect=lambda removals, name: threads.append(threading.current_thread().name) or [])
+
+        asyncio.run(self.manager.run_async({ 'uri': 'spotify:playlist:' + pl_id }, self.make_async_helper([])))
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].startswith('Approval'))
+
+
     # ----- Tests for IntegrityManager.find_latest_backup ----- #
     
     def test_find_latest_backup_returns_backup_imported_from_file_with_latest_timestamp(self):
@@ -236,7 +347,7 @@ class TestIntegrityManager(unittest.TestCase):
             'name': 'playlist_name',
             'items': [ { 'name': 'track%d' % num, 'uri': self.generate_track_uri() } for num in range(0, 5) ]
         }
-        self.manager.spotify_helper.get_all_items_in_playlist = Mock(return_value=[
+        self.manager.spotify_helper.iter_playlist_items = Mock(return_value=[
             {
                 'track': {
                     'name': track['name'],
@@ -247,6 +358,16 @@ class TestIntegrityManager(unittest.TestCase):
         self.assertEqual(self.manager.get_removals(self.generate_spotify_id(), backup), backup['items'][3:])
 
 
+    def test_get_removals_compares_local_files_by_their_uris(self):
+        local_uri = 'spotify:local:artist:album:title:120'
+        backup = {
+            'name': 'playlist_name',
+            'items': [ { 'name': 'title', 'uri': local_uri }, { 'name': 'track', 'uri': self.generate_track_uri() } ]
+        }
+        self.manager.spotify_helper.iter_playlist_items = Mock(return_value=[ { 'track': { 'uri': local_uri } } ])
+        self.assertEqual(self.manager.get_removals(self.generate_spotify_id(), backup), backup['items'][1:])
+
+
     # ----- Tests for IntegrityManager.get_unapproved_removals ------ #
 
     def test_get_unapproved_removals_returns_only_unapproved_removals(self):
@@ -272,7 +393,7 @@ class TestIntegrityManager(unittest.TestCase):
         self.manager.api.playlist = Mock(return_value={
             'name': 'playlist name'
         })
-        self.manager.spotify_helper.get_all_items_in_playlist = Mock(return_value=[])
+        self.manager.spotify_helper.iter_playlist_items = Mock(return_value=[])
         self.manager.backup_playlist(pl_id)
         relevant_files = []
         for fl in os.listdir(self.test_backup_path):
@@ -313,7 +434,7 @@ class TestIntegrityManager(unittest.TestCase):
                 'position': 1
             }
         ]
-        self.manager.spotify_helper.get_all_items_in_playlist = Mock(return_value=items)
+        self.manager.spotify_helper.iter_playlist_items = Mock(return_value=items)
         self.manager.backup_playlist(pl_id)
         relevant_backups = []
         for backup in os.listdir(self.test_backup_path):
@@ -341,6 +462,68 @@ class TestIntegrityManager(unittest.TestCase):
         }, backup_content)
 
 
+    def test_backup_playlist_saves_backup_of_snapshot_without_fetching_the_playlist(self):
+        pl_id = self.generate_spotify_id()
+        track_uri = self.generate_track_uri()
+        self.manager.api.playlist = Mock()
+        self.manager.spotify_helper.get_all_items_in_playlist = Mock()
+        snapshot = PlaylistSnapshot(pl_id, 'playlistname', [
+            {
+                'track': { 'name': 'track1', 'uri': track_uri, 'artists': [ { 'name': 'artist1' }, { 'name': 'artist2' } ] },
+                'position': 0
+            }
+        ])
+
+        self.manager.backup_playlist(pl_id, snapshot=snapshot)
+        self.manager.api.playlist.assert_not_called()
+        self.manager.spotify_helper.get_all_items_in_playlist.assert_not_called()
+        backups = os.listdir(self.test_backup_path)
+        backups.remove('.gitignore')
+        with open('%s/%s' % (self.test_backup_path, backups[0])) as backup_file:
+            self.assertEqual(json.loads(backup_file.read()), {
+                'name': 'playlistname',
+                'items': [ { 'name': 'track1', 'artists': 'artist1, artist2', 'uri': track_uri, 'position': 0 } ]
+            })
+
+
+    def test_backup_playlist_looks_up_track_details_if_given_a_track_resolver(self):
+        pl_id = self.generate_spotify_id()
+        track_uris = [ self.generate_track_uri() for i in range(0, 2) ]
+        track_resolver = Mock()
+        track_resolver.resolve = Mock(return_value={ track_uris[0]: { 'name': 'track1', 'artists': 'artist1, artist2' } })
+        manager = IntegrityManager(self.test_logger, self.manager.api, self.manager.config, track_resolver=track_resolver)
+        manager.api.playlist = Mock(return_value={ 'name': 'playlistname' })
+        manager.spotify_helper.get_all_items_in_playlist = Mock(return_value=[
+            { 'track': { 'uri': uri }, 'position': position } for (position, uri) in enumerate(track_uris)
+        ])
+
+        manager.backup_playlist(pl_id)
+        self.assertEqual(manager.spotify_helper.get_all_items_in_playlist.call_args[1]['fields'],
+                         'items(track(uri)),total')
+        track_resolver.resolve.assert_called_once_with(track_uris)
+        backups = os.listdir(self.test_backup_path)
+        backups.remove('.gitignore')
+        with open('%s/%s' % (self.test_backup_path, backups[0])) as backup_file:
+            self.assertEqual(json.loads(backup_file.read())['items'], [
+                { 'name': 'track1', 'artists': 'artist1, artist2', 'uri': track_uris[0], 'position': 0 },
+                { 'name': track_uris[1], 'artists': '', 'uri': track_uris[1], 'position': 1 }
+            ])
+
+
+    def test_backup_playlist_saves_item_count_of_playlist_to_the_state_store(self):
+        pl_id = self.generate_spotify_id()
+        state_store = Mock()
+        manager = IntegrityManager(self.test_logger, self.manager.api, self.manager.config, state_store=state_store)
+        snapshot = PlaylistSnapshot(pl_id, 'playlistname', [
+            {
+                'track': { 'name': 'track%d' % position, 'uri': self.generate_track_uri(), 'artists': [] },
+                'position': position
+            } for position in range(0, 3)
+        ])
+        manager.backup_playlist(pl_id, snapshot=snapshot)
+        state_store.update.assert_called_once_with(pl_id, item_count=3)
+
+
     # ----- Tests for IntegrityManager._backup_info_is_valid ----- #
 
     def test_backup_info_is_valid_returns_false_if_it_does_not_incude_a_nonempty_string_name(self):
@@ -1,14 +1,20 @@
 import unittest
-from unittest.mock import Mock, patch
+from unittest.mock import Mock, AsyncMock, patch
 import logging
 import sys
+import asyncio
+from time import sleep, monotonic
+from threading import Event
 import random
 import string
 import yaml
 import spotipy
+from spotipy.exceptions import SpotifyException
 import os
 from inputimeout import inputimeout, TimeoutOccurred
 import src.main as main
+from src.watchdog import Watchdog, WorkCancelled
+from src.request_scheduler import RequestScheduler
 
 class TestMain(unittest.TestCase):
 
@@ -234,7 +240,7 @@ class TestMain(unittest.TestCase):
         helper_obj = Mock()
         helper_obj.configure_api.return_value = spotipy.client.Spotify()
         only_collab_playlists = [ { 'uri': self.generate_playlist_uri() } ]
-        helper_obj.get_all_collab_playlists.return_value = only_collab_playlists
+        helper_obj.iter_collab_playlists.return_value = iter(only_collab_playlists)
         helper_mock.return_value = helper_obj
 
         integrity_mgr_obj = Mock()
@@ -344,6 +350,49 @@ class TestMain(unittest.TestCase):
         self.assertEqual(sys_exit.exception.code, 0)
 
 
+    @patch('src.main.input', return_value='') # exit w/o user input
+    @patch('src.main.PlaylistCleaner')
+    @patch('src.main.IntegrityManager')
+    @patch('src.main.SpotifyHelper')
+    @patch('src.main.setup_logger')
+    @patch('src.main.ConfigValidator')
+    @patch('src.main.load_configurations')
+    def test_main_skips_playlist_which_cannot_be_moderated_due_to_a_temporary_api_error(self, get_config_stub, config_validator_mock,
+                                                                                         setup_logger_mock, helper_mock, integrity_mgr_mock,
+                                                                                         cleaner_mock, exit_stub):
+        playlists = [ { 'uri': self.generate_playlist_uri() } for i in range(0, 2) ]
+        get_config_stub.return_value = ({
+            'PROTECT_ALL': False,
+            'PROTECTED_PLAYLISTS': [ { 'label1': playlists[0] }, { 'label2': playlists[1] } ]
+        }, {}, {
+            'CLIENT_ID': 'spotifyclientid',
+            'CLIENT_SECRET': 'spotifyclientsecret',
+            'REDIRECT_URI': 'http://localhost:8080',
+            'USERNAME': 'spotifyusername'
+        })
+
+        mock_validator = Mock()
+        mock_validator.is_valid.return_value = True
+        mock_validator.all_protected_playlists_exist.return_value = True
+        config_validator_mock.return_value = mock_validator
+
+        configure_api_stub = Mock()
+        configure_api_stub.configure_api.return_value = spotipy.client.Spotify()
+        helper_mock.return_value = configure_api_stub
+
+        integrity_mgr_obj = Mock()
+        playlist_cleaner_obj = Mock()
+        playlist_cleaner_obj.run.side_effect = [ SpotifyException(503, -1, 'service unavailable'), None ]
+        integrity_mgr_mock.return_value = integrity_mgr_obj
+        cleaner_mock.return_value = playlist_cleaner_obj
+
+        with self.assertRaises(SystemExit) as sys_exit:
+            main.main()
+        self.assertEqual(sys_exit.exception.code, 0)
+        self.assertEqual(playlist_cleaner_obj.run.call_count, 2)
+        integrity_mgr_obj.run.assert_called_once_with(playlists[1])
+
+
     @patch('src.main.input', return_value='') # exits on error w/o user input
     @patch('src.main.moderate_playlists')
     @patch('src.main.PlaylistCleaner')
@@ -382,6 +431,345 @@ class TestMain(unittest.TestCase):
         moderate_playlists_mock.assert_not_called()
 
 
+    # ----- Tests for moderate_playlists ----- #
+
+    @patch('src.main.PlaylistCleaner')
+    @patch('src.main.IntegrityManager')
+    def test_moderate_playlists_moderates_playlists_concurrently_if_enabled(self, integrity_mgr_mock, cleaner_mock):
+        playlists = [ { 'uri': self.generate_playlist_uri() } for i in range(0, 4) ]
+        cleaner_mock.return_value.run_async = AsyncMock(side_effect=[
+            None, SpotifyException(503, -1, 'service unavailable'), None, None
+        ])
+        integrity_mgr_mock.return_value.run_async = AsyncMock()
+        logger = logging.getLogger('TestMain')
+        logger.propagate = False
+
+        main.moderate_playlists(logger, spotipy.client.Spotify(), 'spotifyusername', {
+            'PROTECT_ALL': False,
+            'PROTECTED_PLAYLISTS': [ { 'label%d' % i: playlists[i] } for i in range(0, 4) ]
+        }, max_concurrent_playlists=2)
+
+        cleaner_mock.return_value.run.assert_not_called()
+        self.assertEqual(cleaner_mock.return_value.run_async.call_count, 4)
+        # the playlist which could not be scanned is skipped
+        self.assertEqual(integrity_mgr_mock.return_value.run_async.call_count, 3)
+
+
+    @patch('src.main.PlaylistCleaner')
+    @patch('src.main.IntegrityManager')
+    @patch('src.main.PlaylistSnapshot')
+    def test_moderate_playlists_shares_one_snapshot_of_each_playlist_if_enabled(self, snapshot_mock,
+                                                                                  integrity_mgr_mock, cleaner_mock):
+        playlists = [ { 'uri': self.generate_playlist_uri(), 'tracks': { 'total': 120 } } for i in range(0, 2) ]
+        snapshots = [ Mock(), Mock() ]
+        snapshot_mock.fetch.side_effect = snapshots
+        logger = logging.getLogger('TestMain')
+        logger.propagate = False
+
+        with patch('src.main.SpotifyHelper.iter_collab_playlists', return_value=iter(playlists)):
+            main.moderate_playlists(logger, spotipy.client.Spotify(), 'spotifyusername', {
+                'PROTECT_ALL': True
+            }, use_snapshots=True)
+
+        self.assertEqual(snapshot_mock.fetch.call_count, 2)
+        self.assertEqual(snapshot_mock.fetch.call_args_list[0][0][2], playlists[0]['uri'].split(':')[2])
+        self.assertEqual(snapshot_mock.fetch.call_args_list[0][1], { 'total': 120, 'fields': None })
+        cleaner_mock.return_value.run.assert_any_call(playlists[0], snapshot=snapshots[0])
+        cleaner_mock.return_value.run.assert_any_call(playlists[1], snapshot=snapshots[1])
+        integrity_mgr_mock.return_value.run.assert_any_call(playlists[0], snapshot=snapshots[0])
+        integrity_mgr_mock.return_value.run.assert_any_call(playlists[1], snapshot=snapshots[1])
+
+
+    @patch('src.main.PlaylistCleaner')
+    @patch('src.main.IntegrityManager')
+    @patch('src.main.PlaylistSnapshot.fetch')
+    def test_moderate_playlists_fetches_only_track_ids_for_snapshots_if_given_a_track_resolver(self, fetch_mock,
+                                                                                                integrity_mgr_mock, cleaner_mock):
+        playlists = [ { 'uri': self.generate_playlist_uri(), 'tracks': { 'total': 10 } } ]
+        track_resolver = Mock()
+        logger = logging.getLogger('TestMain')
+        logger.propagate = False
+
+        with patch('src.main.SpotifyHelper.iter_collab_playlists', return_value=iter(playlists)):
+            main.moderate_playlists(logger, spotipy.client.Spotify(), 'spotifyusername', {
+                'PROTECT_ALL': True
+            }, use_snapshots=True, track_resolver=track_resolver)
+
+        self.assertEqual(fetch_mock.call_args[1]['fields'], 'items(added_at,added_by.id,track(uri)),total')
+        self.assertEqual(cleaner_mock.call_args[1]['track_resolver'], track_resolver)
+        self.assertEqual(integrity_mgr_mock.call_args[1]['track_resolver'], track_resolver)
+
+
+    @patch('src.main.PlaylistCleaner')
+    @patch('src.main.IntegrityManager')
+    def test_moderate_playlists_skips_playlists_which_have_not_changed_since_they_were_last_moderated(
+            self, integrity_mgr_mock, cleaner_mock):
+        playlists = [
+            { 'uri': self.generate_playlist_uri(), 'snapshot_id': 'snapshot%d' % i } for i in range(0, 3)
+        ]
+        iterations = [
+            playlists,
+            [ playlists[0], dict(playlists[1], snapshot_id='changed'), playlists[2] ],
+        ]
+        # the restoration of removals from the third playlist is left until later in the first iteration
+        integrity_mgr_mock.return_value.run.side_effect = [ True, True, False, True, True ]
+        logger = logging.getLogger('TestMain')
+        logger.propagate = False
+
+        with patch('src.main.SpotifyHelper.iter_collab_playlists', side_effect=[ iter(pls) for pls in iterations ]), \
+             patch('src.main.user_wants_to_exit', side_effect=[ False, True ]), \
+             patch.object(sys, 'argv', [ 'spautomod', '--loop' ]):
+            main.moderate_playlists(logger, spotipy.client.Spotify(), 'spotifyusername', {
+                'PROTECT_ALL': True,
+                'DELAY_BETWEEN_SCANS': 1
+            }, skip_unchanged=True)
+
+        self.assertEqual([ call[0][0] for call in cleaner_mock.return_value.run.call_args_list ],
+                         playlists + [ iterations[1][1], playlists[2] ])
+
+
+    def test_get_playlist_snapshot_id_fetches_snapshot_id_only_if_playlist_was_not_listed_with_it(self):
+        api = spotipy.client.Spotify()
+        api.playlist = Mock(return_value={ 'snapshot_id': 'snapshot2' })
+        self.assertEqual(main.get_playlist_snapshot_id(api, 'playlistid', { 'uri': 'uri', 'snapshot_id': 'snapshot1' }),
+                         'snapshot1')
+        api.playlist.assert_not_called()
+        self.assertEqual(main.get_playlist_snapshot_id(api, 'playlistid', { 'uri': 'uri' }), 'snapshot2')
+        api.playlist.assert_called_once_with('playlistid', fields='snapshot_id')
+
+
+    def test_get_playlist_snapshot_id_fetches_snapshot_id_as_a_change_detection_probe(self):
+        api = spotipy.client.Spotify()
+        api.playlist = Mock(side_effect=lambda *args, **kwargs: { 'snapshot_id': RequestScheduler.current_class() })
+        self.assertEqual(main.get_playlist_snapshot_id(api, 'playlistid', { 'uri': 'uri' }), 'probe')
+
+
+    @patch('src.main.PlaylistCleaner')
+    @patch('src.main.IntegrityManager')
+    def test_moderate_playlists_saves_state_of_moderated_playlists_once_per_iteration(self, integrity_mgr_mock,
+                                                                                        cleaner_mock):
+        playlists = [ { 'uri': self.generate_playlist_uri() } for i in range(0, 2) ]
+        playlist_ids = [ playlist['uri'].split(':')[2] for playlist in playlists ]
+        cleaner_mock.return_value.run.side_effect = [ None, SpotifyException(503, -1, 'unavailable') ]
+        state_store = Mock()
+        state_store.get_metadata = Mock(return_value=None)
+        logger = logging.getLogger('TestMain')
+        logger.propagate = False
+
+        with patch('src.main.SpotifyHelper.iter_collab_playlists', return_value=iter(playlists)):
+            main.moderate_playlists(logger, spotipy.client.Spotify(), 'spotifyusername', {
+                'PROTECT_ALL': True
+            }, state_store=state_store)
+
+        self.assertEqual(cleaner_mock.call_args[1]['state_store'], state_store)
+        self.assertEqual(integrity_mgr_mock.call_args[1]['state_store'], state_store)
+        self.assertEqual(state_store.record_scan.call_count, 1)
+        self.assertEqual(state_store.record_scan.call_args[0][0], playlist_ids[0])
+        state_store.record_error.assert_called_once_with(playlist_ids[1])
+        state_store.commit.assert_called_once_with()
+        # all playlists are scanned again as the playlist configuration is not the one last used
+        state_store.forget_snapshot_ids.assert_called_once_with()
+
+
+    @patch('src.main.PlaylistCleaner')
+    @patch('src.main.IntegrityManager')
+    def test_moderate_playlists_summarises_api_requests_after_each_iteration_even_if_it_fails(self, integrity_mgr_mock,
+                                                                                            cleaner_mock):
+        playlist = { 'uri': self.generate_playlist_uri() }
+        cleaner_mock.return_value.run.side_effect = Exception('unexpected')
+        api_metrics = Mock()
+        request_scheduler = Mock()
+        logger = logging.getLogger('TestMain')
+        logger.propagate = False
+
+        with self.assertRaises(Exception):
+            main.moderate_playlists(logger, spotipy.client.Spotify(), 'spotifyusername', {
+                'PROTECT_ALL': False,
+                'PROTECTED_PLAYLISTS': [ { 'label': playlist } ]
+            }, api_metrics=api_metrics, request_scheduler=request_scheduler)
+        api_metrics.log_summary.assert_called_once_with()
+        request_scheduler.log_summary.assert_called_once_with()
+
+
+    def test_forget_snapshot_ids_if_config_changed_only_forgets_snapshot_ids_if_config_changed(self):
+        logger = logging.getLogger('TestMain')
+        state_store = Mock()
+        metadata = {}
+        state_store.get_metadata = Mock(side_effect=lambda key: metadata.get(key))
+        state_store.set_metadata = Mock(side_effect=lambda key, value: metadata.update({ key: value }))
+
+        main.forget_snapshot_ids_if_config_changed(logger, state_store, 'username', { 'PROTECT_ALL': True })
+        main.forget_snapshot_ids_if_config_changed(logger, state_store, 'username', { 'PROTECT_ALL': True })
+        self.assertEqual(state_store.forget_snapshot_ids.call_count, 1)
+        main.forget_snapshot_ids_if_config_changed(logger, state_store, 'username', { 'PROTECT_ALL': False })
+        self.assertEqual(state_store.forget_snapshot_ids.call_count, 2)
+
+
+    @patch('src.main.StateStore')
+    def test_create_state_store_creates_store_only_if_enabled(self, store_mock):
+        logger = logging.getLogger('TestMain')
+        self.assertIsNone(main.create_state_store(logger, {}))
+        self.assertEqual(main.create_state_store(logger, { 'STATE_STORE': True }), store_mock.return_value)
+        store_mock.assert_called_once_with(logger, 'data/state/state.db')
+
+
+    @patch('src.main.PlaylistCleaner')
+    @patch('src.main.IntegrityManager')
+    def test_moderate_playlists_lists_collab_playlists_through_the_playlist_registry_if_given(self, integrity_mgr_mock,
+                                                                                               cleaner_mock):
+        playlists = [ { 'uri': self.generate_playlist_uri() } for i in range(0, 2) ]
+        playlist_registry = Mock()
+        playlist_registry.get_collab_playlists = Mock(return_value=playlists)
+        api = spotipy.client.Spotify()
+        logger = logging.getLogger('TestMain')
+        logger.propagate = False
+
+        with patch('src.main.SpotifyHelper.iter_collab_playlists') as iter_mock:
+            main.moderate_playlists(logger, api, 'spotifyusername', {
+                'PROTECT_ALL': True
+            }, playlist_registry=playlist_registry)
+            iter_mock.assert_not_called()
+
+        playlist_registry.get_collab_playlists.assert_called_once_with('spotifyusername', api)
+        self.assertEqual([ call[0][0] for call in cleaner_mock.return_value.run.call_args_list ], playlists)
+
+
+    @patch('src.main.PlaylistRegistry')
+    def test_create_playlist_registry_creates_registry_only_if_enabled(self, registry_mock):
+        logger = logging.getLogger('TestMain')
+        self.assertIsNone(main.create_playlist_registry(logger, { 'PLAYLIST_REGISTRY': False }))
+        self.assertEqual(main.create_playlist_registry(logger, { 'PLAYLIST_REGISTRY': True, 'PLAYLIST_REGISTRY_TTL': 60 }),
+                         registry_mock.return_value)
+        registry_mock.assert_called_once_with(logger, ttl=60, path='data/state/playlist_registry.json')
+
+
+    @patch('src.main.PlaylistCleaner')
+    @patch('src.main.IntegrityManager')
+    def test_moderate_playlists_abandons_playlist_whose_scan_runs_past_its_time_budget(self, integrity_mgr_mock,
+                                                                                       cleaner_mock):
+        playlists = [ { 'uri': self.generate_playlist_uri() } for i in range(0, 2) ]
+        release = Event()
+        cleaner_mock.return_value.run.side_effect = lambda playlist: release.wait() if playlist is playlists[0] else None
+        state_store = Mock()
+        state_store.get_metadata = Mock(return_value=None)
+        logger = logging.getLogger('TestMain')
+        logger.propagate = False
+
+        try:
+            with patch('src.main.SpotifyHelper.iter_collab_playlists', return_value=iter(playlists)):
+                main.moderate_playlists(logger, spotipy.client.Spotify(), 'spotifyusername', {
+                    'PROTECT_ALL': True
+                }, state_store=state_store, watchdog=Watchdog(logger, playlist_budget=0.1))
+        finally:
+            release.set()
+
+        integrity_mgr_mock.return_value.run.assert_called_once_with(playlists[1])
+        state_store.record_error.assert_called_once_with(playlists[0]['uri'].split(':')[2])
+        self.assertEqual(state_store.record_scan.call_args[0][0], playlists[1]['uri'].split(':')[2])
+
+
+    @patch('src.main.PlaylistCleaner')
+    @patch('src.main.IntegrityManager')
+    def test_moderate_playlists_skips_remaining_playlists_once_iteration_runs_past_its_time_budget(
+            self, integrity_mgr_mock, cleaner_mock):
+        playlists = [ { 'uri': self.generate_playlist_uri() } for i in range(0, 3) ]
+        cleaner_mock.return_value.run.side_effect = lambda playlist: sleep(0.15)
+        logger = logging.getLogger('TestMain')
+        logger.propagate = False
+
+        with patch('src.main.SpotifyHelper.iter_collab_playlists', return_value=iter(playlists)):
+            main.moderate_playlists(logger, spotipy.client.Spotify(), 'spotifyusername', {
+                'PROTECT_ALL': True
+            }, watchdog=Watchdog(logger, iteration_budget=0.2))
+
+        self.assertEqual([ call[0][0] for call in integrity_mgr_mock.return_value.run.call_args_list ], playlists[0:1])
+
+
+    @patch('src.main.PlaylistCleaner')
+    @patch('src.main.IntegrityManager')
+    def test_moderate_playlists_concurrently_abandons_playlist_whose_scan_runs_past_its_time_budget(
+            self, integrity_mgr_mock, cleaner_mock):
+        playlists = [ { 'uri': self.generate_playlist_uri() } for i in range(0, 3) ]
+        async def clean(playlist, async_helper):
+            if playlist['uri'] == playlists[1]['uri']:
+                await asyncio.sleep(10)
+        cleaner_mock.return_value.run_async = AsyncMock(side_effect=clean)
+        integrity_mgr_mock.return_value.run_async = AsyncMock()
+        logger = logging.getLogger('TestMain')
+        logger.propagate = False
+
+        main.moderate_playlists(logger, spotipy.client.Spotify(), 'spotifyusername', {
+            'PROTECT_ALL': False,
+            'PROTECTED_PLAYLISTS': [ { 'label%d' % i: playlists[i] } for i in range(0, 3) ]
+        }, max_concurrent_playlists=2, watchdog=Watchdog(logger, playlist_budget=0.1))
+
+        self.assertEqual(sorted([ call[0][0]['uri'] for call in integrity_mgr_mock.return_value.run_async.call_args_list ]),
+                         sorted([ playlists[0]['uri'], playlists[2]['uri'] ]))
+
+
+    @patch('src.main.PlaylistCleaner')
+    @patch('src.main.IntegrityManager')
+    def test_moderate_playlists_concurrently_cancels_blocking_calls_of_abandoned_scans(self, integrity_mgr_mock,
+                                                                                       cleaner_mock):
+        playlists = [ { 'uri': self.generate_playlist_uri() } for i in range(0, 2) ]
+        cancelled = Event()
+        def remove_items():
+            # e.g., a write of many chunks
+            started = monotonic()
+            try:
+                while monotonic() - started < 5:
+                    Watchdog.check_cancelled()
+                    sleep(0.01)
+            except WorkCancelled:
+                cancelled.set()
+        async def clean(playlist, async_helper):
+            if playlist['uri'] == playlists[0]['uri']:
+                await async_helper.call(remove_items)
+        cleaner_mock.return_value.run_async = AsyncMock(side_effect=clean)
+        integrity_mgr_mock.return_value.run_async = AsyncMock()
+        logger = logging.getLogger('TestMain')
+        logger.propagate = False
+
+        started = monotonic()
+        main.moderate_playlists(logger, spotipy.client.Spotify(), 'spotifyusername', {
+            'PROTECT_ALL': False,
+            'PROTECTED_PLAYLISTS': [ { 'label%d' % i: playlists[i] } for i in range(0, 2) ]
+        }, max_concurrent_playlists=2, watchdog=Watchdog(logger, playlist_budget=0.1))
+
+        self.assertTrue(cancelled.is_set())
+        self.assertLess(monotonic() - started, 2)
+        integrity_mgr_mock.return_value.run_async.assert_called_once()
+
+
+    def test_create_watchdog_creates_watchdog_only_if_a_time_budget_is_set(self):
+        logger = logging.getLogger('TestMain')
+        self.assertIsNone(main.create_watchdog(logger, {}))
+        self.assertIsNone(main.create_watchdog(logger, { 'PLAYLIST_TIME_BUDGET': 0, 'ITERATION_TIME_BUDGET': 0 }))
+        watchdog = main.create_watchdog(logger, { 'ITERATION_TIME_BUDGET': 600 })
+        self.assertEqual((watchdog.playlist_budget, watchdog.iteration_budget), (None, 600))
+
+
+    # ----- Tests for create_track_resolver ----- #
+
+    def test_create_track_resolver_returns_none_unless_track_metadata_cache_is_enabled(self):
+        logger = logging.getLogger('TestMain')
+        self.assertIsNone(main.create_track_resolver(logger, spotipy.client.Spotify(), {}))
+        self.assertIsNone(main.create_track_resolver(logger, spotipy.client.Spotify(), { 'TRACK_METADATA_CACHE': False }))
+
+
+    @patch('src.main.TrackMetadataResolver')
+    def test_create_track_resolver_creates_resolver_with_configured_cache(self, resolver_mock):
+        logger = logging.getLogger('TestMain')
+        api = spotipy.client.Spotify()
+        resolver = main.create_track_resolver(logger, api, {
+            'TRACK_METADATA_CACHE': True,
+            'TRACK_METADATA_CACHE_PATH': 'data/test/cache/track_metadata.json',
+            'TRACK_METADATA_CACHE_SIZE': 500
+        })
+        self.assertEqual(resolver, resolver_mock.return_value)
+        resolver_mock.assert_called_once_with(logger, api, max_entries=500, path='data/test/cache/track_metadata.json')
+
+
     # ----- Tests for setup_logger ----- #
 
     def test_setup_logger_returns_a_logger(self):
@@ -614,6 +1002,35 @@ ACCOUNT_CONFIG:
         fake_file.close.assert_called_once()
 
 
+    # ----- Tests for load_api_configuration ----- #
+
+    def test_load_api_configuration_loads_api_configuration_from_yaml_at_the_given_path(self):
+        test_config_file = open('data/test/config/config.yaml', 'w')
+        test_config_file.write("""
+---
+API_CONFIG:
+  MAX_PARALLEL_REQUESTS: 4
+""")
+        test_config_file.close()
+        self.assertEqual(main.load_api_configuration(path='data/test/config/config.yaml'), {
+            'MAX_PARALLEL_REQUESTS': 4
+        })
+        os.remove('data/test/config/config.yaml')
+
+
+    def test_load_api_configuration_returns_empty_dict_if_there_is_no_api_configuration(self):
+        test_config_file = open('data/test/config/config.yaml', 'w')
+        test_config_file.write("""
+---
+API_CONFIG:
+LOG_CONFIG:
+  FILE: data/test/log/log_file_path
+""")
+        test_config_file.close()
+        self.assertEqual(main.load_api_configuration(path='data/test/config/config.yaml'), {})
+        os.remove('data/test/config/config.yaml')
+
+
 
 if __name__ == '__main__':
     unittest.main()
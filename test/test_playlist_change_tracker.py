@@ -0,0 +1,71 @@
+import unittest
+from unittest.mock import Mock
+from src.playlist_change_tracker import PlaylistChangeTracker
+
+class TestPlaylistChangeTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.tracker = PlaylistChangeTracker()
+
+
+    # ----- Tests for PlaylistChangeTracker.has_changed ----- #
+
+    def test_has_changed_returns_true_for_a_playlist_which_was_never_recorded(self):
+        self.assertTrue(self.tracker.has_changed('playlist1', 'snapshot1'))
+
+
+    def test_has_changed_returns_false_only_if_snapshot_id_is_the_same_as_when_recorded(self):
+        self.tracker.record('playlist1', 'snapshot1')
+        self.assertFalse(self.tracker.has_changed('playlist1', 'snapshot1'))
+        self.assertTrue(self.tracker.has_changed('playlist1', 'snapshot2'))
+        self.assertTrue(self.tracker.has_changed('playlist2', 'snapshot1'))
+
+
+    def test_has_changed_returns_true_if_snapshot_id_is_not_known(self):
+        self.tracker.record('playlist1', None)
+        self.assertTrue(self.tracker.has_changed('playlist1', None))
+
+
+    # ----- Tests for PlaylistChangeTracker.record_write ----- #
+
+    def test_record_records_nothing_for_a_playlist_which_was_written_to_so_it_is_scanned_again(self):
+        # the playlist's snapshot after the write may include changes made by someone else after the scan
+        self.tracker.record('playlist1', 'snapshot1')
+        self.tracker.record_write('playlist1')
+        self.tracker.record('playlist1', 'snapshot2')
+        self.assertTrue(self.tracker.has_changed('playlist1', 'snapshot2'))
+        self.assertTrue(self.tracker.has_changed('playlist1', 'snapshot3'))
+        # the next scan which needs no writes is recorded
+        self.tracker.record('playlist1', 'snapshot3')
+        self.assertFalse(self.tracker.has_changed('playlist1', 'snapshot3'))
+
+
+    # ----- Tests for PlaylistChangeTracker.start_cycle ----- #
+
+    def test_start_cycle_discards_writes_of_the_previous_cycle(self):
+        # the scan which made the write failed, so it was never recorded
+        self.tracker.record_write('playlist1')
+        self.tracker.start_cycle()
+        self.tracker.record('playlist1', 'snapshot5')
+        self.assertFalse(self.tracker.has_changed('playlist1', 'snapshot5'))
+
+
+    # ----- Tests for PlaylistChangeTracker.forget ----- #
+
+    def test_forget_causes_playlist_to_be_treated_as_changed(self):
+        self.tracker.record('playlist1', 'snapshot1')
+        self.tracker.forget('playlist1')
+        self.assertTrue(self.tracker.has_changed('playlist1', 'snapshot1'))
+        self.tracker.forget('playlist2') # forgetting an unknown playlist has no effect
+
+
+    # ----- Tests for PlaylistChangeTracker with a state store ----- #
+
+    def test_snapshot_ids_are_read_from_and_written_to_the_state_store(self):
+        state_store = Mock()
+        state_store.get = Mock(side_effect=[ None, { 'snapshot_id': 'snapshot1' } ])
+        tracker = PlaylistChangeTracker(state_store=state_store)
+        self.assertTrue(tracker.has_changed('playlist1', 'snapshot1'))
+        self.assertFalse(tracker.has_changed('playlist1', 'snapshot1'))
+        tracker.record('playlist1', 'snapshot2')
+        state_store.update.assert_called_once_with('playlist1', snapshot_id='snapshot2')
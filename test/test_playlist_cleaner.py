@@ -1,4 +1,5 @@
 import unittest
+import asyncio
 import logging
 import random
 import string
@@ -6,6 +7,8 @@ from unittest.mock import Mock, patch
 import spotipy
 from src.playlist_cleaner import PlaylistCleaner
 from src.spotify_helper import SpotifyHelper
+from src.playlist_snapshot import PlaylistSnapshot
+from src.bulk_playlist_write import BulkPlaylistWrite, BulkWriteError
 
 class TestPlaylistCleaner(unittest.TestCase):
 
@@ -52,6 +55,154 @@ class TestPlaylistCleaner(unittest.TestCase):
         cleaner.find_unauthorized_additions.called_once_with(pl_id)
 
 
+    def test_run_passes_track_total_of_listed_playlist_when_finding_unauthorized_additions(self):
+        mock_api = spotipy.client.Spotify()
+        mock_api.playlist = Mock(return_value={'name': 'myplaylist'})
+        pl_id = self.generate_spotify_id()
+        cleaner = PlaylistCleaner(self.test_logger, mock_api, 'playlist_owner', {})
+        cleaner.find_unauthorized_additions = Mock(return_value=[])
+        cleaner.run({ 'uri': 'spotify:playlist:' + pl_id, 'tracks': { 'total': 1200 } })
+        cleaner.find_unauthorized_additions.assert_called_once_with(pl_id, total=1200)
+
+
+    def test_run_removes_unauthorized_items_found_in_snapshot_and_updates_snapshot(self):
+        mock_api = spotipy.client.Spotify()
+        mock_api.playlist = Mock()
+        pl_id = self.generate_spotify_id()
+        cleaner = PlaylistCleaner(self.test_logger, mock_api, 'playlist_owner', {})
+        cleaner.find_unauthorized_additions = Mock()
+        cleaner.spotify_helper.remove_items_from_playlist = Mock(return_value='snapshot2')
+        items = [
+            {
+                'added_at': '2021-01-01T00:00:00Z',
+                'added_by': { 'id': adder },
+                'track': { 'name': 'track', 'uri': self.generate_track_uri() },
+                'position': position
+            } for (position, adder) in enumerate([ 'other_user', 'playlist_owner' ])
+        ]
+        snapshot = PlaylistSnapshot(pl_id, 'myplaylist', list(items), snapshot_id='snapshot1')
+
+        cleaner.run({ 'uri': 'spotify:playlist:' + pl_id }, snapshot=snapshot)
+        mock_api.playlist.assert_not_called()
+        cleaner.find_unauthorized_additions.assert_not_called()
+        removed = cleaner.spotify_helper.remove_items_from_playlist.call_args[0][1]
+        self.assertEqual([ item['uri'] for item in removed ], [ items[0]['track']['uri'] ])
+        self.assertEqual(snapshot.items, [ items[1] ])
+        self.assertEqual(snapshot.items[0]['position'], 0)
+        self.assertEqual(snapshot.snapshot_id, 'snapshot2')
+
+
+    def test_run_removes_items_at_positions_of_snapshot_and_keeps_applied_removals_if_write_fails(self):
+        mock_api = spotipy.client.Spotify()
+        pl_id = self.generate_spotify_id()
+        cleaner = PlaylistCleaner(self.test_logger, mock_api, 'playlist_owner', {})
+        items = [
+            {
+                'added_at': '2021-01-01T00:00:00Z',
+                'added_by': { 'id': 'other_user' if position < 150 else 'playlist_owner' },
+                'track': { 'name': 'track', 'uri': self.generate_track_uri() },
+                'position': position
+            } for position in range(0, 200)
+        ]
+        snapshot = PlaylistSnapshot(pl_id, 'myplaylist', list(items), snapshot_id='snapshot1')
+        failed_write = BulkPlaylistWrite(cleaner.spotify_helper, mock_api, pl_id, 'remove', [
+            { 'uri': item['track']['uri'], 'position': item['position'] } for item in items[0:150]
+        ])
+        failed_write.chunks[0]['applied'] = True
+        cleaner.spotify_helper.remove_items_from_playlist = Mock(side_effect=BulkWriteError(failed_write, Exception()))
+
+        with self.assertRaises(BulkWriteError):
+            cleaner.run({ 'uri': 'spotify:playlist:' + pl_id }, snapshot=snapshot)
+        self.assertEqual(cleaner.spotify_helper.remove_items_from_playlist.call_args[1]['snapshot_id'], 'snapshot1')
+        self.assertEqual(snapshot.items, items[100:200])
+        self.assertIsNone(snapshot.snapshot_id)
+
+
+    def test_run_fetches_only_track_uris_and_looks_up_names_of_removed_tracks_if_given_a_track_resolver(self):
+        mock_api = spotipy.client.Spotify()
+        mock_api.playlist = Mock(return_value={'name': 'myplaylist'})
+        pl_id = self.generate_spotify_id()
+        track_resolver = Mock()
+        cleaner = PlaylistCleaner(self.test_logger, mock_api, 'playlist_owner', {}, track_resolver=track_resolver)
+        items = [
+            {
+                'added_at': '2021-01-01T00:00:00Z',
+                'added_by': { 'id': adder },
+                'track': { 'uri': self.generate_track_uri() },
+                'position': position
+            } for (position, adder) in enumerate([ 'other_user', 'playlist_owner', 'other_user' ])
+        ]
+        track_resolver.resolve = Mock(return_value={ items[0]['track']['uri']: { 'name': 'track1', 'artists': 'artist1' } })
+        cleaner.spotify_helper.iter_playlist_items = Mock(return_value=iter(items))
+        cleaner.spotify_helper.remove_items_from_playlist = Mock()
+
+        cleaner.run({ 'uri': 'spotify:playlist:' + pl_id })
+        self.assertEqual(cleaner.spotify_helper.iter_playlist_items.call_args[1]['fields'],
+                         'items(added_at,added_by.id,track(uri)),total')
+        track_resolver.resolve.assert_called_once_with([ items[0]['track']['uri'], items[2]['track']['uri'] ])
+        removed = cleaner.spotify_helper.remove_items_from_playlist.call_args[0][1]
+        # a track which could not be looked up is named by its URI
+        self.assertEqual([ item['name'] for item in removed ], [ 'track1', items[2]['track']['uri'] ])
+
+
+    def test_run_saves_item_count_and_newest_addition_of_playlist_to_the_state_store(self):
+        mock_api = spotipy.client.Spotify()
+        mock_api.playlist = Mock(return_value={'name': 'myplaylist'})
+        pl_id = self.generate_spotify_id()
+        state_store = Mock()
+        cleaner = PlaylistCleaner(self.test_logger, mock_api, 'playlist_owner', {}, state_store=state_store)
+        items = [
+            {
+                'added_at': added_at,
+                'added_by': { 'id': adder },
+                'track': { 'name': 'track', 'uri': self.generate_track_uri() },
+                'position': position
+            } for (position, (added_at, adder)) in enumerate([
+                ('2021-03-01T00:00:00Z', 'playlist_owner'),
+                ('2021-05-01T00:00:00Z', 'other_user'),
+                (None, 'playlist_owner')
+            ])
+        ]
+        cleaner.spotify_helper.iter_playlist_items = Mock(return_value=iter(items))
+        cleaner.spotify_helper.remove_items_from_playlist = Mock()
+
+        cleaner.run({ 'uri': 'spotify:playlist:' + pl_id })
+        state_store.update.assert_called_once_with(pl_id, item_count=2, newest_added_at='2021-05-01T00:00:00Z')
+
+
+    # ----- Tests for PlaylistCleaner.run_async ----- #
+
+    def test_run_async_removes_only_unauthorized_items(self):
+        mock_api = spotipy.client.Spotify()
+        mock_api.playlist = Mock(return_value={'name': 'myplaylist'})
+        pl_id = self.generate_spotify_id()
+        cleaner = PlaylistCleaner(self.test_logger, mock_api, 'playlist_owner', {})
+        items = [
+            {
+                'added_at': '2021-01-01T00:00:00Z',
+                'added_by': { 'id': adder },
+                'track': { 'name': 'track', 'uri': self.generate_track_uri() },
+                'position': position
+            } for (position, adder) in enumerate([ 'playlist_owner', 'other_user', 'playlist_owner' ])
+        ]
+
+        async_helper = Mock()
+        async def call(func, *args, **kwargs):
+            return func(*args, **kwargs)
+        async_helper.call = call
+        async_helper.get_all_items_in_playlist = Mock(side_effect=lambda *args, **kwargs: asyncio.sleep(0, items))
+        cleaner.spotify_helper.remove_items_from_playlist = Mock(return_value='snapshot2')
+        cleaner.change_tracker = Mock()
+
+        asyncio.run(cleaner.run_async({ 'uri': 'spotify:playlist:' + pl_id, 'tracks': { 'total': 3 } }, async_helper))
+        self.assertEqual(async_helper.get_all_items_in_playlist.call_args[1]['total'], 3)
+        removed = cleaner.spotify_helper.remove_items_from_playlist.call_args[0][1]
+        self.assertEqual([ item['uri'] for item in removed ], [ items[1]['track']['uri'] ])
+        self.assertEqual(removed[0]['position'], 1)
+        # the removal is recorded the same way as by `run`
+        cleaner.change_tracker.record_write.assert_called_once_with(pl_id)
+
+
     # ----- Tests for PlaylistCleaner.find_unauthorized_additions ----- #
 
     def test_find_unauthorized_additions_returns_only_unauthorized_additions(self):
@@ -71,7 +222,7 @@ class TestPlaylistCleaner(unittest.TestCase):
         mock_api.playlist = Mock(return_value={ 'name': 'playlist_name' })
 
         cleaner = PlaylistCleaner(self.test_logger, mock_api, 'playlist_owner', {})
-        cleaner.spotify_helper.get_all_items_in_playlist = Mock(return_value=items)
+        cleaner.spotify_helper.iter_playlist_items = Mock(return_value=items)
         cleaner.playlist_addition_is_authorized = Mock(side_effect=[
             i not in [22, 60, 129] for i in range(0, len(items))
         ])
@@ -346,10 +497,11 @@ class TestPlaylistCleaner(unittest.TestCase):
 
             } for index in range(0, len(item_ids))
         ]
+        # without a snapshot ID, the positions of each block refer to the playlist after the blocks before it
         expected_removed = [
             {
                 'uri': item['uri'],
-                'positions': [ item['position'] ]
+                'positions': [ item['position'] % 100 ]
             } for item in items
         ]
         cleaner.remove_playlist_items(pl_id, items)
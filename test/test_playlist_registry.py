@@ -0,0 +1,182 @@
+import unittest
+import logging
+import os
+import re
+import random
+import string
+from unittest.mock import Mock, patch
+import spotipy
+from src.playlist_registry import PlaylistRegistry
+
+class TestPlaylistRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.test_logger = logging.getLogger('TestPlaylistRegistry')
+        log_handler = logging.StreamHandler()
+        log_handler.setLevel('CRITICAL')
+        self.test_logger.addHandler(log_handler)
+        self.test_logger.propagate = False
+        self.generate_spotify_id = (
+            lambda: ''.join(random.choice(string.ascii_letters + string.digits) for i in range(0, 22)))
+        self.generate_playlist_uri = (
+            lambda gen_id=self.generate_spotify_id: 'spotify:playlist:' + gen_id())
+
+        self.test_state_path = 'data/test/state'
+        self.test_registry_path = '%s/playlist_registry.json' % self.test_state_path
+        self.clear_state_files()
+        self.api = spotipy.client.Spotify()
+
+
+    def tearDown(self):
+        self.clear_state_files()
+
+
+    def clear_state_files(self):
+        for filename in os.listdir(self.test_state_path):
+            if re.search('^\\.gitignore$', filename) is None:
+                os.remove('%s/%s' % (self.test_state_path, filename))
+
+
+    def generate_playlists(self, num_playlists):
+        # every third playlist is a collaborative playlist owned by the user
+        return [
+            {
+                'uri': self.generate_playlist_uri(),
+                'collaborative': num % 3 == 0,
+                'owner': { 'id': 'creator_id' if num % 3 != 1 else 'someotheruser' },
+                'snapshot_id': 'snapshot%d' % num,
+                'tracks': { 'total': num }
+            } for num in range(0, num_playlists)
+        ]
+
+
+    def mock_listing(self, playlists):
+        self.api.current_user_playlists = Mock(side_effect=lambda limit, offset: {
+            'items': playlists[offset : offset + limit],
+            'total': len(playlists)
+        })
+
+
+    # ----- Tests for PlaylistRegistry.get_collab_playlists ----- #
+
+    def test_get_collab_playlists_returns_collaborative_playlists_owned_by_the_user(self):
+        playlists = self.generate_playlists(120)
+        self.mock_listing(playlists)
+        registry = PlaylistRegistry(self.test_logger, ttl=300)
+        self.assertEqual(registry.get_collab_playlists('creator_id', self.api), [
+            {
+                'uri': playlist['uri'],
+                'snapshot_id': playlist['snapshot_id'],
+                'tracks': { 'total': playlist['tracks']['total'] }
+            } for playlist in playlists[0::3]
+        ])
+        self.assertEqual(self.api.current_user_playlists.call_count, 3)
+
+
+    def test_get_collab_playlists_reuses_listing_with_its_snapshot_ids_until_it_expires(self):
+        playlists = self.generate_playlists(10)
+        self.mock_listing(playlists)
+        registry = PlaylistRegistry(self.test_logger, ttl=300)
+        listed = registry.get_collab_playlists('creator_id', self.api)
+        self.api.current_user_playlists.reset_mock()
+
+        # a change to a playlist is therefore noticed once the listing has expired
+        playlists[0]['snapshot_id'] = 'changed'
+        self.assertEqual(registry.get_collab_playlists('creator_id', self.api), listed)
+        self.assertEqual(listed[0]['snapshot_id'], 'snapshot0')
+        self.assertEqual(listed[1]['tracks'], { 'total': 3 })
+        self.api.current_user_playlists.assert_not_called()
+
+        with patch('src.playlist_registry.time', return_value=registry._listing['listed_at'] + 301):
+            self.assertEqual(registry.get_collab_playlists('creator_id', self.api)[0]['snapshot_id'], 'changed')
+        self.api.current_user_playlists.assert_called_once_with(limit=50, offset=0)
+
+
+    def test_get_collab_playlists_stops_listing_at_a_page_of_known_playlists_if_the_rest_are_unchanged(self):
+        playlists = self.generate_playlists(200)
+        self.mock_listing(playlists)
+        registry = PlaylistRegistry(self.test_logger, ttl=0)
+        registry.get_collab_playlists('creator_id', self.api)
+
+        new_playlist = self.generate_playlists(1)[0]
+        self.mock_listing([ new_playlist ] + playlists)
+        result = registry.get_collab_playlists('creator_id', self.api)
+        self.assertEqual(self.api.current_user_playlists.call_count, 2)
+        self.assertEqual([ playlist['uri'] for playlist in result ],
+                         [ new_playlist['uri'] ] + [ playlist['uri'] for playlist in playlists[0::3] ])
+        # snapshot IDs are only included for the playlists which were just listed
+        self.assertEqual([ 'snapshot_id' in playlist.keys() for playlist in result ],
+                         [ True ] + [ index < 99 for index in range(0, 200, 3) ])
+
+
+    def test_get_collab_playlists_notices_changes_to_older_playlists_within_full_refresh_interval(self):
+        playlists = self.generate_playlists(200)
+        self.mock_listing(playlists)
+        registry = PlaylistRegistry(self.test_logger, ttl=0)
+        registry.get_collab_playlists('creator_id', self.api)
+
+        # an older playlist is no longer collaborative, which an incremental refresh does not notice
+        playlists[150]['collaborative'] = False
+        self.mock_listing([ self.generate_playlists(1)[0] ] + playlists)
+        result = registry.get_collab_playlists('creator_id', self.api)
+        self.assertEqual(self.api.current_user_playlists.call_count, 2)
+        self.assertIn(playlists[150]['uri'], [ playlist['uri'] for playlist in result ])
+        # nor is a playlist which was not listed again given with its (possibly outdated) snapshot ID
+        self.assertEqual([ playlist for playlist in result if playlist['uri'] == playlists[150]['uri'] ],
+                         [ { 'uri': playlists[150]['uri'] } ])
+
+        with patch('src.playlist_registry.time',
+                   return_value=registry._listing['fully_listed_at'] + PlaylistRegistry.full_refresh_interval):
+            result = registry.get_collab_playlists('creator_id', self.api)
+        self.assertNotIn(playlists[150]['uri'], [ playlist['uri'] for playlist in result ])
+
+
+    def test_get_collab_playlists_lists_every_playlist_if_the_known_playlists_have_changed(self):
+        playlists = self.generate_playlists(200)
+        self.mock_listing(playlists)
+        registry = PlaylistRegistry(self.test_logger, ttl=0)
+        registry.get_collab_playlists('creator_id', self.api)
+
+        # the last playlist was removed, so the known playlists do not account for all playlists
+        changed_playlists = self.generate_playlists(1) + playlists[:-1]
+        self.mock_listing(changed_playlists)
+        result = registry.get_collab_playlists('creator_id', self.api)
+        self.assertEqual(self.api.current_user_playlists.call_count, 5)
+        self.assertEqual([ playlist['uri'] for playlist in result ],
+                         [ changed_playlists[0]['uri'] ] + [ playlist['uri'] for playlist in playlists[0:-1:3] ])
+
+
+    def test_get_collab_playlists_lists_every_playlist_once_full_refresh_interval_has_passed(self):
+        playlists = self.generate_playlists(200)
+        self.mock_listing(playlists)
+        registry = PlaylistRegistry(self.test_logger, ttl=0)
+        registry.get_collab_playlists('creator_id', self.api)
+        self.api.current_user_playlists.reset_mock()
+
+        with patch('src.playlist_registry.time', return_value=registry._listing['listed_at'] + 24 * 60 * 60):
+            registry.get_collab_playlists('creator_id', self.api)
+        self.assertEqual(self.api.current_user_playlists.call_count, 5)
+
+
+    def test_get_collab_playlists_reuses_listing_saved_by_another_registry(self):
+        playlists = self.generate_playlists(10)
+        self.mock_listing(playlists)
+        PlaylistRegistry(self.test_logger, ttl=300, path=self.test_registry_path).get_collab_playlists(
+            'creator_id', self.api)
+        self.api.current_user_playlists.reset_mock()
+
+        registry = PlaylistRegistry(self.test_logger, ttl=300, path=self.test_registry_path)
+        self.assertEqual(len(registry.get_collab_playlists('creator_id', self.api)), 4)
+        self.api.current_user_playlists.assert_not_called()
+        # a listing of another user's playlists is not reused
+        registry.get_collab_playlists('someotheruser', self.api)
+        self.api.current_user_playlists.assert_called_once_with(limit=50, offset=0)
+
+
+    def test_get_collab_playlists_ignores_unreadable_saved_listing(self):
+        with open(self.test_registry_path, 'w') as registry_file:
+            registry_file.write('[]')
+        self.mock_listing(self.generate_playlists(10))
+        registry = PlaylistRegistry(self.test_logger, ttl=300, path=self.test_registry_path)
+        self.assertEqual(len(registry.get_collab_playlists('creator_id', self.api)), 4)
+        self.api.current_user_playlists.assert_called_once_with(limit=50, offset=0)
@@ -0,0 +1,141 @@
+import unittest
+import logging
+import random
+import string
+from unittest.mock import Mock
+import spotipy
+from src.playlist_snapshot import PlaylistSnapshot
+from src.spotify_helper import SpotifyHelper
+
+class TestPlaylistSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.test_logger = logging.getLogger('TestPlaylistSnapshot')
+        self.generate_spotify_id = (
+            lambda: ''.join(random.choice(string.ascii_letters + string.digits) for i in range(0, 22)))
+        self.generate_track_uri = (
+            lambda gen_id=self.generate_spotify_id: 'spotify:track:' + gen_id())
+        self.make_items = lambda num_items: [
+            {
+                'track': { 'name': 'track%d' % position, 'uri': self.generate_track_uri() },
+                'position': position
+            } for position in range(0, num_items)
+        ]
+
+
+    # ----- Tests for PlaylistSnapshot.fetch ----- #
+
+    def make_playlist(self, snapshot_id, items, total=None):
+        page_items = [ { 'track': item['track'] } for item in items[0:100] ]
+        return { 'name': 'myplaylist', 'snapshot_id': snapshot_id,
+                 'tracks': { 'items': page_items, 'total': total if total is not None else len(items) } }
+
+
+    def test_fetch_fetches_playlist_details_and_items_with_all_fields_needed_for_moderation(self):
+        pl_id = self.generate_spotify_id()
+        items = self.make_items(3)
+        mock_api = spotipy.client.Spotify()
+        mock_api.playlist = Mock(return_value=self.make_playlist('snapshot1', items))
+        helper = SpotifyHelper(self.test_logger, api=mock_api)
+        helper.get_all_items_in_playlist = Mock()
+
+        snapshot = PlaylistSnapshot.fetch(helper, mock_api, pl_id, total=3)
+        # the items of a playlist with one page are fetched with the playlist
+        mock_api.playlist.assert_called_once_with(
+            pl_id, fields='name,snapshot_id,tracks(items(added_at,added_by.id,track(name,uri,artists.name)),total)')
+        helper.get_all_items_in_playlist.assert_not_called()
+        self.assertEqual(snapshot.playlist_id, pl_id)
+        self.assertEqual(snapshot.name, 'myplaylist')
+        self.assertEqual(snapshot.snapshot_id, 'snapshot1')
+        self.assertEqual(snapshot.items, items)
+        self.assertTrue(snapshot.is_current)
+
+
+    def test_fetch_fetches_remaining_pages_and_checks_that_the_playlist_did_not_change_meanwhile(self):
+        pl_id = self.generate_spotify_id()
+        items = self.make_items(250)
+        mock_api = spotipy.client.Spotify()
+        mock_api.playlist = Mock(side_effect=[ self.make_playlist('snapshot1', items), { 'snapshot_id': 'snapshot1' } ])
+        helper = SpotifyHelper(self.test_logger, api=mock_api)
+        helper.get_all_items_in_playlist = Mock(return_value=items[100:])
+
+        snapshot = PlaylistSnapshot.fetch(helper, mock_api, pl_id, fields=PlaylistSnapshot.item_id_fields)
+        helper.get_all_items_in_playlist.assert_called_once_with(
+            pl_id, fields=PlaylistSnapshot.item_id_fields, api=mock_api, total=250, offset=100)
+        self.assertEqual(mock_api.playlist.call_args_list[1][1], { 'fields': 'snapshot_id' })
+        self.assertEqual(snapshot.items, items)
+        self.assertEqual(snapshot.snapshot_id, 'snapshot1')
+
+
+    def test_fetch_fetches_items_again_if_the_playlist_changed_while_they_were_fetched(self):
+        pl_id = self.generate_spotify_id()
+        (items, changed_items) = (self.make_items(150), self.make_items(150))
+        mock_api = spotipy.client.Spotify()
+        mock_api.playlist = Mock(side_effect=[
+            self.make_playlist('snapshot1', items), { 'snapshot_id': 'snapshot2' },
+            self.make_playlist('snapshot2', changed_items), { 'snapshot_id': 'snapshot2' }
+        ])
+        helper = SpotifyHelper(self.test_logger, api=mock_api)
+        helper.get_all_items_in_playlist = Mock(side_effect=[ changed_items[100:], changed_items[100:] ])
+
+        snapshot = PlaylistSnapshot.fetch(helper, mock_api, pl_id)
+        self.assertEqual(snapshot.items, changed_items)
+        self.assertEqual(snapshot.snapshot_id, 'snapshot2')
+
+
+    def test_fetch_leaves_snapshot_id_unknown_if_the_playlist_keeps_changing(self):
+        pl_id = self.generate_spotify_id()
+        items = self.make_items(150)
+        responses = []
+        for attempt in range(0, PlaylistSnapshot.max_refetches + 1):
+            responses += [ self.make_playlist('snapshot%d' % attempt, items), { 'snapshot_id': 'changed' } ]
+        mock_api = spotipy.client.Spotify()
+        mock_api.playlist = Mock(side_effect=responses)
+        helper = SpotifyHelper(self.test_logger, api=mock_api)
+        helper.get_all_items_in_playlist = Mock(side_effect=lambda *args, **kwargs: items[100:])
+
+        snapshot = PlaylistSnapshot.fetch(helper, mock_api, pl_id)
+        self.assertEqual(len(snapshot.items), 150)
+        self.assertIsNone(snapshot.snapshot_id)
+
+
+    # ----- Tests for PlaylistSnapshot.remove_items ----- #
+
+    def test_remove_items_removes_items_at_the_given_positions_and_moves_remaining_items_up(self):
+        items = self.make_items(5)
+        snapshot = PlaylistSnapshot(self.generate_spotify_id(), 'myplaylist', list(items), snapshot_id='snapshot1')
+        snapshot.remove_items([ { 'uri': items[1]['track']['uri'], 'position': 1 },
+                                { 'uri': items[3]['track']['uri'], 'position': 3 } ], snapshot_id='snapshot2')
+
+        self.assertEqual([ item['track']['name'] for item in snapshot.items ], [ 'track0', 'track2', 'track4' ])
+        self.assertEqual([ item['position'] for item in snapshot.items ], [ 0, 1, 2 ])
+        self.assertEqual(snapshot.snapshot_id, 'snapshot2')
+        self.assertTrue(snapshot.is_current)
+
+
+    # ----- Tests for PlaylistSnapshot.add_items ----- #
+
+    def test_add_items_adds_items_with_their_backed_up_details_to_the_end_of_the_playlist(self):
+        items = self.make_items(2)
+        snapshot = PlaylistSnapshot(self.generate_spotify_id(), 'myplaylist', list(items), snapshot_id='snapshot1')
+        added_uri = 'spotify:track:' + self.generate_spotify_id()
+        snapshot.add_items([ { 'name': 'restored', 'artists': 'Band A, Band B', 'uri': added_uri, 'position': 7 } ],
+                           snapshot_id='snapshot2')
+
+        self.assertEqual(snapshot.items[0:2], items)
+        self.assertEqual(snapshot.items[2]['track'], { 'name': 'restored', 'uri': added_uri, 'artists': [ { 'name': 'Band A, Band B' } ] })
+        self.assertEqual(snapshot.items[2]['position'], 2)
+        self.assertEqual(snapshot.snapshot_id, 'snapshot2')
+        self.assertTrue(snapshot.is_current)
+
+
+    # ----- Tests for PlaylistSnapshot.invalidate ----- #
+
+    def test_invalidate_marks_snapshot_as_no_longer_current(self):
+        snapshot = PlaylistSnapshot(self.generate_spotify_id(), 'myplaylist', [])
+        snapshot.invalidate()
+        self.assertFalse(snapshot.is_current)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+from threading import Thread
+from time import monotonic, sleep
+from src.rate_limiter import RateLimiter
+
+class TestRateLimiter(unittest.TestCase):
+
+    # ----- Tests for RateLimiter.acquire ----- #
+
+    def test_acquire_does_not_wait_while_burst_tokens_are_available(self):
+        limiter = RateLimiter(rate=1, burst=5)
+        started = monotonic()
+        for i in range(0, 5):
+            limiter.acquire()
+        self.assertLess(monotonic() - started, 0.5)
+
+
+    def test_acquire_waits_for_tokens_to_be_added_at_the_configured_rate(self):
+        limiter = RateLimiter(rate=50, burst=1)
+        started = monotonic()
+        for i in range(0, 6):
+            limiter.acquire()
+        # the first token is available immediately and the other five take 1/50 seconds each
+        self.assertGreaterEqual(monotonic() - started, 0.09)
+
+
+    def test_acquire_does_not_limit_requests_if_no_rate_is_given(self):
+        limiter = RateLimiter(rate=None)
+        started = monotonic()
+        for i in range(0, 1000):
+            limiter.acquire()
+        self.assertLess(monotonic() - started, 0.5)
+
+
+    # ----- Tests for RateLimiter.pause ----- #
+
+    def test_pause_holds_back_requests_to_the_paused_endpoint_only(self):
+        limiter = RateLimiter(rate=None)
+        limiter.pause('GET playlists/{id}/tracks', 0.2)
+
+        started = monotonic()
+        limiter.acquire('GET me/playlists')
+        self.assertLess(monotonic() - started, 0.1)
+
+        limiter.acquire('GET playlists/{id}/tracks')
+        self.assertGreaterEqual(monotonic() - started, 0.19)
+
+
+    def test_pause_does_not_shorten_an_existing_pause(self):
+        limiter = RateLimiter(rate=None)
+        limiter.pause('GET me/playlists', 10)
+        limiter.pause('GET me/playlists', 1)
+        self.assertGreater(limiter.pause_remaining('GET me/playlists'), 5)
+
+
+    # ----- Tests for RateLimiter.queue_depth ----- #
+
+    def test_queue_depth_counts_the_requests_waiting_for_a_token(self):
+        limiter = RateLimiter(rate=None)
+        limiter.pause('GET me/playlists', 0.3)
+        self.assertEqual(limiter.queue_depth, 0)
+
+        waiting = [ Thread(target=limiter.acquire, args=('GET me/playlists',)) for i in range(0, 3) ]
+        for thread in waiting:
+            thread.start()
+        sleep(0.1)
+        self.assertEqual(limiter.queue_depth, 3)
+
+        for thread in waiting:
+            thread.join()
+        self.assertEqual(limiter.queue_depth, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+from src.request_hedger import RequestHedger
+
+class TestRequestHedger(unittest.TestCase):
+
+    # ----- Tests for RequestHedger.hedge_delay ----- #
+
+    def test_hedge_delay_returns_none_until_enough_latencies_have_been_observed(self):
+        hedger = RequestHedger(percentile=90, min_samples=5)
+        for i in range(0, 4):
+            hedger.record_latency('GET me/playlists', 0.1)
+            self.assertIsNone(hedger.hedge_delay('GET me/playlists'))
+        hedger.record_latency('GET me/playlists', 0.1)
+        self.assertEqual(hedger.hedge_delay('GET me/playlists'), 0.1)
+
+
+    def test_hedge_delay_returns_percentile_of_latencies_observed_for_the_endpoint(self):
+        hedger = RequestHedger(percentile=90, min_samples=1)
+        for latency in range(1, 101):
+            hedger.record_latency('GET playlists/{id}/tracks', latency / 100)
+        hedger.record_latency('GET me/playlists', 5.0)
+        self.assertEqual(hedger.hedge_delay('GET playlists/{id}/tracks'), 0.9)
+        self.assertEqual(hedger.hedge_delay('GET me/playlists'), 5.0)
+        self.assertIsNone(hedger.hedge_delay('GET playlists/{id}'))
+
+
+    def test_hedge_delay_is_based_only_on_the_most_recent_latencies(self):
+        hedger = RequestHedger(percentile=50, window=10, min_samples=1)
+        for i in range(0, 10):
+            hedger.record_latency('GET me/playlists', 10.0)
+        for i in range(0, 10):
+            hedger.record_latency('GET me/playlists', 0.2)
+        self.assertEqual(hedger.hedge_delay('GET me/playlists'), 0.2)
+
+
+    # ----- Tests for RequestHedger.record_hedge ----- #
+
+    def test_record_hedge_counts_hedged_requests_and_how_often_they_answered_first(self):
+        hedger = RequestHedger()
+        hedger.record_hedge(won=True)
+        hedger.record_hedge(won=False)
+        hedger.record_hedge(won=True)
+        self.assertEqual(hedger.hedged_requests, 3)
+        self.assertEqual(hedger.hedge_wins, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import unittest
+import logging
+from unittest.mock import Mock
+from threading import Thread, Lock
+from time import monotonic, sleep
+from src.rate_limiter import RateLimiter
+from src.request_scheduler import RequestScheduler
+
+class TestRequestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.test_logger = logging.getLogger('TestRequestScheduler')
+        log_handler = logging.StreamHandler()
+        log_handler.setLevel('CRITICAL')
+        self.test_logger.addHandler(log_handler)
+        self.test_logger.propagate = False
+
+
+    def start_request(self, scheduler, priority_class, sent, sent_lock, endpoint=None):
+        def send():
+            with RequestScheduler.priority(priority_class):
+                scheduler.acquire(endpoint)
+            with sent_lock:
+                sent.append(priority_class)
+        thread = Thread(target=send)
+        thread.start()
+        return thread
+
+
+    # ----- Tests for RequestScheduler.acquire ----- #
+
+    def test_acquire_lets_waiting_requests_through_in_order_of_priority_class(self):
+        scheduler = RequestScheduler(self.test_logger, RateLimiter(rate=10, burst=1))
+        scheduler.acquire() # i.e., no tokens are left
+        (sent, sent_lock) = ([], Lock())
+        threads = []
+        for priority_class in [ 'background', 'background', 'scan', 'probe' ]:
+            threads.append(self.start_request(scheduler, priority_class, sent, sent_lock))
+            sleep(0.01)
+        threads.append(self.start_request(scheduler, 'enforcement', sent, sent_lock))
+        for thread in threads:
+            thread.join()
+
+        # the first request was already waiting for a token when the others were queued
+        self.assertEqual(sent, [ 'background', 'enforcement', 'probe', 'scan', 'background' ])
+
+
+    def test_acquire_does_not_hold_back_requests_behind_a_request_to_a_paused_endpoint(self):
+        limiter = RateLimiter(rate=None)
+        limiter.pause('DELETE playlists/{id}/tracks', 0.3)
+        scheduler = RequestScheduler(self.test_logger, limiter)
+        (sent, sent_lock) = ([], Lock())
+        paused = self.start_request(scheduler, 'enforcement', sent, sent_lock, endpoint='DELETE playlists/{id}/tracks')
+        sleep(0.05)
+
+        started = monotonic()
+        with RequestScheduler.priority('background'):
+            scheduler.acquire('GET playlists/{id}/tracks')
+        self.assertLess(monotonic() - started, 0.1)
+        paused.join()
+        self.assertEqual(sent, [ 'enforcement' ])
+
+
+    def test_acquire_does_not_wait_while_tokens_are_available(self):
+        scheduler = RequestScheduler(self.test_logger, RateLimiter(rate=1, burst=5))
+        started = monotonic()
+        for i in range(0, 5):
+            scheduler.acquire()
+        self.assertLess(monotonic() - started, 0.5)
+
+
+    # ----- Tests for RequestScheduler.priority ----- #
+
+    def test_priority_sets_the_class_of_requests_of_the_calling_thread_only(self):
+        classes = []
+        self.assertEqual(RequestScheduler.current_class(), 'scan')
+        with RequestScheduler.priority('enforcement'):
+            with RequestScheduler.priority('probe'):
+                self.assertEqual(RequestScheduler.current_class(), 'probe')
+            self.assertEqual(RequestScheduler.current_class(), 'enforcement')
+            thread = Thread(target=lambda: classes.append(RequestScheduler.current_class()))
+            thread.start()
+            thread.join()
+        self.assertEqual(RequestScheduler.current_class(), 'scan')
+        self.assertEqual(classes, [ 'scan' ])
+
+        with self.assertRaises(ValueError):
+            with RequestScheduler.priority('urgent'):
+                pass
+
+
+    # ----- Tests for RequestScheduler.bind ----- #
+
+    def test_bind_runs_function_with_the_class_of_the_thread_which_bound_it(self):
+        classes = []
+        with RequestScheduler.priority('enforcement'):
+            record_class = RequestScheduler.bind(lambda value: classes.append((value, RequestScheduler.current_class())))
+        thread = Thread(target=record_class, args=[ 1 ])
+        thread.start()
+        thread.join()
+        record_class(2)
+        self.assertEqual(classes, [ (1, 'enforcement'), (2, 'enforcement') ])
+        self.assertEqual(RequestScheduler.current_class(), 'scan')
+
+
+    # ----- Tests for RequestScheduler.log_summary ----- #
+
+    def test_log_summary_logs_and_resets_the_queue_metrics_of_each_class(self):
+        scheduler = RequestScheduler(self.test_logger, RateLimiter(rate=20, burst=1))
+        for priority_class in [ 'background', 'enforcement', 'enforcement' ]:
+            with RequestScheduler.priority(priority_class):
+                scheduler.acquire()
+        scheduler.logger = Mock()
+        summary = scheduler.log_summary()
+
+        self.assertEqual(sorted(summary.keys()), [ 'background', 'enforcement' ])
+        self.assertEqual((summary['enforcement']['requests'], summary['enforcement']['queued']), (2, 2))
+        self.assertGreaterEqual(summary['enforcement']['max_wait'], 0.04)
+        messages = [ call[0][0] % call[0][1:] for call in scheduler.logger.info.call_args_list ]
+        self.assertEqual(len(messages), 3)
+        self.assertIn('Priority \'enforcement\': 2 requests (queued: 2)', messages[1])
+        self.assertIn('Priority \'background\': 1 requests (queued: 0)', messages[2])
+        self.assertEqual(scheduler.take_summary(), {})
@@ -0,0 +1,98 @@
+import unittest
+import logging
+import os
+import re
+from time import sleep
+from src.response_cache import ResponseCache
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.test_logger = logging.getLogger('TestResponseCache')
+        log_handler = logging.StreamHandler()
+        log_handler.setLevel('CRITICAL')
+        self.test_logger.addHandler(log_handler)
+        self.test_logger.propagate = False
+
+        self.test_cache_path = 'data/test/cache'
+        self.clear_cache_files()
+
+
+    def tearDown(self):
+        self.clear_cache_files()
+
+
+    def clear_cache_files(self):
+        for filename in os.listdir(self.test_cache_path):
+            if re.search('^\\.gitignore$', filename) is None:
+                os.remove('%s/%s' % (self.test_cache_path, filename))
+
+
+    # ----- Tests for ResponseCache.get ----- #
+
+    def test_get_returns_etag_and_content_of_stored_response(self):
+        cache = ResponseCache(self.test_logger, self.test_cache_path)
+        cache.put('https://api.spotify.com/v1/me/playlists?limit=50', '"etag1"', b'{"items": []}',
+                  content_type='application/json')
+        entry = cache.get('https://api.spotify.com/v1/me/playlists?limit=50')
+        self.assertEqual(entry['etag'], '"etag1"')
+        self.assertEqual(entry['content'], '{"items": []}')
+        self.assertEqual(entry['content_type'], 'application/json')
+
+
+    def test_get_returns_none_if_no_response_is_stored_for_the_key(self):
+        cache = ResponseCache(self.test_logger, self.test_cache_path)
+        cache.put('https://api.spotify.com/v1/me/playlists?limit=50', '"etag1"', b'{}')
+        self.assertIsNone(cache.get('https://api.spotify.com/v1/me/playlists?limit=50&offset=50'))
+
+
+    def test_get_returns_responses_stored_by_a_previous_run(self):
+        ResponseCache(self.test_logger, self.test_cache_path).put('key', '"etag1"', b'{}')
+        self.assertEqual(ResponseCache(self.test_logger, self.test_cache_path).get('key')['etag'], '"etag1"')
+
+
+    def test_get_ignores_and_removes_unreadable_cached_responses(self):
+        cache = ResponseCache(self.test_logger, self.test_cache_path)
+        cache.put('key', '"etag1"', b'{}')
+        with open('%s/%s.cache.json' % (self.test_cache_path, ResponseCache.entry_name('key')), 'w') as cache_file:
+            cache_file.write('{ not json')
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(os.listdir(self.test_cache_path), [ '.gitignore' ])
+
+
+    # ----- Tests for ResponseCache.put ----- #
+
+    def test_put_replaces_previously_stored_response_for_the_key(self):
+        cache = ResponseCache(self.test_logger, self.test_cache_path)
+        cache.put('key', '"etag1"', b'{"a": 1}')
+        cache.put('key', '"etag2"', b'{"a": 2}')
+        self.assertEqual(cache.get('key')['etag'], '"etag2"')
+        self.assertEqual(cache.get('key')['content'], '{"a": 2}')
+
+
+    def test_put_removes_least_recently_used_responses_once_the_cache_is_full(self):
+        cache = ResponseCache(self.test_logger, self.test_cache_path, max_entries=2)
+        cache.put('key1', '"etag1"', b'{}')
+        cache.put('key2', '"etag2"', b'{}')
+        cache.get('key1')
+        cache.put('key3', '"etag3"', b'{}')
+
+        self.assertIsNotNone(cache.get('key1'))
+        self.assertIsNone(cache.get('key2'))
+        self.assertIsNotNone(cache.get('key3'))
+        self.assertEqual(len(os.listdir(self.test_cache_path)), 3) # including .gitignore
+
+
+    def test_cache_removes_least_recently_used_responses_of_previous_runs_if_it_is_smaller(self):
+        cache = ResponseCache(self.test_logger, self.test_cache_path)
+        for num in range(0, 3):
+            cache.put('key%d' % num, '"etag"', b'{}')
+            sleep(0.02) # for distinct modification times
+
+        smaller_cache = ResponseCache(self.test_logger, self.test_cache_path, max_entries=2)
+        self.assertIsNone(smaller_cache.get('key0'))
+        self.assertIsNotNone(smaller_cache.get('key2'))
+
+
+if __name__ == '__main__':
+    unittest.main()
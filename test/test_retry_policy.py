@@ -0,0 +1,51 @@
+import unittest
+import requests
+from unittest.mock import Mock
+from spotipy.exceptions import SpotifyException
+from src.retry_policy import RetryPolicy
+from src.circuit_breaker import CircuitOpenError
+from src.bulk_playlist_write import BulkWriteError
+
+class TestRetryPolicy(unittest.TestCase):
+
+    # ----- Tests for RetryPolicy.delay ----- #
+
+    def test_delay_is_between_zero_and_exponentially_growing_bound(self):
+        policy = RetryPolicy(base_delay=0.5, max_delay=30)
+        for attempt in range(0, 4):
+            for i in range(0, 50):
+                delay = policy.delay(attempt)
+                self.assertGreaterEqual(delay, 0)
+                self.assertLessEqual(delay, 0.5 * (2 ** attempt))
+
+
+    def test_delay_is_never_greater_than_max_delay(self):
+        policy = RetryPolicy(base_delay=0.5, max_delay=2)
+        for i in range(0, 50):
+            self.assertLessEqual(policy.delay(10), 2)
+
+
+    # ----- Tests for RetryPolicy.is_transient_error ----- #
+
+    def test_is_transient_error_returns_true_for_server_errors_throttling_and_connection_problems(self):
+        self.assertTrue(RetryPolicy.is_transient_error(SpotifyException(502, -1, 'bad gateway')))
+        self.assertTrue(RetryPolicy.is_transient_error(SpotifyException(429, -1, 'Max Retries')))
+        self.assertTrue(RetryPolicy.is_transient_error(requests.exceptions.ConnectionError()))
+        self.assertTrue(RetryPolicy.is_transient_error(requests.exceptions.ReadTimeout()))
+        self.assertTrue(RetryPolicy.is_transient_error(CircuitOpenError()))
+
+
+    def test_is_transient_error_returns_false_for_client_errors_and_other_exceptions(self):
+        self.assertFalse(RetryPolicy.is_transient_error(SpotifyException(401, -1, 'unauthorized')))
+        self.assertFalse(RetryPolicy.is_transient_error(SpotifyException(404, -1, 'not found')))
+        self.assertFalse(RetryPolicy.is_transient_error(Exception('something went wrong')))
+
+
+
+    def test_is_transient_error_returns_whether_cause_of_error_is_transient(self):
+        failed_write = Mock(applied_items=[], items=[ {} ], playlist_id='a' * 22)
+        self.assertTrue(RetryPolicy.is_transient_error(BulkWriteError(failed_write, SpotifyException(503, -1, 'unavailable'))))
+        self.assertFalse(RetryPolicy.is_transient_error(BulkWriteError(failed_write, SpotifyException(400, -1, 'bad request'))))
+
+if __name__ == '__main__':
+    unittest.main()
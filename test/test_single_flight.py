@@ -0,0 +1,90 @@
+import unittest
+from time import sleep
+from threading import Thread, Event
+from src.single_flight import SingleFlight
+
+class TestSingleFlight(unittest.TestCase):
+
+    def setUp(self):
+        self.single_flight = SingleFlight()
+
+
+    def call_concurrently(self, key, func, num_callers):
+        results = []
+        errors = []
+        def caller():
+            try:
+                results.append(self.single_flight.do(key, func))
+            except Exception as err:
+                errors.append(err)
+        threads = [ Thread(target=caller) for i in range(0, num_callers) ]
+        for thread in threads:
+            thread.start()
+        return (threads, results, errors)
+
+
+    # ----- Tests for SingleFlight.do ----- #
+
+    def test_do_shares_result_of_one_call_between_concurrent_callers_with_the_same_key(self):
+        calls = []
+        release = Event()
+        def func():
+            calls.append(1)
+            release.wait()
+            return 'result'
+
+        (threads, results, errors) = self.call_concurrently('key', func, 5)
+        sleep(0.1) # allows all callers to arrive while the call is in flight
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [ 'result' ] * 5)
+        self.assertEqual(self.single_flight.shared_calls, 4)
+
+
+    def test_do_makes_separate_calls_for_different_keys(self):
+        release = Event()
+        calls = []
+        def func():
+            calls.append(1)
+            release.wait()
+
+        (threads_a, results, errors) = self.call_concurrently('key_a', func, 2)
+        (threads_b, results, errors) = self.call_concurrently('key_b', func, 2)
+        sleep(0.1)
+        release.set()
+        for thread in threads_a + threads_b:
+            thread.join()
+        self.assertEqual(len(calls), 2)
+
+
+    def test_do_raises_error_of_shared_call_for_every_caller(self):
+        release = Event()
+        def func():
+            release.wait()
+            raise ValueError('failed')
+
+        (threads, results, errors) = self.call_concurrently('key', func, 3)
+        sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(errors), 3)
+        for err in errors:
+            self.assertTrue(isinstance(err, ValueError))
+
+
+    def test_do_makes_a_new_call_once_the_previous_call_has_completed(self):
+        calls = []
+        def func():
+            calls.append(1)
+            return len(calls)
+        self.assertEqual(self.single_flight.do('key', func), 1)
+        self.assertEqual(self.single_flight.do('key', func), 2)
+        self.assertEqual(self.single_flight.shared_calls, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
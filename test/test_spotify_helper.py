@@ -3,9 +3,16 @@ import logging
 import os
 import random
 import string
+from threading import Event
 from unittest.mock import Mock, patch
 import spotipy
 from src.spotify_helper import SpotifyHelper
+from src.api_metrics import ApiMetrics
+from src.request_scheduler import RequestScheduler
+from src.watchdog import Watchdog, WorkCancelled
+from spotipy.exceptions import SpotifyException
+from src.api_session import ApiSession
+from src.retry_policy import RetryPolicy
 
 class TestSpotifyHelper(unittest.TestCase):
 
@@ -15,6 +22,7 @@ class TestSpotifyHelper(unittest.TestCase):
         log_handler.setLevel('CRITICAL')
         self.test_logger.addHandler(log_handler)
 
+        SpotifyHelper.shared_api = None
         self.helper = SpotifyHelper(self.test_logger)
 
         self.generate_spotify_id = (
@@ -27,10 +35,15 @@ class TestSpotifyHelper(unittest.TestCase):
         os.environ = {} # reset environment
 
 
+    def tearDown(self):
+        SpotifyHelper.shared_api = None
+        SpotifyHelper.configure_requests()
+
+
     # ----- Tests for SpotifyHelper.configure_api ----- #
 
     @patch('src.spotify_helper.spotipy.Spotify')
-    @patch('src.spotify_helper.SpotifyOAuth')
+    @patch('src.spotify_helper.TokenManager')
     def test_configure_api_authenticates_with_all_required_scopes(self, oauth_mock, spotify_mock):
         oauth_mock.return_value  = Mock()
         spotify_mock.return_value = None
@@ -49,7 +62,7 @@ class TestSpotifyHelper(unittest.TestCase):
 
         # Ensure the used auth manager received all of the required scopes
         self.assertTrue(isinstance(oauth_mock.call_args[1], dict) and 'scope' in oauth_mock.call_args[1].keys(),
-                        "SpotifyOAuth did not receive any list/string of scopes.")
+                        "TokenManager did not receive any list/string of scopes.")
         requested_scopes = oauth_mock.call_args[1]['scope']
         for scope in required_scopes:
             # Scopes must be delimiteed by a space which can be either prefixed or suffixed
@@ -69,7 +82,7 @@ class TestSpotifyHelper(unittest.TestCase):
 
 
     @patch('src.spotify_helper.spotipy.Spotify')
-    @patch('src.spotify_helper.SpotifyOAuth')
+    @patch('src.spotify_helper.TokenManager')
     def test_configure_api_returns_none_if_spotipy_raises_exception(self, oauth_mock, spotify_mock):
         spotify_mock.side_effect = Exception('TestException')
         api = self.helper.configure_api('test_client_id', 'test_client_secret', 'test_redirect')
@@ -77,13 +90,172 @@ class TestSpotifyHelper(unittest.TestCase):
 
 
     @patch('src.spotify_helper.spotipy.Spotify')
-    @patch('src.spotify_helper.SpotifyOAuth')
+    @patch('src.spotify_helper.TokenManager')
     def test_configure_api_returns_client_object_if_spotipy_returns_the_correct_type(self, oauth_mock, spotify_mock):
         spotify_mock.return_value = spotipy.client.Spotify()
         api = self.helper.configure_api('test_client_id', 'test_client_secret', 'test_redirect')
         self.assertEqual(api, spotify_mock.return_value)
 
 
+    @patch('src.spotify_helper.spotipy.Spotify')
+    @patch('src.spotify_helper.TokenManager')
+    def test_configure_api_sends_all_requests_through_a_rate_limited_session(self, oauth_mock, spotify_mock):
+        spotify_mock.return_value = spotipy.client.Spotify()
+        self.helper.configure_api('test_client_id', 'test_client_secret', 'test_redirect', api_config={
+            'RATE_LIMIT': 4,
+            'RATE_LIMIT_BURST': 8
+        })
+        session = spotify_mock.call_args[1]['requests_session']
+        self.assertTrue(isinstance(session, ApiSession))
+        self.assertEqual(session.rate_limiter.rate, 4)
+        self.assertEqual(session.rate_limiter.burst, 8)
+
+
+    @patch('src.spotify_helper.spotipy.Spotify')
+    @patch('src.spotify_helper.TokenManager')
+    def test_configure_api_adapts_concurrency_up_to_max_parallel_requests_unless_disabled(self, oauth_mock, spotify_mock):
+        spotify_mock.return_value = spotipy.client.Spotify()
+        self.helper.configure_api('test_client_id', 'test_client_secret', 'test_redirect', api_config={
+            'MAX_PARALLEL_REQUESTS': 6
+        })
+        controller = spotify_mock.call_args[1]['requests_session'].concurrency_controller
+        self.assertEqual(controller.max_window, 6)
+
+        self.helper.configure_api('test_client_id', 'test_client_secret', 'test_redirect', api_config={
+            'MAX_PARALLEL_REQUESTS': 6,
+            'ADAPTIVE_CONCURRENCY': False
+        })
+        self.assertIsNone(spotify_mock.call_args[1]['requests_session'].concurrency_controller)
+
+
+    @patch('src.spotify_helper.spotipy.Spotify')
+    @patch('src.spotify_helper.TokenManager')
+    def test_configure_api_pools_connections_for_at_least_max_parallel_requests(self, oauth_mock, spotify_mock):
+        spotify_mock.return_value = spotipy.client.Spotify()
+        self.helper.configure_api('test_client_id', 'test_client_secret', 'test_redirect', api_config={
+            'CONNECTION_POOL_SIZE': 4,
+            'MAX_PARALLEL_REQUESTS': 8,
+            'KEEP_ALIVE': False
+        })
+        session = spotify_mock.call_args[1]['requests_session']
+        self.assertEqual(session.get_adapter('https://api.spotify.com')._pool_maxsize, 8)
+        self.assertEqual(session.headers['Connection'], 'close')
+
+
+    @patch('src.spotify_helper.spotipy.Spotify')
+    @patch('src.spotify_helper.TokenManager')
+    def test_configure_api_hedges_reads_only_if_enabled(self, oauth_mock, spotify_mock):
+        spotify_mock.return_value = spotipy.client.Spotify()
+        self.helper.configure_api('test_client_id', 'test_client_secret', 'test_redirect')
+        self.assertIsNone(spotify_mock.call_args[1]['requests_session'].hedger)
+
+        self.helper.configure_api('test_client_id', 'test_client_secret', 'test_redirect', api_config={
+            'HEDGE_READS': True,
+            'HEDGE_PERCENTILE': 90
+        })
+        self.assertEqual(spotify_mock.call_args[1]['requests_session'].hedger.percentile, 90)
+
+
+    @patch('src.spotify_helper.spotipy.Spotify')
+    @patch('src.spotify_helper.TokenManager')
+    def test_configure_api_caches_responses_at_the_configured_path_unless_disabled(self, oauth_mock, spotify_mock):
+        spotify_mock.return_value = spotipy.client.Spotify()
+        self.helper.configure_api('test_client_id', 'test_client_secret', 'test_redirect', api_config={
+            'RESPONSE_CACHE_PATH': 'data/test/cache',
+            'RESPONSE_CACHE_SIZE': 10
+        })
+        cache = spotify_mock.call_args[1]['requests_session'].response_cache
+        self.assertEqual(cache.path, 'data/test/cache')
+        self.assertEqual(cache.max_entries, 10)
+
+        self.helper.configure_api('test_client_id', 'test_client_secret', 'test_redirect', api_config={
+            'RESPONSE_CACHE': False
+        })
+        self.assertIsNone(spotify_mock.call_args[1]['requests_session'].response_cache)
+
+
+    @patch('src.spotify_helper.spotipy.Spotify')
+    @patch('src.spotify_helper.TokenManager')
+    @patch('src.spotify_helper.CassetteAdapter')
+    def test_configure_api_replays_requests_from_cassette_without_authenticating(self, cassette_mock, oauth_mock,
+                                                                                   spotify_mock):
+        spotify_mock.return_value = spotipy.client.Spotify()
+        self.helper.configure_api('test_client_id', 'test_client_secret', 'test_redirect', api_config={
+            'CASSETTE_MODE': 'replay',
+            'CASSETTE_PATH': 'data/test/cassettes/test.jsonl.gz',
+            'CASSETTE_LATENCY_SCALE': 0,
+            'HEDGE_READS': True
+        })
+        self.assertEqual(cassette_mock.call_args[0][1], 'data/test/cassettes/test.jsonl.gz')
+        self.assertEqual(cassette_mock.call_args[1]['mode'], 'replay')
+        self.assertEqual(cassette_mock.call_args[1]['latency_scale'], 0)
+        oauth_mock.assert_not_called()
+        self.assertEqual(spotify_mock.call_args[1]['auth'], 'replay')
+        session = spotify_mock.call_args[1]['requests_session']
+        self.assertIs(session.get_thread_session().get_adapter('https://api.spotify.com'), cassette_mock.return_value)
+        self.assertIsNone(session.response_cache)
+        self.assertIsNone(session.hedger)
+
+
+    @patch('src.spotify_helper.spotipy.Spotify')
+    @patch('src.spotify_helper.TokenManager')
+    def test_configure_api_counts_requests_with_shared_metrics_unless_disabled(self, oauth_mock, spotify_mock):
+        spotify_mock.return_value = spotipy.client.Spotify()
+        self.helper.configure_api('test_client_id', 'test_client_secret', 'test_redirect')
+        metrics = spotify_mock.call_args[1]['requests_session'].metrics
+        self.assertIsInstance(metrics, ApiMetrics)
+        self.assertIs(SpotifyHelper.shared_metrics, metrics)
+
+        self.helper.configure_api('test_client_id', 'test_client_secret', 'test_redirect', api_config={
+            'API_METRICS': False
+        })
+        self.assertIsNone(spotify_mock.call_args[1]['requests_session'].metrics)
+        self.assertIsNone(SpotifyHelper.shared_metrics)
+
+
+    @patch('src.spotify_helper.spotipy.Spotify')
+    @patch('src.spotify_helper.TokenManager')
+    def test_configure_api_sets_connect_and_read_timeouts_of_every_request(self, oauth_mock, spotify_mock):
+        spotify_mock.return_value = spotipy.client.Spotify()
+        self.helper.configure_api('test_client_id', 'test_client_secret', 'test_redirect')
+        self.assertEqual(spotify_mock.call_args[1]['requests_session'].timeout, (5, 5))
+
+        self.helper.configure_api('test_client_id', 'test_client_secret', 'test_redirect', api_config={
+            'CONNECT_TIMEOUT': 3,
+            'READ_TIMEOUT': 12.5
+        })
+        self.assertEqual(spotify_mock.call_args[1]['requests_session'].timeout, (3, 12.5))
+        self.assertEqual(oauth_mock.call_args[1]['requests_timeout'], (3, 12.5))
+
+
+    @patch('src.spotify_helper.spotipy.Spotify')
+    @patch('src.spotify_helper.TokenManager')
+    def test_configure_api_schedules_requests_by_priority_unless_disabled(self, oauth_mock, spotify_mock):
+        spotify_mock.return_value = spotipy.client.Spotify()
+        self.helper.configure_api('test_client_id', 'test_client_secret', 'test_redirect')
+        session = spotify_mock.call_args[1]['requests_session']
+        self.assertIsInstance(session.scheduler, RequestScheduler)
+        self.assertIs(session.scheduler.rate_limiter, session.rate_limiter)
+        self.assertIs(SpotifyHelper.shared_scheduler, session.scheduler)
+
+        self.helper.configure_api('test_client_id', 'test_client_secret', 'test_redirect', api_config={
+            'PRIORITY_SCHEDULING': False
+        })
+        self.assertIsNone(spotify_mock.call_args[1]['requests_session'].scheduler)
+        self.assertIsNone(SpotifyHelper.shared_scheduler)
+
+
+    @patch('src.spotify_helper.spotipy.Spotify')
+    @patch('src.spotify_helper.TokenManager')
+    def test_configure_api_shares_configured_client_with_helpers_created_later(self, oauth_mock, spotify_mock):
+        spotify_mock.return_value = spotipy.client.Spotify()
+        api = self.helper.configure_api('test_client_id', 'test_client_secret', 'test_redirect')
+        self.assertIs(SpotifyHelper(self.test_logger).api, api)
+
+        other_api = spotipy.client.Spotify()
+        self.assertIs(SpotifyHelper(self.test_logger, api=other_api).api, other_api)
+
+
     # Tests for SpotifyHelper.get_all_collab_playlists ----- #
 
     def test_get_all_collab_playlists_returns_none_if_no_api_clients_are_given_or_configured(self):
@@ -169,6 +341,26 @@ class TestSpotifyHelper(unittest.TestCase):
         self.assertEqual(result, expected_result)
 
 
+    def test_get_all_collab_playlists_includes_snapshot_id_and_track_total_of_listed_playlists(self):
+        playlist_uri = self.generate_playlist_uri()
+        mock_api = spotipy.client.Spotify()
+        mock_api.current_user_playlists = Mock(return_value={
+            'items': [
+                {
+                    'uri': playlist_uri,
+                    'collaborative': True,
+                    'owner': { 'id': 'creator_id' },
+                    'snapshot_id': 'snapshot1',
+                    'tracks': { 'href': 'https://api.spotify.com/v1/playlists/id/tracks', 'total': 12 }
+                }
+            ],
+            'total': 1
+        })
+        self.assertEqual(self.helper.get_all_collab_playlists('creator_id', api=mock_api), [
+            { 'uri': playlist_uri, 'snapshot_id': 'snapshot1', 'tracks': { 'total': 12 } }
+        ])
+
+
     def test_get_all_collab_playlists_fetches_playlists_in_blocks_of_50_playlists(self):
         response = {
             'items': [
@@ -211,13 +403,32 @@ class TestSpotifyHelper(unittest.TestCase):
         self.assertEqual(mock_api.current_user_playlists.call_args_list[2][1]['offset'], 100)
 
 
+    def test_get_all_collab_playlists_includes_track_totals_if_they_are_listed(self):
+        pl_uri = self.generate_playlist_uri()
+        mock_api = spotipy.client.Spotify()
+        mock_api.current_user_playlists = Mock(return_value={
+            'items': [
+                {
+                    'uri': pl_uri,
+                    'collaborative': True,
+                    'owner': { 'id': 'creator_id' },
+                    'tracks': { 'href': 'tracks_href', 'total': 321 }
+                }
+            ],
+            'total': 1
+        })
+        result = self.helper.get_all_collab_playlists('creator_id', api=mock_api)
+        self.assertEqual(result, [ { 'uri': pl_uri, 'tracks': { 'total': 321 } } ])
+
 
     # ----- Tests for SpotifyHelper.add_items_to_playlist ----- \
 
     def test_add_items_to_playlist_uses_api_client_received_as_argument_instead_of_preconfigured_client(self):
         self.helper.api = spotipy.client.Spotify()
+        self.helper.api.playlist = Mock(return_value={ 'snapshot_id': 'snapshot' })
         self.helper.api.playlist_add_items = Mock()
         received_api = spotipy.client.Spotify()
+        received_api.playlist = Mock(return_value={ 'snapshot_id': 'snapshot' })
         received_api.playlist_add_items = Mock()
         self.helper.add_items_to_playlist(self.generate_spotify_id(), [
             { 'uri': self.generate_track_uri() } for i in range (0, 2)
@@ -228,6 +439,7 @@ class TestSpotifyHelper(unittest.TestCase):
 
     def test_add_items_to_playlist_uses_preconfigure_api_client_one_is_available_and_no_api_is_given(self):
         self.helper.api = spotipy.client.Spotify()
+        self.helper.api.playlist = Mock(return_value={ 'snapshot_id': 'snapshot' })
         self.helper.api.playlist_add_items = Mock()
         self.helper.add_items_to_playlist(self.generate_spotify_id(), [
             { 'uri': self.generate_track_uri() } for i in range (0, 2)
@@ -249,6 +461,7 @@ class TestSpotifyHelper(unittest.TestCase):
 
     def test_add_items_to_playlist_add_items_in_blocks_of_100(self):
         mock_api = spotipy.client.Spotify()
+        mock_api.playlist = Mock(return_value={ 'snapshot_id': 'snapshot' })
         mock_api.playlist_add_items = Mock()
         pl_id = self.generate_spotify_id()
         items = [ { 'uri': self.generate_track_uri() } for i in range(0, 230) ]
@@ -269,6 +482,96 @@ class TestSpotifyHelper(unittest.TestCase):
         self.assertEqual(mock_api.playlist_add_items.call_args_list[2][0][1], item_uris[200:])
 
 
+    def test_add_items_to_playlist_retries_failed_write_if_playlist_snapshot_is_unchanged(self):
+        self.helper.retry_policy = RetryPolicy(max_retries=3, base_delay=0.01)
+        mock_api = spotipy.client.Spotify()
+        mock_api.playlist = Mock(return_value={ 'snapshot_id': 'snapshot1' })
+        mock_api.playlist_add_items = Mock(side_effect=[
+            SpotifyException(502, -1, 'bad gateway'),
+            { 'snapshot_id': 'snapshot2' }
+        ])
+        self.helper.add_items_to_playlist(self.generate_spotify_id(), [ { 'uri': self.generate_track_uri() } ], api=mock_api)
+        self.assertEqual(mock_api.playlist_add_items.call_count, 2)
+
+
+    def test_add_items_to_playlist_does_not_retry_failed_write_if_playlist_snapshot_changed(self):
+        self.helper.retry_policy = RetryPolicy(max_retries=3, base_delay=0.01)
+        mock_api = spotipy.client.Spotify()
+        # the snapshot before the write and the snapshot after the failed write
+        mock_api.playlist = Mock(side_effect=[ { 'snapshot_id': 'snapshot1' }, { 'snapshot_id': 'snapshot2' } ])
+        mock_api.playlist_add_items = Mock(side_effect=[
+            SpotifyException(500, -1, 'server error'),
+            { 'snapshot_id': 'snapshot3' }
+        ])
+        items = [ { 'uri': self.generate_track_uri() } for i in range(0, 150) ]
+        # the playlist contains the first block (after a track which was already in the playlist)
+        mock_api.playlist_items = Mock(return_value={
+            'items': [ { 'track': { 'uri': uri } } for uri in [ self.generate_track_uri() ] + [ item['uri'] for item in items[0:100] ] ],
+            'total': 101
+        })
+        self.helper.add_items_to_playlist(self.generate_spotify_id(), items, api=mock_api)
+
+        # the first block was not added again but the second block was still added
+        self.assertEqual(mock_api.playlist_add_items.call_count, 2)
+        self.assertEqual(mock_api.playlist_add_items.call_args_list[1][0][1], [ item['uri'] for item in items[100:] ])
+
+
+    def test_add_items_to_playlist_raises_error_of_failed_write_if_playlist_changed_without_containing_it(self):
+        self.helper.retry_policy = RetryPolicy(max_retries=3, base_delay=0.01)
+        mock_api = spotipy.client.Spotify()
+        # someone else changed the playlist
+        mock_api.playlist = Mock(side_effect=[ { 'snapshot_id': 'snapshot1' }, { 'snapshot_id': 'snapshot2' } ])
+        mock_api.playlist_add_items = Mock(side_effect=SpotifyException(500, -1, 'server error'))
+        mock_api.playlist_items = Mock(return_value={ 'items': [ { 'track': { 'uri': self.generate_track_uri() } } ], 'total': 1 })
+        with self.assertRaises(SpotifyException):
+            self.helper.add_items_to_playlist(self.generate_spotify_id(), [ { 'uri': self.generate_track_uri() } ], api=mock_api)
+        mock_api.playlist_add_items.assert_called_once()
+
+
+    def test_remove_items_from_playlist_assumes_failed_removal_was_applied_only_if_the_tracks_are_gone(self):
+        self.helper.retry_policy = RetryPolicy(max_retries=3, base_delay=0.01)
+        uris = [ self.generate_track_uri() for i in range(0, 3) ]
+        for (remaining_uris, applied) in [ ([ uris[0], uris[2] ], True), ([ uris[0], uris[1] ], False) ]:
+            mock_api = spotipy.client.Spotify()
+            mock_api.playlist = Mock(side_effect=[ { 'snapshot_id': 'snapshot1' }, { 'snapshot_id': 'snapshot2' } ])
+            mock_api.playlist_remove_specific_occurrences_of_items = Mock(side_effect=SpotifyException(502, -1, 'bad gateway'))
+            mock_api.playlist_items = Mock(return_value={
+                'items': [ { 'track': { 'uri': uri } } for uri in remaining_uris ], 'total': len(remaining_uris) })
+            remove = lambda: self.helper.remove_items_from_playlist(
+                self.generate_spotify_id(), [ { 'uri': uris[1], 'position': 1 } ], api=mock_api)
+            if applied:
+                self.assertEqual(remove(), 'snapshot2')
+            else:
+                self.assertRaises(SpotifyException, remove)
+            mock_api.playlist_remove_specific_occurrences_of_items.assert_called_once()
+
+
+    def test_add_items_to_playlist_does_not_retry_write_which_failed_with_a_client_error(self):
+        mock_api = spotipy.client.Spotify()
+        mock_api.playlist = Mock(return_value={ 'snapshot_id': 'snapshot1' })
+        mock_api.playlist_add_items = Mock(side_effect=SpotifyException(403, -1, 'forbidden'))
+        self.assertRaises(SpotifyException, self.helper.add_items_to_playlist,
+                          self.generate_spotify_id(), [ { 'uri': self.generate_track_uri() } ], api=mock_api)
+        mock_api.playlist_add_items.assert_called_once()
+
+
+    # ----- Tests for SpotifyHelper.remove_items_from_playlist ----- #
+
+    def test_remove_items_from_playlist_removes_occurrences_at_positions_in_blocks_of_100(self):
+        mock_api = spotipy.client.Spotify()
+        mock_api.playlist = Mock(return_value={ 'snapshot_id': 'snapshot1' })
+        mock_api.playlist_remove_specific_occurrences_of_items = Mock(return_value={ 'snapshot_id': 'snapshot2' })
+        pl_id = self.generate_spotify_id()
+        items = [ { 'uri': self.generate_track_uri(), 'position': i } for i in range(0, 120) ]
+        self.helper.remove_items_from_playlist(pl_id, items, api=mock_api)
+
+        calls = mock_api.playlist_remove_specific_occurrences_of_items.call_args_list
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(calls[0][0][0], pl_id)
+        self.assertEqual(calls[0][0][1], [ { 'uri': item['uri'], 'positions': [ item['position'] ] } for item in items[0:100] ])
+        self.assertEqual(calls[1][0][1], [ { 'uri': item['uri'], 'positions': [ item['position'] ] } for item in items[100:] ])
+
+
     # ----- Tests for SpotifyHelper.get_track_id ----- #
 
     def test_get_track_id_returns_correct_id_when_input_is_uri(self):
@@ -366,5 +669,216 @@ class TestSpotifyHelper(unittest.TestCase):
         self.assertEqual(result, items)
 
 
+    def test_get_all_items_in_playlist_does_not_request_an_empty_page_if_total_is_a_multiple_of_100(self):
+        items = [
+            {
+                'track': { 'uri': self.generate_track_uri() },
+                'position': index
+            } for index in range(0, 200)
+        ]
+        mock_api = spotipy.client.Spotify()
+        mock_api.playlist_items = Mock(side_effect=[
+            { 'items': items[0:100], 'total': 200 },
+            { 'items': items[100:], 'total': 200 }
+        ])
+        result = self.helper.get_all_items_in_playlist(self.generate_spotify_id(), api=mock_api)
+        self.assertEqual(mock_api.playlist_items.call_count, 2)
+        self.assertEqual(result, items)
+
+
+    def test_get_all_items_in_playlist_fetches_remaining_pages_in_parallel_and_in_order_if_total_is_known(self):
+        pl_id = self.generate_spotify_id()
+        items = [
+            {
+                'track': { 'uri': self.generate_track_uri() },
+                'position': index
+            } for index in range(0, 1050)
+        ]
+
+        def playlist_items(playlist_id, limit=100, offset=0, fields=None):
+            return { 'items': items[offset:offset + limit], 'total': len(items) }
+
+        mock_api = spotipy.client.Spotify()
+        mock_api.playlist_items = Mock(side_effect=playlist_items)
+        self.helper.max_parallel_requests = 4
+        result = self.helper.get_all_items_in_playlist(pl_id, api=mock_api, fields='items.track(uri),total')
+
+        self.assertEqual(result, items)
+        self.assertEqual(mock_api.playlist_items.call_count, 11)
+        self.assertEqual(sorted([ call[1]['offset'] for call in mock_api.playlist_items.call_args_list ]),
+                         list(range(0, 1100, 100)))
+
+
+    def test_get_all_items_in_playlist_uses_given_total_to_request_all_pages_in_parallel(self):
+        items = [
+            {
+                'track': { 'uri': self.generate_track_uri() },
+                'position': index
+            } for index in range(0, 300)
+        ]
+
+        def playlist_items(playlist_id, limit=100, offset=0, fields=None):
+            return { 'items': items[offset:offset + limit] }
+
+        mock_api = spotipy.client.Spotify()
+        mock_api.playlist_items = Mock(side_effect=playlist_items)
+        self.helper.max_parallel_requests = 2
+        result = self.helper.get_all_items_in_playlist(self.generate_spotify_id(), api=mock_api, total=250)
+
+        # the given total was out of date so the final (full) page is followed by one more request
+        self.assertEqual(result, items)
+        self.assertEqual(sorted([ call[1]['offset'] for call in mock_api.playlist_items.call_args_list ]),
+                         [ 0, 100, 200, 300 ])
+
+
+    def test_get_all_items_in_playlist_requests_the_first_page_if_given_total_is_zero(self):
+        item = { 'track': { 'uri': self.generate_track_uri() } }
+        mock_api = spotipy.client.Spotify()
+        mock_api.playlist_items = Mock(return_value={ 'items': [ item ], 'total': 1 })
+        self.helper.max_parallel_requests = 2
+        result = self.helper.get_all_items_in_playlist(self.generate_spotify_id(), api=mock_api, total=0)
+        mock_api.playlist_items.assert_called_once()
+        self.assertEqual(result, [ { 'track': item['track'], 'position': 0 } ])
+
+
+    # ----- Tests for SpotifyHelper.iter_playlist_items ----- #
+
+    def test_iter_playlist_items_yields_items_with_positions_before_requesting_the_next_page(self):
+        items = [ { 'track': { 'uri': self.generate_track_uri() } } for index in range(0, 150) ]
+        mock_api = spotipy.client.Spotify()
+        mock_api.playlist_items = Mock(side_effect=[
+            { 'items': items[0:100], 'total': 150 },
+            { 'items': items[100:], 'total': 150 }
+        ])
+        item_iter = self.helper.iter_playlist_items(self.generate_spotify_id(), api=mock_api)
+        first_item = next(item_iter)
+        self.assertEqual(first_item['position'], 0)
+        self.assertEqual(mock_api.playlist_items.call_count, 1)
+
+        remaining_items = list(item_iter)
+        self.assertEqual(mock_api.playlist_items.call_count, 2)
+        self.assertEqual([ item['position'] for item in remaining_items ], list(range(1, 150)))
+
+
+    def test_iter_playlist_items_requests_no_more_than_max_parallel_requests_pages_ahead(self):
+        items = [ { 'track': { 'uri': self.generate_track_uri() } } for index in range(0, 1000) ]
+
+        def playlist_items(playlist_id, limit=100, offset=0, fields=None):
+            return { 'items': items[offset:offset + limit], 'total': len(items) }
+
+        mock_api = spotipy.client.Spotify()
+        mock_api.playlist_items = Mock(side_effect=playlist_items)
+        self.helper.max_parallel_requests = 3
+        item_iter = self.helper.iter_playlist_items(self.generate_spotify_id(), api=mock_api, total=1000)
+        self.assertEqual(next(item_iter)['position'], 0)
+        self.assertLessEqual(mock_api.playlist_items.call_count, 3)
+        self.assertEqual([ item['position'] for item in item_iter ], list(range(1, 1000)))
+        self.assertEqual(mock_api.playlist_items.call_count, 10)
+
+
+    def test_iter_playlist_items_requests_pages_in_parallel_with_the_priority_class_of_the_caller(self):
+        classes = []
+        def playlist_items(playlist_id, limit=100, offset=0, fields=None):
+            classes.append(RequestScheduler.current_class())
+            return { 'items': [ { 'track': { 'uri': self.generate_track_uri() } } ] * (limit if offset < 200 else 0),
+                     'total': 300 }
+
+        mock_api = spotipy.client.Spotify()
+        mock_api.playlist_items = Mock(side_effect=playlist_items)
+        self.helper.max_parallel_requests = 3
+        with RequestScheduler.priority('background'):
+            items = self.helper.get_all_items_in_playlist(self.generate_spotify_id(), api=mock_api, total=300)
+        self.assertEqual(len(items), 200)
+        self.assertEqual(classes, [ 'background' ] * 3)
+
+
+    def test_iter_playlist_items_starts_from_the_given_offset(self):
+        items = [ { 'track': { 'uri': self.generate_track_uri() } } for index in range(0, 250) ]
+        def playlist_items(playlist_id, limit=100, offset=0, fields=None):
+            return { 'items': items[offset:offset + limit], 'total': len(items) }
+
+        mock_api = spotipy.client.Spotify()
+        mock_api.playlist_items = Mock(side_effect=playlist_items)
+        for max_parallel_requests in [ 1, 2 ]:
+            self.helper.max_parallel_requests = max_parallel_requests
+            result = list(self.helper.iter_playlist_items(self.generate_spotify_id(), api=mock_api, total=250, offset=100))
+            self.assertEqual([ item['position'] for item in result ], list(range(100, 250)))
+        self.assertEqual([ call[1]['offset'] for call in mock_api.playlist_items.call_args_list ], [ 100, 200 ] * 2)
+
+
+    def test_iter_playlist_items_stops_before_the_next_page_once_cancelled(self):
+        items = [ { 'track': { 'uri': self.generate_track_uri() } } for index in range(0, 300) ]
+        mock_api = spotipy.client.Spotify()
+        mock_api.playlist_items = Mock(side_effect=lambda playlist_id, limit=100, offset=0, fields=None: {
+            'items': items[offset:offset + limit], 'total': len(items) })
+        cancelled = Event()
+        with Watchdog.cancellation(cancelled):
+            item_iter = self.helper.iter_playlist_items(self.generate_spotify_id(), api=mock_api)
+            next(item_iter)
+            cancelled.set()
+            with self.assertRaises(WorkCancelled):
+                list(item_iter)
+        mock_api.playlist_items.assert_called_once()
+
+
+    def test_iter_playlist_items_yields_nothing_if_there_is_no_preconfigured_or_received_api_available(self):
+        self.helper.api = None
+        self.assertEqual(list(self.helper.iter_playlist_items(self.generate_spotify_id())), [])
+
+
+    # ----- Tests for SpotifyHelper.iter_collab_playlists ----- #
+
+    def test_iter_collab_playlists_yields_playlists_before_requesting_the_next_page(self):
+        pl_uris = [ self.generate_playlist_uri() for i in range(0, 60) ]
+        mock_api = spotipy.client.Spotify()
+        mock_api.current_user_playlists = Mock(side_effect=[
+            {
+                'items': [
+                    {
+                        'uri': pl_uri,
+                        'collaborative': True,
+                        'owner': { 'id': 'creator_id' }
+                    } for pl_uri in pl_uris[0:50]
+                ]
+            },
+            {
+                'items': [
+                    {
+                        'uri': pl_uri,
+                        'collaborative': True,
+                        'owner': { 'id': 'creator_id' }
+                    } for pl_uri in pl_uris[50:]
+                ]
+            }
+        ])
+        playlist_iter = self.helper.iter_collab_playlists('creator_id', api=mock_api)
+        self.assertEqual(next(playlist_iter), { 'uri': pl_uris[0] })
+        self.assertEqual(mock_api.current_user_playlists.call_count, 1)
+        self.assertEqual([ playlist['uri'] for playlist in playlist_iter ], pl_uris[1:])
+        self.assertEqual(mock_api.current_user_playlists.call_count, 2)
+
+
+    def test_iter_collab_playlists_lists_playlists_with_the_probe_class_only(self):
+        classes = []
+        mock_api = spotipy.client.Spotify()
+        mock_api.current_user_playlists = Mock(side_effect=lambda **kwargs: (
+            classes.append(RequestScheduler.current_class()) or {
+                'items': [ { 'uri': self.generate_playlist_uri(), 'collaborative': True, 'owner': { 'id': 'creator_id' } } ]
+            }))
+        for playlist in self.helper.iter_collab_playlists('creator_id', api=mock_api):
+            # the class does not apply to the code consuming the playlists
+            classes.append(RequestScheduler.current_class())
+        self.assertEqual(classes, [ 'probe', 'scan' ])
+
+
+    # ----- Tests for SpotifyHelper.configure_requests ----- #
+
+    def test_configure_requests_sets_max_parallel_requests_for_all_helpers(self):
+        SpotifyHelper.configure_requests({ 'MAX_PARALLEL_REQUESTS': 8 })
+        self.assertEqual(SpotifyHelper(self.test_logger).max_parallel_requests, 8)
+        SpotifyHelper.configure_requests(None)
+        self.assertEqual(SpotifyHelper(self.test_logger).max_parallel_requests, 1)
+
+
 if __name__ == '__main__':
     unittest.main()
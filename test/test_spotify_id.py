@@ -0,0 +1,35 @@
+import unittest
+import random
+import string
+from src.spotify_id import SpotifyId
+
+class TestSpotifyId(unittest.TestCase):
+
+    def setUp(self):
+        self.generate_spotify_id = (
+            lambda: ''.join(random.choice(string.ascii_letters + string.digits) for i in range(0, 22)))
+
+
+    # ----- Tests for SpotifyId.from_uri ----- #
+
+    def test_from_uri_returns_id_of_uri_of_given_kind(self):
+        spotify_id = self.generate_spotify_id()
+        self.assertEqual(SpotifyId.from_uri('spotify:track:' + spotify_id, 'track'), spotify_id)
+        self.assertEqual(SpotifyId.from_uri('spotify:playlist:' + spotify_id, 'playlist'), spotify_id)
+
+
+    def test_from_uri_returns_none_for_invalid_uris(self):
+        spotify_id = self.generate_spotify_id()
+        for uri in [
+            'spotify:playlist:' + spotify_id,
+            'spotify:track:' + spotify_id[1:],
+            'spotify:track:' + spotify_id + 'a',
+            'spotify:track:' + spotify_id[1:] + '-',
+            'spotify:track:' + spotify_id[1:] + 'é',
+            'spotify.track:' + spotify_id,
+            'spotify:local:artist:album:title:120',
+            spotify_id,
+            None
+        ]:
+            self.assertIsNone(SpotifyId.from_uri(uri, 'track'))
+
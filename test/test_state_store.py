@@ -0,0 +1,116 @@
+import unittest
+import logging
+import os
+import re
+from src.state_store import StateStore
+
+class TestStateStore(unittest.TestCase):
+
+    def setUp(self):
+        self.test_logger = logging.getLogger('TestStateStore')
+        log_handler = logging.StreamHandler()
+        log_handler.setLevel('CRITICAL')
+        self.test_logger.addHandler(log_handler)
+        self.test_logger.propagate = False
+
+        self.test_state_path = 'data/test/state'
+        self.test_db_path = '%s/state.db' % self.test_state_path
+        self.clear_state_files()
+        self.store = StateStore(self.test_logger, self.test_db_path)
+
+
+    def tearDown(self):
+        self.store.close()
+        self.clear_state_files()
+
+
+    def clear_state_files(self):
+        for filename in os.listdir(self.test_state_path):
+            if re.search('^\\.gitignore$', filename) is None:
+                os.remove('%s/%s' % (self.test_state_path, filename))
+
+
+    # ----- Tests for StateStore.get ----- #
+
+    def test_get_returns_none_for_a_playlist_with_no_state(self):
+        self.assertIsNone(self.store.get('playlist1'))
+
+
+    def test_get_includes_updates_which_have_not_been_committed(self):
+        self.store.update('playlist1', snapshot_id='snapshot1', item_count=3)
+        state = self.store.get('playlist1')
+        self.assertEqual(state['snapshot_id'], 'snapshot1')
+        self.assertEqual(state['item_count'], 3)
+        self.assertEqual(state['error_count'], 0)
+        self.assertIsNone(state['last_scanned'])
+
+
+    # ----- Tests for StateStore.update ----- #
+
+    def test_update_raises_error_for_unknown_fields(self):
+        with self.assertRaises(ValueError):
+            self.store.update('playlist1', unknown=1)
+
+
+    # ----- Tests for StateStore.commit ----- #
+
+    def test_commit_saves_state_which_is_loaded_by_a_new_store(self):
+        self.store.update('playlist1', snapshot_id='snapshot1', newest_added_at='2021-01-01T00:00:00Z')
+        self.store.record_scan('playlist1', 1600000000.5, 2.5)
+        self.store.update('playlist2', item_count=7)
+        self.assertTrue(self.store.commit())
+
+        other_store = StateStore(self.test_logger, self.test_db_path)
+        self.assertEqual(other_store.get('playlist1'), {
+            'snapshot_id': 'snapshot1',
+            'last_scanned': 1600000000.5,
+            'item_count': None,
+            'newest_added_at': '2021-01-01T00:00:00Z',
+            'last_duration': 2.5,
+            'error_count': 0,
+            'consecutive_errors': 0
+        })
+        self.assertEqual(other_store.get('playlist2')['item_count'], 7)
+        other_store.close()
+
+
+    def test_commit_keeps_fields_which_were_not_updated(self):
+        self.store.update('playlist1', snapshot_id='snapshot1', item_count=3)
+        self.store.commit()
+        self.store.update('playlist1', item_count=4)
+        self.store.commit()
+        self.assertEqual(self.store.get('playlist1')['snapshot_id'], 'snapshot1')
+        self.assertEqual(self.store.get('playlist1')['item_count'], 4)
+
+
+    # ----- Tests for StateStore.record_error ----- #
+
+    def test_record_error_counts_errors_and_consecutive_errors_until_a_successful_scan(self):
+        self.store.record_error('playlist1')
+        self.store.commit()
+        self.store.record_error('playlist1')
+        self.assertEqual(self.store.get('playlist1')['consecutive_errors'], 2)
+        self.store.record_scan('playlist1', 1600000000.0, 1.0)
+        self.store.commit()
+        self.assertEqual(self.store.get('playlist1')['error_count'], 2)
+        self.assertEqual(self.store.get('playlist1')['consecutive_errors'], 0)
+
+
+    # ----- Tests for StateStore.forget_snapshot_ids ----- #
+
+    def test_forget_snapshot_ids_forgets_committed_and_pending_snapshot_ids(self):
+        self.store.update('playlist1', snapshot_id='snapshot1', item_count=3)
+        self.store.commit()
+        self.store.update('playlist2', snapshot_id='snapshot2')
+        self.store.forget_snapshot_ids()
+        self.assertIsNone(self.store.get('playlist1')['snapshot_id'])
+        self.assertEqual(self.store.get('playlist1')['item_count'], 3)
+        self.assertIsNone(self.store.get('playlist2')['snapshot_id'])
+
+
+    # ----- Tests for StateStore.get_metadata ----- #
+
+    def test_get_metadata_returns_value_which_was_set(self):
+        self.assertIsNone(self.store.get_metadata('playlist_config'))
+        self.store.set_metadata('playlist_config', 'fingerprint')
+        self.assertEqual(self.store.get_metadata('playlist_config'), 'fingerprint')
@@ -1,10 +1,34 @@
 import unittest
 import os
 from test import test_spotify_helper
+from test import test_spotify_id
+from test import test_bulk_playlist_write
+from test import test_rate_limiter
+from test import test_request_scheduler
+from test import test_concurrency_controller
+from test import test_circuit_breaker
+from test import test_retry_policy
+from test import test_watchdog
+from test import test_single_flight
+from test import test_request_hedger
+from test import test_response_cache
+from test import test_cassette_adapter
+from test import test_api_metrics
+from test import test_api_session
+from test import test_token_manager
+from test import test_async_spotify_helper
+from test import test_playlist_snapshot
+from test import test_track_metadata_resolver
+from test import test_playlist_change_tracker
+from test import test_state_store
+from test import test_playlist_registry
 from test import test_playlist_cleaner
 from test import test_integrity_manager
 from test import test_config_validator
 from test import test_main
+from test import test_fake_spotify_server
+from test import test_fake_spotify
+from test import test_workload_generator
 from test import test_integration
 
 
@@ -22,10 +46,34 @@ def run_test_suite():
 
     for mod in [
         test_spotify_helper,
+        test_spotify_id,
+        test_bulk_playlist_write,
+        test_rate_limiter,
+        test_request_scheduler,
+        test_concurrency_controller,
+        test_circuit_breaker,
+        test_retry_policy,
+        test_watchdog,
+        test_single_flight,
+        test_request_hedger,
+        test_response_cache,
+        test_cassette_adapter,
+        test_api_metrics,
+        test_api_session,
+        test_token_manager,
+        test_async_spotify_helper,
+        test_playlist_snapshot,
+        test_track_metadata_resolver,
+        test_playlist_change_tracker,
+        test_state_store,
+        test_playlist_registry,
         test_playlist_cleaner,
         test_integrity_manager,
         test_config_validator,
         test_main,
+        test_fake_spotify_server,
+        test_fake_spotify,
+        test_workload_generator,
         test_integration
     ]:
         test_suite.addTests(test_loader.loadTestsFromModule(mod))
@@ -0,0 +1,103 @@
+import unittest
+import logging
+from time import time
+from unittest.mock import Mock, patch
+from spotipy.cache_handler import CacheHandler
+from src.token_manager import TokenManager
+
+class FakeCacheHandler(CacheHandler):
+
+    def __init__(self, token_info=None):
+        self.token_info = token_info
+        self.get_cached_token = Mock(side_effect=lambda: self.token_info)
+        self.save_token_to_cache = Mock()
+
+
+class TestTokenManager(unittest.TestCase):
+
+    def setUp(self):
+        self.test_logger = logging.getLogger('TestTokenManager')
+        log_handler = logging.StreamHandler()
+        log_handler.setLevel('CRITICAL')
+        self.test_logger.addHandler(log_handler)
+        self.test_logger.propagate = False
+
+        self.make_token = lambda access_token, expires_in: {
+            'access_token': access_token,
+            'refresh_token': 'refresh',
+            'expires_at': int(time()) + expires_in,
+            'scope': 'playlist-read-private'
+        }
+        self.managers = []
+
+
+    def tearDown(self):
+        for manager in self.managers:
+            manager.stop()
+
+
+    def make_manager(self, cache_handler, **kwargs):
+        manager = TokenManager(self.test_logger, scope='playlist-read-private', client_id='id',
+                               client_secret='secret', redirect_uri='http://localhost:8080',
+                               cache_handler=cache_handler, **kwargs)
+        self.managers.append(manager)
+        return manager
+
+
+    # ----- Tests for TokenManager.get_access_token ----- #
+
+    def test_get_access_token_reads_token_cache_file_only_once(self):
+        cache_handler = FakeCacheHandler(self.make_token('token1', 3600))
+        manager = self.make_manager(cache_handler)
+        for i in range(0, 5):
+            self.assertEqual(manager.get_access_token(as_dict=False), 'token1')
+        cache_handler.get_cached_token.assert_called_once()
+        cache_handler.save_token_to_cache.assert_not_called()
+
+
+    @patch('src.token_manager.SpotifyOAuth.refresh_access_token')
+    def test_get_access_token_refreshes_expired_cached_token_before_returning_it(self, refresh_mock):
+        refresh_mock.return_value = self.make_token('token2', 3600)
+        manager = self.make_manager(FakeCacheHandler(self.make_token('token1', 10)))
+        self.assertEqual(manager.get_access_token(as_dict=False), 'token2')
+        refresh_mock.assert_called_once_with('refresh')
+        self.assertEqual(manager.get_access_token(as_dict=False), 'token2')
+        refresh_mock.assert_called_once()
+
+
+    def test_get_access_token_schedules_refresh_ahead_of_token_expiry(self):
+        manager = self.make_manager(FakeCacheHandler(self.make_token('token1', 3600)), refresh_margin=600)
+        manager.get_access_token(as_dict=False)
+        self.assertIsNotNone(manager._refresh_timer)
+        self.assertAlmostEqual(manager._refresh_timer.interval, 3000, delta=2)
+        self.assertTrue(manager._refresh_timer.daemon)
+
+
+    # ----- Tests for TokenManager background refresh ----- #
+
+    @patch('src.token_manager.SpotifyOAuth.refresh_access_token')
+    def test_background_refresh_replaces_token_in_memory_and_schedules_next_refresh(self, refresh_mock):
+        refresh_mock.return_value = self.make_token('token2', 3600)
+        cache_handler = FakeCacheHandler(self.make_token('token1', 400))
+        manager = self.make_manager(cache_handler, refresh_margin=300)
+        self.assertEqual(manager.get_access_token(as_dict=False), 'token1')
+
+        manager._refresh_in_background()
+        self.assertEqual(manager.get_access_token(as_dict=False), 'token2')
+        self.assertAlmostEqual(manager._refresh_timer.interval, 3300, delta=2)
+        cache_handler.get_cached_token.assert_called_once()
+
+
+    @patch('src.token_manager.SpotifyOAuth.refresh_access_token')
+    def test_background_refresh_keeps_current_token_and_retries_later_if_refresh_fails(self, refresh_mock):
+        refresh_mock.side_effect = Exception('connection error')
+        manager = self.make_manager(FakeCacheHandler(self.make_token('token1', 400)), retry_delay=15)
+        manager.get_access_token(as_dict=False)
+
+        manager._refresh_in_background()
+        self.assertEqual(manager.get_access_token(as_dict=False), 'token1')
+        self.assertEqual(manager._refresh_timer.interval, 15)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+import logging
+import os
+import re
+import random
+import string
+from unittest.mock import Mock
+import spotipy
+from src.track_metadata_resolver import TrackMetadataResolver
+
+class TestTrackMetadataResolver(unittest.TestCase):
+
+    def setUp(self):
+        self.test_logger = logging.getLogger('TestTrackMetadataResolver')
+        log_handler = logging.StreamHandler()
+        log_handler.setLevel('CRITICAL')
+        self.test_logger.addHandler(log_handler)
+        self.test_logger.propagate = False
+        self.generate_spotify_id = (
+            lambda: ''.join(random.choice(string.ascii_letters + string.digits) for i in range(0, 22)))
+        self.generate_track_uri = (
+            lambda gen_id=self.generate_spotify_id: 'spotify:track:' + gen_id())
+
+        self.test_cache_path = 'data/test/cache'
+        self.clear_cache_files()
+        self.api = spotipy.client.Spotify()
+        self.api.tracks = Mock(side_effect=self.tracks_response)
+
+
+    def tearDown(self):
+        self.clear_cache_files()
+
+
+    def clear_cache_files(self):
+        for filename in os.listdir(self.test_cache_path):
+            if re.search('^\\.gitignore$', filename) is None:
+                os.remove('%s/%s' % (self.test_cache_path, filename))
+
+
+    def tracks_response(self, uris):
+        return {
+            'tracks': [
+                {
+                    'name': 'name of %s' % uri,
+                    'uri': uri,
+                    'artists': [ { 'name': 'artist1' }, { 'name': 'artist2' } ]
+                } for uri in uris
+            ]
+        }
+
+
+    # ----- Tests for TrackMetadataResolver.resolve ----- #
+
+    def test_resolve_returns_name_and_artists_of_each_track(self):
+        resolver = TrackMetadataResolver(self.test_logger, self.api)
+        uris = [ self.generate_track_uri() for i in range(0, 3) ]
+        self.assertEqual(resolver.resolve(uris), {
+            uri: { 'name': 'name of %s' % uri, 'artists': 'artist1, artist2' } for uri in uris
+        })
+
+
+    def test_resolve_looks_up_tracks_in_batches_of_fifty(self):
+        resolver = TrackMetadataResolver(self.test_logger, self.api)
+        uris = [ self.generate_track_uri() for i in range(0, 120) ]
+        self.assertEqual(len(resolver.resolve(uris)), 120)
+        self.assertEqual([ len(call[0][0]) for call in self.api.tracks.call_args_list ], [ 50, 50, 20 ])
+
+
+    def test_resolve_only_looks_up_tracks_which_are_not_cached(self):
+        resolver = TrackMetadataResolver(self.test_logger, self.api)
+        uris = [ self.generate_track_uri() for i in range(0, 3) ]
+        resolver.resolve(uris[:2])
+        self.api.tracks.reset_mock()
+
+        self.assertEqual(len(resolver.resolve(uris + [ uris[2] ])), 3)
+        self.api.tracks.assert_called_once_with([ uris[2] ])
+        self.api.tracks.reset_mock()
+        resolver.resolve(uris)
+        self.api.tracks.assert_not_called()
+
+
+    def test_resolve_omits_tracks_which_cannot_be_looked_up(self):
+        resolver = TrackMetadataResolver(self.test_logger, self.api)
+        uris = [ self.generate_track_uri() for i in range(0, 2) ]
+        self.api.tracks = Mock(return_value={ 'tracks': [ self.tracks_response(uris[:1])['tracks'][0], None ] })
+        resolved = resolver.resolve(uris + [ 'spotify:local:artist:album:track:180' ])
+        self.assertEqual(list(resolved.keys()), [ uris[0] ])
+        self.api.tracks.assert_called_once_with(uris)
+
+
+    def test_resolve_forgets_least_recently_used_tracks_once_cache_is_full(self):
+        resolver = TrackMetadataResolver(self.test_logger, self.api, max_entries=2)
+        uris = [ self.generate_track_uri() for i in range(0, 3) ]
+        resolver.resolve(uris[:2])
+        resolver.resolve(uris[:1]) # the first track is now the most recently used
+        resolver.resolve(uris[2:])
+        self.api.tracks.reset_mock()
+
+        resolver.resolve(uris[:1] + uris[2:])
+        self.api.tracks.assert_not_called()
+        resolver.resolve(uris[1:2])
+        self.api.tracks.assert_called_once_with(uris[1:2])
+
+
+    def test_resolve_saves_cache_which_is_loaded_by_a_new_resolver(self):
+        path = '%s/track_metadata.json' % self.test_cache_path
+        uris = [ self.generate_track_uri() for i in range(0, 2) ]
+        expected = TrackMetadataResolver(self.test_logger, self.api, path=path).resolve(uris)
+        self.api.tracks.reset_mock()
+
+        self.assertEqual(TrackMetadataResolver(self.test_logger, self.api, path=path).resolve(uris), expected)
+        self.api.tracks.assert_not_called()
+
+
+    def test_resolve_ignores_unreadable_saved_cache(self):
+        path = '%s/track_metadata.json' % self.test_cache_path
+        with open(path, 'w') as cache_file:
+            cache_file.write('{ not json')
+        uris = [ self.generate_track_uri() ]
+        resolver = TrackMetadataResolver(self.test_logger, self.api, path=path)
+        self.assertEqual(len(resolver.resolve(uris)), 1)
+        self.api.tracks.assert_called_once_with(uris)
@@ -0,0 +1,109 @@
+import unittest
+import logging
+from time import sleep, monotonic
+from threading import Event, Thread
+from src.watchdog import Watchdog, WatchdogTimeout, WorkCancelled
+from src.request_scheduler import RequestScheduler
+
+class TestWatchdog(unittest.TestCase):
+
+    def setUp(self):
+        self.test_logger = logging.getLogger('TestWatchdog')
+        self.test_logger.propagate = False
+        self.release = Event()
+
+
+    def tearDown(self):
+        self.release.set() # lets abandoned work finish
+
+
+    # ----- Tests for Watchdog.run ----- #
+
+    def test_run_returns_result_of_work_which_finishes_within_its_budget(self):
+        watchdog = Watchdog(self.test_logger, playlist_budget=5)
+        self.assertEqual(watchdog.run('Work', lambda value: value * 2, 21), 42)
+        with self.assertRaises(ValueError):
+            watchdog.run('Work', int, 'not a number')
+
+
+    def test_run_abandons_work_which_runs_past_its_budget_and_logs_its_stack(self):
+        watchdog = Watchdog(self.test_logger, playlist_budget=0.1)
+        started = monotonic()
+        with self.assertLogs(self.test_logger, level='ERROR') as logs:
+            with self.assertRaises(WatchdogTimeout):
+                watchdog.run('Scan of playlist', self.release.wait)
+        self.assertLess(monotonic() - started, 1)
+        self.assertIn('Scan of playlist ran past its time budget', logs.output[0])
+        self.assertIn('in wait', logs.output[1])
+        # the next work is run by a new worker
+        self.assertEqual(watchdog.run('Work', lambda: 'done'), 'done')
+
+
+    def test_run_cancels_abandoned_work_and_its_workers_at_their_next_check(self):
+        watchdog = Watchdog(self.test_logger, playlist_budget=0.1)
+        cancelled = []
+        def check_until_cancelled():
+            try:
+                while not self.release.is_set():
+                    Watchdog.check_cancelled()
+                    sleep(0.01)
+            except WorkCancelled:
+                cancelled.append(True)
+        def work():
+            # e.g., a page fetched by another thread
+            worker = Thread(target=Watchdog.bind(check_until_cancelled))
+            worker.start()
+            check_until_cancelled()
+            worker.join()
+
+        with self.assertLogs(self.test_logger, level='ERROR'):
+            with self.assertRaises(WatchdogTimeout):
+                watchdog.run('Scan of playlist', work)
+        sleep(0.1)
+        self.assertEqual(cancelled, [ True, True ])
+        Watchdog.check_cancelled() # the calling thread was not cancelled
+
+
+    def test_run_does_not_start_work_again_until_its_abandoned_run_has_stopped(self):
+        watchdog = Watchdog(self.test_logger, playlist_budget=0.1)
+        with self.assertLogs(self.test_logger, level='ERROR'):
+            with self.assertRaises(WatchdogTimeout):
+                watchdog.run('Scan of playlist', self.release.wait) # i.e., does not check for cancellation
+        with self.assertRaises(WatchdogTimeout):
+            watchdog.run('Scan of playlist', lambda: 'done')
+        self.assertEqual(watchdog.run('Scan of other playlist', lambda: 'done'), 'done')
+
+        self.release.set()
+        sleep(0.05)
+        self.assertEqual(watchdog.run('Scan of playlist', lambda: 'done'), 'done')
+
+
+    def test_run_runs_work_with_the_priority_class_of_the_caller(self):
+        watchdog = Watchdog(self.test_logger, playlist_budget=5)
+        with RequestScheduler.priority('background'):
+            self.assertEqual(watchdog.run('Work', RequestScheduler.current_class), 'background')
+
+
+    def test_run_runs_work_in_calling_thread_if_there_is_no_budget(self):
+        watchdog = Watchdog(self.test_logger)
+        self.assertIsNone(watchdog.budget())
+        self.assertEqual(watchdog.run('Work', lambda: 'done'), 'done')
+
+
+    # ----- Tests for iteration budgets ----- #
+
+    def test_iteration_expires_once_its_budget_has_passed(self):
+        watchdog = Watchdog(self.test_logger, playlist_budget=10, iteration_budget=0.1)
+        self.assertFalse(watchdog.iteration_expired())
+        watchdog.start_iteration()
+        self.assertLessEqual(watchdog.budget(), 0.1)
+        self.assertFalse(watchdog.iteration_expired())
+        sleep(0.15)
+        self.assertTrue(watchdog.iteration_expired())
+        self.assertEqual(watchdog.budget(), 0)
+        watchdog.start_iteration()
+        self.assertFalse(watchdog.iteration_expired())
+
+
+if __name__ == '__main__':
+    unittest.main()
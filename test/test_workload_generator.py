@@ -0,0 +1,77 @@
+import unittest
+import logging
+from src.workload_generator import WorkloadGenerator
+from src.fake_spotify_server import FakeSpotifyServer
+from src.config_validator import ConfigValidator
+
+class TestWorkloadGenerator(unittest.TestCase):
+
+    def setUp(self):
+        self.test_logger = logging.getLogger('TestWorkloadGenerator')
+        log_handler = logging.StreamHandler()
+        log_handler.setLevel('CRITICAL')
+        self.test_logger.addHandler(log_handler)
+        self.test_logger.propagate = False
+
+
+    def generate(self, **kwargs):
+        server = FakeSpotifyServer(self.test_logger, seed=0)
+        generator = WorkloadGenerator(**kwargs)
+        generator.generate(server)
+        return (server, generator)
+
+
+    def all_items(self, server, generator):
+        return [ server.get_playlist_items(playlist['uri']) for playlist in generator.playlists ]
+
+
+    # ----- Tests for WorkloadGenerator.generate ----- #
+
+    def test_generate_generates_the_same_workload_for_the_same_seed(self):
+        (server, generator) = self.generate(seed=1, num_playlists=10, num_tracks=100)
+        (other_server, other_generator) = self.generate(seed=1, num_playlists=10, num_tracks=100)
+        self.assertEqual(self.all_items(server, generator), self.all_items(other_server, other_generator))
+        self.assertEqual(generator.playlists, other_generator.playlists)
+
+        (other_server, other_generator) = self.generate(seed=2, num_playlists=10, num_tracks=100)
+        self.assertNotEqual([ len(items) for items in self.all_items(server, generator) ],
+                            [ len(items) for items in self.all_items(other_server, other_generator) ])
+
+
+    def test_generate_generates_playlists_of_sampled_sizes_with_sampled_collaborators(self):
+        (server, generator) = self.generate(num_playlists=5, playlist_size=('constant', 40),
+                                            num_collaborators=('constant', 3), num_followed_playlists=2,
+                                            duplicate_rate=0, unauthorized_rate=0)
+        self.assertEqual(len(server.call('GET', 'me/playlists')[1]['items']), 7)
+        for (playlist, items) in zip(generator.playlists, self.all_items(server, generator)):
+            self.assertEqual(len(playlist['collaborators']), 3)
+            self.assertEqual(len(items), 40)
+            self.assertTrue(all([ item[1] in playlist['collaborators'] + [ 'fakeuser' ] for item in items ]))
+
+
+    def test_generate_generates_duplicates_and_unauthorized_additions_at_given_rates(self):
+        (server, generator) = self.generate(num_playlists=2, playlist_size=('constant', 50),
+                                            duplicate_rate=1, unauthorized_rate=1)
+        for items in self.all_items(server, generator):
+            self.assertEqual(len(set([ item[0] for item in items ])), 1)
+            self.assertTrue(all([ item[1].startswith('intruder') for item in items ]))
+
+
+    def test_playlist_config_is_a_valid_configuration_protecting_every_playlist(self):
+        (server, generator) = self.generate(num_playlists=3)
+        playlist_config = generator.playlist_config()
+        self.assertTrue(ConfigValidator(playlist=playlist_config).validate_playlist_config())
+        self.assertEqual([ list(playlist.values())[0]['uri'] for playlist in playlist_config['PROTECTED_PLAYLISTS'] ],
+                         [ playlist['uri'] for playlist in generator.playlists ])
+
+
+    # ----- Tests for WorkloadGenerator.churn ----- #
+
+    def test_churn_adds_and_removes_items_at_given_rates(self):
+        (server, generator) = self.generate(num_playlists=4, playlist_size=('constant', 100),
+                                            add_rate=0.2, remove_rate=0.1)
+        snapshot_ids = [ server.get_snapshot_id(playlist['uri']) for playlist in generator.playlists ]
+        self.assertEqual(generator.churn(server), (80, 48))
+        self.assertEqual([ len(items) for items in self.all_items(server, generator) ], [ 108 ] * 4)
+        self.assertTrue(all([ server.get_snapshot_id(playlist['uri']) != snapshot_id
+                              for (playlist, snapshot_id) in zip(generator.playlists, snapshot_ids) ]))